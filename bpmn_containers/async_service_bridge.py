@@ -22,7 +22,7 @@ from flowlib.constants import (
     split_key,
 )
 from flowlib.etcd_utils import get_etcd
-from flowlib.flowpost import FlowPost, FlowPostStatus
+from flowlib.flowpost import AsyncFlowPost, FlowPost, FlowPostStatus
 from flowlib.quart_app import QuartApp
 
 
@@ -140,14 +140,14 @@ class EventCatchApp(QuartApp):
         )
         payload['callback_url'] = f'{self.host}{instance_id}/{self._task_id}/{request_id}'
 
-        poster = FlowPost(
+        poster = AsyncFlowPost(
             instance_id,
             task_id,
             json.dumps(payload),
             headers=headers,
             url=self._task_url,
         )
-        result = poster.send()
+        result = await poster.send()
         logging.info(f"{request_id} got response {result.response}.")
 
         if result.message == FlowPostStatus.SUCCESS:
@@ -22,16 +22,18 @@ from confluent_kafka import Consumer, Message
 from etcd3.client import Etcd3Client
 import json
 import os
-import requests
 from retry import retry
 
 from flowlib.executor import get_executor
-from flowlib.flowpost import FlowPost, FlowPostResult, FlowPostStatus
+from flowlib.flowpost import AsyncFlowPost, FlowPost, FlowPostResult, FlowPostStatus
 from flowlib.quart_app import QuartApp
+from flowlib.shadowing import get_shadower
 from flowlib import workflow
 from flowlib.etcd_utils import (
     get_dict_from_prefix,
     get_etcd,
+    try_create_state,
+    try_transition_state,
 )
 from flowlib.constants import (
     WorkflowInstanceKeys,
@@ -163,10 +165,10 @@ class EventCatchPoller:
             cur_state,_ = etcd.get(keys.state)
             if cur_state == BStates.COMPLETED:
                 logging.info(f'{keys.state} already completed')
-            elif not etcd.replace(keys.state, States.STARTING, BStates.RUNNING):
+            elif not try_transition_state(etcd, keys.state, [BStates.STARTING], BStates.RUNNING)[0]:
                 logging.error(f'Failed to transition {keys.state} from STARTING -> RUNNING.')
         else:
-            if not etcd.replace(keys.state, States.STARTING, States.ERROR):
+            if not try_transition_state(etcd, keys.state, [BStates.STARTING], BStates.ERROR)[0]:
                 logging.error(f'Failed to transition {keys.state} from STARTING -> ERROR.')
 
     def create_instance_timer_callback(self, token_stack, incoming_data, content_type, instance_id=None):
@@ -182,7 +184,7 @@ class EventCatchPoller:
         logging.info(f'Creating instance {instance_id}')
         etcd = get_etcd()
         keys = WorkflowInstanceKeys(instance_id)
-        if not etcd.put_if_not_exists(keys.state, BStates.STARTING):
+        if not try_create_state(etcd, keys.state, BStates.STARTING):
             # Should never happen...unless there's a collision in uuid1
             logging.error(f'{keys.state} already defined in etcd!')
             return flow_result(-1, f"Internal Error: ID {instance_id} already exists", id=None)
@@ -215,14 +217,10 @@ class EventCatchPoller:
         if not KAFKA_SHADOW_URL:
             return
         o = urlparse(FORWARD_URL)
-        # TODO: REXFLOW-188 Move kafka shadowing to a utility, make everything use that utility,
-        # and get rid of these hardcoded headers.
-        headers['x-rexflow-original-host'] = o.netloc
-        headers['x-rexflow-original-path'] = o.path
-        try:
-            requests.post(KAFKA_SHADOW_URL, headers=headers, data=data).raise_for_status()
-        except Exception:
-            logging.warning("Failed shadowing traffic to Kafka")
+        headers[Headers.X_HEADER_ORIGINAL_HOST] = o.netloc
+        headers[Headers.X_HEADER_ORIGINAL_PATH] = o.path
+        if not get_shadower(KAFKA_SHADOW_URL).submit(data, headers):
+            logging.warning("Shadow queue full; dropped traffic to Kafka")
 
     def _make_call(self, data:str, flow_id:str, wf_id:str, content_type:str, token_stack:str = None):
         # Note: Python is garbage; so don't set `{}` as a default argument to a function. Because a dict is
@@ -366,6 +364,27 @@ class IntermediateCatchEventManager:
     def handle_incoming(self, payload: dict, signal_type: str) -> NoReturn:
         """Payload is the incoming data. It can be in two 
         """
+        poster = self._match_incoming(payload, signal_type)
+        if poster is not None:
+            poster.send()
+
+    async def handle_incoming_async(self, payload: dict, signal_type: str) -> NoReturn:
+        """handle_incoming() for the Quart handlers: the etcd bookkeeping runs
+        on the executor and the forward is made with AsyncFlowPost, so neither
+        blocks the event loop.
+        """
+        loop = asyncio.get_event_loop()
+        poster = await loop.run_in_executor(
+            get_executor(), self._match_incoming, payload, signal_type, AsyncFlowPost,
+        )
+        if poster is not None:
+            await poster.send()
+
+    def _match_incoming(self, payload: dict, signal_type: str, poster_class=FlowPost):
+        """Queues the payload in etcd, or pairs it with a queued payload of the
+        other signal type. Returns a poster_class instance for the merged data
+        if a pair was made, else None.
+        """
         assert signal_type in ['message', 'instance_signal']
         logging.warning(f"hello from handle_incoming {signal_type}")
 
@@ -415,7 +434,7 @@ class IntermediateCatchEventManager:
                 headers = data_to_merge_and_send['instance_signal']['headers']
                 request_json = data_to_merge_and_send['instance_signal']['data']
                 request_json.update(data_to_merge_and_send['message'])
-                poster = FlowPost(
+                return poster_class(
                     data_to_merge_and_send['instance_signal']['instance_id'],
                     self._forward_task_id,
                     json.dumps(request_json),
@@ -423,7 +442,7 @@ class IntermediateCatchEventManager:
                     headers=headers,
                     shadow_url=self._shadow_url,
                 )
-                poster.send()
+        return None
 
     @retry(tries=20, delay=0.01, jitter=(0, 0.01), logger=logging)
     def _acquire(self, lock):
@@ -490,7 +509,7 @@ class EventCatchApp(QuartApp):
                 'instance_id': request.headers[Headers.X_HEADER_FLOW_ID],
             }
             try:
-                self.catch_manager.handle_incoming(payload, 'instance_signal')
+                await self.catch_manager.handle_incoming_async(payload, 'instance_signal')
                 response = flow_result(0, "Job accepted.")
             except Exception as exn:
                 logging.exception('Failed handling incoming message', exc_info=exn)
@@ -522,7 +541,9 @@ class EventCatchApp(QuartApp):
         if request.method == 'GET':
             # return information about the existing timers
             aspects = self.manager.timed_manager.aspects
-            response = flow_result(0, 'Ok', timer_type=aspects.timer_type_s, timer_spec=aspects.spec, timer_done=self.manager.timed_manager.completed)
+            response = flow_result(0, 'Ok', timer_type=aspects.timer_type_s, timer_spec=aspects.spec, timer_done=self.manager.timed_manager.completed,
+                timer_stats=self.manager.timed_manager.scheduler.stats(),
+                timer_restore=self.manager.timed_manager.restore_stats)
         else: #if request.method == 'POST'
             # update the existing timer
             req = json.loads(data)
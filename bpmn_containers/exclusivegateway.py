@@ -2,7 +2,6 @@ from quart import request, jsonify
 import json
 import logging
 import os
-import requests
 from urllib.parse import urlparse
 
 from flowlib.quart_app import QuartApp
@@ -11,6 +10,8 @@ from flowlib.constants import (
     flow_result,
 )
 from flowlib.config import XGW_LISTEN_PORT
+from flowlib.http_sessions import get_session_pool
+from flowlib.shadowing import get_shadower
 
 
 CONDITIONAL_PATHS = json.loads(os.environ['REXFLOW_XGW_CONDITIONAL_PATHS'])
@@ -62,7 +63,7 @@ class ExclusiveGatewayApp(QuartApp):
                 dataz = [{path['expression'] : "True", "":"False"}, req_json]
 
                 # TODO: move this hardcoded uri to somwhere configurations live
-                response = requests.post(
+                response = get_session_pool().post(
                     f"{DMN_SERVER_HOST}/dmn/dt",
                     headers=headers,
                     data=json.dumps(dataz)
@@ -93,7 +94,7 @@ class ExclusiveGatewayApp(QuartApp):
         success = False
         for _ in range(int(total_attempts)):
             try:
-                response = requests.post(target_url, json=req_json, headers=headers)
+                response = get_session_pool().post(target_url, json=req_json, headers=headers)
                 response.raise_for_status()
                 success = True
                 break
@@ -108,14 +109,13 @@ class ExclusiveGatewayApp(QuartApp):
 
         if not success:
             # Notify Flowd that we failed.
-            requests.post(REXFLOW_XGW_FAIL_URL, json=req_json, headers=headers)
+            get_session_pool().post(REXFLOW_XGW_FAIL_URL, json=req_json, headers=headers)
 
         if KAFKA_SHADOW_URL:
-            try:
-                headers['x-rexflow-failure'] = True
-                requests.post(KAFKA_SHADOW_URL, headers=headers, json=req_json).raise_for_status()
-            except Exception:
-                logging.warning("Failed shadowing traffic to Kafka")
+            headers['x-rexflow-failure'] = 'True'
+            headers[Headers.CONTENT_TYPE] = 'application/json'
+            if not get_shadower(KAFKA_SHADOW_URL).submit(json.dumps(req_json), headers):
+                logging.warning("Shadow queue full; dropped traffic to Kafka")
 
         resp = jsonify(flow_result(0, "Ok."))
         if Headers.TRACEID_HEADER.lower() in request.headers:
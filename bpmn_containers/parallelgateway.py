@@ -3,10 +3,11 @@
 import json
 import logging
 import os
-import requests
 
 from flask import Flask, request, make_response, jsonify
 
+from flowlib.http_sessions import get_session_pool
+
 app = Flask(__name__)
 
 
@@ -61,7 +62,7 @@ def parallel():
 
         for i in range(len(REXFLOW_PGW_FORWARD_URLS)):
             headers['x-rexflow-task-id'] = REXFLOW_PGW_FORWARD_IDS[i]
-            requests.post(REXFLOW_PGW_FORWARD_URLS[i], json=incoming_json, headers=headers)
+            get_session_pool().post(REXFLOW_PGW_FORWARD_URLS[i], json=incoming_json, headers=headers)
 
     elif REXFLOW_PGW_TYPE == "combiner":
 
@@ -79,7 +80,7 @@ def parallel():
 
             if REXFLOW_PGW_FORWARD_URL:
                 headers['x-rexflow-task-id'] = REXFLOW_PGW_FORWARD_ID
-                requests.post(REXFLOW_PGW_FORWARD_URL, json=incoming_json, headers=headers)
+                get_session_pool().post(REXFLOW_PGW_FORWARD_URL, json=incoming_json, headers=headers)
             else:
                 logging.error(f"[flow_id={flow_id}] REXFLOW_PGW_FORWARD_URL not set, can't send results.")
 
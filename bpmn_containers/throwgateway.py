@@ -16,10 +16,11 @@ from flowlib.constants import (
 )
 from flowlib.etcd_utils import (
     get_etcd,
-    transition_state,
+    state_index_ops,
+    try_transition_state,
     locked_call,
 )
-from flowlib.flowpost import FlowPost, FlowPostResult, FlowPostStatus
+from flowlib.flowpost import AsyncFlowPost, FlowPostResult, FlowPostStatus
 from flowlib.token_api import TokenPool
 from flowlib.quart_app import QuartApp
 from flowlib.workflow import Workflow
@@ -69,15 +70,10 @@ def complete_instance(instance_id, wf_id, payload, content_type, timer_header):
         # flow can be completed if we exhaust the list.
         #
         # The tokens are in chrono order, so first token is oldest.
-        alldone = True
         toks = timer_header.split(',')[::-1]  # sort in reverse order so newest first
-        for token in toks:
-            logging.info(f'Releasing token for pool {token}')
-            pool = TokenPool.from_pool_name(token)
-            if not pool.release_as_complete():
-                alldone = False
-                logging.info(str(pool))
-                break
+        logging.info(f'Releasing tokens for pools {toks}')
+        alldone, pools = TokenPool.release_chain_as_complete(toks)
+        for pool in pools:
             logging.info(str(pool))
 
         def __logic(etcd, payload):
@@ -122,29 +118,32 @@ def complete_instance(instance_id, wf_id, payload, content_type, timer_header):
         #     logging.info('All tokens accounted for')
         #     # else fall through and complete the workflow instance
     assert wf_id == WF_ID, "Did we call the wrong End Event???"
-    if etcd.put_if_not_exists(keys.result, payload):
-
-        if not etcd.put_if_not_exists(keys.content_type, content_type):
-            logging.error(f"Couldn't store content type {content_type} on instance {instance_id}.")
-
-        # Mark the WF Instance with the name of the End Event that terminated it.
-        if END_EVENT_NAME:
-            etcd.put(keys.end_event, END_EVENT_NAME)
-
-        # Now, all we have to do is update the state.
-        good_states = {BStates.STARTING, BStates.RUNNING}
-        if not transition_state(etcd, keys.state, good_states, BStates.COMPLETED):
-            logging.error(
-                f'Race on {keys.state}; state changed out of known'
-                ' good state before state transition could occur!'
-            )
-            etcd.put(keys.state, BStates.ERROR)
-    else:
+    # Store the result and content type, mark the WF Instance with the name of
+    # the End Event that terminated it, and update the state, all in one txn.
+    puts = {keys.result: payload, keys.content_type: content_type}
+    if END_EVENT_NAME:
+        puts[keys.end_event] = END_EVENT_NAME
+    good_states = {BStates.STARTING, BStates.RUNNING}
+    completed, prior_state = try_transition_state(
+        etcd, keys.state, good_states, BStates.COMPLETED, puts=puts,
+    )
+    if not completed:
         # This means that A Bad Thing has happened, and we should transition
         # the Instance to the Error state.
-        logging.error(f'Race on {keys.state}; somehow we ended up at End Event twice!')
-        etcd.put(keys.state, BStates.ERROR)
-        assert False, "somehow it was already completed?"
+        txns = etcd.transactions
+        etcd.transaction(
+            compare=[],
+            success=[txns.put(keys.state, BStates.ERROR)]
+                + state_index_ops(txns, keys.state, prior_state, BStates.ERROR),
+            failure=[],
+        )
+        if prior_state == BStates.COMPLETED:
+            logging.error(f'Race on {keys.state}; somehow we ended up at End Event twice!')
+            assert False, "somehow it was already completed?"
+        logging.error(
+            f'Race on {keys.state}; state changed out of known'
+            f' good state ({prior_state}) before state transition could occur!'
+        )
     return 'Great shot kid, that was one in a million!'
 
 class EventThrowApp(QuartApp):
@@ -185,7 +184,7 @@ class EventThrowApp(QuartApp):
                 target_url = target['target_url']
                 task_id = target['task_id']
                 total_attempts = int(target['total_attempts'])
-                poster = FlowPost(
+                poster = AsyncFlowPost(
                     headers[Headers.X_HEADER_FLOW_ID],
                     task_id,
                     data,
@@ -195,7 +194,7 @@ class EventThrowApp(QuartApp):
                     shadow_url=SHADOW_URL,
                     headers=headers,
                 )
-                poster.send()
+                await poster.send()
 
             resp = await make_response(flow_result(0, ""))
 
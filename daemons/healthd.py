@@ -7,7 +7,7 @@ from quart import jsonify
 import requests
 
 from flowlib.bpmn_util import BPMNComponent
-from flowlib.etcd_utils import get_etcd, get_next_level, get_keys_from_prefix
+from flowlib.etcd_utils import get_etcd, get_mirror
 from flowlib.executor import get_executor
 from flowlib.flowd_utils import get_log_format
 from flowlib.quart_app import QuartApp
@@ -91,9 +91,10 @@ class HealthManager:
     def __init__(self):
         self.etcd = get_etcd()
         self.executor = get_executor()
+        self.mirror = get_mirror(WorkflowKeys.ROOT)
         self.workflows = {
             workflow_id: Workflow.from_id(workflow_id)
-            for workflow_id in get_next_level(WorkflowKeys.ROOT)
+            for workflow_id in self.mirror.get_next_level(WorkflowKeys.ROOT)
         }
         self.probes = {}
         self.future = None
@@ -243,7 +244,7 @@ class HealthManager:
             for probe in probes.values():
                 probe.start()
             self.probes[workflow.id] = probes
-            workflow_state = self.etcd.get(workflow.keys.state)[0].decode()
+            workflow_state = self.mirror.get(workflow.keys.state).decode()
             self.logger.info(f'Started probes for {workflow.id}, in state {workflow_state}')
             if workflow_state in {States.STARTING, States.ERROR}:
                 self.executor.submit(self.wait_for_up, workflow)
@@ -21,18 +21,17 @@ from flowlib.constants import (
     flow_result,
     WorkflowInstanceKeys,
     split_key,
-    Headers,
 )
 from flowlib.etcd_utils import get_dict_from_prefix, get_etcd
 from flowlib.executor import get_executor
-from flowlib.flowpost import FlowPost
 from flowlib.quart_app import QuartApp
+from flowlib import shadowing
 
 
 class MessageTypes:
     ETCD_PUT = "ETCD_PUT"
     ETCD_DELETE = "ETCD_DELETE"
-    REQUEST_SENT = "REQUEST_SENT"
+    REQUEST_SENT = shadowing.REQUEST_SENT
 
 
 class EtcdInstanceWatcher:
@@ -123,6 +122,7 @@ class WorkflowPublisher(QuartApp):
 
         self.app.route('/', methods=['GET'])(self.health_check)
         self.app.route('/', methods=['POST'])(self.fire_event)
+        self.app.route(f'/{shadowing.BATCH_PATH}', methods=['POST'])(self.fire_events)
 
     def health_check(self):
         self._etcd.get("MayTheForceBeWithUs")
@@ -131,20 +131,22 @@ class WorkflowPublisher(QuartApp):
 
     async def fire_event(self):
         data = await request.data
-        message_headers = {
-            'instance_id': request.headers[Headers.X_HEADER_FLOW_ID],
-            'workflow_id': self._workflow_id,
-            'event_type': MessageTypes.REQUEST_SENT,
-            'content-type': 'application/json',
-        }
-        payload = {
-            'request_data': FlowPost.jsonify_or_encode_data(data),
-            'request_headers': dict(request.headers),
-            **message_headers,
-        }
-        self.manager._send_message(json.dumps(payload), message_headers)
+        body, message_headers = shadowing.publisher_message(
+            self._workflow_id, data, dict(request.headers),
+        )
+        self.manager._send_message(body, message_headers)
         return jsonify(flow_result(0, "Saved."))
 
+    async def fire_events(self):
+        """Batched fire_event: the body is a list of shadow records as sent
+        by flowlib.shadowing.HttpBatchSink.
+        """
+        records = shadowing.decode_batch(await request.data)
+        for data, headers in records:
+            body, message_headers = shadowing.publisher_message(self._workflow_id, data, headers)
+            self.manager._send_message(body, message_headers)
+        return jsonify(flow_result(0, f"Saved {len(records)}."))
+
     def run(self):
         self.manager.start()
         # now bring up the web server (this call blocks)
@@ -2,6 +2,9 @@ import argparse
 import json
 import logging
 import os
+import sys
+
+import grpc
 
 from flowlib import flow_pb2
 from flowlib.flowd_utils import get_flowd_connection
@@ -39,6 +42,32 @@ def __refine_args__(parser: argparse.ArgumentParser):
         action='store_true',
         help='Output response data to stdout.'
     )
+    # Listing instances (no ids given) streams them from flowd a page at a
+    # time; these narrow down what is streamed.
+    parser.add_argument(
+        '--state', action='append', default=[],
+        help='Only list instances in this state. May be repeated.',
+    )
+    parser.add_argument(
+        '--workflow-prefix', action='store', default='',
+        help='Only list instances of deployments whose ID starts with this.',
+    )
+    parser.add_argument(
+        '--fields', action='store', default='',
+        help='Comma-separated instance fields to return, e.g. state,metadata. Default is all.',
+    )
+    parser.add_argument(
+        '--limit', action='store', type=int, default=0,
+        help='Return at most this many instances.',
+    )
+    parser.add_argument(
+        '--page-size', action='store', type=int, default=0,
+        help='Instances per page fetched from flowd.',
+    )
+    parser.add_argument(
+        '--page-token', action='store', default='',
+        help='Resume a listing where an earlier --limit cut it off.',
+    )
     parser.add_argument(
         'ids',
         nargs='*',
@@ -48,6 +77,50 @@ def __refine_args__(parser: argparse.ArgumentParser):
     return parser
 
 
+def ps_stream(flowd, namespace: argparse.Namespace):
+    '''Lists instances through PSQueryStream, writing each page out as it
+    arrives. Returns the status, or None if flowd does not support streaming.
+    '''
+    request = flow_pb2.PSStreamRequest(
+        page_token=namespace.page_token,
+        limit=namespace.limit,
+        page_size=namespace.page_size,
+        states=namespace.state,
+        workflow_id_prefix=namespace.workflow_prefix,
+        fields=[field for field in namespace.fields.split(',') if field],
+    )
+    count = 0
+    next_page_token = ''
+    opened = False
+    try:
+        for page in flowd.PSQueryStream(request):
+            if namespace.output and not opened:
+                # Pages are spliced into a single JSON object, as PSQuery returns.
+                sys.stdout.write('{')
+                opened = True
+            if page.status < 0:
+                logging.error(f'Error from server: {page.status}, "{page.message}"')
+                return page.status
+            for instance_id, instance in json.loads(page.data).items():
+                if namespace.output:
+                    sys.stdout.write(f'{", " if count else ""}{json.dumps(instance_id)}: {json.dumps(instance)}')
+                count += 1
+            if namespace.output:
+                sys.stdout.flush()
+            next_page_token = page.next_page_token
+    except grpc.RpcError as exn:
+        if exn.code() == grpc.StatusCode.UNIMPLEMENTED and count == 0:
+            return None
+        raise
+    finally:
+        if opened:
+            print('}')
+    logging.info(f'Got {count} instances.')
+    if next_page_token:
+        logging.info(f'More instances follow; pass --page-token {next_page_token} to continue.')
+    return 0
+
+
 def ps_action(namespace: argparse.Namespace, *args, **kws):
     response = None
     if namespace.kubernetes_output:
@@ -61,6 +134,11 @@ def ps_action(namespace: argparse.Namespace, *args, **kws):
     else:
         kind = getattr(flow_pb2.RequestKind, namespace.kind, flow_pb2.RequestKind.INSTANCE)
     with get_flowd_connection(namespace.flowd_host, namespace.flowd_port) as flowd:
+        if kind == flow_pb2.RequestKind.INSTANCE and not namespace.ids:
+            status = ps_stream(flowd, namespace)
+            if status is not None:
+                return status
+            logging.info('flowd does not stream ps results; asking for all of them at once.')
         request = flow_pb2.PSRequest(
             kind=kind, ids=namespace.ids, include_kubernetes=include_kubernetes,
         )
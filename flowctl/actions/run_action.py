@@ -1,5 +1,10 @@
 import argparse
+import itertools
+import json
 import logging
+import sys
+
+import grpc
 
 from flowlib import flow_pb2
 from flowlib.flowd_utils import get_flowd_connection
@@ -36,12 +41,101 @@ def __refine_args__(parser: argparse.ArgumentParser):
         type=str,
         help='optional arguments to send to the workflow deployment',
     )
+    parser.add_argument(
+        '--batch-file',
+        help='start one instance per line of this JSON lines file ("-" for '
+             'stdin); each line is an object with optional "args", "metadata" '
+             'and "start_event_id"',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=500,
+        help='instances started per request in --batch-file mode',
+    )
+    parser.add_argument(
+        '--parallelism',
+        type=int,
+        default=0,
+        help='start events flowd calls at once in --batch-file mode (0 for its default)',
+    )
     return parser
 
 
+def read_batch_items(lines):
+    '''Turns JSON lines into RunBatchItems, skipping blank lines.'''
+    for line in lines:
+        if not line.strip():
+            continue
+        spec = json.loads(line)
+        yield flow_pb2.RunBatchItem(
+            args=[str(arg) for arg in spec.get('args', [])],
+            start_event_id=spec.get('start_event_id', ''),
+            metadata=[
+                flow_pb2.StringPair(key=key, value=str(value))
+                for key, value in spec.get('metadata', {}).items()
+            ],
+        )
+
+
+def _run_items(flowd, namespace, items):
+    '''Starts a chunk of instances. Falls back to one RunWorkflow call per
+    item against a flowd without RunWorkflowBatch.
+    Returns:
+        The list of per-item results.
+    '''
+    try:
+        response = flowd.RunWorkflowBatch(flow_pb2.RunBatchRequest(
+            workflow_id=namespace.workflow_id, items=items,
+            start_event_id=namespace.start_event_id, parallelism=namespace.parallelism,
+        ))
+    except grpc.RpcError as exn:
+        if exn.code() != grpc.StatusCode.UNIMPLEMENTED:
+            raise
+        results = []
+        for item in items:
+            response = flowd.RunWorkflow(flow_pb2.RunRequest(
+                workflow_id=namespace.workflow_id, args=item.args,
+                start_event_id=item.start_event_id or namespace.start_event_id,
+                metadata=item.metadata,
+            ))
+            results.append(
+                json.loads(response.data) if response.status == 0
+                else {'status': response.status, 'message': response.message}
+            )
+        return results
+    if response.status < 0:
+        return [{'status': response.status, 'message': response.message}] * len(items)
+    return json.loads(response.data)
+
+
+def run_batch(flowd, namespace):
+    '''Starts an instance per line of namespace.batch_file, batch_size at a
+    time. With --output, prints one JSON result per line, in file order.
+    '''
+    started = failed = 0
+    with (sys.stdin if namespace.batch_file == '-' else open(namespace.batch_file)) as lines:
+        items = read_batch_items(lines)
+        while True:
+            chunk = list(itertools.islice(items, namespace.batch_size))
+            if not chunk:
+                break
+            for result in _run_items(flowd, namespace, chunk):
+                if result.get('status', -1) == 0 and result.get('id'):
+                    started += 1
+                else:
+                    failed += 1
+                if namespace.output:
+                    print(json.dumps(result))
+    logging.info(f'Started {started} instances; {failed} failed.')
+    return 0 if failed == 0 else -1
+
+
 def run_action(namespace: argparse.Namespace, *args, **kws):
     response = None
     with get_flowd_connection(namespace.flowd_host, namespace.flowd_port) as flowd:
+        if namespace.batch_file:
+            return run_batch(flowd, namespace)
         response = flowd.RunWorkflow(flow_pb2.RunRequest(
             workflow_id=namespace.workflow_id, args=namespace.args,
             stopped=namespace.stopped, start_event_id=namespace.start_event_id
@@ -0,0 +1,134 @@
+'''In-memory index of deployment ids, for resolving the ids flowctl users type.
+
+flowctl run (and RunWorkflowBatch) accept any unambiguous substring of a
+deployment id. Resolving one used to read every key and value under
+/rexflow/workflows, BPMN blobs included, on every request. The index instead
+loads the deployment ids once, with a keys-only paged range read, then
+follows a watch on the prefix and keeps only what the deployments' state keys
+say: a deployment exists while its state key does. Lookups that hit never
+touch etcd; a miss syncs the index once, so that a deployment applied just
+before is still found.
+'''
+import bisect
+import threading
+from typing import List
+
+from etcd3.events import DeleteEvent
+
+from flowlib.constants import WorkflowKeys
+from flowlib.etcd_utils import EtcdMirror, get_etcd, get_prefix_pages
+
+
+class DeploymentIndex(EtcdMirror):
+    '''Sorted, watch-fed set of deployment ids. Reuses EtcdMirror's watch,
+    compaction and reconnect handling, but holds neither keys nor values.
+    '''
+    def __init__(self, etcd=None):
+        super().__init__(WorkflowKeys.ROOT + '/', etcd)
+        self._ids = []
+        self._count = 0  # of all keys under the prefix, for sync()
+
+    def _id_of(self, key):
+        '''The deployment id if key is a deployment's state key, else None.'''
+        did, _, rest = key[len(self.prefix):].decode('utf-8').partition('/')
+        return did if rest == 'state' else None
+
+    def _load(self):
+        ids = set()
+        count = 0
+        revision = None
+        for response in get_prefix_pages(self.etcd, self.prefix, keys_only=True):
+            revision = response.header.revision
+            count += len(response.kvs)
+            for kv in response.kvs:
+                did = self._id_of(kv.key)
+                if did is not None:
+                    ids.add(did)
+        with self._cond:
+            self._ids = sorted(ids)
+            self._count = count
+            self.revision = revision
+            self._cond.notify_all()
+
+    def _apply(self, event):
+        did = self._id_of(event.key)
+        with self._cond:
+            if isinstance(event, DeleteEvent):
+                self._count -= 1
+            elif event.version == 1:
+                self._count += 1
+            if did is not None:
+                index = bisect.bisect_left(self._ids, did)
+                present = index < len(self._ids) and self._ids[index] == did
+                if isinstance(event, DeleteEvent):
+                    if present:
+                        del self._ids[index]
+                elif not present:
+                    self._ids.insert(index, did)
+            self.revision = max(self.revision, event.mod_revision)
+            self.events_applied += 1
+            self._cond.notify_all()
+
+    def _key_count(self):
+        return self._count
+
+    def stats(self):
+        stats = super().stats()
+        del stats['keys'], stats['bytes'], stats['overflowed']
+        with self._cond:
+            stats['deployments'] = len(self._ids)
+        return stats
+
+    def ids(self) -> List[str]:
+        with self._cond:
+            return list(self._ids)
+
+    def __contains__(self, did) -> bool:
+        with self._cond:
+            index = bisect.bisect_left(self._ids, did)
+            return index < len(self._ids) and self._ids[index] == did
+
+    def with_prefix(self, prefix: str) -> List[str]:
+        with self._cond:
+            start = bisect.bisect_left(self._ids, prefix)
+            end = start
+            while end < len(self._ids) and self._ids[end].startswith(prefix):
+                end += 1
+            return self._ids[start:end]
+
+    def matching(self, substring: str) -> List[str]:
+        with self._cond:
+            return [did for did in self._ids if substring in did]
+
+    def resolve(self, workflow_id: str) -> str:
+        '''For developer convenience, a workflow id may be any substring of a
+        single deployment's id. If the match is ambiguous (or there is none),
+        even once the index has caught up with etcd, the id is taken as given.
+        '''
+        for attempt in range(2):
+            if attempt:
+                self.sync()
+            if workflow_id in self:
+                return workflow_id
+            matches = self.matching(workflow_id)
+            if len(matches) == 1:
+                return matches[0]
+        return workflow_id
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_deployment_index() -> DeploymentIndex:
+    '''Get the started, module-level DeploymentIndex, creating it on first
+    use. Requires the module-level etcd client.
+    '''
+    global _index
+    etcd = get_etcd(is_not_none=True)
+    with _index_lock:
+        if _index is None or _index.etcd is not etcd:
+            if _index is not None:
+                _index.stop()
+            _index = DeploymentIndex(etcd).start()
+        return _index
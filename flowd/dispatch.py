@@ -0,0 +1,153 @@
+'''Runs flowd's gRPC handlers without blocking the event loop.
+
+The handlers do blocking work (etcd, kubectl, S3), and flowd's
+gRPC server shares its event loop with the Quart app that serves
+/instancefail and /wf_map to every running workflow. The dispatcher hands
+each call to a dedicated, bounded thread pool, lets at most a configured
+number of calls of each RPC run at once, and records how long calls wait
+for a slot (queue time) and how long the handler takes (handle time).
+'''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import threading
+import time
+
+from flowlib import flow_pb2
+from flowlib.config import FLOWD_HANDLER_WORKERS, FLOWD_RPC_CONCURRENCY, FLOWD_RPC_LIMITS
+
+from .handlers import handler_dispatch, stream_dispatch
+
+
+class RpcStats:
+    '''Counters for one RPC.'''
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.calls = 0
+        self.errors = 0
+        self.waiting = 0
+        self.active = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self.handle_time_total = 0.0
+        self.handle_time_max = 0.0
+
+    def to_dict(self) -> dict:
+        finished = max(self.calls - self.waiting - self.active, 1)
+        return {
+            'limit': self.limit,
+            'calls': self.calls,
+            'errors': self.errors,
+            'waiting': self.waiting,
+            'active': self.active,
+            'queue_time_avg': self.queue_time_total / max(self.calls - self.waiting, 1),
+            'queue_time_max': self.queue_time_max,
+            'handle_time_avg': self.handle_time_total / finished,
+            'handle_time_max': self.handle_time_max,
+        }
+
+
+class RpcDispatcher:
+    def __init__(
+        self,
+        workers: int = FLOWD_HANDLER_WORKERS,
+        concurrency: int = FLOWD_RPC_CONCURRENCY,
+        limits: dict = None,
+    ):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='flowd-rpc')
+        self._concurrency = concurrency
+        self._limits = dict(FLOWD_RPC_LIMITS if limits is None else limits)
+        self._semaphores = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _stats_for(self, command: str) -> RpcStats:
+        stats = self._stats.get(command)
+        if stats is None:
+            stats = self._stats[command] = RpcStats(self._limits.get(command, self._concurrency))
+        return stats
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, name: str):
+        '''Waits for one of name's slots and keeps the books on the call.
+        Yields a dict whose 'ok' the caller clears if the call failed.
+        '''
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            semaphore = self._semaphores[name] = asyncio.Semaphore(
+                self._limits.get(name, self._concurrency)
+            )
+        with self._lock:
+            stats = self._stats_for(name)
+            stats.calls += 1
+            stats.waiting += 1
+        queued = time.monotonic()
+        async with semaphore:
+            started = time.monotonic()
+            with self._lock:
+                stats.waiting -= 1
+                stats.active += 1
+                stats.queue_time_total += started - queued
+                stats.queue_time_max = max(stats.queue_time_max, started - queued)
+            outcome = {'ok': False}
+            try:
+                yield outcome
+            except Exception:
+                outcome['ok'] = False
+                raise
+            finally:
+                elapsed = time.monotonic() - started
+                with self._lock:
+                    stats.active -= 1
+                    stats.handle_time_total += elapsed
+                    stats.handle_time_max = max(stats.handle_time_max, elapsed)
+                    if not outcome['ok']:
+                        stats.errors += 1
+
+    async def dispatch(self, command: str, request, context):
+        '''Runs handler_dispatch(command, request, context) on the handler pool
+        once a slot for command is free.
+        '''
+        async with self._slot(command) as outcome:
+            result = await asyncio.get_event_loop().run_in_executor(
+                self._executor, handler_dispatch, command, request, context,
+            )
+            outcome['ok'] = isinstance(result, flow_pb2.FlowdResult) and result.status == 0
+            return result
+
+    async def dispatch_stream(self, command: str, request, context):
+        '''Async generator over the messages of stream_dispatch(command, ...).
+        Each message is produced on the handler pool; the slot (counted
+        against "<command>_stream") is held until the stream ends.
+        '''
+        loop = asyncio.get_event_loop()
+        async with self._slot(f'{command}_stream') as outcome:
+            messages = stream_dispatch(command, request, context)
+            outcome['ok'] = True
+            while True:
+                message = await loop.run_in_executor(self._executor, next, messages, None)
+                if message is None:
+                    break
+                if message.status != 0:
+                    outcome['ok'] = False
+                yield message
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {command: stats.to_dict() for command, stats in self._stats.items()}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> RpcDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = RpcDispatcher()
+    return _dispatcher
@@ -7,22 +7,32 @@ import json
 from async_timeout import timeout
 from quart import request, jsonify
 
-from flowlib.etcd_utils import get_etcd, transition_state
+from flowlib.etcd_utils import get_etcd, get_mirror, try_transition_state, try_transition_states
+from flowlib.executor import get_executor
+from flowlib.failure_reporter import decode_failures
+from flowlib.instance_index import check_index
+from flowlib.k8s_apply import get_k8s_apply_stats
 from flowlib.quart_app import QuartApp
-from flowlib.workflow import Workflow, get_workflows
+from flowlib.workflow import Workflow
 
 from flowlib.config import (
+    INSTANCE_FAIL_BATCH_ENDPOINT_PATH,
+    INSTANCE_INDEX_CHECK_ON_START,
     INSTANCE_FAIL_ENDPOINT_PATH,
     WF_MAP_ENDPOINT_PATH
 )
 from flowlib.constants import (
     BStates,
     flow_result,
+    States,
     WorkflowInstanceKeys,
+    WorkflowKeys,
     Headers,
 )
 from flowlib.token_api import TokenPool
 
+from .dispatch import get_dispatcher
+
 
 TIMEOUT_SECONDS = 10
 
@@ -83,7 +93,30 @@ class FlowApp(QuartApp):
         self.app.route('/health', methods=['GET'])(self.health)
         self.app.route('/', methods=['POST'])(self.root_route)
         self.app.route(INSTANCE_FAIL_ENDPOINT_PATH, methods=(['POST']))(self.fail_route)
+        self.app.route(INSTANCE_FAIL_BATCH_ENDPOINT_PATH, methods=['POST'])(self.fail_batch_route)
         self.app.route(WF_MAP_ENDPOINT_PATH, methods=['GET', 'POST'])(self.wf_map)
+        self.instance_index_report = None
+        if INSTANCE_INDEX_CHECK_ON_START:
+            self.app.before_serving(self._start_index_check)
+
+    def _metrics(self) -> dict:
+        return {
+            **super()._metrics(),
+            'rpc': get_dispatcher().stats(),
+            'instance_index': self.instance_index_report,
+            'k8s_apply': get_k8s_apply_stats(),
+        }
+
+    async def _start_index_check(self):
+        # Runs in the background: flowd serves while the index is checked, and
+        # filtered ps falls back to full scans until the index is ready.
+        asyncio.get_event_loop().run_in_executor(get_executor(), self._check_instance_index)
+
+    def _check_instance_index(self):
+        try:
+            self.instance_index_report = check_index(self.etcd, repair=True)
+        except Exception as exn:
+            logging.exception('Failed checking the instance index.', exc_info=exn)
 
     async def health(self):
         self.etcd.get('Is The Force With Us?')
@@ -96,19 +129,19 @@ class FlowApp(QuartApp):
             flow_id = request.headers[Headers.X_HEADER_FLOW_ID]
             keys = WorkflowInstanceKeys(flow_id)
             good_states = {BStates.STARTING, BStates.RUNNING}
-            if self.etcd.get(keys.state)[0] in good_states:
-                if transition_state(self.etcd, keys.state, good_states, BStates.COMPLETED):
-                    self.etcd.put(keys.result, await request.data)
-                else:
-                    logging.error(
-                        f'Race on {keys.state}; state changed out of known'
-                        ' good state before state transition could occur!'
-                    )
+            completed, prior_state = try_transition_state(
+                self.etcd, keys.state, good_states, BStates.COMPLETED,
+                puts={keys.result: await request.data},
+            )
+            if not completed and prior_state is not None:
+                logging.warning(
+                    f'Not completing {flow_id}; {keys.state} is {prior_state}.'
+                )
         return 'Hello there!\n'
 
     async def fail_route(self):
         # When there is a flow ID in the headers, store the result in etcd and
-        # change the state to ERROR.
+        # change the state to ERROR.
 
         if Headers.X_HEADER_WORKFLOW_ID not in request.headers or Headers.X_HEADER_FLOW_ID not in request.headers:
             return jsonify(flow_result(-1, "Didn't provide workflow headers"), 400)
@@ -121,65 +154,158 @@ class FlowApp(QuartApp):
         state_key = keys.state
         good_states = {BStates.STARTING, BStates.RUNNING}
 
-        if self.etcd.get(state_key)[0] in good_states:
-            # As per spec, if we have a recoverable workflow we go to STOPPING --> STOPPED.
-            # Otherwise, we go straight to ERROR.
-            if workflow.process.properties.is_recoverable:
-                if not transition_state(self.etcd, state_key, good_states, BStates.STOPPING):
-                    logging.error(
-                        f'Race on {state_key}; state changed out of known'
-                        ' good state before state transition could occur!'
-                    )
-            else:
-                if not transition_state(self.etcd, state_key, good_states, BStates.ERROR):
-                    logging.error(
-                        f'Race on {state_key}; state changed out of known'
-                        ' good state before state transition could occur!'
-                    )
+        # As per spec, if we have a recoverable workflow we go to STOPPING --> STOPPED.
+        # Otherwise, we go straight to ERROR.
+        if workflow.process.properties.is_recoverable:
+            fail_state = BStates.STOPPING
+        else:
+            fail_state = BStates.ERROR
 
-            if timer_pool_id is not None:
-                # if we're tracking tokens, we're not any more as the workflow instance
-                # is being failed.
-                for pool_name in timer_pool_id.split(','):
-                    logging.info(f'Erasing token pool {pool_name}')
-                    TokenPool.erase(pool_name)
+        incoming_data = None
+        try:
+            async with timeout(TIMEOUT_SECONDS):
+                incoming_data = await request.data
+        except asyncio.exceptions.TimeoutError as exn:
+            logging.exception(
+                f"Timed out waiting for error data on flow id {flow_id}.",
+                exc_info=exn
+            )
+            if try_transition_state(self.etcd, state_key, good_states, BStates.ERROR)[0]:
+                self._erase_token_pools(timer_pool_id)
+            return jsonify(flow_result(-1, "Could not load promised data."), 400)
 
-            incoming_data = None
-            try:
-                with timeout(TIMEOUT_SECONDS):
-                    incoming_data = await request.data
-            except asyncio.exceptions.TimeoutError as exn:
-                logging.exception(
-                    f"Timed out waiting for error data on flow id {flow_id}.",
-                    exc_info=exn
-                )
-                self.etcd.put(state_key, BStates.ERROR)
-                return jsonify(flow_result(-1, "Could not load promised data."), 400)
+        try:
+            payload = json.loads(incoming_data.decode())
+            puts = self._payload_puts(payload, keys, workflow)
+        except Exception as exn:
+            logging.exception(
+                f"Failed processing instance error payload:",
+                exc_info=exn,
+            )
+            puts = {
+                keys.result: incoming_data,
+                keys.content_type: 'application/octet-stream',
+            }
 
-            try:
-                payload = json.loads(incoming_data.decode())
-                self._put_payload(payload, keys, workflow)
-            except Exception as exn:
-                logging.exception(
-                    f"Failed processing instance error payload:",
-                    exc_info=exn,
-                )
-                self.etcd.put(keys.result, incoming_data)
-                self.etcd.put(keys.content_type, 'application/octet-stream')
+        # The state change and the error payload land in a single transaction.
+        failed, prior_state = try_transition_state(
+            self.etcd, state_key, good_states, fail_state, puts=puts,
+        )
+        if failed:
+            self._erase_token_pools(timer_pool_id)
             if workflow.process.properties.is_recoverable:
-                self.etcd.replace(state_key, BStates.STOPPING, BStates.STOPPED)
+                try_transition_state(self.etcd, state_key, [BStates.STOPPING], BStates.STOPPED)
+        elif prior_state is not None:
+            logging.info(f'Not failing {flow_id}; {state_key} is {prior_state}.')
         return 'Another happy landing (https://i.gifer.com/PNk.gif)'
 
+    async def fail_batch_route(self):
+        """Batched fail_route(). The body is a JSON list of failure records, each
+        holding the headers and payload of one /instancefail request (see
+        flowlib.failure_reporter). The whole batch is applied in a handful of
+        grouped etcd transactions.
+        """
+        try:
+            async with timeout(TIMEOUT_SECONDS):
+                records = decode_failures(await request.data)
+        except asyncio.exceptions.TimeoutError as exn:
+            logging.exception("Timed out waiting for a batch of instance failures.", exc_info=exn)
+            return jsonify(flow_result(-1, "Could not load promised data.")), 400
+        except Exception as exn:
+            logging.exception("Failed decoding a batch of instance failures.", exc_info=exn)
+            return jsonify(flow_result(-1, "Expected a list of failure records.")), 400
+        results = await asyncio.get_event_loop().run_in_executor(
+            get_executor(), self._fail_instances, records,
+        )
+        return jsonify(flow_result(0, "Ok.", results=results))
+
+    def _fail_instances(self, records):
+        """Moves every instance named in records to its failure state and saves
+        its error payload. Returns one result dict per record.
+        """
+        results = [None] * len(records)
+        workflows = {}
+        pending = {}    # flow id -> (index, workflow, timer pool id)
+        transitions = []
+        good_states = {BStates.STARTING, BStates.RUNNING}
+        for index, (headers, payload) in enumerate(records):
+            headers = {key.lower(): value for key, value in headers.items()}
+            flow_id = headers.get(Headers.X_HEADER_FLOW_ID.lower())
+            wf_id = headers.get(Headers.X_HEADER_WORKFLOW_ID.lower())
+            if flow_id is None or wf_id is None:
+                results[index] = {'id': flow_id, 'failed': False, 'message': "Didn't provide workflow headers"}
+                continue
+            if flow_id in pending:
+                # the first failure of an instance is the one that sticks.
+                results[index] = {'id': flow_id, 'failed': False, 'message': 'Duplicate'}
+                continue
+            if wf_id not in workflows:
+                try:
+                    workflows[wf_id] = Workflow.from_id(wf_id)
+                except Exception as exn:
+                    logging.exception(f'Could not load workflow {wf_id}', exc_info=exn)
+                    workflows[wf_id] = None
+            workflow = workflows[wf_id]
+            if workflow is None:
+                results[index] = {'id': flow_id, 'failed': False, 'message': f'Unknown workflow {wf_id}'}
+                continue
+            keys = WorkflowInstanceKeys(flow_id)
+            try:
+                puts = self._payload_puts(payload, keys, workflow)
+            except Exception as exn:
+                logging.exception("Failed processing instance error payload:", exc_info=exn)
+                puts = {
+                    keys.result: json.dumps(payload),
+                    keys.content_type: 'application/json',
+                }
+            fail_state = BStates.STOPPING if workflow.process.properties.is_recoverable else BStates.ERROR
+            pending[flow_id] = (index, workflow, headers.get(Headers.X_HEADER_TOKEN_POOL_ID.lower()))
+            transitions.append((keys.state, good_states, fail_state, puts))
+
+        pools = []
+        stopping = []
+        outcomes = try_transition_states(self.etcd, transitions)
+        for (flow_id, (index, workflow, timer_pool_id)), (failed, prior_state) in zip(pending.items(), outcomes):
+            results[index] = {'id': flow_id, 'failed': failed}
+            if failed:
+                if timer_pool_id is not None:
+                    pools.extend(timer_pool_id.split(','))
+                if workflow.process.properties.is_recoverable:
+                    stopping.append(
+                        (WorkflowInstanceKeys.state_key(flow_id), [BStates.STOPPING], BStates.STOPPED, None)
+                    )
+            elif prior_state is not None:
+                logging.info(f'Not failing {flow_id}; state is {prior_state}.')
+                results[index]['message'] = f'Instance is {prior_state.decode()}'
+        if pools:
+            logging.info(f'Erasing token pools {pools}')
+            TokenPool.erase_many(pools)
+        if stopping:
+            try_transition_states(self.etcd, stopping)
+        return results
+
+    def _erase_token_pools(self, timer_pool_id):
+        if timer_pool_id is not None:
+            # if we're tracking tokens, we're not any more as the workflow instance
+            # is being failed.
+            for pool_name in timer_pool_id.split(','):
+                logging.info(f'Erasing token pool {pool_name}')
+                TokenPool.erase(pool_name)
+
     def wf_map(self):
         """Get a map from workflow ID's to workflow deployment ID's.
 
         Note that this mapping does not assume the workflow ID is "baked" into
         the workflow deployment ID, which it presently is.
         """
-        etcd = get_etcd(is_not_none=True)
+        workflow_states = get_mirror(WorkflowKeys.ROOT).get_dict(
+            WorkflowKeys.ROOT, keys={'state'},
+            value_transformer=lambda bstr: bstr.decode('utf-8'),
+        )
         wf_map = {}
-        for workflow in get_workflows():
-            if etcd.get(workflow.keys.state)[0] == BStates.RUNNING:
+        for workflow_did, workflow_keys in workflow_states.items():
+            if workflow_keys.get('state') == States.RUNNING:
+                workflow = Workflow.from_id(workflow_did)
                 wf_id = workflow.process.xmldict['@id']
                 if wf_id not in wf_map:
                     wf_map[wf_id] = []
@@ -195,22 +321,24 @@ class FlowApp(QuartApp):
                 })
         return flow_result(0, 'Ok', wf_map=wf_map)
 
-    def _put_payload(self, payload: dict, keys: WorkflowInstanceKeys, workflow: Workflow):
-        """Accepts incoming JSON and saves the error payload. Error data from Envoy
-        looks slightly different than error data from flowpost(), simply because
+    def _payload_puts(self, payload: dict, keys: WorkflowInstanceKeys, workflow: Workflow):
+        """Accepts incoming JSON and returns the etcd puts that save the error
+        payload. Error data from Envoy looks slightly different than error data
+        from flowpost(), simply because
         it's harder to manipulate data within the confines of the Envoy codebase.
-        Therefore, we have a separate helper method _put_payload_from_envoy() that
-        cleans up and stores the data. If the `from_flowpost` key is in the result,
+        Therefore, we have a separate helper method _payload_puts_from_envoy() that
+        cleans up the data. If the `from_flowpost` key is in the result,
         we don't use that helper; otherwise, we know the data came from Envoy, and we
         do use the helper.
         """
         if payload.get('from_envoy', True):
-            self._put_payload_from_envoy(payload, keys, workflow)
-        else:
-            self.etcd.put(keys.result, json.dumps(payload))
-            self.etcd.put(keys.content_type, 'application/json')
+            return self._payload_puts_from_envoy(payload, keys, workflow)
+        return {
+            keys.result: json.dumps(payload),
+            keys.content_type: 'application/json',
+        }
 
-    def _put_payload_from_envoy(
+    def _payload_puts_from_envoy(
         self, payload: dict, keys: WorkflowInstanceKeys, workflow: Workflow
     ):
         """Take all of the incoming data from envoy and make it as close to JSON as we
@@ -230,7 +358,7 @@ class FlowApp(QuartApp):
         If we can successfully decode into a string, we then check if content-type is json,
         and if so, we make it a dict.
 
-        Finally, after processing, we dump the whole dict into the `result` key, and
+        Finally, after processing, the whole dict goes into the `result` key, and
         since we're putting a `json.dumps()` into the `result` key, we put `application/json`
         into the `content-type` key so that consumers of the result payload may know how
         to process the data.
@@ -264,5 +392,7 @@ class FlowApp(QuartApp):
         if 'output_data_encoded' in payload:
             result['output_data'] = process_data(payload['output_data_encoded'], output_is_json)
 
-        self.etcd.put(keys.result, json.dumps(result))
-        self.etcd.put(keys.content_type, 'application/json')
+        return {
+            keys.result: json.dumps(result),
+            keys.content_type: 'application/json',
+        }
@@ -1,33 +1,45 @@
 from flowlib import flow_pb2_grpc
 
-from .handlers import handler_dispatch
+from .dispatch import RpcDispatcher, get_dispatcher
 
 
 class Flow(flow_pb2_grpc.FlowDaemon):
+    '''Each RPC runs its handler through an RpcDispatcher, so that none of
+    them blocks the event loop.
+    '''
+    def __init__(self, dispatcher: RpcDispatcher = None):
+        self.dispatcher = dispatcher if dispatcher is not None else get_dispatcher()
 
-    def ApplyWorkflow(self, request, context):
-        return handler_dispatch('apply', request, context)
+    async def ApplyWorkflow(self, request, context):
+        return await self.dispatcher.dispatch('apply', request, context)
 
-    def DeleteWorkflow(self, request, context):
-        return handler_dispatch('delete', request, context)
+    async def DeleteWorkflow(self, request, context):
+        return await self.dispatcher.dispatch('delete', request, context)
 
-    def ProbeWorkflow(self, request, context):
-        return handler_dispatch('probe', request, context)
+    async def PSQueryStream(self, request, context):
+        async for page in self.dispatcher.dispatch_stream('ps', request, context):
+            yield page
 
-    def PSQuery(self, request, context):
-        return handler_dispatch('ps', request, context)
+    async def ProbeWorkflow(self, request, context):
+        return await self.dispatcher.dispatch('probe', request, context)
 
-    def RunWorkflow(self, request, context):
-        return handler_dispatch('run', request, context)
+    async def PSQuery(self, request, context):
+        return await self.dispatcher.dispatch('ps', request, context)
 
-    def StartWorkflow(self, request, context):
-        return handler_dispatch('start', request, context)
+    async def RunWorkflow(self, request, context):
+        return await self.dispatcher.dispatch('run', request, context)
 
-    def StopWorkflow(self, request, context):
-        return handler_dispatch('stop', request, context)
+    async def RunWorkflowBatch(self, request, context):
+        return await self.dispatcher.dispatch('run_batch', request, context)
 
-    def UpdateWorkflow(self, request, context):
-        return handler_dispatch('update', request, context)
+    async def StartWorkflow(self, request, context):
+        return await self.dispatcher.dispatch('start', request, context)
 
-    def ValidateWorkflow(self, request, context):
-        return handler_dispatch('validate', request, context)
+    async def StopWorkflow(self, request, context):
+        return await self.dispatcher.dispatch('stop', request, context)
+
+    async def UpdateWorkflow(self, request, context):
+        return await self.dispatcher.dispatch('update', request, context)
+
+    async def ValidateWorkflow(self, request, context):
+        return await self.dispatcher.dispatch('validate', request, context)
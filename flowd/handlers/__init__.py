@@ -3,7 +3,7 @@ import logging
 
 from flowlib import flow_pb2
 
-from . import handle_apply, handle_delete, handle_probe, handle_ps, handle_run, handle_start, handle_stop, handle_update, handle_validate  # noqa
+from . import handle_apply, handle_delete, handle_probe, handle_ps, handle_run, handle_run_batch, handle_start, handle_stop, handle_update, handle_validate  # noqa
 
 
 def handler_dispatch(command, request, context):
@@ -25,3 +25,12 @@ def handler_dispatch(command, request, context):
     return flow_pb2.FlowdResult(
         status=0, message='Ok', data=json.dumps(internal_response)
     )
+
+
+def stream_dispatch(command, request, context):
+    """Server-streaming counterpart of handler_dispatch(): returns the iterator
+    of messages produced by handle_<command>.stream_handler(request), which
+    reports its own errors in-band.
+    """
+    logging.info(f'Received {request} in {context}.')
+    return globals()[f'handle_{command}'].stream_handler(request)
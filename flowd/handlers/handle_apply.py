@@ -45,7 +45,16 @@ def handler(request):
         msg = f"Failed to compile provided bpmn diagram: {exc_info[0]} {exc_info[1]}"
         return flow_result(-1, msg)
 
-    etcd.put(workflow_obj.keys.proc, process.to_xml())
+    # The compiled record goes in with the XML, so readers always find both
+    # at the same revision.
+    etcd.transaction(
+        compare=[],
+        success=[
+            etcd.transactions.put(workflow_obj.keys.compiled, process.to_compiled_json()),
+            etcd.transactions.put(workflow_obj.keys.proc, process.to_xml()),
+        ],
+        failure=[],
+    )
     if request.stopped:
         if not etcd.put_if_not_exists(workflow_obj.keys.state, States.STOPPED):
             logging.error(f'{workflow_obj.keys.state} already defined in etcd!')
@@ -54,5 +63,5 @@ def handler(request):
         for user_task in process.user_tasks:
             if user_task.field_desc:
                 etcd.put(WorkflowKeys.field_key(process.id, user_task.id), json.dumps(user_task.field_desc))
-        workflow_obj.start()
+        result['kubernetes'] = workflow_obj.start()
     return result
@@ -1,7 +1,12 @@
+import json
 import logging
 
+from etcd3 import utils as etcd3_utils
+
 from flowlib import flow_pb2
+from flowlib.instance_index import delete_ops
 from flowlib.etcd_utils import get_etcd, get_keys_from_prefix, EtcdDict
+from flowlib.spec_cache import get_spec_cache
 from flowlib.constants import BStates, WorkflowKeys, WorkflowInstanceKeys
 from flowlib.workflow import Workflow
 
@@ -39,13 +44,16 @@ def handler(request: flow_pb2.DeleteRequest):
             # on the deployment?
             else:
                 wf = Workflow.from_id(workflow_id)
-                wf.remove()
+                report = wf.remove()
+                # Only local copies of the specs go; S3 keeps the specs the
+                # deployment was applied with.
+                get_spec_cache().invalidate(wf.process.id)
                 # FIXME: Should deleting a workflow also delete all workflow
                 # instance history as well?
                 if etcd.delete_prefix(prefix):
                     message = f'Successfully deleted {workflow_id}.'
                     logging.info(message)
-                    result[workflow_id] = dict(result=0, message=message)
+                    result[workflow_id] = dict(result=0, message=message, kubernetes=report)
                 else:
                     message = f'Failed to fully remove {workflow_id} from the backing store.'
                     logging.error(message)
@@ -68,7 +76,7 @@ def handler(request: flow_pb2.DeleteRequest):
                     'COMPLETED, ERROR, or STOPPED state.'
                 logging.warn(message)
                 result[instance_id] = dict(result=-2, message=message)
-            elif etcd.delete_prefix(prefix):
+            elif _delete_instance(etcd, instance_id, prefix, instance_state):
                 message = f'Successfully deleted {instance_id}.'
                 logging.info(message)
                 result[instance_id] = dict(result=0, message=message)
@@ -79,3 +87,24 @@ def handler(request: flow_pb2.DeleteRequest):
     else:
         raise ValueError(f'Unknown delete request kind ({request_kind})!')
     return result
+
+
+def _delete_instance(etcd, instance_id, prefix, instance_state):
+    '''Deletes an instance's keys and its index entries in one transaction.
+    Returns:
+        True if any keys were deleted.
+    '''
+    metadata = etcd.get(WorkflowInstanceKeys.metadata_key(instance_id))[0]
+    try:
+        metadata = json.loads(metadata) if metadata else None
+    except ValueError:
+        metadata = None
+    txns = etcd.transactions
+    prefix = prefix.encode()
+    _, responses = etcd.transaction(
+        compare=[],
+        success=[txns.delete(prefix, range_end=etcd3_utils.increment_last_byte(prefix))]
+            + delete_ops(txns, instance_id, instance_state, metadata if isinstance(metadata, dict) else None),
+        failure=[],
+    )
+    return responses[0].response_delete_range.deleted > 0
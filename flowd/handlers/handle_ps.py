@@ -1,22 +1,130 @@
+import base64
 from io import StringIO
 import json
 import logging
-from typing import Mapping, Optional
+from typing import Iterator, Mapping, Optional
 
 from flowlib import flow_pb2
 from flowlib import etcd_utils
+from flowlib import instance_index
+from flowlib.config import PS_PAGE_SIZE
 from flowlib.constants import WorkflowKeys, WorkflowInstanceKeys, States
 from flowlib.workflow import Workflow
 from flowlib.ingress_utils import get_host_dict
 
 
+def format_instance(result):
+    '''Turns the nested dict of an instance's keys into what ps reports.'''
+    if 'state' in result and result['state'] in [States.ERROR, States.STOPPED] and 'content_type' in result \
+            and result['content_type'] == 'application/json' and 'result' in result:
+        # Then the result *should* be a JSON-loadable item. If so,
+        # we load it and splat it.
+        try:
+            splat_result = json.loads(result['result'])
+            del result['result']
+            splat_result.update(result)
+            result = splat_result
+        except Exception as exn:
+            logging.exception('unexpected error loading json of error instance:', exc_info=exn)
+    if 'metadata' in result:
+        result.update(metadata=json.loads(result['metadata']))
+    return result
+
+
+def encode_page_token(instance_id):
+    return base64.urlsafe_b64encode(json.dumps({'after': instance_id}).encode()).decode()
+
+
+def decode_page_token(token):
+    return json.loads(base64.urlsafe_b64decode(token.encode()))['after']
+
+
+def iter_instance_keys(etcd, prefix, start=None):
+    '''Reads the instance keyspace under prefix in pages, and yields each
+    instance's keys together, as (instance_id, [(sub_key, value), ...]).
+    '''
+    root = WorkflowInstanceKeys.ROOT + '/'
+    instance_id, items = None, []
+    for value, metadata in etcd_utils.iter_prefix(etcd, prefix, start=start):
+        key_iid, _, sub_key = metadata.key.decode('utf-8')[len(root):].partition('/')
+        if key_iid != instance_id:
+            if items:
+                yield instance_id, items
+            instance_id, items = key_iid, []
+        items.append((sub_key, value))
+    if items:
+        yield instance_id, items
+
+
+def stream_instances(etcd, request) -> Iterator[flow_pb2.PSPage]:
+    '''Yields the instances matching a PSStreamRequest a page at a time,
+    without ever holding more than a page of them.
+    '''
+    page_size = request.page_size or PS_PAGE_SIZE
+    states = set(request.states)
+    fields = set(request.fields)
+    metadata = {obj.key: obj.value for obj in request.metadata}
+    after = decode_page_token(request.page_token) if request.page_token else None
+    if (states or metadata) and instance_index.is_ready(etcd):
+        # Only the instances the index names are read; they are still
+        # checked against the filters below.
+        candidates = instance_index.find_instances(
+            etcd, states, metadata, request.workflow_id_prefix, after,
+        )
+        instances = instance_index.read_instances(etcd, candidates)
+    else:
+        prefix = f'{WorkflowInstanceKeys.ROOT}/{request.workflow_id_prefix}'
+        start = None
+        if after is not None:
+            # '0' sorts right after '/', so this skips the whole subtree of the
+            # last instance sent.
+            start = max(prefix, WorkflowInstanceKeys.key_of(after) + '0')
+        instances = iter_instance_keys(etcd, prefix, start)
+    page = {}
+    sent = 0
+    for instance_id, items in instances:
+        values = dict(items)
+        if states and values.get('state', b'').decode('utf-8') not in states:
+            continue
+        if metadata:
+            instance_md = json.loads(values.get('metadata', b'{}'))
+            if not all(instance_md.get(key) == value for key, value in metadata.items()):
+                continue
+        if fields:
+            items = [(key, value) for key, value in items if key.split('/')[0] in fields]
+        page[instance_id] = format_instance(etcd_utils.nest_items(
+            items, '', value_transformer=lambda bstr: bstr.decode('utf-8'),
+        ))
+        sent += 1
+        if sent == request.limit:
+            break
+        if len(page) == page_size:
+            yield flow_pb2.PSPage(
+                status=0, message='Ok', data=json.dumps(page),
+                next_page_token=encode_page_token(instance_id),
+            )
+            page = {}
+    else:
+        yield flow_pb2.PSPage(status=0, message='Ok', data=json.dumps(page))
+        return
+    # stopped at the limit
+    yield flow_pb2.PSPage(
+        status=0, message='Ok', data=json.dumps(page),
+        next_page_token=encode_page_token(instance_id),
+    )
+
+
 class PSHandlers:
     def __init__(self):
         self.etcd = etcd_utils.get_etcd(is_not_none=True)
+        # ps is served from watch-fed mirrors of the workflow and instance
+        # keyspaces; handler() syncs the relevant mirror once per request.
+        self.workflows = etcd_utils.get_mirror(WorkflowKeys.ROOT)
+        self.instances = etcd_utils.get_mirror(WorkflowInstanceKeys.ROOT)
 
     def handle_single_deployment(self, deployment_id, include_kubernetes):
         keys = {'state'}
-        response = etcd_utils.get_dict_from_prefix(
+        response = self.workflows.get_dict(
             WorkflowKeys.key_of(deployment_id),
             keys=keys,
             value_transformer=lambda bstr: bstr.decode('utf-8')
@@ -27,7 +135,7 @@ class PSHandlers:
         if include_kubernetes:
             # get the kubernetes spec. Can't directly query S3 because not all
             # flowd deployments will have access to s3. Therefore, we get the
-            # cached value if cached, else recompute from scratch.
+            # value from the spec cache, which only recomputes it on a miss.
             k8s_specs_stream = StringIO()
             wf.process.to_istio(stream=k8s_specs_stream)
             response['k8s_specs'] = k8s_specs_stream.getvalue()
@@ -47,31 +155,14 @@ class PSHandlers:
         return result
 
     def handle_all_deployments(self, include_kubernetes):
-        all_ids = set(
-            key.split('/')[3]
-            for key in etcd_utils.get_keys_from_prefix(WorkflowKeys.ROOT)
-        )
+        all_ids = self.workflows.get_next_level(WorkflowKeys.ROOT)
         return self.handle_some_deployments(all_ids, include_kubernetes)
 
     def handle_single_instance(self, instance_id):
-        result = etcd_utils.get_dict_from_prefix(
+        return format_instance(self.instances.get_dict(
             WorkflowInstanceKeys.key_of(instance_id),
             value_transformer=lambda bstr: bstr.decode('utf-8')
-        )
-        if 'state' in result and result['state'] in [States.ERROR, States.STOPPED] and 'content_type' in result \
-                and result['content_type'] == 'application/json':
-            # Then the result *should* be a JSON-loadable item. If so,
-            # we load it and splat it.
-            try:
-                splat_result = json.loads(result['result'])
-                del result['result']
-                splat_result.update(result)
-                result = splat_result
-            except Exception as exn:
-                logging.exception('unexpected error loading json of error instance:', exc_info=exn)
-        if 'metadata' in result:
-            result.update(metadata=json.loads(result['metadata']))
-        return result
+        ))
 
     def handle_some_instances(self, ids, metadata: Optional[Mapping[str, str]]=None):
         result = dict()
@@ -89,10 +180,11 @@ class PSHandlers:
 
 
     def handle_all_instances(self, metadata=None):
-        all_ids = set(
-            key.split('/')[3]
-            for key in etcd_utils.get_keys_from_prefix(WorkflowInstanceKeys.ROOT)
-        )
+        if metadata and instance_index.is_ready(self.etcd):
+            # handle_some_instances() checks each candidate's metadata.
+            all_ids = instance_index.find_instances(self.etcd, metadata=metadata)
+        else:
+            all_ids = self.instances.get_next_level(WorkflowInstanceKeys.ROOT)
         return self.handle_some_instances(all_ids, metadata)
 
 
@@ -101,12 +193,14 @@ def handler(request):
     handlers = PSHandlers()
     request_kind = request.kind
     if request_kind == flow_pb2.RequestKind.DEPLOYMENT:
+        handlers.workflows.sync()
         include_kubernetes = request.include_kubernetes
         if request.ids:
             result = handlers.handle_some_deployments(request.ids, include_kubernetes)
         else:
             result = handlers.handle_all_deployments(include_kubernetes)
     elif request_kind == flow_pb2.RequestKind.INSTANCE:
+        handlers.instances.sync()
         metadata = (
             {obj.key: obj.value for obj in request.metadata}
             if len(request.metadata) > 0 else None
@@ -118,3 +212,13 @@ def handler(request):
     else:
         raise ValueError(f'Unknown PS request kind ({request_kind})!')
     return result
+
+
+def stream_handler(request):
+    try:
+        yield from stream_instances(etcd_utils.get_etcd(is_not_none=True), request)
+    except Exception as exn:
+        logging.info('Traceback from unhandled exception.', exc_info=exn)
+        yield flow_pb2.PSPage(
+            status=-1, message=f'{type(exn).__name__}({",".join(str(arg) for arg in exn.args)})'
+        )
@@ -1,22 +1,20 @@
 import logging
-import json
 from flowlib import workflow
-from flowlib.etcd_utils import get_etcd, EtcdDict
+from flowlib.instance_index import put_metadata
+from flowlib.etcd_utils import get_etcd
 from flowlib.constants import BStates
 
-def handler(request):
-    workflow_id = request.workflow_id
+from ..deployment_index import get_deployment_index
+
 
+def resolve_workflow_id(workflow_id):
     # for developer convenience, attempt to find a workflow ID based on a simple substring match;
     # if the match is ambiguous (more than one), silently fall back to exact matching
-    wf_keys = []
+    return get_deployment_index().resolve(workflow_id)
 
-    for wf_key, wf_data in EtcdDict.from_root(f'/rexflow/workflows').items():
-        if workflow_id in wf_key:
-            wf_keys.append(wf_key)
 
-    if len(wf_keys) == 1:
-        workflow_id = wf_keys[0]
+def handler(request):
+    workflow_id = resolve_workflow_id(request.workflow_id)
 
     wf_deployment = workflow.Workflow.from_id(workflow_id)
     result = dict()
@@ -34,7 +32,6 @@ def handler(request):
         result = instance.start(start_event_id=request.start_event_id)
         if 'id' in result:
             iid = result['id']
-            instance = workflow.WorkflowInstance(parent=wf_deployment, id=iid)
-            metadata = json.dumps({obj.key: obj.value for obj in request.metadata})
-            etcd.put(instance.keys.metadata, metadata.encode())
+            # The metadata and its index entries land in one transaction.
+            put_metadata(etcd, [(iid, {obj.key: obj.value for obj in request.metadata})])
     return result
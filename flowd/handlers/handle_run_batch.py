@@ -0,0 +1,73 @@
+'''Starts many instances of one deployment in a single RunWorkflowBatch call.
+
+The deployment is resolved, loaded and checked once for the whole batch. The
+start events are then called concurrently, at most `parallelism` at a time,
+and the metadata of every instance that started is written in batched etcd
+transactions.
+'''
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from flowlib import workflow
+from flowlib.config import RUN_BATCH_MAX_PARALLELISM, RUN_BATCH_PARALLELISM
+from flowlib.constants import BStates, flow_result
+from flowlib.etcd_utils import get_etcd
+from flowlib.instance_index import put_metadata
+
+from .handle_run import resolve_workflow_id
+
+
+def start_instance(wf_deployment, item, default_start_event_id):
+    '''Calls the start event for one RunBatchItem.
+    Returns:
+        The item's result: a dict of status, message and, if the instance
+        started, its id.
+    '''
+    instance = workflow.WorkflowInstance(parent=wf_deployment)
+    target, error = instance.start_target(item.start_event_id or default_start_event_id)
+    if error is not None:
+        return error
+    try:
+        response = instance.call_start_event(target, item.args)
+    except Exception as exn:
+        logging.warning(f'Failed calling start event {target} of {wf_deployment.id}: {exn}')
+        return flow_result(-1, f'{type(exn).__name__}: {exn}')
+    if not response.ok:
+        return flow_result(-1, f'Start event {target} returned {response.status_code}.')
+    result = response.json()
+    if not result.get('id'):
+        return flow_result(-1, result.get('message', 'Start event did not return an instance id.'))
+    return flow_result(0, 'Ok', id=result['id'])
+
+
+def handler(request):
+    '''
+    Returns:
+        A list with one result per request item, in order.
+    '''
+    workflow_id = resolve_workflow_id(request.workflow_id)
+    wf_deployment = workflow.Workflow.from_id(workflow_id)
+    etcd = get_etcd(is_not_none=True)
+    items = list(request.items)
+
+    state = etcd.get(wf_deployment.keys.state)[0]
+    if state != BStates.RUNNING:
+        message = f'Deployment {wf_deployment.id} is not RUNNING. {state}'
+        logging.warning(message)
+        return [flow_result(-1, message) for _ in items]
+
+    parallelism = min(request.parallelism or RUN_BATCH_PARALLELISM, RUN_BATCH_MAX_PARALLELISM)
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(parallelism, len(items))), thread_name_prefix='run-batch',
+    ) as pool:
+        results = list(pool.map(
+            lambda item: start_instance(wf_deployment, item, request.start_event_id), items,
+        ))
+
+    put_metadata(etcd, [
+        (result['id'], {obj.key: obj.value for obj in item.metadata})
+        for item, result in zip(items, results) if result['status'] == 0
+    ])
+    started = sum(result['status'] == 0 for result in results)
+    logging.info(f'Started {started} of {len(items)} instances of {wf_deployment.id}.')
+    return results
@@ -12,8 +12,8 @@ def handler(request: flow_pb2.StartRequest):
         for id in request.ids:
             wf_obj = workflow.Workflow.from_id(id)
             try:
-                wf_obj.start()
-                result[id] = {'status': 0, 'message': 'Started.'}
+                report = wf_obj.start()
+                result[id] = {'status': 0, 'message': 'Started.', 'kubernetes': report}
             except Exception as exn:
                 result[id] = {'status': -1, 'message': f'Error: {exn}'}
     else:
@@ -32,6 +32,11 @@ def handler(request: flow_pb2.StopRequest):
             #     update_spec.get('component_name'),
             #     update_spec.get('component_id'),
             # )
+        elif update_spec['action'] == 'redeploy':
+            # Regenerates the deployment's specs and pushes only the k8s
+            # objects that changed.
+            wf = workflow.Workflow.from_id(update_spec['wf_id'])
+            result[f'redeploy_{wf.id}'] = wf.redeploy()
         elif update_spec['action'] == 'subscribe_to_topic':
             raise NotImplementedError("Lazy Developer Error!")
         elif update_spec['action'] == 'unsubscribe_from_topic':
@@ -2,21 +2,16 @@
 '''
 
 from collections import OrderedDict
-from io import IOBase, StringIO, BytesIO
-import functools
+from io import IOBase, StringIO
 import hashlib
 import json
 import logging
-import os
-import subprocess
 import sys
-from typing import Mapping, Set, List
+from typing import FrozenSet, Mapping, Set, List
 
-import boto3
-from botocore.exceptions import ClientError
-import yaml
 import xmltodict
 
+from . import config
 from .etcd_utils import get_etcd
 from .task import BPMNTask
 from .exclusive_gateway import BPMNXGateway
@@ -27,9 +22,22 @@ from .throw_event import BPMNThrowEvent
 from .catch_event import BPMNCatchEvent
 from .constants import WorkflowKeys, to_valid_k8s_name
 from .user_task import BPMNUserTask
+from .reliable_wf_utils import kafka_transport_topic
+from .sidecar_injector import (
+    ISTIO_VERSION,
+    REX_ISTIO_PROXY_IMAGE,
+    get_injector,
+    get_template,
+    istioctl_inject,
+    template_version,
+)
+from .spec_cache import get_spec_cache
+from .spec_writer import dump_specs
 
 from .bpmn_util import (
     HealthProperties,
+    AnnotationIndex,
+    boundary_event_table,
     iter_xmldict_for_key,
     raw_proc_to_digraph,
     BPMNComponent,
@@ -50,7 +58,6 @@ from .k8s_utils import (
 )
 from .config import (
     DO_MANUAL_INJECTION,
-    K8S_SPECS_S3_BUCKET,
     UI_BRIDGE_IMAGE,
     UI_BRIDGE_NAME,
     UI_BRIDGE_PORT,
@@ -62,14 +69,51 @@ from .config import (
 )
 
 
-ISTIO_VERSION = os.getenv('ISTIO_VERSION', '1.8.2')
-REX_ISTIO_PROXY_IMAGE = os.getenv('REX_ISTIO_PROXY_IMAGE', 'rex-proxy:1.8.2')
+# Bumped whenever the layout of BPMNProcess.to_compiled() records changes.
+# Records of any other version are ignored, and the XML is parsed instead.
+COMPILED_PROCESS_VERSION = 1
+
+# Bumped whenever the k8s specs generated for a given process change.
+SPEC_COMPILER_VERSION = 1
+
+
+def _spec_compiler() -> str:
+    '''SPEC_COMPILER_VERSION plus a digest of the configuration the specs are
+    generated from, so a flowd with other images, ports or injection
+    settings never shares cached specs with this one.
+    '''
+    settings = {name: repr(getattr(config, name)) for name in dir(config) if name.isupper()}
+    settings.update(
+        ISTIO_VERSION=ISTIO_VERSION,
+        REX_ISTIO_PROXY_IMAGE=REX_ISTIO_PROXY_IMAGE,
+        sidecar_injector=get_injector() if DO_MANUAL_INJECTION else None,
+        sidecar_template=(
+            template_version(get_template()) if DO_MANUAL_INJECTION and get_injector() == 'native' else None
+        ),
+    )
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+    return f'{SPEC_COMPILER_VERSION}.{digest}'
+
+
+SPEC_COMPILER = _spec_compiler()
 
 
 class BPMNProcess:
-    def __init__(self, process: OrderedDict):
+    def __init__(self, process: OrderedDict, compiled: Mapping = None):
+        '''Arguments:
+            process: the bpmn:process element, as parsed by xmltodict.
+            compiled: a record from to_compiled() for the same process, whose
+                pre-computed parts are used instead of deriving them again.
+        '''
         self._process = process
-        self.hash = hashlib.sha256(json.dumps(self._process).encode()).hexdigest()[:8]
+        if compiled is not None:
+            self.hash = compiled['hash']
+            self._digest = None
+            self._annotations = AnnotationIndex(process, compiled['annotations'])
+        else:
+            self._digest = hashlib.sha256(json.dumps(self._process).encode()).hexdigest()
+            self.hash = self._digest[:8]
+            self._annotations = AnnotationIndex(process)
         self.entry_points = [entry_point for entry_point in iter_xmldict_for_key(self._process, 'bpmn:startEvent')]
         assert len(self.entry_points) > 0, "Must have at least one StartEvent."
 
@@ -77,7 +121,7 @@ class BPMNProcess:
         # annotations = list(get_annotations(process, self.entry_points[0]['@id']))
         all_annotations = iter_xmldict_for_key(self._process, 'bpmn:textAnnotation')
         global_annotations = [
-            yaml.safe_load(annot['bpmn:text'].replace('\xa0', ''))
+            self._annotations.load(annot['bpmn:text'].replace('\xa0', ''))
             for annot in all_annotations
             if annot['bpmn:text'].startswith('rexflow_global_properties')
         ]
@@ -99,8 +143,21 @@ class BPMNProcess:
         self.id = self.properties.id
 
         # needed for calculation of some BPMN Components
-        self._digraph = raw_proc_to_digraph(process)
-        self._sequence_flow_table = outgoing_sequence_flow_table(process)
+        if compiled is not None:
+            self._digraph = {
+                source: set(targets) for source, targets in compiled['digraph'].items()
+            }
+            sequence_flows = {
+                sequence_flow['@id']: sequence_flow
+                for sequence_flow in iter_xmldict_for_key(process, 'bpmn:sequenceFlow')
+            }
+            self._sequence_flow_table = {
+                source: [sequence_flows[flow_id] for flow_id in flow_ids]
+                for source, flow_ids in compiled['sequence_flows'].items()
+            }
+        else:
+            self._digraph = raw_proc_to_digraph(process)
+            self._sequence_flow_table = outgoing_sequence_flow_table(process)
 
         # Maps an Id (eg. "Event_25dst7" or "Gateway_2sh38s") to a BPMNComponent Object.
         self.component_map: Mapping[str, BPMNComponent] = {}
@@ -113,29 +170,35 @@ class BPMNProcess:
         # Now, create all of the BPMN Components.
         # Start with Tasks:
         self.tasks: List[BPMNTask] = []
+        boundary_events = boundary_event_table(process)
         for task in iter_xmldict_for_key(process, 'bpmn:serviceTask'):
-            bpmn_task = BPMNTask(task, process, self.properties)
+            bpmn_task = BPMNTask(
+                task, process, self.properties, annotations=self._annotations,
+                boundary_events=boundary_events.get(task['@id'], []),
+            )
             self.tasks.append(bpmn_task)
             self.component_map[task['@id']] = bpmn_task
 
         # Exclusive Gateways (conditional)
         self.xgateways: List[BPMNXGateway] = []
         for gw in iter_xmldict_for_key(process, 'bpmn:exclusiveGateway'):
-            bpmn_gw = BPMNXGateway(gw, process, self.properties)
+            bpmn_gw = BPMNXGateway(gw, process, self.properties, annotations=self._annotations)
             self.xgateways.append(bpmn_gw)
             self.component_map[gw['@id']] = bpmn_gw
 
         # Parallel Gateways
         self.pgateways: List[BPMNParallelGateway] = []
         for gw in iter_xmldict_for_key(process, 'bpmn:parallelGateway'):
-            bpmn_gw = BPMNParallelGateway(gw, process, self.properties)
+            bpmn_gw = BPMNParallelGateway(gw, process, self.properties, annotations=self._annotations)
             self.pgateways.append(bpmn_gw)
             self.component_map[gw['@id']] = bpmn_gw
 
         # Don't forget BPMN Start Event!
         self.start_events: List[BPMNStartEvent] = []
         for entry_point in self.entry_points:
-            bpmn_start_event = BPMNStartEvent(entry_point, process, self.properties)
+            bpmn_start_event = BPMNStartEvent(
+                entry_point, process, self.properties, annotations=self._annotations,
+            )
             self.start_events.append(bpmn_start_event)
             # equivalent to:
             # self.component_map[bpmn_start_even.id] = bpmn_start_event
@@ -144,7 +207,7 @@ class BPMNProcess:
         # Don't forget BPMN End Events!
         self.end_events: List[BPMNEndEvent] = []
         for eev in iter_xmldict_for_key(process, 'bpmn:endEvent'):
-            end_event = BPMNEndEvent(eev, process, self.properties)
+            end_event = BPMNEndEvent(eev, process, self.properties, annotations=self._annotations)
             self.end_events.append(end_event)
             self.component_map[eev['@id']] = end_event
 
@@ -152,13 +215,13 @@ class BPMNProcess:
         self.throws: List[BPMNThrowEvent] = []
         for event in iter_xmldict_for_key(process, 'bpmn:intermediateThrowEvent'):
             assert 'bpmn:incoming' in event, "Must have incoming edge to Throw Event."
-            bpmn_throw = BPMNThrowEvent(event, process, self.properties)
+            bpmn_throw = BPMNThrowEvent(event, process, self.properties, annotations=self._annotations)
             self.throws.append(bpmn_throw)
             self.component_map[event['@id']] = bpmn_throw
 
         self.catches: List[BPMNCatchEvent] = []
         for event in iter_xmldict_for_key(process, 'bpmn:intermediateCatchEvent'):
-            bpmn_catch = BPMNCatchEvent(event, process, self.properties)
+            bpmn_catch = BPMNCatchEvent(event, process, self.properties, annotations=self._annotations)
             self.catches.append(bpmn_catch)
             self.component_map[event['@id']] = bpmn_catch
 
@@ -193,7 +256,7 @@ class BPMNProcess:
         for defn in self.user_task_definitions:
             bpmn_user_task = BPMNUserTask(
                 defn, process, self.properties, self._ui_bridge_service_properties,
-                self._ui_bridge_call_properties,
+                self._ui_bridge_call_properties, annotations=self._annotations,
             )
             self.user_tasks.append(bpmn_user_task)
             self.component_map[defn['@id']] = bpmn_user_task
@@ -215,43 +278,95 @@ class BPMNProcess:
                 assert False, f"Name {component.name} used twice! Not allowed."
             all_names.add(component.name)
 
-        self._s3_bucket = None
-        if K8S_SPECS_S3_BUCKET is not None:
-            s3 = boto3.resource('s3')
-            self._s3_bucket = s3.Bucket(K8S_SPECS_S3_BUCKET)
-        else:
-            logging.info("Not setting up s3 bucket for k8s specs: no bucket configured.")
+        self._kafka_topics = None
 
     @property
-    def kafka_topics(self):
-        # Note: some kafka topics can only be determined at compile-time (i.e. when
-        # to_kubernetes() is called) because they are dependent on the properties
-        # of the edge between two nodes in the DAG. Therefore, we must refresh
-        # the kafka_topics of the workflow.
-        kafka_topics = []
+    def kafka_topics(self) -> FrozenSet[str]:
+        '''Every kafka topic the workflow needs: those its events listen and
+        publish on, one per kafka-transport edge, and the notification topic.
+        Worked out on first use and cached, without generating any k8s specs.
+        '''
+        if self._kafka_topics is None:
+            self._kafka_topics = frozenset(self._compile_kafka_topics())
+        return self._kafka_topics
+
+    def _compile_kafka_topics(self) -> Set[str]:
+        # Some topics depend on the edge between two components rather than on
+        # either one, so they are only known once the whole process is built.
+        kafka_topics = set()
         for component in self.all_components:
-            # to_kubernetes() doesn't create any k8s resources; rather, it just
-            # returns the specs AND updates the underlying BPMNComponent.kafka_topics
-            # list.
-            component.to_kubernetes(
-                self.properties.id_hash,
-                self.component_map,
-                self._digraph,
-                self._sequence_flow_table
-            )
-            kafka_topics.extend(component.kafka_topics)
+            kafka_topics.update(component.kafka_topics)
+            for target_id in component.kafka_transport_targets(self._sequence_flow_table):
+                kafka_topics.add(kafka_transport_topic(component, self.component_map[target_id]))
         if self.properties.notification_kafka_topic:
-            kafka_topics.append(self.properties.notification_kafka_topic)
-        return set(kafka_topics)
+            kafka_topics.add(self.properties.notification_kafka_topic)
+        return kafka_topics
+
+    @property
+    def digest(self) -> str:
+        '''SHA-256 of the process, of which hash is the first 8 digits.'''
+        if self._digest is None:
+            self._digest = hashlib.sha256(json.dumps(self._process).encode()).hexdigest()
+        return self._digest
+
+    def spec_key(self, id_hash: str = None, **kws) -> str:
+        '''Key of the specs to_istio(id_hash=id_hash, **kws) generates, in
+        flowlib.spec_cache: a digest of the process, the arguments and the
+        SPEC_COMPILER that generates them.
+        '''
+        key = [SPEC_COMPILER, self.digest, self.id, id_hash, sorted(kws.items())]
+        return hashlib.sha256(json.dumps(key, default=repr).encode()).hexdigest()
 
     @classmethod
     def from_workflow_id(cls, workflow_id):
         etcd = get_etcd(is_not_none=True)
+        compiled = etcd.get(WorkflowKeys.compiled_key(workflow_id))[0]
+        if compiled is not None:
+            try:
+                return cls.from_compiled(json.loads(compiled))
+            except ValueError as exn:
+                logging.warning(f'Ignoring compiled process of {workflow_id}: {exn}')
         process_xml = etcd.get(WorkflowKeys.proc_key(workflow_id))[0]
         process_dict = xmltodict.parse(process_xml)['bpmn:process']
         process = cls(process_dict)
         return process
 
+    @classmethod
+    def from_compiled(cls, record: Mapping):
+        '''Build a BPMNProcess from a to_compiled() record, without parsing
+        any XML or YAML.
+        Raises:
+            ValueError if the record is of another version.
+        '''
+        version = record.get('version')
+        if version != COMPILED_PROCESS_VERSION:
+            raise ValueError(
+                f'compiled process version {version} is not {COMPILED_PROCESS_VERSION}'
+            )
+        return cls(record['process'], compiled=record)
+
+    def to_compiled(self) -> dict:
+        '''A JSON-serializable record of this process, stored by flowd at
+        WorkflowKeys.compiled_key next to the XML: the process tree, with the
+        YAML of its annotations already parsed, its digraph and its sequence
+        flow table (by flow id). The workflow properties and components are
+        rebuilt from these on load, which takes only dictionary lookups.
+        '''
+        return {
+            'version': COMPILED_PROCESS_VERSION,
+            'hash': self.hash,
+            'process': self._process,
+            'annotations': self._annotations.to_record(),
+            'digraph': {source: sorted(targets) for source, targets in self._digraph.items()},
+            'sequence_flows': {
+                source: [sequence_flow['@id'] for sequence_flow in sequence_flows]
+                for source, sequence_flows in self._sequence_flow_table.items()
+            },
+        }
+
+    def to_compiled_json(self) -> str:
+        return json.dumps(self.to_compiled(), separators=(',', ':'))
+
     def to_xml(self):
         return xmltodict.unparse(OrderedDict([('bpmn:process', self._process)]))
 
@@ -287,26 +402,6 @@ class BPMNProcess:
         # No longer used
         raise NotImplementedError("REXFlow requires Istio.")
 
-    def _save_specs_to_s3(self, specs, key):
-        if not self._s3_bucket:
-            logging.info("Not saving k8s specs to S3: No configured bucket.")
-            return
-        self._s3_bucket.upload_fileobj(BytesIO(specs.encode()), key)
-        logging.info(f"Successfully saved k8s specs to S3 at {key}.")
-
-    def _get_specs_from_s3(self, key):
-        if not self._s3_bucket:
-            logging.info("Not getting k8s specs from S3: No configured bucket.")
-            return None
-        fileobj = BytesIO()
-        try:
-            self._s3_bucket.download_fileobj(key, fileobj)
-            logging.info(f"Getting k8s specs from S3 at {key}.")
-            return fileobj.getvalue().decode()
-        except ClientError:
-            logging.info(f"Unable to download s3 object for {key}.")
-            return None
-
     def to_istio(self, stream: IOBase = None, id_hash: str = None, **kws):
         if stream is None:
             stream = sys.stdout
@@ -315,16 +410,18 @@ class BPMNProcess:
             stream.write(result)
         return result
 
-    @functools.lru_cache
     def to_istio_helper(self, id_hash, **kws):
-        # First, check if the input has been cached in s3. If so, then we retrieve and
-        # do NOT recompute. This is critical so that we can update versions of flowd
-        # without worrying about version conflicts.
-        keys_obj = WorkflowKeys(self.properties.id)
-        cached_result = self._get_specs_from_s3(keys_obj.specs)
-        if cached_result:
-            return cached_result
+        # Specs are only generated if no tier of the spec cache has them. Its
+        # S3 tier holds the specs each deployment was applied with, which are
+        # served even if this flowd would generate different ones. This is
+        # critical so that we can update versions of flowd without worrying
+        # about version conflicts.
+        return get_spec_cache().get_or_compile(
+            self.id, self.spec_key(id_hash, **kws),
+            lambda: self._generate_istio_specs(id_hash, **kws),
+        )
 
+    def _generate_istio_specs(self, id_hash, **kws):
         results = []
         if not self.namespace_shared:
             results.append(
@@ -422,28 +519,9 @@ class BPMNProcess:
         # On a true deployment (where we set imagePullSecrets), we
         # could easily tell Istio to automatically inject our own custom
         # proxy image, and thus remove the code below.
-        temp_yaml = yaml.safe_dump_all(results, **kws)
-        if not DO_MANUAL_INJECTION:
-            self._save_specs_to_s3(temp_yaml, keys_obj.specs)
-            return temp_yaml
-
-        istioctl_result = subprocess.run(
-            ['istioctl', 'kube-inject', '-f', '-'],
-            input=temp_yaml, capture_output=True, text=True,
-        )
-
-        result = None
-
-        if istioctl_result.returncode == 0:
-            result = istioctl_result.stdout.replace(
-                ': Always',
-                ': IfNotPresent',
-            ).replace(f'docker.io/istio/proxyv2:{ISTIO_VERSION}', REX_ISTIO_PROXY_IMAGE)
-            self._save_specs_to_s3(result, keys_obj.specs)
-        else:
-            logging.error(f'Error from Istio:\n{istioctl_result.stderr}')
-
-        return result
+        if DO_MANUAL_INJECTION and get_injector() == 'istioctl':
+            return istioctl_inject(dump_specs(results, **kws))
+        return dump_specs(results, get_template() if DO_MANUAL_INJECTION else None, **kws)
 
     def _get_workflow_publisher_specs(self):
         results = []
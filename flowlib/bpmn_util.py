@@ -13,6 +13,7 @@ from flowlib.constants import (
     to_valid_k8s_name,
 )
 from flowlib.timer_util import TimedEventManager, ValidationResults, TimerRecoveryPolicy
+from flowlib.retry_policy import RetryPolicy
 from flowlib.config import (
     DEFAULT_NOTIFICATION_KAFKA_TOPIC,
     DEFAULT_USE_CLOSURE_TRANSPORT,
@@ -77,11 +78,76 @@ def outgoing_sequence_flow_table(proc: OrderedDict):
     return outflows
 
 
-def get_annotations(process: OrderedDict, source_ref=None):
+def boundary_event_table(proc: OrderedDict):
+    '''Takes in an OrderedDict (just the BPMN Process).
+    Returns a dict mapping from a BPMN Component ID to a List of the boundary
+    events attached to that component.
+    '''
+    attached = {}
+    for boundary_event in iter_xmldict_for_key(proc, 'bpmn:boundaryEvent'):
+        attached.setdefault(boundary_event['@attachedToRef'], []).append(boundary_event)
+    return attached
+
+
+class AnnotationIndex:
+    '''The REXFlow annotations of one BPMN process, indexed by the id of the
+    component each is associated with, so that looking up a component's
+    annotations does not rescan the whole process. BPMNProcess builds one and
+    hands it to every component it constructs.
+
+    Also parses each YAML text (annotations and documentation) at most once.
+    A compiled process record carries the texts already parsed, so a process
+    loaded from one never touches YAML.
+    '''
+    def __init__(self, process: OrderedDict = None, parsed: Mapping[str, Any] = None):
+        self._parsed = dict(parsed) if parsed else {}
+        self._by_source = {}
+        if process:
+            sources = {}  # annotation id -> ids of the components associated with it
+            for association in iter_xmldict_for_key(process, 'bpmn:association'):
+                sources.setdefault(association['@targetRef'], {})[association['@sourceRef']] = None
+            for annotation in iter_xmldict_for_key(process, 'bpmn:textAnnotation'):
+                if annotation['bpmn:text'].startswith('rexflow:'):
+                    for source_ref in sources.get(annotation['@id'], ()):
+                        self._by_source.setdefault(source_ref, []).append(annotation)
+
+    def get(self, source_ref) -> Generator[tuple, None, None]:
+        '''Yields (textAnnotation, parsed text) for each REXFlow annotation
+        associated with source_ref, in document order.
+        '''
+        for annotation in self._by_source.get(source_ref, ()):
+            yield (annotation, self.load(annotation['bpmn:text'].replace('\xa0', '')))
+
+    def load(self, text: str) -> Any:
+        try:
+            return self._parsed[text]
+        except KeyError:
+            value = self._parsed[text] = yaml.safe_load(text)
+            return value
+
+    def to_record(self) -> dict:
+        '''The parsed texts that survive a JSON round trip unchanged. Anything
+        else (dates, non-string keys) is left out and parsed again on load.
+        '''
+        record = {}
+        for text, value in self._parsed.items():
+            try:
+                if json.loads(json.dumps(value)) == value:
+                    record[text] = value
+            except (TypeError, ValueError):
+                pass
+        return record
+
+
+def get_annotations(process: OrderedDict, source_ref=None, index: AnnotationIndex = None):
     '''Takes in a BPMN process and BPMN Component ID and returns a generator.
     Yields python dictionaries containing the yaml-like REXFlow annotations
-    from the BPMN Documents.
+    from the BPMN Documents. Given the process's AnnotationIndex, looks the
+    component's annotations up rather than scanning the process.
     '''
+    if index is not None and source_ref is not None:
+        yield from index.get(source_ref)
+        return
     if source_ref is not None:
         targets = set()
         for association in iter_xmldict_for_key(process, 'bpmn:association'):
@@ -93,7 +159,7 @@ def get_annotations(process: OrderedDict, source_ref=None):
         if targets is None or annotation['@id'] in targets:
             text = annotation['bpmn:text']
             if text.startswith('rexflow:'):
-                yield (annotation,yaml.safe_load(text.replace('\xa0', '')))
+                yield (annotation, yaml.safe_load(text.replace('\xa0', '')))
 
 
 class ServiceProperties:
@@ -191,6 +257,7 @@ class CallProperties:
         self._method = None
         self._serialization = None
         self._total_attempts = None
+        self._retry = {}
 
     @property
     def path(self) -> str:
@@ -213,6 +280,14 @@ class CallProperties:
         '''
         return self._total_attempts if self._total_attempts else 2
 
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        '''
+        Returns the RetryPolicy for calls to this service: total_attempts plus the
+        optional backoff and retryable-status settings of the `retry` annotation.
+        '''
+        return RetryPolicy.from_annotation(dict(self._retry, total_attempts=self.total_attempts))
+
     def update(self, annotations: Mapping[str, Any]) -> None:
         if 'path' in annotations:
             self._path = annotations['path']
@@ -221,7 +296,8 @@ class CallProperties:
         if 'serialization' in annotations:
             self._serialization = annotations['serialization']
         if 'retry' in annotations:
-            self._total_attempts = annotations['retry']['total_attempts']
+            self._retry = dict(annotations['retry'])
+            self._total_attempts = annotations['retry'].get('total_attempts', self._total_attempts)
 
 
 class HealthProperties:
@@ -520,10 +596,14 @@ class BPMNComponent:
                  process: OrderedDict,
                  workflow_properties: WorkflowProperties,
                  default_is_preexisting: bool = False,
+                 annotations: AnnotationIndex = None,
     ):
         self.id = spec['@id']
+        self._annotation_index = annotations if annotations is not None else AnnotationIndex(process)
 
-        annotations = [a for _,a in list(get_annotations(process, self.id)) if 'rexflow' in a]
+        annotations = [
+            a for _, a in get_annotations(process, self.id, self._annotation_index) if 'rexflow' in a
+        ]
         assert len(annotations) <= 1, "Can only provide one REXFlow annotation per BPMN Component."
         if len(annotations):
             self._annotation = annotations[0]['rexflow']
@@ -617,6 +697,18 @@ class BPMNComponent:
             ]
         return []
 
+    def kafka_transport_targets(self, sequence_flow_table: Mapping[str, Any]) -> List[str]:
+        '''Returns the ids of the components that to_kubernetes() sets up
+        reliable (kafka) transport to, without generating any k8s specs.
+        Subclasses whose to_kubernetes() treats outgoing edges differently
+        override this to match.
+        '''
+        return [
+            edge['@targetRef']
+            for edge in sequence_flow_table.get(self.id, [])
+            if get_edge_transport(edge, self._global_props.transport) == 'kafka'
+        ]
+
     def to_kubernetes(self, id_hash, component_map: Mapping[str, Any],
                       digraph: Mapping[str, Set[str]], sequence_flow_table: Mapping[str, Any]) -> list:
         '''Takes in a dict which maps a BPMN component id* to a BPMNComponent Object,
@@ -7,7 +7,7 @@ from flowlib.timer_util import TimedEventManager, ValidationResults
 from typing import Mapping
 import os
 
-from .bpmn_util import BPMNComponent, WorkflowProperties, get_edge_transport
+from .bpmn_util import BPMNComponent, AnnotationIndex, WorkflowProperties, get_edge_transport
 
 from .k8s_utils import (
     create_deployment,
@@ -34,8 +34,9 @@ class BPMNCatchEvent(BPMNComponent):
     MAX_RECURRANCE = 1024
     """Wrapper for BPMN service event metadata.
     """
-    def __init__(self, event: OrderedDict, process: OrderedDict, global_props: WorkflowProperties):
-        super().__init__(event, process, global_props)
+    def __init__(self, event: OrderedDict, process: OrderedDict, global_props: WorkflowProperties,
+                 annotations: AnnotationIndex = None):
+        super().__init__(event, process, global_props, annotations=annotations)
         self._kafka_topic = None
         self._correlation = None
         self._catch_event_expiration = global_props.catch_event_expiration
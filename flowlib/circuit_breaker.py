@@ -0,0 +1,150 @@
+"""Circuit breakers for calls between BPMN components.
+
+When the target of a call is down, every instance arriving at the calling
+component would otherwise wait out the full connect and request timeouts
+(and its retries) before reporting the failure. A CircuitBreaker watches the
+outcome of recent calls to one target URL:
+
+* CLOSED - calls go through. If too many of the calls in the failure window
+  fail to reach the target, the breaker opens.
+* OPEN - calls are refused without touching the network until open_seconds
+  have passed; the caller reports the failure straight away.
+* HALF_OPEN - a limited number of trial calls go through. A success closes
+  the breaker, a failure opens it again.
+
+Breakers are shared per process through get_circuit_breaker(url).
+"""
+from enum import Enum
+import logging
+import threading
+import time
+
+from flowlib.config import (
+    CIRCUIT_FAILURE_PERCENT,
+    CIRCUIT_HALF_OPEN_CALLS,
+    CIRCUIT_MIN_CALLS,
+    CIRCUIT_OPEN_SECONDS,
+    CIRCUIT_WINDOW,
+)
+
+
+class BreakerState(Enum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_percent: float = CIRCUIT_FAILURE_PERCENT,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        window: int = CIRCUIT_WINDOW,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        half_open_calls: int = CIRCUIT_HALF_OPEN_CALLS,
+    ):
+        self.name = name
+        self._failure_ratio = failure_percent / 100
+        self._min_calls = min_calls
+        self._window = window
+        self._open_seconds = open_seconds
+        self._half_open_calls = half_open_calls
+        self._lock = threading.Lock()
+        self._state = BreakerState.CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._buckets = {}  # second -> [calls, failures]
+        self._rejected = 0
+        self._times_opened = 0
+
+    @property
+    def state(self) -> BreakerState:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> bool:
+        """Returns True if a call may be made now. Every allowed call must be
+        followed by record_success() or record_failure().
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == BreakerState.CLOSED:
+                return True
+            if state == BreakerState.HALF_OPEN and self._trials < self._half_open_calls:
+                self._trials += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == BreakerState.HALF_OPEN:
+                logging.info(f'Circuit breaker for {self.name} closed.')
+                self._state = BreakerState.CLOSED
+                self._buckets.clear()
+            self._bucket()[0] += 1
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == BreakerState.HALF_OPEN:
+                self._open()
+                return
+            bucket = self._bucket()
+            bucket[0] += 1
+            bucket[1] += 1
+            if self._state == BreakerState.CLOSED:
+                calls = sum(c for c, _ in self._buckets.values())
+                failures = sum(f for _, f in self._buckets.values())
+                if calls >= self._min_calls and failures >= calls * self._failure_ratio:
+                    self._open()
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._bucket()
+            return {
+                'state': self._current_state().value,
+                'calls': sum(c for c, _ in self._buckets.values()),
+                'failures': sum(f for _, f in self._buckets.values()),
+                'rejected': self._rejected,
+                'times_opened': self._times_opened,
+            }
+
+    def _open(self):
+        logging.warning(f'Circuit breaker for {self.name} opened.')
+        self._state = BreakerState.OPEN
+        self._opened_at = time.monotonic()
+        self._times_opened += 1
+
+    def _current_state(self) -> BreakerState:
+        if self._state == BreakerState.OPEN and \
+                time.monotonic() - self._opened_at >= self._open_seconds:
+            self._state = BreakerState.HALF_OPEN
+            self._trials = 0
+        return self._state
+
+    def _bucket(self) -> list:
+        now = int(time.monotonic())
+        for second in [s for s in self._buckets if s <= now - self._window]:
+            del self._buckets[second]
+        return self._buckets.setdefault(now, [0, 0])
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(url: str) -> CircuitBreaker:
+    """Returns the process-wide breaker for calls to url.
+    """
+    breaker = _breakers.get(url)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(url, CircuitBreaker(url))
+    return breaker
+
+
+def get_circuit_breaker_stats() -> dict:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
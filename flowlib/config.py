@@ -7,6 +7,7 @@ your system via `python -m deploy`, the defaults will be overriden.
 See the flowd deployment spec in `deploy/specs.py`.
 '''
 import os
+import tempfile
 
 DEFAULT_REXFLOW_ROOT_PREFIX = "/rexflow"
 REXFLOW_ROOT_PREFIX = os.getenv('REXFLOW_ROOT_PREFIX', DEFAULT_REXFLOW_ROOT_PREFIX)
@@ -22,6 +23,8 @@ FLOWD_URL = f"http://{FLOWD_HOST}:{FLOWD_PORT}"
 
 INSTANCE_FAIL_ENDPOINT_PATH = "/instancefail"
 INSTANCE_FAIL_ENDPOINT = f"{FLOWD_URL}{INSTANCE_FAIL_ENDPOINT_PATH}"
+INSTANCE_FAIL_BATCH_ENDPOINT_PATH = f"{INSTANCE_FAIL_ENDPOINT_PATH}/batch"
+INSTANCE_FAIL_BATCH_ENDPOINT = f"{FLOWD_URL}{INSTANCE_FAIL_BATCH_ENDPOINT_PATH}"
 
 WF_MAP_ENDPOINT_PATH = '/wf_map'
 WF_MAP_ENDPOINT = f'{FLOWD_URL}{WF_MAP_ENDPOINT_PATH}'
@@ -104,6 +107,15 @@ DEFAULT_DO_MANUAL_INJECTION = "True"
 DO_MANUAL_INJECTION = (
     os.getenv("REXFLOW_DO_MANUAL_INJECTION", DEFAULT_DO_MANUAL_INJECTION) == "True"
 )
+# How manual injection is done (see flowlib.sidecar_injector): 'istioctl'
+# pipes the specs through istioctl kube-inject, 'native' injects them
+# in-process from a template. istioctl stays the default until the native
+# injector is checked against recorded istioctl output.
+DEFAULT_SIDECAR_INJECTOR = 'istioctl'
+SIDECAR_INJECTOR = os.getenv('REXFLOW_SIDECAR_INJECTOR', DEFAULT_SIDECAR_INJECTOR)
+# YAML file of the sidecar template used for native injection; Istio's
+# default template if unset.
+SIDECAR_TEMPLATE = os.getenv('REXFLOW_SIDECAR_TEMPLATE', None)
 
 
 # ETCD Configuration
@@ -124,10 +136,158 @@ ETCD_CERT_CERT_PATH = os.getenv("REXFLOW_ETCD_CERT_CERT_PATH")
 ETCD_CERT_KEY = os.getenv("REXFLOW_ETCD_CERT_KEY")
 ETCD_CERT_KEY_PATH = os.getenv("REXFLOW_ETCD_CERT_KEY_PATH")
 
+# Maximum number of keys fetched per range request when reading a prefix.
+# Large prefixes are read in pages of this size, all at the same revision.
+# Set to 0 to read a prefix with a single unbounded request.
+DEFAULT_ETCD_RANGE_PAGE_SIZE = 1000
+ETCD_RANGE_PAGE_SIZE = int(
+    os.getenv('REXFLOW_ETCD_RANGE_PAGE_SIZE', DEFAULT_ETCD_RANGE_PAGE_SIZE)
+)
+
+# Maximum number of operations packed into one etcd transaction by bulk
+# writers.  Must not exceed the etcd server's --max-txn-ops (128 by default).
+DEFAULT_ETCD_TXN_MAX_OPS = 128
+ETCD_TXN_MAX_OPS = int(os.getenv('REXFLOW_ETCD_TXN_MAX_OPS', DEFAULT_ETCD_TXN_MAX_OPS))
+
+# Upper bound on the keys plus values held by each etcd_utils.EtcdMirror.  A
+# mirror that outgrows it drops its copy and reads through to etcd instead.
+DEFAULT_ETCD_MIRROR_MAX_BYTES = 128 * 1024 * 1024
+ETCD_MIRROR_MAX_BYTES = int(
+    os.getenv('REXFLOW_ETCD_MIRROR_MAX_BYTES', DEFAULT_ETCD_MIRROR_MAX_BYTES)
+)
+
+# Upper bound on the (estimated) memory held by the compiled workflows in
+# flowlib.workflow_cache; least recently used deployments are evicted first.
+DEFAULT_WORKFLOW_CACHE_MAX_BYTES = 64 * 1024 * 1024
+WORKFLOW_CACHE_MAX_BYTES = int(
+    os.getenv('REXFLOW_WORKFLOW_CACHE_MAX_BYTES', DEFAULT_WORKFLOW_CACHE_MAX_BYTES)
+)
+
+
+# Number of worker threads each timer_util.TimedEventManager uses to run the
+# callbacks of matured timers. Pending timers cost no threads at all.
+DEFAULT_TIMER_WORKERS = 8
+TIMER_WORKERS = int(os.getenv('REXFLOW_TIMER_WORKERS', DEFAULT_TIMER_WORKERS))
+
+
+# Keep-alive HTTP sessions used by flowlib.http_sessions (and so by FlowPost):
+# the number of upstream hosts that get a session of their own, the number of
+# idle connections kept open to each host, whether a host's connection cap is
+# hard (callers wait for a free connection) and whether connections are kept
+# alive between calls at all.
+DEFAULT_HTTP_POOL_MAX_HOSTS = 64
+HTTP_POOL_MAX_HOSTS = int(os.getenv('REXFLOW_HTTP_POOL_MAX_HOSTS', DEFAULT_HTTP_POOL_MAX_HOSTS))
+DEFAULT_HTTP_POOL_CONNECTIONS_PER_HOST = 32
+HTTP_POOL_CONNECTIONS_PER_HOST = int(
+    os.getenv('REXFLOW_HTTP_POOL_CONNECTIONS_PER_HOST', DEFAULT_HTTP_POOL_CONNECTIONS_PER_HOST)
+)
+HTTP_POOL_BLOCK = os.getenv('REXFLOW_HTTP_POOL_BLOCK', 'False').lower() == 'true'
+HTTP_POOL_KEEP_ALIVE = os.getenv('REXFLOW_HTTP_POOL_KEEP_ALIVE', 'True').lower() == 'true'
+
+
+# Retries made by flowpost.FlowPost (see flowlib.retry_policy): the backoff
+# before retry n is a random delay of up to min(BASE * 2**(n-1), MAX) seconds.
+# Retries are also capped per process to BUDGET_PERCENT of the calls made in
+# the last BUDGET_WINDOW seconds, plus BUDGET_MIN_PER_SECOND retries a second.
+DEFAULT_RETRY_BACKOFF_BASE = 0.1
+RETRY_BACKOFF_BASE = float(os.getenv('REXFLOW_RETRY_BACKOFF_BASE', DEFAULT_RETRY_BACKOFF_BASE))
+DEFAULT_RETRY_BACKOFF_MAX = 5.0
+RETRY_BACKOFF_MAX = float(os.getenv('REXFLOW_RETRY_BACKOFF_MAX', DEFAULT_RETRY_BACKOFF_MAX))
+DEFAULT_RETRY_BUDGET_PERCENT = 20.0
+RETRY_BUDGET_PERCENT = float(os.getenv('REXFLOW_RETRY_BUDGET_PERCENT', DEFAULT_RETRY_BUDGET_PERCENT))
+DEFAULT_RETRY_BUDGET_MIN_PER_SECOND = 10
+RETRY_BUDGET_MIN_PER_SECOND = float(
+    os.getenv('REXFLOW_RETRY_BUDGET_MIN_PER_SECOND', DEFAULT_RETRY_BUDGET_MIN_PER_SECOND)
+)
+DEFAULT_RETRY_BUDGET_WINDOW = 10
+RETRY_BUDGET_WINDOW = int(os.getenv('REXFLOW_RETRY_BUDGET_WINDOW', DEFAULT_RETRY_BUDGET_WINDOW))
+
+
+# Circuit breakers on calls made by flowpost.FlowPost, one per target URL (see
+# flowlib.circuit_breaker). A breaker opens when at least FAILURE_PERCENT of
+# the (at least MIN_CALLS) calls of the last WINDOW seconds failed to reach the
+# target. Calls then fail fast for OPEN_SECONDS, after which HALF_OPEN_CALLS
+# trial calls decide whether it closes again.
+DEFAULT_CIRCUIT_FAILURE_PERCENT = 50.0
+CIRCUIT_FAILURE_PERCENT = float(
+    os.getenv('REXFLOW_CIRCUIT_FAILURE_PERCENT', DEFAULT_CIRCUIT_FAILURE_PERCENT)
+)
+DEFAULT_CIRCUIT_MIN_CALLS = 10
+CIRCUIT_MIN_CALLS = int(os.getenv('REXFLOW_CIRCUIT_MIN_CALLS', DEFAULT_CIRCUIT_MIN_CALLS))
+DEFAULT_CIRCUIT_WINDOW = 30
+CIRCUIT_WINDOW = int(os.getenv('REXFLOW_CIRCUIT_WINDOW', DEFAULT_CIRCUIT_WINDOW))
+DEFAULT_CIRCUIT_OPEN_SECONDS = 15.0
+CIRCUIT_OPEN_SECONDS = float(os.getenv('REXFLOW_CIRCUIT_OPEN_SECONDS', DEFAULT_CIRCUIT_OPEN_SECONDS))
+DEFAULT_CIRCUIT_HALF_OPEN_CALLS = 1
+CIRCUIT_HALF_OPEN_CALLS = int(
+    os.getenv('REXFLOW_CIRCUIT_HALF_OPEN_CALLS', DEFAULT_CIRCUIT_HALF_OPEN_CALLS)
+)
+
+
+# Traffic shadowing (flowlib.shadowing): records wait in a queue of at most
+# QUEUE_SIZE entries (further records are dropped and counted) and are sent in
+# batches of up to BATCH_SIZE, waiting at most LINGER seconds to fill a batch.
+# On shutdown, queued records get FLUSH_TIMEOUT seconds to go out. If
+# REXFLOW_SHADOW_KAFKA_TOPIC is set (and Kafka is configured), records are
+# produced straight to that topic instead of going through the publisher.
+DEFAULT_SHADOW_QUEUE_SIZE = 10000
+SHADOW_QUEUE_SIZE = int(os.getenv('REXFLOW_SHADOW_QUEUE_SIZE', DEFAULT_SHADOW_QUEUE_SIZE))
+DEFAULT_SHADOW_BATCH_SIZE = 100
+SHADOW_BATCH_SIZE = int(os.getenv('REXFLOW_SHADOW_BATCH_SIZE', DEFAULT_SHADOW_BATCH_SIZE))
+DEFAULT_SHADOW_LINGER = 0.05
+SHADOW_LINGER = float(os.getenv('REXFLOW_SHADOW_LINGER', DEFAULT_SHADOW_LINGER))
+DEFAULT_SHADOW_FLUSH_TIMEOUT = 5.0
+SHADOW_FLUSH_TIMEOUT = float(os.getenv('REXFLOW_SHADOW_FLUSH_TIMEOUT', DEFAULT_SHADOW_FLUSH_TIMEOUT))
+SHADOW_KAFKA_TOPIC = os.getenv('REXFLOW_SHADOW_KAFKA_TOPIC', None)
+
 
 # S3 Bucket, optionally used to store k8s specs.
 K8S_SPECS_S3_BUCKET = os.getenv("REXFLOW_K8S_SPECS_S3_BUCKET", None)
 
+# Generated k8s specs are cached in flowlib.spec_cache, in memory (bounded by
+# SPEC_CACHE_MAX_BYTES) and under SPEC_CACHE_DIR on local disk (bounded by
+# SPEC_CACHE_DISK_MAX_BYTES). An empty SPEC_CACHE_DIR turns the disk tier off.
+DEFAULT_SPEC_CACHE_MAX_BYTES = 32 * 1024 * 1024
+SPEC_CACHE_MAX_BYTES = int(os.getenv('REXFLOW_SPEC_CACHE_MAX_BYTES', DEFAULT_SPEC_CACHE_MAX_BYTES))
+DEFAULT_SPEC_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'rexflow-specs')
+SPEC_CACHE_DIR = os.getenv('REXFLOW_SPEC_CACHE_DIR', DEFAULT_SPEC_CACHE_DIR) or None
+DEFAULT_SPEC_CACHE_DISK_MAX_BYTES = 256 * 1024 * 1024
+SPEC_CACHE_DISK_MAX_BYTES = int(
+    os.getenv('REXFLOW_SPEC_CACHE_DISK_MAX_BYTES', DEFAULT_SPEC_CACHE_DISK_MAX_BYTES)
+)
+
+# Lists of at least SPEC_PARALLEL_MIN_SPECS generated k8s specs are injected
+# and dumped to YAML on a pool of SPEC_WORKERS processes (see
+# flowlib.spec_writer). With 0 or 1 workers, flowd does it all itself.
+DEFAULT_SPEC_WORKERS = min(os.cpu_count() or 1, 8)
+SPEC_WORKERS = int(os.getenv('REXFLOW_SPEC_WORKERS', DEFAULT_SPEC_WORKERS))
+DEFAULT_SPEC_PARALLEL_MIN_SPECS = 1000
+SPEC_PARALLEL_MIN_SPECS = int(
+    os.getenv('REXFLOW_SPEC_PARALLEL_MIN_SPECS', DEFAULT_SPEC_PARALLEL_MIN_SPECS)
+)
+
+# flowd applies and deletes k8s objects through the API server at
+# K8S_API_SERVER, by default the cluster's own when flowd runs in a pod, and
+# with kubectl when there is none. It authenticates with the token in
+# K8S_TOKEN_FILE (read again whenever the kubelet rotates it), checks the
+# server against K8S_CA_FILE, and sends up to K8S_APPLY_WORKERS requests at
+# once (see flowlib.k8s_apply).
+DEFAULT_K8S_API_SERVER = None
+if os.getenv('KUBERNETES_SERVICE_HOST'):
+    _k8s_host = os.environ['KUBERNETES_SERVICE_HOST']
+    if ':' in _k8s_host:  # IPv6
+        _k8s_host = f'[{_k8s_host}]'
+    DEFAULT_K8S_API_SERVER = f"https://{_k8s_host}:{os.getenv('KUBERNETES_SERVICE_PORT', '443')}"
+K8S_API_SERVER = os.getenv('REXFLOW_K8S_API_SERVER', DEFAULT_K8S_API_SERVER) or None
+DEFAULT_K8S_SERVICE_ACCOUNT_DIR = '/var/run/secrets/kubernetes.io/serviceaccount'
+K8S_TOKEN_FILE = os.getenv('REXFLOW_K8S_TOKEN_FILE', os.path.join(DEFAULT_K8S_SERVICE_ACCOUNT_DIR, 'token'))
+K8S_CA_FILE = os.getenv('REXFLOW_K8S_CA_FILE', os.path.join(DEFAULT_K8S_SERVICE_ACCOUNT_DIR, 'ca.crt'))
+DEFAULT_K8S_APPLY_WORKERS = 16
+K8S_APPLY_WORKERS = int(os.getenv('REXFLOW_K8S_APPLY_WORKERS', DEFAULT_K8S_APPLY_WORKERS))
+DEFAULT_K8S_API_TIMEOUT = 30.0
+K8S_API_TIMEOUT = float(os.getenv('REXFLOW_K8S_API_TIMEOUT', DEFAULT_K8S_API_TIMEOUT))
+K8S_FIELD_MANAGER = os.getenv('REXFLOW_K8S_FIELD_MANAGER', 'rexflow')
+
 
 # Kafka Configuration (pass-through as configuration to confluent_kafka)
 KAFKA_HOST = os.getenv("REXFLOW_KAFKA_HOST", None)
@@ -225,3 +385,49 @@ DEFAULT_USE_CLOSURE_TRANSPORT = (
 DEFAULT_USE_SHARED_NAMESPACE = (
     os.getenv('DEFAULT_USE_SHARED_NAMESPACE', 'false').lower() == 'true'
 )
+
+# Instance failure reports (flowlib.failure_reporter) made within LINGER
+# seconds of each other go to flowd's /instancefail/batch endpoint together,
+# at most BATCH_SIZE per request. A LINGER of 0 still batches whatever piles
+# up while a request is in flight, but never waits for more.
+DEFAULT_INSTANCE_FAIL_LINGER = 0.02
+INSTANCE_FAIL_LINGER = float(os.getenv('REXFLOW_INSTANCE_FAIL_LINGER', DEFAULT_INSTANCE_FAIL_LINGER))
+DEFAULT_INSTANCE_FAIL_BATCH_SIZE = 500
+INSTANCE_FAIL_BATCH_SIZE = int(
+    os.getenv('REXFLOW_INSTANCE_FAIL_BATCH_SIZE', DEFAULT_INSTANCE_FAIL_BATCH_SIZE)
+)
+
+# flowd runs its gRPC handlers on a pool of FLOWD_HANDLER_WORKERS threads, so
+# that they stay off the event loop it shares with the Quart app. At most
+# FLOWD_RPC_CONCURRENCY calls of any one RPC run at once, and the rest wait for
+# a slot; REXFLOW_FLOWD_RPC_LIMITS sets that limit per command, e.g.
+# "apply=1,ps=32".
+DEFAULT_FLOWD_HANDLER_WORKERS = 16
+FLOWD_HANDLER_WORKERS = int(os.getenv('REXFLOW_FLOWD_HANDLER_WORKERS', DEFAULT_FLOWD_HANDLER_WORKERS))
+DEFAULT_FLOWD_RPC_CONCURRENCY = 8
+FLOWD_RPC_CONCURRENCY = int(os.getenv('REXFLOW_FLOWD_RPC_CONCURRENCY', DEFAULT_FLOWD_RPC_CONCURRENCY))
+DEFAULT_FLOWD_RPC_LIMITS = 'apply=2,delete=2,update=2,start=4,stop=4,run_batch=2'
+FLOWD_RPC_LIMITS = {
+    command.strip(): int(limit)
+    for command, _, limit in (
+        item.partition('=')
+        for item in os.getenv('REXFLOW_FLOWD_RPC_LIMITS', DEFAULT_FLOWD_RPC_LIMITS).split(',')
+        if item.strip()
+    )
+}
+
+# Instances per page of a streamed ps (flowd PSQueryStream) when the request
+# does not ask for a page size.
+DEFAULT_PS_PAGE_SIZE = 100
+PS_PAGE_SIZE = int(os.getenv('REXFLOW_PS_PAGE_SIZE', DEFAULT_PS_PAGE_SIZE))
+
+# Whether flowd checks (and repairs) the instance state/metadata index in the
+# background when it starts. The first run after an upgrade builds the index.
+INSTANCE_INDEX_CHECK_ON_START = os.getenv('REXFLOW_INSTANCE_INDEX_CHECK_ON_START', 'True').lower() == 'true'
+
+# flowd's RunWorkflowBatch calls up to RUN_BATCH_PARALLELISM start events at
+# once, or as many as the request asks for, up to RUN_BATCH_MAX_PARALLELISM.
+DEFAULT_RUN_BATCH_PARALLELISM = 32
+RUN_BATCH_PARALLELISM = int(os.getenv('REXFLOW_RUN_BATCH_PARALLELISM', DEFAULT_RUN_BATCH_PARALLELISM))
+DEFAULT_RUN_BATCH_MAX_PARALLELISM = 128
+RUN_BATCH_MAX_PARALLELISM = int(os.getenv('REXFLOW_RUN_BATCH_MAX_PARALLELISM', DEFAULT_RUN_BATCH_MAX_PARALLELISM))
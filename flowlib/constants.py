@@ -1,6 +1,8 @@
 from hashlib import sha256
+import json
 import uuid
 import re
+from urllib.parse import quote
 from flowlib.config import REXFLOW_ROOT_PREFIX
 
 """
@@ -113,9 +115,11 @@ class WorkflowKeys:
     def __init__(self, did):
         self.root = self.key_of(did)
         self.proc = self.proc_key(did)
+        self.compiled = self.compiled_key(did)
         self.probe = self.probe_key(did)
         self.state = self.state_key(did)
         self.host = self.host_key(did)
+        self.applied = self.applied_key(did)
 
         # Actually an S3 key since we don't store the k8s specs in etcd.
         self.specs = self.specs_key(did)
@@ -128,6 +132,10 @@ class WorkflowKeys:
     def proc_key(cls, did):
         return f'{cls.key_of(did)}/proc'
 
+    @classmethod
+    def compiled_key(cls, did):
+        return f'{cls.key_of(did)}/compiled'
+
     @classmethod
     def probe_key(cls, did):
         return f'{cls.key_of(did)}/probes'
@@ -140,6 +148,10 @@ class WorkflowKeys:
     def state_key(cls, did):
         return f'{cls.key_of(did)}/state'
 
+    @classmethod
+    def applied_key(cls, did):
+        return f'{cls.key_of(did)}/applied'
+
     @classmethod
     def specs_key(cls, did):
         return f'{cls.key_of(did)}/k8s_specs'
@@ -252,6 +264,63 @@ class WorkflowInstanceKeys:
     def metadata_key(cls, iid):
         return f'{cls.key_of(iid)}/metadata'
 
+    @classmethod
+    def iid_of_state_key(cls, key):
+        """Return the iid if key is an instance's state key, else None.
+        """
+        if isinstance(key, bytes):
+            key = key.decode('utf-8')
+        root = f'{WorkflowInstanceKeys.ROOT}/'
+        if not key.startswith(root) or not key.endswith('/state'):
+            return None
+        iid = key[len(root):-len('/state')]
+        return iid if iid and '/' not in iid else None
+
+
+class InstanceIndexKeys:
+    """Secondary index over workflow instances, so ps can find the instances
+    in a given state or with a given metadata value without reading every
+    instance:
+
+        /rexflow/index/state/<STATE>/<iid>
+        /rexflow/index/meta/<key>/<value>/<iid>
+
+    Metadata keys and values are percent-encoded, and values are case-folded,
+    so an index entry is a candidate: readers check it against the instance.
+    """
+    ROOT = f'{REXFLOW_ROOT}/index'
+    STATE_ROOT = f'{ROOT}/state'
+    META_ROOT = f'{ROOT}/meta'
+    # Written once the index is known to cover every instance.
+    READY = f'{ROOT}/ready'
+
+    @classmethod
+    def state_prefix(cls, state):
+        if isinstance(state, bytes):
+            state = state.decode('utf-8')
+        return f'{cls.STATE_ROOT}/{state}/'
+
+    @classmethod
+    def state_key(cls, state, iid):
+        return f'{cls.state_prefix(state)}{iid}'
+
+    @classmethod
+    def meta_prefix(cls, key, value):
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        return f"{cls.META_ROOT}/{quote(key, safe='')}/{quote(value.lower(), safe='')}/"
+
+    @classmethod
+    def meta_key(cls, key, value, iid):
+        return f'{cls.meta_prefix(key, value)}{iid}'
+
+    @classmethod
+    def iid_from_key(cls, key):
+        if isinstance(key, bytes):
+            key = key.decode('utf-8')
+        return key.rsplit('/', 1)[-1]
+
+
 def split_key(iid: str):
     """
     Accept a key in the form of <workflow_id>-<guid>
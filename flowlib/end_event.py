@@ -6,7 +6,7 @@ as COMPLETED.
 from collections import OrderedDict
 from typing import Mapping
 
-from .bpmn_util import BPMNComponent
+from .bpmn_util import BPMNComponent, AnnotationIndex
 
 from .k8s_utils import (
     create_deployment,
@@ -27,8 +27,9 @@ END_EVENT_PREFIX = 'end'
 class BPMNEndEvent(BPMNComponent):
     '''Wrapper for BPMN service task metadata.
     '''
-    def __init__(self, event: OrderedDict, process: OrderedDict, global_props):
-        super().__init__(event, process, global_props)
+    def __init__(self, event: OrderedDict, process: OrderedDict, global_props,
+                 annotations: AnnotationIndex = None):
+        super().__init__(event, process, global_props, annotations=annotations)
         self._namespace = global_props.namespace
 
         self._kafka_topic = None
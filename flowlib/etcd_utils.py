@@ -1,11 +1,18 @@
+import bisect
 import logging
 import os
 import re
+import threading
 import time
+from typing import Iterator, List
 
 import etcd3
-from etcd3.exceptions import ConnectionFailedError
+from etcd3 import utils as etcd3_utils
+from etcd3.client import KVMetadata
+from etcd3.events import DeleteEvent
+from etcd3.exceptions import ConnectionFailedError, RevisionCompactedError
 from etcd3.locks import Lock
+from etcd3.transactions import Txn
 from retry import retry
 
 from .config import (
@@ -16,7 +23,11 @@ from .config import (
     ETCD_CA_CERT_PATH,
     ETCD_CERT_CERT_PATH,
     ETCD_CERT_KEY_PATH,
+    ETCD_MIRROR_MAX_BYTES,
+    ETCD_RANGE_PAGE_SIZE,
+    ETCD_TXN_MAX_OPS,
 )
+from .constants import InstanceIndexKeys, WorkflowInstanceKeys
 
 _etcd = None
 
@@ -126,6 +137,60 @@ def get_etcd(*args, is_not_none=False, **kws):
     return result
 
 
+def get_prefix_pages(etcd, prefix, keys_only=False, page_size=None, revision=None, start=None):
+    '''Read every key under a prefix as a series of bounded range requests.
+    All pages are read at the revision of the first page (or at the given
+    revision), so the result is a consistent snapshot even if the prefix is
+    being written to.
+    Arguments:
+        etcd - etcd client.
+        prefix - Key prefix (str or bytes).
+        keys_only - Don't transfer values.
+        page_size - Maximum keys per request.  Defaults to ETCD_RANGE_PAGE_SIZE;
+            0 reads the whole prefix in one request.
+        revision - Revision to read at.  Default is the current revision.
+        start - Key to start reading at, to pick up part way through the
+            prefix.  Default is the prefix itself.
+    Yields:
+        etcd RangeResponse messages, one per page.  Every response header
+        carries the snapshot revision.
+    '''
+    if page_size is None:
+        page_size = ETCD_RANGE_PAGE_SIZE
+    range_end = etcd3_utils.increment_last_byte(etcd3_utils.to_bytes(prefix))
+    start = etcd3_utils.to_bytes(prefix if start is None else start)
+    while True:
+        request = etcd._build_get_range_request(
+            start, range_end=range_end, sort_order='ascend', keys_only=keys_only,
+        )
+        # Note: python-etcd3 accepts, but never sets, limit and revision on
+        # the request it builds, so they are filled in here.
+        request.limit = page_size
+        if revision is not None:
+            request.revision = revision
+        response = etcd.kvstub.Range(
+            request,
+            etcd.timeout,
+            credentials=etcd.call_credentials,
+            metadata=etcd.metadata,
+        )
+        yield response
+        if not response.more or not response.kvs:
+            break
+        revision = response.header.revision
+        start = response.kvs[-1].key + b'\0'
+
+
+def iter_prefix(etcd, prefix, keys_only=False, page_size=None, revision=None, start=None):
+    '''Like etcd.get_prefix(), but reads large prefixes in pages.
+    Returns:
+        A generator of (value, KVMetadata) tuples in key order.
+    '''
+    for response in get_prefix_pages(etcd, prefix, keys_only, page_size, revision, start):
+        for kv in response.kvs:
+            yield kv.value, KVMetadata(kv, response.header)
+
+
 def get_keys_from_prefix(prefix=None):
     '''
     Arguents:
@@ -137,7 +202,7 @@ def get_keys_from_prefix(prefix=None):
     assert _etcd is not None
     return set(
         metadata.key.decode('utf-8')
-        for _, metadata in _etcd.get_prefix(prefix, keys_only=True)
+        for _, metadata in iter_prefix(_etcd, prefix, keys_only=True)
     )
 
 
@@ -158,9 +223,34 @@ def get_next_level(prefix=None, delim='/'):
     )
 
 
+def nest_items(items, prefix, delim='/', keys_only=False, keys=None,
+                value_transformer=None):
+    '''Build the nested dictionary described in get_dict_from_prefix() from
+    an iterable of (key, value) pairs, where every key starts with prefix.
+    '''
+    plain_old_dict = dict()
+    for key, value in items:
+        crnt = plain_old_dict
+        key_split = key[len(prefix):].split(delim)
+        dict_key = key_split[-1]
+        if keys is None or dict_key in keys:
+            for subkey in key_split[:-1]:
+                if subkey not in crnt:
+                    crnt[subkey] = dict()
+                crnt = crnt[subkey]
+            crnt[dict_key] = (
+                None if keys_only
+                else (value if value_transformer is None
+                      else value_transformer(value))
+            )
+    return plain_old_dict
+
+
 def get_dict_from_prefix(prefix=None, delim='/', keys_only=False,
                          keys=None, value_transformer=None):
     '''Impose a naming discipline over a set of prefixed keys in etcd.
+    Keys and values are fetched together by paged range reads (see
+    get_prefix_pages()), rather than listing keys and getting each one.
     Arguments:
         prefix - Key prefix.  Default is the root.
         delim - Path delimiter.  Default is "/".
@@ -176,24 +266,291 @@ def get_dict_from_prefix(prefix=None, delim='/', keys_only=False,
         prefix = delim
     elif not prefix.endswith(delim):
         prefix += delim
-    key_gen = (etcd_result[-1].key.decode('utf-8')
-               for etcd_result in _etcd.get_prefix(prefix, keys_only=True))
-    plain_old_dict = dict()
-    for key in key_gen:
-        crnt = plain_old_dict
-        key_split = key[len(prefix):].split(delim)
-        dict_key = key_split[-1]
-        if keys is None or dict_key in keys:
-            for subkey in key_split[:-1]:
-                if subkey not in crnt:
-                    crnt[subkey] = dict()
-                crnt = crnt[subkey]
-            crnt[dict_key] = (
-                None if keys_only
-                else (_etcd.get(key)[0] if value_transformer is None
-                      else value_transformer(_etcd.get(key)[0]))
+    items = (
+        (metadata.key.decode('utf-8'), value)
+        for value, metadata in iter_prefix(_etcd, prefix, keys_only=keys_only)
+    )
+    return nest_items(items, prefix, delim, keys_only, keys, value_transformer)
+
+
+class EtcdMirror:
+    '''Read-only, in-memory copy of everything under an etcd prefix.
+    The mirror does one paged range read at a known revision, then follows a
+    watch on the prefix starting at the next revision, so reads are served
+    from memory without touching etcd.  If etcd compacts away the revision
+    the watch needs, the mirror reloads the prefix and carries on.  If the
+    copy grows past max_bytes, the mirror drops it and every read goes
+    through to etcd.
+    Example:
+        >>> mirror = get_mirror(WorkflowKeys.ROOT)
+        >>> mirror.get_dict(WorkflowKeys.ROOT, keys={'state'})
+    '''
+    RETRY_DELAY = 1.0
+
+    def __init__(self, prefix, etcd=None, max_bytes=None):
+        self.prefix = prefix if isinstance(prefix, bytes) else prefix.encode('utf-8')
+        self.etcd = etcd if etcd is not None else get_etcd(is_not_none=True)
+        self.max_bytes = ETCD_MIRROR_MAX_BYTES if max_bytes is None else max_bytes
+        self.revision = 0
+        self.overflowed = False
+        self.live = False
+        self.resyncs = 0
+        self.events_applied = 0
+        self.stale_reads = 0
+        self.fallback_reads = 0
+        self.sync_timeouts = 0
+        self._data = dict()
+        self._keys = []  # sorted keys of self._data, for prefix scans
+        self._size = 0
+        self._cond = threading.Condition()
+        self._cancel = None
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        '''Load the prefix (blocking) and start following the watch.'''
+        self._load()
+        self._thread = threading.Thread(
+            target=self._run, name=f'etcd-mirror:{self.prefix.decode()}', daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        if self._cancel is not None:
+            self._cancel()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'prefix': self.prefix.decode('utf-8'),
+                'revision': self.revision,
+                'keys': len(self._data),
+                'bytes': self._size,
+                'live': self.live,
+                'overflowed': self.overflowed,
+                'resyncs': self.resyncs,
+                'events_applied': self.events_applied,
+                'stale_reads': self.stale_reads,
+                'fallback_reads': self.fallback_reads,
+                'sync_timeouts': self.sync_timeouts,
+            }
+
+    def sync(self, timeout=2.0):
+        '''Wait until the mirror reflects every write made to the prefix
+        before this call.  Costs one small range request, whose header
+        revision is the target: the watch delivers events in revision order,
+        so once the mirror has applied an event at or past it, it has applied
+        every earlier one, deletes included.  If nothing under the prefix has
+        been written since, no such event may ever come; the mirror is then
+        current once it has applied the newest mod_revision under the prefix
+        and holds the same number of keys (an unseen delete would leave it
+        holding extra keys).
+        Returns:
+            True if the mirror caught up within the timeout.
+        '''
+        request = self.etcd._build_get_range_request(
+            self.prefix, range_end=etcd3_utils.increment_last_byte(self.prefix),
+            sort_order='descend', sort_target='mod', keys_only=True,
+        )
+        request.limit = 1
+        response = self.etcd.kvstub.Range(
+            request,
+            self.etcd.timeout,
+            credentials=self.etcd.call_credentials,
+            metadata=self.etcd.metadata,
+        )
+        target = response.header.revision
+        newest = response.kvs[0].mod_revision if response.kvs else 0
+        count = response.count
+        with self._cond:
+            synced = self._cond.wait_for(
+                lambda: self.overflowed or self.revision >= target or (
+                    self.revision >= newest and self._key_count() == count
+                ),
+                timeout,
+            ) and not self.overflowed
+            if not synced and not self.overflowed:
+                self.sync_timeouts += 1
+        if not synced and not self.overflowed:
+            logging.warning(
+                f'etcd mirror of {self.prefix} did not catch up with revision {target} '
+                f'within {timeout}s; reads may be stale.'
             )
-    return plain_old_dict
+        return synced
+
+    def _key_count(self):
+        '''How many keys under the prefix the mirror has seen live; called
+        with self._cond held.  Subclasses that keep no values count them.
+        '''
+        return len(self._data)
+
+    def items(self, prefix=None):
+        '''Returns a list of (key, value) byte pairs under prefix, in key order.'''
+        prefix = self.prefix if prefix is None else etcd3_utils.to_bytes(prefix)
+        assert prefix.startswith(self.prefix), f'{prefix} is not under {self.prefix}'
+        with self._cond:
+            if not self.overflowed:
+                if not self.live:
+                    self.stale_reads += 1
+                start = bisect.bisect_left(self._keys, prefix)
+                end = bisect.bisect_left(
+                    self._keys, etcd3_utils.increment_last_byte(prefix), start,
+                )
+                return [(key, self._data[key]) for key in self._keys[start:end]]
+            self.fallback_reads += 1
+        return [
+            (metadata.key, value)
+            for value, metadata in iter_prefix(self.etcd, prefix)
+        ]
+
+    def get(self, key):
+        '''Returns the value of a single key under the prefix, or None.'''
+        key = etcd3_utils.to_bytes(key)
+        with self._cond:
+            if not self.overflowed:
+                if not self.live:
+                    self.stale_reads += 1
+                return self._data.get(key)
+            self.fallback_reads += 1
+        return self.etcd.get(key)[0]
+
+    def get_dict(self, prefix=None, delim='/', keys_only=False, keys=None,
+                 value_transformer=None):
+        '''Same as get_dict_from_prefix(), but served from the mirror.'''
+        if prefix is None:
+            prefix = self.prefix.decode('utf-8')
+        if not prefix.endswith(delim):
+            prefix += delim
+        items = (
+            (key.decode('utf-8'), value)
+            for key, value in self.items(prefix)
+        )
+        return nest_items(items, prefix, delim, keys_only, keys, value_transformer)
+
+    def get_next_level(self, prefix=None, delim='/'):
+        '''Same as get_next_level(), but served from the mirror.'''
+        if prefix is None:
+            prefix = self.prefix.decode('utf-8')
+        if not prefix.endswith(delim):
+            prefix += delim
+        return set(
+            key.decode('utf-8')[len(prefix):].split(delim)[0]
+            for key, _ in self.items(prefix)
+        )
+
+    def _load(self):
+        data = dict()
+        size = 0
+        revision = None
+        for response in get_prefix_pages(self.etcd, self.prefix):
+            revision = response.header.revision
+            for kv in response.kvs:
+                data[kv.key] = kv.value
+                size += len(kv.key) + len(kv.value)
+            if size > self.max_bytes:
+                self._overflow()
+                return
+        with self._cond:
+            self._data = data
+            self._keys = sorted(data.keys())
+            self._size = size
+            self.revision = revision
+            self._cond.notify_all()
+
+    def _overflow(self):
+        logging.warning(
+            f'etcd mirror of {self.prefix} exceeded {self.max_bytes} bytes; '
+            'reading through to etcd from now on.'
+        )
+        with self._cond:
+            self.overflowed = True
+            self._data = dict()
+            self._keys = []
+            self._size = 0
+            self._cond.notify_all()
+        self.stop()
+
+    def _apply(self, event):
+        key = event.key
+        with self._cond:
+            old_value = self._data.get(key)
+            if old_value is not None:
+                self._size -= len(key) + len(old_value)
+            if isinstance(event, DeleteEvent):
+                if old_value is not None:
+                    del self._data[key]
+                    del self._keys[bisect.bisect_left(self._keys, key)]
+            else:
+                if old_value is None:
+                    bisect.insort(self._keys, key)
+                self._data[key] = event.value
+                self._size += len(key) + len(event.value)
+            self.revision = max(self.revision, event.mod_revision)
+            self.events_applied += 1
+            self._cond.notify_all()
+        if self._size > self.max_bytes:
+            self._overflow()
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                events, self._cancel = self.etcd.watch_prefix(
+                    self.prefix, start_revision=self.revision + 1,
+                )
+                if self._stopped:
+                    self._cancel()
+                    break
+                self.live = True
+                for event in events:
+                    self._apply(event)
+            except RevisionCompactedError as exn:
+                self.live = False
+                logging.warning(
+                    f'etcd mirror of {self.prefix} fell behind compaction '
+                    f'(revision {exn.compacted_revision}); reloading.'
+                )
+                self.resyncs += 1
+                self._retry(self._load)
+            except Exception as exn:
+                self.live = False
+                logging.exception(
+                    f'etcd mirror of {self.prefix} lost its watch; reconnecting.',
+                    exc_info=exn,
+                )
+                time.sleep(self.RETRY_DELAY)
+            finally:
+                self.live = False
+
+    def _retry(self, func):
+        while not self._stopped:
+            try:
+                return func()
+            except Exception as exn:
+                logging.exception(
+                    f'etcd mirror of {self.prefix} failed to reload.', exc_info=exn,
+                )
+                time.sleep(self.RETRY_DELAY)
+
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_mirror(prefix):
+    '''Get the started, module-level EtcdMirror for a prefix, creating it
+    on first use.  Requires the module-level etcd client.
+    '''
+    etcd = get_etcd(is_not_none=True)
+    with _mirrors_lock:
+        mirror = _mirrors.get(prefix)
+        if mirror is None or mirror.etcd is not etcd:
+            if mirror is not None:
+                mirror.stop()
+            mirror = EtcdMirror(prefix, etcd).start()
+            _mirrors[prefix] = mirror
+        return mirror
 
 
 class EtcdDict(dict):
@@ -242,36 +599,217 @@ class EtcdDict(dict):
             root=root, delim=delim)
 
 
-def transition_state(etcd, state_key, from_states, to_state):
-    '''Utility function that attempts to simulate an etcd transaction.
+def try_transition_state(etcd, state_key, from_states, to_state, puts=None):
+    '''Atomically move a state key from any of from_states to to_state in a
+    single etcd transaction, without taking a lock.  etcd compares can only
+    be AND-ed, so the transaction is a chain of nested transactions, one per
+    allowed from-state; the innermost failure branch reads the key back.
+    If state_key belongs to a workflow instance, the instance's state index
+    entry moves in the same transaction (see state_index_ops()).
     Arguments:
         etcd - etcd instance.
         state_key - key representing a state variable
         from_states - Set (or iterable) of valid states from which to transition.
         to_state - End state for the transition.
+        puts - Optional mapping of other keys to values (e.g. the instance
+            result and content type) to write in the same transaction, only
+            if the transition happens.
+    Returns:
+        A (succeeded, prior_state) tuple.  prior_state is the value (bytes)
+        the state key held when the transaction ran, or None if it did not
+        exist.
     '''
-    result = False
-    with etcd.lock(state_key):
-        crnt_state = etcd.get(state_key)[0]
-        if crnt_state in from_states:
-            if etcd.replace(state_key, crnt_state, to_state):
-                result = True
+    from_states = [etcd3_utils.to_bytes(state) for state in from_states]
+    if not from_states:
+        return False, etcd.get(state_key)[0]
+    compare, success, failure = _transition_txn(
+        etcd.transactions, state_key, from_states, to_state, puts,
+    )
+    succeeded, responses = etcd.transaction(
+        compare=compare,
+        success=success,
+        failure=failure,
+    )
+    if succeeded:
+        return True, from_states[0]
+    response = responses[0]
+    for from_state in from_states[1:]:
+        # python-etcd3 only unpacks range responses at the top level.
+        if response.response_txn.succeeded:
+            return True, from_state
+        response = response.response_txn.responses[0]
+        if response.WhichOneof('response') == 'response_range':
+            kvs = response.response_range.kvs
+            return False, kvs[0].value if kvs else None
+    return False, response[0][0] if response else None
+
+
+def state_index_ops(txns, state_key, from_state, to_state):
+    '''Ops that move an instance's entry in the state index (see
+    constants.InstanceIndexKeys) along with its state key.  Other state keys,
+    such as a deployment's, are not indexed and get no ops.
+    Arguments:
+        txns - etcd.transactions.
+        state_key - The state key being written.
+        from_state - The state being left, or None if the key is new.
+        to_state - The state being entered.
+    '''
+    iid = WorkflowInstanceKeys.iid_of_state_key(state_key)
+    if iid is None:
+        return []
+    ops = []
+    if from_state is not None and etcd3_utils.to_bytes(from_state) != etcd3_utils.to_bytes(to_state):
+        ops.append(txns.delete(InstanceIndexKeys.state_key(from_state, iid)))
+    ops.append(txns.put(InstanceIndexKeys.state_key(to_state, iid), b''))
+    return ops
+
+
+def _transition_txn(txns, state_key, from_states, to_state, puts=None):
+    '''Builds the (compare, success, failure) of a transition transaction;
+    from_states must be a non-empty list of bytes.  Each from-state gets its
+    own success branch, since the state index entry it removes differs.
+    '''
+    def success_for(from_state):
+        success = [txns.put(state_key, to_state)]
+        if puts:
+            success.extend(txns.put(key, value) for key, value in puts.items())
+        success.extend(state_index_ops(txns, state_key, from_state, to_state))
+        return success
+
+    failure = [txns.get(state_key)]
+    for from_state in reversed(from_states[1:]):
+        failure = [txns.txn(
+            compare=[txns.value(state_key) == from_state],
+            success=success_for(from_state),
+            failure=failure,
+        )]
+    return [txns.value(state_key) == from_states[0]], success_for(from_states[0]), failure
+
+
+def _nested_transition_result(from_states, response_txn):
+    '''Reads a (succeeded, prior_state) tuple out of the raw response of a
+    transition transaction that ran nested inside another one.
+    '''
+    for from_state in from_states:
+        if response_txn.succeeded:
+            return True, from_state
+        response = response_txn.responses[0]
+        if response.WhichOneof('response') == 'response_range':
+            kvs = response.response_range.kvs
+            return False, kvs[0].value if kvs else None
+        response_txn = response.response_txn
+    return False, None
+
+
+def txn_ops(op) -> int:
+    '''Operations etcd counts for op against --max-txn-ops when op runs
+    nested in another transaction: a nested txn's widest list (compare,
+    success or failure) plus, recursively, the most any of its own nested
+    txns counts. Other ops count nothing, as the transaction around them
+    counts them.
+    '''
+    if not isinstance(op, Txn):
+        return 0
+    branches = (op.success or []) + (op.failure or [])
+    return max(len(op.compare or []), len(op.success or []), len(op.failure or [])) + max(
+        (txn_ops(nested) for nested in branches), default=0,
+    )
+
+
+def txn_chunks(ops: List, max_ops: int = ETCD_TXN_MAX_OPS) -> Iterator[List]:
+    '''Splits ops into success lists of transactions that etcd accepts.
+    etcd allows a nested txn only max_ops minus the number of ops of the
+    transaction around it, so a chunk's length plus the largest txn_ops() in
+    it stays within max_ops.
+    '''
+    chunk = []
+    widest = 0
+    for op in ops:
+        nested = txn_ops(op)
+        if chunk and len(chunk) + 1 + max(widest, nested) > max_ops:
+            yield chunk
+            chunk = []
+            widest = 0
+        chunk.append(op)
+        widest = max(widest, nested)
+    if chunk:
+        yield chunk
+
+
+def try_transition_states(etcd, transitions, max_ops=ETCD_TXN_MAX_OPS):
+    '''Batched try_transition_state(). Each transition runs as its own nested
+    transaction, so a refused transition does not hold back the others, and
+    as many as fit in one etcd transaction (see txn_chunks()) share a round
+    trip.
+    Arguments:
+        etcd - etcd instance.
+        transitions - List of (state_key, from_states, to_state, puts) tuples,
+            as taken by try_transition_state(). No two may touch the same key.
+        max_ops - etcd's --max-txn-ops (default 128), counting nested
+            transactions' operations as etcd does.
+    Returns:
+        A list of (succeeded, prior_state) tuples, one per transition.
+    '''
+    txns = etcd.transactions
+    ops = []
+    all_states = []
+    for state_key, from_states, to_state, puts in transitions:
+        from_states = [etcd3_utils.to_bytes(state) for state in from_states]
+        all_states.append(from_states)
+        if not from_states:
+            ops.append(txns.get(state_key))
+            continue
+        compare, success, failure = _transition_txn(txns, state_key, from_states, to_state, puts)
+        ops.append(txns.txn(compare=compare, success=success, failure=failure))
+    results = []
+    for chunk in txn_chunks(ops, max_ops):
+        _, responses = etcd.transaction(compare=[], success=chunk, failure=[])
+        for from_states, response in zip(all_states[len(results):], responses):
+            if not from_states:
+                results.append((False, response[0][0] if response else None))
             else:
-                # The `with etcd.lock(state_key)` line doesn't actually work sometimes.
-                # It's possible in one edge case that crnt_state == STARTING but the state key
-                # is now in the RUNNING state, so the replace fails.
-                new_crnt_state = etcd.get(state_key)[0]
-                if new_crnt_state != crnt_state:
-                    logging.warning("The etcd.lock() failed again.")
-                    if new_crnt_state in from_states and \
-                            etcd.replace(state_key, new_crnt_state, to_state):
-                        result = True
+                results.append(_nested_transition_result(from_states, response.response_txn))
+    return results
+
+
+def transition_state(etcd, state_key, from_states, to_state, puts=None):
+    '''Lock-free state transition; see try_transition_state().
+    Arguments:
+        etcd - etcd instance.
+        state_key - key representing a state variable
+        from_states - Set (or iterable) of valid states from which to transition.
+        to_state - End state for the transition.
+        puts - Optional mapping of keys to values written in the same transaction.
+    Returns:
+        True if the transition happened.
+    '''
+    result, crnt_state = try_transition_state(etcd, state_key, from_states, to_state, puts)
     if result:
         logging.debug(f'State transition was successful. {state_key} : {crnt_state} -> {to_state}')
     else:
         logging.error(f'State transition failed! {state_key} : {crnt_state} -> {to_state}')
     return result
 
+
+def try_create_state(etcd, state_key, state, puts=None):
+    '''Like etcd.put_if_not_exists(state_key, state), but keeps the state
+    index current and can write other keys in the same transaction.
+    Returns:
+        True if the key was created.
+    '''
+    txns = etcd.transactions
+    success = [txns.put(state_key, state)]
+    if puts:
+        success.extend(txns.put(key, value) for key, value in puts.items())
+    success.extend(state_index_ops(txns, state_key, None, state))
+    succeeded, _ = etcd.transaction(
+        compare=[txns.version(state_key) == 0],
+        success=success,
+        failure=[],
+    )
+    return succeeded
+
+
 def locked_call(key:str, callback:callable, args:list = None):
     """
     encapsulate an etcd3 operation in a key lock.
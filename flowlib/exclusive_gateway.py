@@ -6,7 +6,7 @@ from collections import OrderedDict
 import json
 from typing import Mapping
 
-from .bpmn_util import BPMNComponent, outgoing_sequence_flow_table, get_edge_transport
+from .bpmn_util import BPMNComponent, AnnotationIndex, get_edge_transport
 from .reliable_wf_utils import create_kafka_transport
 from .k8s_utils import (
     create_deployment,
@@ -32,8 +32,9 @@ XGATEWAY_SVC_PREFIX = "xgateway"
 class BPMNXGateway(BPMNComponent):
     '''Wrapper for BPMN service task metadata.
     '''
-    def __init__(self, gateway: OrderedDict, process: OrderedDict=None, global_props=None):
-        super().__init__(gateway, process, global_props)
+    def __init__(self, gateway: OrderedDict, process: OrderedDict=None, global_props=None,
+                 annotations: AnnotationIndex = None):
+        super().__init__(gateway, process, global_props, annotations=annotations)
         self.expression = ""
         self._gateway = gateway
         self._branches = []
@@ -68,7 +69,7 @@ class BPMNXGateway(BPMNComponent):
         k8s_objects = []
         default_path = None
         conditional_paths = []
-        self.outgoing_edges = outgoing_sequence_flow_table(self._proc)[self.id]
+        self.outgoing_edges = edge_map[self.id]
         for edge in self.outgoing_edges:
             transport_type = get_edge_transport(edge, self.workflow_properties.transport)
             assert transport_type in ['kafka', 'rpc'], \
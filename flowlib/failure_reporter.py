@@ -0,0 +1,157 @@
+"""Coalesces instance failure reports on their way to flowd.
+
+When a dependency shared by many workflow instances goes down, every one of
+those instances fails at about the same time, and each failing hop used to
+POST its own report to flowd's /instancefail endpoint. Reports now go through
+a FailureReporter, which collects whatever arrives within a short window and
+sends it to /instancefail/batch in one request, where flowd applies the whole
+batch in a few grouped etcd transactions. Callers still learn, per report,
+whether it reached flowd:
+
+    future = get_failure_reporter(INSTANCE_FAIL_ENDPOINT).report(headers, payload)
+    reported = future.result()
+"""
+import collections
+from concurrent.futures import Future
+import json
+import logging
+import threading
+import time
+from typing import List, Mapping, Tuple, Union
+
+from flowlib.config import INSTANCE_FAIL_BATCH_SIZE, INSTANCE_FAIL_LINGER
+from flowlib.http_sessions import get_session_pool
+
+
+# Path of the batch endpoint, relative to the single-report endpoint.
+BATCH_SUFFIX = '/batch'
+
+FailureRecord = Tuple[Mapping[str, str], dict]
+
+
+def encode_failures(records: List[FailureRecord]) -> str:
+    """Body of a POST to /instancefail/batch: a JSON list of the headers and
+    payload each report would have been POSTed to /instancefail with.
+    """
+    return json.dumps([
+        {'headers': dict(headers), 'payload': payload}
+        for headers, payload in records
+    ])
+
+
+def decode_failures(body: Union[bytes, str]) -> List[FailureRecord]:
+    records = json.loads(body)
+    if not isinstance(records, list):
+        raise ValueError('Expected a list of failure records.')
+    return [(record['headers'], record['payload']) for record in records]
+
+
+class FailureReporter:
+    """Queue of pending failure reports plus the thread that sends them.
+    """
+    def __init__(
+        self,
+        url: str,
+        linger: float = INSTANCE_FAIL_LINGER,
+        batch_size: int = INSTANCE_FAIL_BATCH_SIZE,
+    ):
+        self.url = url
+        self.batch_url = url.rstrip('/') + BATCH_SUFFIX
+        self._linger = linger
+        self._batch_size = batch_size
+        self._batch_supported = True
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._counts = collections.Counter()
+        self._thread = threading.Thread(target=self._run, name='failure-reporter', daemon=True)
+        self._thread.start()
+
+    def report(self, headers: Mapping[str, str], payload: dict) -> Future:
+        """Queues a report. The returned future resolves to True once flowd has
+        accepted it, or to False if it could not be delivered.
+        """
+        future = Future()
+        with self._cond:
+            self._queue.append((dict(headers), payload, future))
+            self._counts['reports'] += 1
+            if len(self._queue) == 1 or len(self._queue) >= self._batch_size:
+                self._cond.notify_all()
+        return future
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(self._counts, queued=len(self._queue))
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = time.monotonic() + self._linger
+            while len(self._queue) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(self._batch_size, len(self._queue))
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            records = [(headers, payload) for headers, payload, _ in batch]
+            try:
+                delivered = self._send(records)
+            except Exception as exn:
+                logging.warning(f'Failed reporting {len(batch)} instance failures: {exn}')
+                delivered = [False] * len(batch)
+            with self._cond:
+                self._counts['batches'] += 1
+                self._counts['undelivered'] += delivered.count(False)
+                self._counts['largest_batch'] = max(self._counts['largest_batch'], len(batch))
+            for (_, _, future), ok in zip(batch, delivered):
+                future.set_result(ok)
+
+    def _send(self, records: List[FailureRecord]) -> List[bool]:
+        pool = get_session_pool()
+        if self._batch_supported:
+            response = pool.post(
+                self.batch_url,
+                data=encode_failures(records),
+                headers={'content-type': 'application/json'},
+            )
+            if response.status_code not in (404, 405):
+                response.raise_for_status()
+                return [True] * len(records)
+            logging.warning(f'{self.batch_url} is not available; reporting failures one at a time.')
+            self._batch_supported = False
+        delivered = []
+        for headers, payload in records:
+            try:
+                pool.post(self.url, headers=headers, data=json.dumps(payload)).raise_for_status()
+                delivered.append(True)
+            except Exception as exn:
+                logging.warning(f'Failed reporting an instance failure: {exn}')
+                delivered.append(False)
+        return delivered
+
+
+_reporters = {}
+_reporters_lock = threading.Lock()
+
+
+def get_failure_reporter(url: str) -> FailureReporter:
+    """Returns the process-wide reporter for an /instancefail url.
+    """
+    reporter = _reporters.get(url)
+    if reporter is None:
+        with _reporters_lock:
+            reporter = _reporters.get(url)
+            if reporter is None:
+                reporter = _reporters[url] = FailureReporter(url)
+    return reporter
+
+
+def get_failure_reporter_stats() -> dict:
+    with _reporters_lock:
+        reporters = dict(_reporters)
+    return {url: reporter.stats() for url, reporter in reporters.items()}
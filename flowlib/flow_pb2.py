@@ -2,10 +2,9 @@
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # source: flow.proto
 """Generated protocol buffer code."""
-from google.protobuf.internal import enum_type_wrapper
+from google.protobuf.internal import builder as _builder
 from google.protobuf import descriptor as _descriptor
-from google.protobuf import message as _message
-from google.protobuf import reflection as _reflection
+from google.protobuf import descriptor_pool as _descriptor_pool
 from google.protobuf import symbol_database as _symbol_database
 # @@protoc_insertion_point(imports)
 
@@ -14,711 +13,45 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor.FileDescriptor(
-  name='flow.proto',
-  package='',
-  syntax='proto3',
-  serialized_options=None,
-  create_key=_descriptor._internal_create_key,
-  serialized_pb=b'\n\nflow.proto\"(\n\nStringPair\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\"<\n\x0b\x46lowdResult\x12\x0e\n\x06status\x18\x01 \x01(\x03\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\t\"1\n\x0c\x41pplyRequest\x12\x10\n\x08\x62pmn_xml\x18\x01 \x01(\t\x12\x0f\n\x07stopped\x18\x02 \x01(\x08\"8\n\rDeleteRequest\x12\x1a\n\x04kind\x18\x01 \x01(\x0e\x32\x0c.RequestKind\x12\x0b\n\x03ids\x18\x02 \x03(\t\"o\n\tPSRequest\x12\x1a\n\x04kind\x18\x01 \x01(\x0e\x32\x0c.RequestKind\x12\x0b\n\x03ids\x18\x02 \x03(\t\x12\x1a\n\x12include_kubernetes\x18\x03 \x01(\x08\x12\x1d\n\x08metadata\x18\x04 \x03(\x0b\x32\x0b.StringPair\"\x1b\n\x0cProbeRequest\x12\x0b\n\x03ids\x18\x01 \x03(\t\"w\n\nRunRequest\x12\x13\n\x0bworkflow_id\x18\x01 \x01(\t\x12\x0c\n\x04\x61rgs\x18\x02 \x03(\t\x12\x0f\n\x07stopped\x18\x03 \x01(\x08\x12\x16\n\x0estart_event_id\x18\x04 \x01(\t\x12\x1d\n\x08metadata\x18\x05 \x03(\x0b\x32\x0b.StringPair\"7\n\x0cStartRequest\x12\x1a\n\x04kind\x18\x01 \x01(\x0e\x32\x0c.RequestKind\x12\x0b\n\x03ids\x18\x02 \x03(\t\"E\n\x0bStopRequest\x12\x1a\n\x04kind\x18\x01 \x01(\x0e\x32\x0c.RequestKind\x12\x0b\n\x03ids\x18\x02 \x03(\t\x12\r\n\x05\x66orce\x18\x03 \x01(\x08\"$\n\rUpdateRequest\x12\x13\n\x0bupdate_spec\x18\x01 \x01(\t\"?\n\x0fValidateRequest\x12\x10\n\x08\x62pmn_xml\x18\x01 \x01(\t\x12\x1a\n\x12include_kubernetes\x18\x02 \x01(\x08*+\n\x0bRequestKind\x12\x0e\n\nDEPLOYMENT\x10\x00\x12\x0c\n\x08INSTANCE\x10\x01\x32\xa5\x03\n\nFlowDaemon\x12,\n\rApplyWorkflow\x12\r.ApplyRequest\x1a\x0c.FlowdResult\x12.\n\x0e\x44\x65leteWorkflow\x12\x0e.DeleteRequest\x1a\x0c.FlowdResult\x12#\n\x07PSQuery\x12\n.PSRequest\x1a\x0c.FlowdResult\x12,\n\rProbeWorkflow\x12\r.ProbeRequest\x1a\x0c.FlowdResult\x12(\n\x0bRunWorkflow\x12\x0b.RunRequest\x1a\x0c.FlowdResult\x12,\n\rStartWorkflow\x12\r.StartRequest\x1a\x0c.FlowdResult\x12*\n\x0cStopWorkflow\x12\x0c.StopRequest\x1a\x0c.FlowdResult\x12.\n\x0eUpdateWorkflow\x12\x0e.UpdateRequest\x1a\x0c.FlowdResult\x12\x32\n\x10ValidateWorkflow\x12\x10.ValidateRequest\x1a\x0c.FlowdResultb\x06proto3'
-)
-
-_REQUESTKIND = _descriptor.EnumDescriptor(
-  name='RequestKind',
-  full_name='RequestKind',
-  filename=None,
-  file=DESCRIPTOR,
-  create_key=_descriptor._internal_create_key,
-  values=[
-    _descriptor.EnumValueDescriptor(
-      name='DEPLOYMENT', index=0, number=0,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-    _descriptor.EnumValueDescriptor(
-      name='INSTANCE', index=1, number=1,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-  ],
-  containing_type=None,
-  serialized_options=None,
-  serialized_start=721,
-  serialized_end=764,
-)
-_sym_db.RegisterEnumDescriptor(_REQUESTKIND)
-
-RequestKind = enum_type_wrapper.EnumTypeWrapper(_REQUESTKIND)
-DEPLOYMENT = 0
-INSTANCE = 1
-
-
-
-_STRINGPAIR = _descriptor.Descriptor(
-  name='StringPair',
-  full_name='StringPair',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='key', full_name='StringPair.key', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='value', full_name='StringPair.value', index=1,
-      number=2, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=14,
-  serialized_end=54,
-)
-
-
-_FLOWDRESULT = _descriptor.Descriptor(
-  name='FlowdResult',
-  full_name='FlowdResult',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='status', full_name='FlowdResult.status', index=0,
-      number=1, type=3, cpp_type=2, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='message', full_name='FlowdResult.message', index=1,
-      number=2, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='data', full_name='FlowdResult.data', index=2,
-      number=3, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=56,
-  serialized_end=116,
-)
-
-
-_APPLYREQUEST = _descriptor.Descriptor(
-  name='ApplyRequest',
-  full_name='ApplyRequest',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='bpmn_xml', full_name='ApplyRequest.bpmn_xml', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='stopped', full_name='ApplyRequest.stopped', index=1,
-      number=2, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=118,
-  serialized_end=167,
-)
-
-
-_DELETEREQUEST = _descriptor.Descriptor(
-  name='DeleteRequest',
-  full_name='DeleteRequest',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='kind', full_name='DeleteRequest.kind', index=0,
-      number=1, type=14, cpp_type=8, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='ids', full_name='DeleteRequest.ids', index=1,
-      number=2, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=169,
-  serialized_end=225,
-)
-
-
-_PSREQUEST = _descriptor.Descriptor(
-  name='PSRequest',
-  full_name='PSRequest',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='kind', full_name='PSRequest.kind', index=0,
-      number=1, type=14, cpp_type=8, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='ids', full_name='PSRequest.ids', index=1,
-      number=2, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='include_kubernetes', full_name='PSRequest.include_kubernetes', index=2,
-      number=3, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='metadata', full_name='PSRequest.metadata', index=3,
-      number=4, type=11, cpp_type=10, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=227,
-  serialized_end=338,
-)
-
-
-_PROBEREQUEST = _descriptor.Descriptor(
-  name='ProbeRequest',
-  full_name='ProbeRequest',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='ids', full_name='ProbeRequest.ids', index=0,
-      number=1, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=340,
-  serialized_end=367,
-)
-
-
-_RUNREQUEST = _descriptor.Descriptor(
-  name='RunRequest',
-  full_name='RunRequest',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='workflow_id', full_name='RunRequest.workflow_id', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='args', full_name='RunRequest.args', index=1,
-      number=2, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='stopped', full_name='RunRequest.stopped', index=2,
-      number=3, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='start_event_id', full_name='RunRequest.start_event_id', index=3,
-      number=4, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='metadata', full_name='RunRequest.metadata', index=4,
-      number=5, type=11, cpp_type=10, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=369,
-  serialized_end=488,
-)
-
-
-_STARTREQUEST = _descriptor.Descriptor(
-  name='StartRequest',
-  full_name='StartRequest',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='kind', full_name='StartRequest.kind', index=0,
-      number=1, type=14, cpp_type=8, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='ids', full_name='StartRequest.ids', index=1,
-      number=2, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=490,
-  serialized_end=545,
-)
-
-
-_STOPREQUEST = _descriptor.Descriptor(
-  name='StopRequest',
-  full_name='StopRequest',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='kind', full_name='StopRequest.kind', index=0,
-      number=1, type=14, cpp_type=8, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='ids', full_name='StopRequest.ids', index=1,
-      number=2, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='force', full_name='StopRequest.force', index=2,
-      number=3, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=547,
-  serialized_end=616,
-)
-
-
-_UPDATEREQUEST = _descriptor.Descriptor(
-  name='UpdateRequest',
-  full_name='UpdateRequest',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='update_spec', full_name='UpdateRequest.update_spec', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=618,
-  serialized_end=654,
-)
-
-
-_VALIDATEREQUEST = _descriptor.Descriptor(
-  name='ValidateRequest',
-  full_name='ValidateRequest',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='bpmn_xml', full_name='ValidateRequest.bpmn_xml', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='include_kubernetes', full_name='ValidateRequest.include_kubernetes', index=1,
-      number=2, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=656,
-  serialized_end=719,
-)
-
-_DELETEREQUEST.fields_by_name['kind'].enum_type = _REQUESTKIND
-_PSREQUEST.fields_by_name['kind'].enum_type = _REQUESTKIND
-_PSREQUEST.fields_by_name['metadata'].message_type = _STRINGPAIR
-_RUNREQUEST.fields_by_name['metadata'].message_type = _STRINGPAIR
-_STARTREQUEST.fields_by_name['kind'].enum_type = _REQUESTKIND
-_STOPREQUEST.fields_by_name['kind'].enum_type = _REQUESTKIND
-DESCRIPTOR.message_types_by_name['StringPair'] = _STRINGPAIR
-DESCRIPTOR.message_types_by_name['FlowdResult'] = _FLOWDRESULT
-DESCRIPTOR.message_types_by_name['ApplyRequest'] = _APPLYREQUEST
-DESCRIPTOR.message_types_by_name['DeleteRequest'] = _DELETEREQUEST
-DESCRIPTOR.message_types_by_name['PSRequest'] = _PSREQUEST
-DESCRIPTOR.message_types_by_name['ProbeRequest'] = _PROBEREQUEST
-DESCRIPTOR.message_types_by_name['RunRequest'] = _RUNREQUEST
-DESCRIPTOR.message_types_by_name['StartRequest'] = _STARTREQUEST
-DESCRIPTOR.message_types_by_name['StopRequest'] = _STOPREQUEST
-DESCRIPTOR.message_types_by_name['UpdateRequest'] = _UPDATEREQUEST
-DESCRIPTOR.message_types_by_name['ValidateRequest'] = _VALIDATEREQUEST
-DESCRIPTOR.enum_types_by_name['RequestKind'] = _REQUESTKIND
-_sym_db.RegisterFileDescriptor(DESCRIPTOR)
-
-StringPair = _reflection.GeneratedProtocolMessageType('StringPair', (_message.Message,), {
-  'DESCRIPTOR' : _STRINGPAIR,
-  '__module__' : 'flow_pb2'
-  # @@protoc_insertion_point(class_scope:StringPair)
-  })
-_sym_db.RegisterMessage(StringPair)
-
-FlowdResult = _reflection.GeneratedProtocolMessageType('FlowdResult', (_message.Message,), {
-  'DESCRIPTOR' : _FLOWDRESULT,
-  '__module__' : 'flow_pb2'
-  # @@protoc_insertion_point(class_scope:FlowdResult)
-  })
-_sym_db.RegisterMessage(FlowdResult)
-
-ApplyRequest = _reflection.GeneratedProtocolMessageType('ApplyRequest', (_message.Message,), {
-  'DESCRIPTOR' : _APPLYREQUEST,
-  '__module__' : 'flow_pb2'
-  # @@protoc_insertion_point(class_scope:ApplyRequest)
-  })
-_sym_db.RegisterMessage(ApplyRequest)
-
-DeleteRequest = _reflection.GeneratedProtocolMessageType('DeleteRequest', (_message.Message,), {
-  'DESCRIPTOR' : _DELETEREQUEST,
-  '__module__' : 'flow_pb2'
-  # @@protoc_insertion_point(class_scope:DeleteRequest)
-  })
-_sym_db.RegisterMessage(DeleteRequest)
-
-PSRequest = _reflection.GeneratedProtocolMessageType('PSRequest', (_message.Message,), {
-  'DESCRIPTOR' : _PSREQUEST,
-  '__module__' : 'flow_pb2'
-  # @@protoc_insertion_point(class_scope:PSRequest)
-  })
-_sym_db.RegisterMessage(PSRequest)
-
-ProbeRequest = _reflection.GeneratedProtocolMessageType('ProbeRequest', (_message.Message,), {
-  'DESCRIPTOR' : _PROBEREQUEST,
-  '__module__' : 'flow_pb2'
-  # @@protoc_insertion_point(class_scope:ProbeRequest)
-  })
-_sym_db.RegisterMessage(ProbeRequest)
-
-RunRequest = _reflection.GeneratedProtocolMessageType('RunRequest', (_message.Message,), {
-  'DESCRIPTOR' : _RUNREQUEST,
-  '__module__' : 'flow_pb2'
-  # @@protoc_insertion_point(class_scope:RunRequest)
-  })
-_sym_db.RegisterMessage(RunRequest)
-
-StartRequest = _reflection.GeneratedProtocolMessageType('StartRequest', (_message.Message,), {
-  'DESCRIPTOR' : _STARTREQUEST,
-  '__module__' : 'flow_pb2'
-  # @@protoc_insertion_point(class_scope:StartRequest)
-  })
-_sym_db.RegisterMessage(StartRequest)
-
-StopRequest = _reflection.GeneratedProtocolMessageType('StopRequest', (_message.Message,), {
-  'DESCRIPTOR' : _STOPREQUEST,
-  '__module__' : 'flow_pb2'
-  # @@protoc_insertion_point(class_scope:StopRequest)
-  })
-_sym_db.RegisterMessage(StopRequest)
-
-UpdateRequest = _reflection.GeneratedProtocolMessageType('UpdateRequest', (_message.Message,), {
-  'DESCRIPTOR' : _UPDATEREQUEST,
-  '__module__' : 'flow_pb2'
-  # @@protoc_insertion_point(class_scope:UpdateRequest)
-  })
-_sym_db.RegisterMessage(UpdateRequest)
-
-ValidateRequest = _reflection.GeneratedProtocolMessageType('ValidateRequest', (_message.Message,), {
-  'DESCRIPTOR' : _VALIDATEREQUEST,
-  '__module__' : 'flow_pb2'
-  # @@protoc_insertion_point(class_scope:ValidateRequest)
-  })
-_sym_db.RegisterMessage(ValidateRequest)
-
-
-
-_FLOWDAEMON = _descriptor.ServiceDescriptor(
-  name='FlowDaemon',
-  full_name='FlowDaemon',
-  file=DESCRIPTOR,
-  index=0,
-  serialized_options=None,
-  create_key=_descriptor._internal_create_key,
-  serialized_start=767,
-  serialized_end=1188,
-  methods=[
-  _descriptor.MethodDescriptor(
-    name='ApplyWorkflow',
-    full_name='FlowDaemon.ApplyWorkflow',
-    index=0,
-    containing_service=None,
-    input_type=_APPLYREQUEST,
-    output_type=_FLOWDRESULT,
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-  ),
-  _descriptor.MethodDescriptor(
-    name='DeleteWorkflow',
-    full_name='FlowDaemon.DeleteWorkflow',
-    index=1,
-    containing_service=None,
-    input_type=_DELETEREQUEST,
-    output_type=_FLOWDRESULT,
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-  ),
-  _descriptor.MethodDescriptor(
-    name='PSQuery',
-    full_name='FlowDaemon.PSQuery',
-    index=2,
-    containing_service=None,
-    input_type=_PSREQUEST,
-    output_type=_FLOWDRESULT,
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-  ),
-  _descriptor.MethodDescriptor(
-    name='ProbeWorkflow',
-    full_name='FlowDaemon.ProbeWorkflow',
-    index=3,
-    containing_service=None,
-    input_type=_PROBEREQUEST,
-    output_type=_FLOWDRESULT,
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-  ),
-  _descriptor.MethodDescriptor(
-    name='RunWorkflow',
-    full_name='FlowDaemon.RunWorkflow',
-    index=4,
-    containing_service=None,
-    input_type=_RUNREQUEST,
-    output_type=_FLOWDRESULT,
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-  ),
-  _descriptor.MethodDescriptor(
-    name='StartWorkflow',
-    full_name='FlowDaemon.StartWorkflow',
-    index=5,
-    containing_service=None,
-    input_type=_STARTREQUEST,
-    output_type=_FLOWDRESULT,
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-  ),
-  _descriptor.MethodDescriptor(
-    name='StopWorkflow',
-    full_name='FlowDaemon.StopWorkflow',
-    index=6,
-    containing_service=None,
-    input_type=_STOPREQUEST,
-    output_type=_FLOWDRESULT,
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-  ),
-  _descriptor.MethodDescriptor(
-    name='UpdateWorkflow',
-    full_name='FlowDaemon.UpdateWorkflow',
-    index=7,
-    containing_service=None,
-    input_type=_UPDATEREQUEST,
-    output_type=_FLOWDRESULT,
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-  ),
-  _descriptor.MethodDescriptor(
-    name='ValidateWorkflow',
-    full_name='FlowDaemon.ValidateWorkflow',
-    index=8,
-    containing_service=None,
-    input_type=_VALIDATEREQUEST,
-    output_type=_FLOWDRESULT,
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-  ),
-])
-_sym_db.RegisterServiceDescriptor(_FLOWDAEMON)
-
-DESCRIPTOR.services_by_name['FlowDaemon'] = _FLOWDAEMON
-
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nflow.proto\"(\n\nStringPair\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\"<\n\x0b\x46lowdResult\x12\x0e\n\x06status\x18\x01 \x01(\x03\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\t\"1\n\x0c\x41pplyRequest\x12\x10\n\x08\x62pmn_xml\x18\x01 \x01(\t\x12\x0f\n\x07stopped\x18\x02 \x01(\x08\"8\n\rDeleteRequest\x12\x1a\n\x04kind\x18\x01 \x01(\x0e\x32\x0c.RequestKind\x12\x0b\n\x03ids\x18\x02 \x03(\t\"o\n\tPSRequest\x12\x1a\n\x04kind\x18\x01 \x01(\x0e\x32\x0c.RequestKind\x12\x0b\n\x03ids\x18\x02 \x03(\t\x12\x1a\n\x12include_kubernetes\x18\x03 \x01(\x08\x12\x1d\n\x08metadata\x18\x04 \x03(\x0b\x32\x0b.StringPair\"\xa2\x01\n\x0fPSStreamRequest\x12\x12\n\npage_token\x18\x01 \x01(\t\x12\r\n\x05limit\x18\x02 \x01(\x05\x12\x11\n\tpage_size\x18\x03 \x01(\x05\x12\x0e\n\x06states\x18\x04 \x03(\t\x12\x1a\n\x12workflow_id_prefix\x18\x05 \x01(\t\x12\x0e\n\x06\x66ields\x18\x06 \x03(\t\x12\x1d\n\x08metadata\x18\x07 \x03(\x0b\x32\x0b.StringPair\"P\n\x06PSPage\x12\x0e\n\x06status\x18\x01 \x01(\x03\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\t\x12\x17\n\x0fnext_page_token\x18\x04 \x01(\t\"\x1b\n\x0cProbeRequest\x12\x0b\n\x03ids\x18\x01 \x03(\t\"w\n\nRunRequest\x12\x13\n\x0bworkflow_id\x18\x01 \x01(\t\x12\x0c\n\x04\x61rgs\x18\x02 \x03(\t\x12\x0f\n\x07stopped\x18\x03 \x01(\x08\x12\x16\n\x0estart_event_id\x18\x04 \x01(\t\x12\x1d\n\x08metadata\x18\x05 \x03(\x0b\x32\x0b.StringPair\"S\n\x0cRunBatchItem\x12\x0c\n\x04\x61rgs\x18\x01 \x03(\t\x12\x16\n\x0estart_event_id\x18\x02 \x01(\t\x12\x1d\n\x08metadata\x18\x03 \x03(\x0b\x32\x0b.StringPair\"q\n\x0fRunBatchRequest\x12\x13\n\x0bworkflow_id\x18\x01 \x01(\t\x12\x1c\n\x05items\x18\x02 \x03(\x0b\x32\r.RunBatchItem\x12\x16\n\x0estart_event_id\x18\x03 \x01(\t\x12\x13\n\x0bparallelism\x18\x04 \x01(\x05\"7\n\x0cStartRequest\x12\x1a\n\x04kind\x18\x01 \x01(\x0e\x32\x0c.RequestKind\x12\x0b\n\x03ids\x18\x02 \x03(\t\"E\n\x0bStopRequest\x12\x1a\n\x04kind\x18\x01 \x01(\x0e\x32\x0c.RequestKind\x12\x0b\n\x03ids\x18\x02 \x03(\t\x12\r\n\x05\x66orce\x18\x03 \x01(\x08\"$\n\rUpdateRequest\x12\x13\n\x0bupdate_spec\x18\x01 \x01(\t\"?\n\x0fValidateRequest\x12\x10\n\x08\x62pmn_xml\x18\x01 \x01(\t\x12\x1a\n\x12include_kubernetes\x18\x02 \x01(\x08*+\n\x0bRequestKind\x12\x0e\n\nDEPLOYMENT\x10\x00\x12\x0c\n\x08INSTANCE\x10\x01\x32\x87\x04\n\nFlowDaemon\x12,\n\rApplyWorkflow\x12\r.ApplyRequest\x1a\x0c.FlowdResult\x12.\n\x0e\x44\x65leteWorkflow\x12\x0e.DeleteRequest\x1a\x0c.FlowdResult\x12#\n\x07PSQuery\x12\n.PSRequest\x1a\x0c.FlowdResult\x12,\n\rPSQueryStream\x12\x10.PSStreamRequest\x1a\x07.PSPage0\x01\x12,\n\rProbeWorkflow\x12\r.ProbeRequest\x1a\x0c.FlowdResult\x12(\n\x0bRunWorkflow\x12\x0b.RunRequest\x1a\x0c.FlowdResult\x12\x32\n\x10RunWorkflowBatch\x12\x10.RunBatchRequest\x1a\x0c.FlowdResult\x12,\n\rStartWorkflow\x12\r.StartRequest\x1a\x0c.FlowdResult\x12*\n\x0cStopWorkflow\x12\x0c.StopRequest\x1a\x0c.FlowdResult\x12.\n\x0eUpdateWorkflow\x12\x0e.UpdateRequest\x1a\x0c.FlowdResult\x12\x32\n\x10ValidateWorkflow\x12\x10.ValidateRequest\x1a\x0c.FlowdResultb\x06proto3')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'flow_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _REQUESTKIND._serialized_start=1168
+  _REQUESTKIND._serialized_end=1211
+  _STRINGPAIR._serialized_start=14
+  _STRINGPAIR._serialized_end=54
+  _FLOWDRESULT._serialized_start=56
+  _FLOWDRESULT._serialized_end=116
+  _APPLYREQUEST._serialized_start=118
+  _APPLYREQUEST._serialized_end=167
+  _DELETEREQUEST._serialized_start=169
+  _DELETEREQUEST._serialized_end=225
+  _PSREQUEST._serialized_start=227
+  _PSREQUEST._serialized_end=338
+  _PSSTREAMREQUEST._serialized_start=341
+  _PSSTREAMREQUEST._serialized_end=503
+  _PSPAGE._serialized_start=505
+  _PSPAGE._serialized_end=585
+  _PROBEREQUEST._serialized_start=587
+  _PROBEREQUEST._serialized_end=614
+  _RUNREQUEST._serialized_start=616
+  _RUNREQUEST._serialized_end=735
+  _RUNBATCHITEM._serialized_start=737
+  _RUNBATCHITEM._serialized_end=820
+  _RUNBATCHREQUEST._serialized_start=822
+  _RUNBATCHREQUEST._serialized_end=935
+  _STARTREQUEST._serialized_start=937
+  _STARTREQUEST._serialized_end=992
+  _STOPREQUEST._serialized_start=994
+  _STOPREQUEST._serialized_end=1063
+  _UPDATEREQUEST._serialized_start=1065
+  _UPDATEREQUEST._serialized_end=1101
+  _VALIDATEREQUEST._serialized_start=1103
+  _VALIDATEREQUEST._serialized_end=1166
+  _FLOWDAEMON._serialized_start=1214
+  _FLOWDAEMON._serialized_end=1733
 # @@protoc_insertion_point(module_scope)
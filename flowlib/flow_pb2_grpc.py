@@ -29,6 +29,11 @@ class FlowDaemonStub(object):
                 request_serializer=flow__pb2.PSRequest.SerializeToString,
                 response_deserializer=flow__pb2.FlowdResult.FromString,
                 )
+        self.PSQueryStream = channel.unary_stream(
+                '/FlowDaemon/PSQueryStream',
+                request_serializer=flow__pb2.PSStreamRequest.SerializeToString,
+                response_deserializer=flow__pb2.PSPage.FromString,
+                )
         self.ProbeWorkflow = channel.unary_unary(
                 '/FlowDaemon/ProbeWorkflow',
                 request_serializer=flow__pb2.ProbeRequest.SerializeToString,
@@ -39,6 +44,11 @@ class FlowDaemonStub(object):
                 request_serializer=flow__pb2.RunRequest.SerializeToString,
                 response_deserializer=flow__pb2.FlowdResult.FromString,
                 )
+        self.RunWorkflowBatch = channel.unary_unary(
+                '/FlowDaemon/RunWorkflowBatch',
+                request_serializer=flow__pb2.RunBatchRequest.SerializeToString,
+                response_deserializer=flow__pb2.FlowdResult.FromString,
+                )
         self.StartWorkflow = channel.unary_unary(
                 '/FlowDaemon/StartWorkflow',
                 request_serializer=flow__pb2.StartRequest.SerializeToString,
@@ -85,6 +95,13 @@ class FlowDaemonServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def PSQueryStream(self, request, context):
+        """flowctl ps, a page at a time
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def ProbeWorkflow(self, request, context):
         """flowctl probe
         """
@@ -99,6 +116,13 @@ class FlowDaemonServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def RunWorkflowBatch(self, request, context):
+        """flowctl run --batch-file
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def StartWorkflow(self, request, context):
         """flowctl start
         """
@@ -145,6 +169,11 @@ def add_FlowDaemonServicer_to_server(servicer, server):
                     request_deserializer=flow__pb2.PSRequest.FromString,
                     response_serializer=flow__pb2.FlowdResult.SerializeToString,
             ),
+            'PSQueryStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.PSQueryStream,
+                    request_deserializer=flow__pb2.PSStreamRequest.FromString,
+                    response_serializer=flow__pb2.PSPage.SerializeToString,
+            ),
             'ProbeWorkflow': grpc.unary_unary_rpc_method_handler(
                     servicer.ProbeWorkflow,
                     request_deserializer=flow__pb2.ProbeRequest.FromString,
@@ -155,6 +184,11 @@ def add_FlowDaemonServicer_to_server(servicer, server):
                     request_deserializer=flow__pb2.RunRequest.FromString,
                     response_serializer=flow__pb2.FlowdResult.SerializeToString,
             ),
+            'RunWorkflowBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.RunWorkflowBatch,
+                    request_deserializer=flow__pb2.RunBatchRequest.FromString,
+                    response_serializer=flow__pb2.FlowdResult.SerializeToString,
+            ),
             'StartWorkflow': grpc.unary_unary_rpc_method_handler(
                     servicer.StartWorkflow,
                     request_deserializer=flow__pb2.StartRequest.FromString,
@@ -236,6 +270,23 @@ class FlowDaemon(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def PSQueryStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/FlowDaemon/PSQueryStream',
+            flow__pb2.PSStreamRequest.SerializeToString,
+            flow__pb2.PSPage.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def ProbeWorkflow(request,
             target,
@@ -270,6 +321,23 @@ class FlowDaemon(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def RunWorkflowBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/FlowDaemon/RunWorkflowBatch',
+            flow__pb2.RunBatchRequest.SerializeToString,
+            flow__pb2.FlowdResult.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def StartWorkflow(request,
             target,
@@ -4,11 +4,13 @@ wf instance ERROR reporting, and traffic shadowing into one place.
 As of this commit, the module is just a placeholder and will be fully fleshed
 out soon. See REXFLOW-188.
 """
-import base64
+import asyncio
+from concurrent.futures import Future
 from enum import Enum
+import httpx
 import logging
-import json
 import requests
+import time
 from typing import Dict, Mapping, Optional, Union, Callable
 from urllib.parse import urlparse
 
@@ -18,13 +20,22 @@ from flowlib import bpmn
 from flowlib.config import INSTANCE_FAIL_ENDPOINT
 from flowlib.constants import Headers, WorkflowInstanceKeys, split_key, ErrorCodes
 from flowlib.bpmn import BPMNComponent
+from flowlib.circuit_breaker import CircuitBreaker, get_circuit_breaker
 from flowlib.executor import get_executor
+from flowlib.failure_reporter import get_failure_reporter
+from flowlib.http_sessions import get_async_client, get_session_pool
+from flowlib.retry_policy import RetryPolicy
+from flowlib.shadowing import get_shadower, jsonify_or_encode_data
 from flowlib.workflow import Workflow
 
 
 CONNECT_TIMEOUT = 3
 REQUEST_TIMEOUT = 30
 TIMEOUT = (CONNECT_TIMEOUT, REQUEST_TIMEOUT)
+ASYNC_TIMEOUT = httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+# Statuses reported to flowd as a failure to connect rather than a task failure.
+CONNECTION_ERROR_STATUSES = (502, 503)
 
 
 class FlowPostStatus(Enum):
@@ -69,6 +80,8 @@ class FlowPost:
         bpmn_component_obj: BPMNComponent = None,
         force_fail: bool = False,
         force_fail_code: int = 500,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None,
     ):
         """Utility for making calls between one task and another. Lazily calculates
         information as needed. Parameters:
@@ -86,6 +99,13 @@ class FlowPost:
         * total_attempts: optional. How many times to attempt to make the call. This parameter
         is ignored if the request succeeds. If the request fails, then we need this value.
         As usual, the value can be provided (for performance) or it can be looked up.
+        * retry_policy: optional. A flowlib.retry_policy.RetryPolicy with the number of
+        attempts, backoff and retryable statuses to use. Takes precedence over `retries`
+        (which is total_attempts - 1). If neither is provided, the policy annotated on
+        the task is looked up.
+        * circuit_breaker: optional. The flowlib.circuit_breaker.CircuitBreaker guarding
+        calls to url. Defaults to the process-wide breaker for url. While it is open,
+        send() reports a connection error without making the call.
         * shadow_url: optional. Some workflows are configured to shadow all traffic to a
         specific URL (normally, this URL is a service that dumps the traffic to a Kafka
         topic). If provided, the traffic is shadowed to this URL after the call.
@@ -103,6 +123,8 @@ class FlowPost:
         self._req_method = req_method
         self._headers = dict(headers) if headers else {}
         self._retries = retries
+        self._retry_policy = retry_policy
+        self._circuit_breaker = circuit_breaker
         self._workflow_obj = workflow_obj
         self._shadow_url = shadow_url
         self._bpmn_component_obj = bpmn_component_obj
@@ -117,52 +139,76 @@ class FlowPost:
     def send(self) -> FlowPostResult:
         assert not self._was_sent
         self._was_sent = True
-        return self._send()
+        try:
+            return self._send()
+        finally:
+            # one shadow per send, however many attempts it took.
+            self.shadow_traffic()
 
     def _send(self) -> FlowPostResult:
+        policy = self.retry_policy
+        policy.budget.record_call()
+        breaker = self.circuit_breaker
         headers = self.headers.copy()
-        try:
-            logging.info(
-                f'Making {self.method} to {self.url} for instance {self.instance_id}.'
-            )
-            response: requests.models.Response = self.req_method(
-                self.url,
-                data=self.data,
-                headers=headers,
-                timeout=TIMEOUT,
-            )
+        attempt = 0
+        while True:
+            attempt += 1
+            if not breaker.allow():
+                logging.error(
+                    f"Circuit to {self.url} is open; failing instance {self.instance_id} fast."
+                )
+                return self.raise_connection_error()
+            try:
+                logging.info(
+                    f'Making {self.method} to {self.url} for instance {self.instance_id} (attempt {attempt}).'
+                )
+                response: requests.models.Response = self.req_method(
+                    self.url,
+                    data=self.data,
+                    headers=headers,
+                    timeout=TIMEOUT,
+                )
+            except Exception as exn:
+                breaker.record_failure()
+                if policy.should_retry(attempt):
+                    time.sleep(policy.backoff(attempt))
+                    continue
+                logging.exception(
+                    f"Instance {self.instance_id} failed to connect to task on url {self.url}.",
+                    exc_info=exn
+                )
+                return self.raise_connection_error()
 
             if self._forcefail:
                 logging.info(f'force failing call with code {self._forcefail_code}')
                 response.status_code = self._forcefail_code
+            self._record_outcome(breaker, policy, response.status_code)
 
-            try:
-                response.raise_for_status()
-            except requests.exceptions.HTTPError as exn:
-                logging.exception(
-                    f"Instance {self.instance_id} failed on task {self.task_id} {self.url}",
-                    exc_info=exn,
+            if response.status_code < 400:
+                logging.info(
+                    f'Successfully made call for {self.instance_id}: {response}.'
                 )
-                if response.status_code in [502, 503]:
-                    return self.raise_connection_error()
-                else:
-                    return self.raise_task_error(response)
-            logging.info(
-                f'Successfully made call for {self.instance_id}: {response}.'
+                return FlowPostResult(response, FlowPostStatus.SUCCESS)
+            logging.error(
+                f"Instance {self.instance_id} failed on task {self.task_id} {self.url}: "
+                f"{response.status_code}"
             )
-            return FlowPostResult(response, FlowPostStatus.SUCCESS)
-        except Exception as exn:
-            if self.retries > 0:
-                self._retries = self.retries - 1
-                return self._send()
-            else:
-                logging.exception(
-                    f"Instance {self.instance_id} failed to connect to task on url {self.url}.",
-                    exc_info=exn
-                )
+            if policy.is_retryable_status(response.status_code) and policy.should_retry(attempt):
+                time.sleep(policy.backoff(attempt))
+                continue
+            if response.status_code in CONNECTION_ERROR_STATUSES:
                 return self.raise_connection_error()
-        finally:
-            self._executor.submit(self.shadow_traffic)
+            return self.raise_task_error(response)
+
+    @staticmethod
+    def _record_outcome(breaker: CircuitBreaker, policy: RetryPolicy, status_code: int):
+        """Any answer from the target counts as a success for its circuit
+        breaker, except those saying it is unavailable.
+        """
+        if status_code in CONNECTION_ERROR_STATUSES or policy.is_retryable_status(status_code):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
 
     def shadow_traffic(self):
         """Shadows traffic to the URL specified for this deployment.
@@ -170,22 +216,17 @@ class FlowPost:
         if self.shadow_url == '':
             return
 
+        logging.info(f"Shadowing traffic to {self.shadow_url} for instance {self.instance_id}.")
+        if not get_shadower(self.shadow_url).submit(self.data, self._shadow_headers()):
+            logging.warning(f"Shadow queue full; dropped traffic on instance {self.instance_id}.")
+
+    def _shadow_headers(self) -> Dict[str, str]:
         headers = self._headers.copy()
         parsed_url = urlparse(self.url)
         headers[Headers.X_HEADER_ORIGINAL_HOST] = parsed_url.netloc
         headers[Headers.X_HEADER_ORIGINAL_PATH] = parsed_url.path
         headers[Headers.X_HEADER_TASK_ID] = self.task_id
-
-        logging.info(f"Shadowing traffic to {self.shadow_url} for instance {self.instance_id}.")
-        try:
-            response = requests.post(self.shadow_url, data=self.data, headers=headers)
-            response.raise_for_status()
-            logging.info(f"Successfully shadowed traffic on instance {self.instance_id}.")
-        except Exception as exn:
-            logging.exception(
-                f"Failed shadowing traffic on workflow instance {self.instance_id}:",
-                exc_info=exn,
-            )
+        return headers
 
     def raise_task_error(self, response: requests.models.Response) -> FlowPostResult:
         """Call this method when the service task failed, and we need to
@@ -195,7 +236,10 @@ class FlowPost:
         handled by making a POST to the /instancefail endpoint of flowd. See
         `flowd/flow_app.py` for the code.
         """
-        payload = {
+        return self._send_error_payload(self._task_error_payload(response))
+
+    def _task_error_payload(self, response) -> dict:
+        return {
             'from_envoy': False,
             'input_data': FlowPost.jsonify_or_encode_data(self.data),
             'input_headers': dict(self.headers),
@@ -205,7 +249,6 @@ class FlowPost:
             'error_code': ErrorCodes.FAILED_TASK,
             'error_msg': f'Task {self.task_id} failed.',
         }
-        return self._send_error_payload(payload)
 
     def cancel_instance(self) -> FlowPostResult:
         """Call this method to cancel a workflow instance.
@@ -214,7 +257,10 @@ class FlowPost:
         handled by making a POST to the /instancefail endpoint of flowd. See
         `flowd/flow_app.py` for the code.
         """
-        payload = {
+        return self._send_error_payload(self._cancel_payload())
+
+    def _cancel_payload(self) -> dict:
+        return {
             'from_envoy': False,
             'input_data': {},
             'input_headers': {},
@@ -224,7 +270,6 @@ class FlowPost:
             'error_code': ErrorCodes.CANCELED_INSTANCE,
             'error_msg': f'Instance {self.instance_id} cancelled.',
         }
-        return self._send_error_payload(payload)
 
     def raise_connection_error(self) -> FlowPostResult:
         """This method is called when flowpost tries to make a call to the target service
@@ -235,7 +280,10 @@ class FlowPost:
         handled by making a POST to the /instancefail endpoint of flowd. See
         `flowd/flow_app.py` for the code.
         """
-        payload = {
+        return self._send_error_payload(self._connection_error_payload())
+
+    def _connection_error_payload(self) -> dict:
+        return {
             'from_envoy': False,
             'input_data': FlowPost.jsonify_or_encode_data(self.data),
             'input_headers': dict(self.headers),
@@ -243,7 +291,6 @@ class FlowPost:
             'error_code': ErrorCodes.FAILED_CONNECTION,
             'error_msg': f'Could not connect to {self.task_id} on {self.url}.',
         }
-        return self._send_error_payload(payload)
 
     def _send_error_payload(self, payload: dict) -> FlowPostResult:
         """Accepts a dictionary containing a properly-formed message to the flowd
@@ -253,21 +300,24 @@ class FlowPost:
         logging.info(
             f"Sending message to flowd's instancefail endpoint for {self._instance_id}"
         )
-        try:
-            headers = dict(self.headers.copy())
-            headers['content-type'] = 'application/json'
-            response = requests.post(
-                INSTANCE_FAIL_ENDPOINT,
-                headers=headers,
-                data=json.dumps(payload)
-            )
-            response.raise_for_status()
+        return self._error_result(self._report_error(payload).result())
+
+    def _report_error(self, payload: dict) -> Future:
+        """Hands the payload to the shared reporter, which sends it to flowd
+        along with any other failures reported within a short window.
+        """
+        return get_failure_reporter(INSTANCE_FAIL_ENDPOINT).report(self._error_headers(), payload)
+
+    def _error_result(self, reported: bool) -> FlowPostResult:
+        if reported:
             return FlowPostResult(None, FlowPostStatus.REPORTED_ERROR)
-        except Exception as exn:
-            logging.exception(
-                f"Failed reporting error for instance {self._instance_id}."
-            )
-            return FlowPostResult(None, FlowPostStatus.FAILED_TO_REPORT_ERROR)
+        logging.error(f"Failed reporting error for instance {self._instance_id}.")
+        return FlowPostResult(None, FlowPostStatus.FAILED_TO_REPORT_ERROR)
+
+    def _error_headers(self) -> Dict[str, str]:
+        headers = dict(self.headers.copy())
+        headers['content-type'] = 'application/json'
+        return headers
 
     @classmethod
     def jsonify_or_encode_data(cls, data: Union[bytes, str]) -> Union[dict, str]:
@@ -275,16 +325,7 @@ class FlowPost:
         If that is not possible, then this method base64-encodes it and returns it
         in string format.
         """
-        try:
-            return json.loads(data.decode()) if isinstance(data, bytes) else json.loads(data)
-        except Exception as exn:
-            logging.exception(
-                f"Failed decoding json {data}",
-                exc_info=exn,
-            )
-            to_encode = data if isinstance(data, bytes) else data.encode()
-            encoded_bytes = base64.b64encode(to_encode) # type: bytes
-            return encoded_bytes.decode()
+        return jsonify_or_encode_data(data)
 
     @property
     def workflow_obj(self) -> Workflow:
@@ -328,20 +369,22 @@ class FlowPost:
 
     @property
     def req_method(self) -> Callable:
-        """Returns the `requests` method used to call our task.
+        """Returns the method used to call our task: the matching method of
+        the process-wide keep-alive session pool.
         """
         if self._req_method is None:
+            pool = get_session_pool()
             if self.method == 'post':
-                self._req_method = requests.post
+                self._req_method = pool.post
             elif self.method == 'patch':
-                self._req_method = requests.patch
+                self._req_method = pool.patch
             elif self.method == 'put':
-                self._req_method = requests.put
+                self._req_method = pool.put
             elif self.method == 'get':
-                self._req_method = requests.get
+                self._req_method = pool.get
             else:
                 assert self.method == 'delete'
-                self._req_method = requests.delete
+                self._req_method = pool.delete
         return self._req_method
 
     @property
@@ -353,13 +396,31 @@ class FlowPost:
             self._shadow_url = self.workflow_obj.properties.traffic_shadow_url or ''
         return self._shadow_url
 
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        """Returns the RetryPolicy for this FlowPost: the one passed in, else
+        one for the given number of retries, else the one annotated on the task.
+        """
+        if self._retry_policy is None:
+            if self._retries is not None:
+                self._retry_policy = RetryPolicy(total_attempts=self._retries + 1)
+            else:
+                self._retry_policy = self.bpmn_component_obj.call_properties.retry_policy
+        return self._retry_policy
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        """Returns the circuit breaker for calls to our url.
+        """
+        if self._circuit_breaker is None:
+            self._circuit_breaker = get_circuit_breaker(self.url)
+        return self._circuit_breaker
+
     @property
     def retries(self) -> int:
-        """Number of retries remaining for this FlowPost.
+        """Number of retries allowed for this FlowPost.
         """
-        if self._retries is None:
-            self._retries = self.bpmn_component_obj.call_properties.total_attempts - 1
-        return self._retries
+        return self.retry_policy.total_attempts - 1
 
     @property
     def data(self) -> Union[str, bytes]:
@@ -398,3 +459,104 @@ class FlowPost:
         """Workflow ID that this request is a part of.
         """
         return self._workflow_id
+
+
+class AsyncFlowPost(FlowPost):
+    """FlowPost for code running on an asyncio event loop (the Quart apps).
+    Same parameters, retries, error reporting and shadowing as FlowPost, but
+    every call goes through the loop's pooled httpx.AsyncClient, so a slow
+    upstream only holds up the request that is waiting for it:
+
+        result = await AsyncFlowPost(iid, task_id, data, url=url).send()
+
+    The response in the returned FlowPostResult is an httpx.Response. The
+    properties that look things up in etcd when a parameter is left out
+    (url, method, retries, shadow_url) still block, so pass them in.
+    """
+    async def send(self) -> FlowPostResult:
+        assert not self._was_sent
+        self._was_sent = True
+        if None in (self._url, self._method, self._shadow_url) or \
+                (self._retry_policy is None and self._retries is None):
+            # the missing ones are looked up in etcd; keep that off the loop.
+            await asyncio.get_event_loop().run_in_executor(self._executor, self._look_up_properties)
+        try:
+            return await self._send()
+        finally:
+            self.shadow_traffic()
+
+    def _look_up_properties(self):
+        return self.url, self.method, self.retry_policy, self.shadow_url
+
+    async def _send(self) -> FlowPostResult:
+        client = get_async_client()
+        policy = self.retry_policy
+        policy.budget.record_call()
+        breaker = self.circuit_breaker
+        headers = self.headers.copy()
+        attempt = 0
+        while True:
+            attempt += 1
+            if not breaker.allow():
+                logging.error(
+                    f"Circuit to {self.url} is open; failing instance {self.instance_id} fast."
+                )
+                return await self.raise_connection_error()
+            try:
+                logging.info(
+                    f'Making {self.method} to {self.url} for instance {self.instance_id} (attempt {attempt}).'
+                )
+                response = await client.request(
+                    self.method.upper(),
+                    self.url,
+                    content=self.data,
+                    headers=headers,
+                    timeout=ASYNC_TIMEOUT,
+                )
+            except Exception as exn:
+                breaker.record_failure()
+                if policy.should_retry(attempt):
+                    await asyncio.sleep(policy.backoff(attempt))
+                    continue
+                logging.exception(
+                    f"Instance {self.instance_id} failed to connect to task on url {self.url}.",
+                    exc_info=exn
+                )
+                return await self.raise_connection_error()
+
+            if self._forcefail:
+                logging.info(f'force failing call with code {self._forcefail_code}')
+                response.status_code = self._forcefail_code
+            self._record_outcome(breaker, policy, response.status_code)
+
+            if response.status_code < 400:
+                logging.info(
+                    f'Successfully made call for {self.instance_id}: {response}.'
+                )
+                return FlowPostResult(response, FlowPostStatus.SUCCESS)
+            logging.error(
+                f"Instance {self.instance_id} failed on task {self.task_id} {self.url}: "
+                f"{response.status_code}"
+            )
+            if policy.is_retryable_status(response.status_code) and policy.should_retry(attempt):
+                await asyncio.sleep(policy.backoff(attempt))
+                continue
+            if response.status_code in CONNECTION_ERROR_STATUSES:
+                return await self.raise_connection_error()
+            return await self.raise_task_error(response)
+
+    async def raise_task_error(self, response) -> FlowPostResult:
+        return await self._send_error_payload(self._task_error_payload(response))
+
+    async def cancel_instance(self) -> FlowPostResult:
+        return await self._send_error_payload(self._cancel_payload())
+
+    async def raise_connection_error(self) -> FlowPostResult:
+        return await self._send_error_payload(self._connection_error_payload())
+
+    async def _send_error_payload(self, payload: dict) -> FlowPostResult:
+        logging.info(
+            f"Sending message to flowd's instancefail endpoint for {self._instance_id}"
+        )
+        return self._error_result(await asyncio.wrap_future(self._report_error(payload)))
+
@@ -0,0 +1,215 @@
+"""Process-wide keep-alive HTTP sessions, one per upstream host.
+
+Calls between BPMN components used to go through the module-level
+`requests.post`, which opens (and closes) a TCP connection per call. The
+SessionPool hands out a `requests.Session` per scheme+host so that
+connections to the same upstream are reused. Use it through the singleton:
+
+    from flowlib.http_sessions import get_session_pool
+    response = get_session_pool().post(url, json=payload, headers=headers)
+
+Code running on an asyncio event loop uses the loop's httpx.AsyncClient
+instead, which pools connections the same way without blocking the loop:
+
+    response = await get_async_client().post(url, json=payload)
+"""
+import asyncio
+from collections import OrderedDict
+import threading
+from urllib.parse import urlparse
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from flowlib.config import (
+    HTTP_POOL_BLOCK,
+    HTTP_POOL_CONNECTIONS_PER_HOST,
+    HTTP_POOL_KEEP_ALIVE,
+    HTTP_POOL_MAX_HOSTS,
+)
+
+
+class SessionPool:
+    """Keeps up to max_hosts sessions, least recently used first out. Each
+    session keeps up to connections_per_host idle connections to its host.
+    A session hit is a call that found a session for its host already open.
+    """
+    def __init__(
+        self,
+        max_hosts: int = HTTP_POOL_MAX_HOSTS,
+        connections_per_host: int = HTTP_POOL_CONNECTIONS_PER_HOST,
+        block: bool = HTTP_POOL_BLOCK,
+        keep_alive: bool = HTTP_POOL_KEEP_ALIVE,
+    ):
+        self._max_hosts = max_hosts
+        self._connections_per_host = connections_per_host
+        self._block = block
+        self._keep_alive = keep_alive
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        # connection counts of sessions that have since been closed
+        self._closed_requests = 0
+        self._closed_connections = 0
+
+    @staticmethod
+    def host_key(url: str) -> str:
+        parsed = urlparse(url)
+        return f'{parsed.scheme}://{parsed.netloc}'
+
+    def session_for(self, url: str) -> requests.Session:
+        """Returns the session for the host of url, creating it if need be.
+        """
+        key = self.host_key(url)
+        evicted = None
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._hits += 1
+                self._sessions.move_to_end(key)
+                return session
+            self._misses += 1
+            session = self._new_session()
+            self._sessions[key] = session
+            if len(self._sessions) > self._max_hosts:
+                _, evicted = self._sessions.popitem(last=False)
+                self._evictions += 1
+        if evicted is not None:
+            self._close_session(evicted)
+        return session
+
+    def request(self, method: str, url: str, **kws) -> requests.models.Response:
+        return self.session_for(url).request(method.upper(), url, **kws)
+
+    def get(self, url: str, **kws) -> requests.models.Response:
+        return self.request('get', url, **kws)
+
+    def post(self, url: str, **kws) -> requests.models.Response:
+        return self.request('post', url, **kws)
+
+    def put(self, url: str, **kws) -> requests.models.Response:
+        return self.request('put', url, **kws)
+
+    def patch(self, url: str, **kws) -> requests.models.Response:
+        return self.request('patch', url, **kws)
+
+    def delete(self, url: str, **kws) -> requests.models.Response:
+        return self.request('delete', url, **kws)
+
+    def stats(self) -> dict:
+        """Session hits and misses, plus how many requests were made and how
+        many connections had to be opened for them. The difference between
+        the two is the number of requests that reused a kept-alive connection.
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+            result = {
+                'hosts': len(sessions),
+                'session_hits': self._hits,
+                'session_misses': self._misses,
+                'session_evictions': self._evictions,
+            }
+            requests_made = self._closed_requests
+            connections_opened = self._closed_connections
+        for session in sessions:
+            made, opened = self._connection_counts(session)
+            requests_made += made
+            connections_opened += opened
+        result['requests'] = requests_made
+        result['connections_opened'] = connections_opened
+        result['connections_reused'] = max(requests_made - connections_opened, 0)
+        return result
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            self._close_session(session)
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self._connections_per_host,
+            pool_block=self._block,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self._keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def _close_session(self, session: requests.Session):
+        made, opened = self._connection_counts(session)
+        with self._lock:
+            self._closed_requests += made
+            self._closed_connections += opened
+        session.close()
+
+    @staticmethod
+    def _connection_counts(session: requests.Session):
+        made = opened = 0
+        adapter = session.get_adapter('http://')
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                made += pool.num_requests
+                opened += pool.num_connections
+        return made, opened
+
+
+def _init_get_session_pool():
+    pool = None
+    lock = threading.Lock()
+
+    def _get_session_pool():
+        nonlocal pool
+        if pool is None:
+            with lock:
+                if pool is None:
+                    pool = SessionPool()
+        return pool
+    return _get_session_pool
+
+
+get_session_pool = _init_get_session_pool()
+
+
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the httpx.AsyncClient of the running event loop. An AsyncClient
+    cannot be shared between loops, so each loop gets its own, sized by the
+    same REXFLOW_HTTP_POOL_* settings as the SessionPool. httpx has no
+    per-host cap; with REXFLOW_HTTP_POOL_BLOCK set, the total number of
+    connections is capped at hosts * connections per host.
+    """
+    loop = asyncio.get_event_loop()
+    with _async_clients_lock:
+        client = _async_clients.get(loop)
+        if client is None or client.is_closed:
+            limits = httpx.Limits(
+                max_keepalive_connections=HTTP_POOL_CONNECTIONS_PER_HOST if HTTP_POOL_KEEP_ALIVE else 0,
+                max_connections=(
+                    HTTP_POOL_MAX_HOSTS * HTTP_POOL_CONNECTIONS_PER_HOST if HTTP_POOL_BLOCK else None
+                ),
+            )
+            client = httpx.AsyncClient(limits=limits)
+            _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Closes the running event loop's httpx.AsyncClient, if it has one.
+    """
+    with _async_clients_lock:
+        client = _async_clients.pop(asyncio.get_event_loop(), None)
+    if client is not None:
+        await client.aclose()
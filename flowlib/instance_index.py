@@ -0,0 +1,240 @@
+'''Secondary index of workflow instances by state and by metadata.
+
+Every write of an instance's state or metadata writes the matching index keys
+(see constants.InstanceIndexKeys) in the same etcd transaction: state
+transitions made through etcd_utils.try_transition_state() and friends keep
+the state index themselves, and metadata goes through metadata_ops(). A
+filtered ps then reads one short index prefix per state or metadata pair,
+rather than every key of every instance.
+
+Index entries are candidates only; readers check them against the instance
+itself. check_index() compares the index against the instances and, with
+repair=True, fixes whatever has drifted (instances written before the index
+existed, or by a writer that went around it).
+'''
+import heapq
+import itertools
+import json
+import logging
+from typing import Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from etcd3 import utils as etcd3_utils
+
+from .config import ETCD_TXN_MAX_OPS
+from .constants import InstanceIndexKeys, WorkflowInstanceKeys
+from . import etcd_utils
+
+
+def metadata_index_keys(iid: str, metadata: Mapping[str, str]) -> List[str]:
+    return sorted({InstanceIndexKeys.meta_key(key, value, iid) for key, value in metadata.items()})
+
+
+def metadata_ops(txns, iid: str, metadata: Mapping[str, str], old_metadata: Mapping[str, str] = None) -> list:
+    '''Ops that write an instance's metadata key together with its index
+    entries, removing the entries of old_metadata that no longer apply.
+    '''
+    keys = metadata_index_keys(iid, metadata)
+    ops = [txns.put(WorkflowInstanceKeys.metadata_key(iid), json.dumps(metadata))]
+    if old_metadata:
+        ops.extend(
+            txns.delete(key)
+            for key in metadata_index_keys(iid, old_metadata) if key not in keys
+        )
+    ops.extend(txns.put(key, b'') for key in keys)
+    return ops
+
+
+def put_metadata(etcd, items: Iterable[Tuple[str, Mapping[str, str]]], max_ops: int = ETCD_TXN_MAX_OPS) -> int:
+    '''Writes the metadata (and index entries) of many new instances, packing
+    as many instances into each etcd transaction as max_ops allows.
+    Arguments:
+        items - (iid, metadata) pairs.
+    Returns:
+        The number of transactions used.
+    '''
+    txns = etcd.transactions
+    batch, transactions = [], 0
+    for iid, metadata in items:
+        ops = metadata_ops(txns, iid, metadata)
+        if batch and len(batch) + len(ops) > max_ops:
+            etcd.transaction(compare=[], success=batch, failure=[])
+            batch, transactions = [], transactions + 1
+        batch.extend(ops)
+    if batch:
+        etcd.transaction(compare=[], success=batch, failure=[])
+        transactions += 1
+    return transactions
+
+
+def delete_ops(txns, iid: str, state: Optional[bytes], metadata: Optional[Mapping[str, str]]) -> list:
+    '''Ops that remove an instance's index entries, for use alongside deleting
+    the instance's keys.
+    '''
+    ops = []
+    if state is not None:
+        ops.append(txns.delete(InstanceIndexKeys.state_key(state, iid)))
+    if metadata:
+        ops.extend(txns.delete(key) for key in metadata_index_keys(iid, metadata))
+    return ops
+
+
+def is_ready(etcd) -> bool:
+    '''True once check_index(repair=True) has covered every instance, i.e. the
+    index can stand in for a full scan.
+    '''
+    return etcd.get(InstanceIndexKeys.READY)[0] is not None
+
+
+def _indexed_ids(etcd, index_prefix: str, id_prefix: str = '', after: str = None) -> Iterator[str]:
+    '''Yields, in order, the ids of the instances indexed under index_prefix
+    whose ids start with id_prefix and sort after `after`.
+    '''
+    start = None
+    if after is not None:
+        start = max(index_prefix + id_prefix, index_prefix + after + '\0')
+    for _, metadata in etcd_utils.iter_prefix(etcd, index_prefix + id_prefix, keys_only=True, start=start):
+        yield InstanceIndexKeys.iid_from_key(metadata.key)
+
+
+def find_instances(
+    etcd,
+    states: Iterable[str] = (),
+    metadata: Mapping[str, str] = None,
+    id_prefix: str = '',
+    after: str = None,
+) -> Iterator[str]:
+    '''Yields, in id order, the candidate instances for a state and/or
+    metadata filter. An instance is a candidate for metadata when it is
+    indexed under every pair; the states filter is left to the caller in
+    that case, since it checks each candidate anyway.
+    Arguments:
+        etcd - etcd client.
+        states - Instance states to look for (any of).
+        metadata - Metadata key/value pairs to look for (all of).
+        id_prefix - Only instances whose ids start with this.
+        after - Only instances whose ids sort after this one.
+    '''
+    if metadata:
+        candidates = None
+        for key, value in metadata.items():
+            ids = set(_indexed_ids(etcd, InstanceIndexKeys.meta_prefix(key, value), id_prefix, after))
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return
+        yield from sorted(candidates)
+    elif states:
+        yield from heapq.merge(*(
+            _indexed_ids(etcd, InstanceIndexKeys.state_prefix(state), id_prefix, after)
+            for state in sorted(set(states))
+        ))
+    else:
+        raise ValueError('find_instances() needs states or metadata to look for.')
+
+
+def read_instances(etcd, iids: Iterable[str], max_ops: int = ETCD_TXN_MAX_OPS) -> Iterator[Tuple[str, list]]:
+    '''Reads the keys of each instance in iids, up to max_ops instances per
+    etcd round trip.
+    Yields:
+        (iid, [(sub_key, value), ...]) for each instance that exists, in the
+        order of iids.
+    '''
+    txns = etcd.transactions
+    iids = iter(iids)
+    while True:
+        chunk = list(itertools.islice(iids, max_ops))
+        if not chunk:
+            break
+        ops = []
+        for iid in chunk:
+            prefix = etcd3_utils.to_bytes(WorkflowInstanceKeys.key_of(iid) + '/')
+            ops.append(txns.get(prefix, range_end=etcd3_utils.increment_last_byte(prefix)))
+        _, responses = etcd.transaction(compare=[], success=ops, failure=[])
+        for iid, response in zip(chunk, responses):
+            if response:
+                root = len(WorkflowInstanceKeys.key_of(iid)) + 1
+                yield iid, [(meta.key.decode('utf-8')[root:], value) for value, meta in response]
+
+
+def _expected_keys(iid: str, state: Optional[bytes], metadata: Optional[bytes]) -> set:
+    keys = set()
+    if state is not None:
+        keys.add(InstanceIndexKeys.state_key(state, iid))
+    if metadata:
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            metadata = None
+        if isinstance(metadata, dict):
+            keys.update(metadata_index_keys(iid, metadata))
+    return keys
+
+
+def check_index(etcd, repair: bool = False, max_ops: int = ETCD_TXN_MAX_OPS) -> dict:
+    '''Compares the index against the instances and optionally repairs it.
+    The instances and the index are read at the same revision. Each
+    instance's repair is its own nested transaction, guarded by the
+    mod_revisions of its state and metadata keys, so an instance written to
+    since it was read is left alone (that write kept its index entries).
+    Once a repair pass finishes, the index is marked ready (see is_ready()).
+    Arguments:
+        etcd - etcd client.
+        repair - Write the missing entries and delete the stale ones.
+        max_ops - etcd's --max-txn-ops; as many repairs as fit in it (see
+            etcd_utils.txn_chunks()) share a transaction.
+    Returns:
+        A dict of counts: instances, missing and stale entries, repaired and
+        skipped (changed concurrently) instances.
+    '''
+    root = WorkflowInstanceKeys.ROOT + '/'
+    # iid -> [state, state mod_revision, metadata, metadata mod_revision]
+    instances = {}
+    revision = None
+    for response in etcd_utils.get_prefix_pages(etcd, root):
+        revision = response.header.revision
+        for kv in response.kvs:
+            iid, _, sub_key = kv.key.decode('utf-8')[len(root):].partition('/')
+            record = instances.setdefault(iid, [None, 0, None, 0])
+            if sub_key == 'state':
+                record[0:2] = kv.value, kv.mod_revision
+            elif sub_key == 'metadata':
+                record[2:4] = kv.value, kv.mod_revision
+    indexed = {}
+    for index_root in (InstanceIndexKeys.STATE_ROOT, InstanceIndexKeys.META_ROOT):
+        for _, metadata in etcd_utils.iter_prefix(etcd, index_root + '/', keys_only=True, revision=revision):
+            key = metadata.key.decode('utf-8')
+            indexed.setdefault(InstanceIndexKeys.iid_from_key(key), set()).add(key)
+
+    report = dict(instances=len(instances), missing=0, stale=0, repaired=0, skipped=0)
+    fixes = []
+    for iid in sorted(set(instances) | set(indexed)):
+        state, state_rev, metadata, metadata_rev = instances.get(iid, [None, 0, None, 0])
+        expected = _expected_keys(iid, state, metadata)
+        actual = indexed.get(iid, set())
+        missing, stale = expected - actual, actual - expected
+        if missing or stale:
+            report['missing'] += len(missing)
+            report['stale'] += len(stale)
+            fixes.append((iid, state_rev, metadata_rev, sorted(missing), sorted(stale)))
+    if not repair:
+        return report
+
+    txns = etcd.transactions
+    ops = [
+        txns.txn(
+            compare=[
+                txns.mod(WorkflowInstanceKeys.state_key(iid)) == state_rev,
+                txns.mod(WorkflowInstanceKeys.metadata_key(iid)) == metadata_rev,
+            ],
+            success=[txns.delete(key) for key in stale] + [txns.put(key, b'') for key in missing],
+            failure=[],
+        )
+        for iid, state_rev, metadata_rev, missing, stale in fixes
+    ]
+    for chunk in etcd_utils.txn_chunks(ops, max_ops):
+        _, responses = etcd.transaction(compare=[], success=chunk, failure=[])
+        for response in responses:
+            report['repaired' if response.response_txn.succeeded else 'skipped'] += 1
+    etcd.put(InstanceIndexKeys.READY, str(revision or 0))
+    if fixes:
+        logging.info(f'Repaired the instance index: {report}')
+    return report
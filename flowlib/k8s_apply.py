@@ -0,0 +1,383 @@
+'''Pushing a deployment's k8s objects to the cluster, only as far as they
+changed.
+
+flowd used to pipe all of a deployment's specs through `kubectl apply` on
+every start, and through `kubectl delete` to remove it, waiting on one
+kubectl process either way. Now each deployment keeps in etcd (at
+WorkflowKeys.applied) a digest of every object last applied for it. apply()
+diffs new specs against that record: objects that are new or whose spec
+changed are sent with server-side apply, objects that are no longer in the
+specs are deleted, and the rest are left alone. The record only knows what
+flowd did, not what someone since deleted or edited by hand, so a start
+sends every object (full=True) and only updates and redeploys rely on it. The record is then updated;
+objects that failed to apply are kept in it with the FAILED digest, which
+matches no spec, so that the next apply retries them and remove() still
+deletes them.
+
+Requests go straight to the API server (K8S_API_SERVER), up to
+K8S_APPLY_WORKERS at a time. Namespaces are applied before, and deleted
+after, everything else. Without an API server to talk to, the same diff goes
+through kubectl, which then does its own server-side apply.
+
+Example:
+    >>> report, applied = apply(specs, applied)
+    >>> report
+    {'applied': 1, 'unchanged': 12, 'deleted': 0, 'failed': 0, ...}
+'''
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+import yaml
+
+from .config import (
+    K8S_API_SERVER,
+    K8S_API_TIMEOUT,
+    K8S_APPLY_WORKERS,
+    K8S_CA_FILE,
+    K8S_FIELD_MANAGER,
+    K8S_TOKEN_FILE,
+)
+
+
+SpecLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Kinds that are not in a namespace, out of those flowd deploys.
+CLUSTER_KINDS = {'Namespace', 'ClusterRole', 'ClusterRoleBinding', 'CustomResourceDefinition'}
+
+# Kinds whose resource name isn't their lowercased name plus an s.
+RESOURCE_NAMES = {
+    'Endpoints': 'endpoints',
+    'Ingress': 'ingresses',
+    'NetworkPolicy': 'networkpolicies',
+    'PodSecurityPolicy': 'podsecuritypolicies',
+}
+
+APPLY_CONTENT_TYPE = 'application/apply-patch+yaml'
+
+# Recorded digest of an object whose apply failed: it may or may not exist.
+FAILED = 'failed'
+
+
+def load_specs(specs_yaml: str) -> List[dict]:
+    return [spec for spec in yaml.load_all(specs_yaml, Loader=SpecLoader) if spec]
+
+
+def object_key(spec: Mapping) -> str:
+    '''Identifies the object spec describes:
+    "<apiVersion>/<kind>/<namespace>/<name>", with an empty namespace for
+    cluster-wide kinds.
+    '''
+    metadata = spec['metadata']
+    namespace = '' if spec['kind'] in CLUSTER_KINDS else metadata.get('namespace', 'default')
+    return f"{spec['apiVersion']}/{spec['kind']}/{namespace}/{metadata['name']}"
+
+
+def split_key(key: str) -> Tuple[str, str, str, str]:
+    '''(apiVersion, kind, namespace, name) of an object_key().'''
+    return tuple(key.rsplit('/', 3))
+
+
+def spec_digest(spec: Mapping) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def _is_namespace(key: str) -> bool:
+    return split_key(key)[1] == 'Namespace'
+
+
+class SpecDiff(NamedTuple):
+    changed: List[dict]  # specs of new and changed objects
+    removed: List[str]  # keys of objects that are no longer in the specs
+    unchanged: int
+    digests: Dict[str, str]  # object key -> digest, of all the new specs
+
+
+def diff_specs(specs: Iterable[Mapping], applied: Mapping[str, str] = None) -> SpecDiff:
+    '''Diffs specs against the digests of the objects last applied.'''
+    applied = applied or {}
+    digests = {}
+    changed = []
+    for spec in specs:
+        key = object_key(spec)
+        digests[key] = spec_digest(spec)
+        if applied.get(key) != digests[key]:
+            changed.append(spec)
+    removed = [key for key in applied if key not in digests]
+    return SpecDiff(changed, removed, len(digests) - len(changed), digests)
+
+
+class KubernetesApi:
+    '''Server-side apply and delete of objects through the API server, over
+    one keep-alive session, on a pool of workers threads.
+    The bearer token is either fixed (token) or read from token_file, which
+    is read again whenever it changes, since the kubelet rotates projected
+    service account tokens, and once more if the API server answers 401.
+    '''
+    def __init__(
+        self,
+        server: str,
+        token: str = None,
+        verify=True,
+        workers: int = K8S_APPLY_WORKERS,
+        timeout: float = K8S_API_TIMEOUT,
+        field_manager: str = K8S_FIELD_MANAGER,
+        token_file: str = None,
+    ):
+        self.server = server.rstrip('/')
+        self.timeout = timeout
+        self.field_manager = field_manager
+        self.token_file = token_file
+        self._token = token
+        self._token_mtime = None
+        self._token_lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.verify = verify
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='k8s-apply')
+
+    def url(self, key: str) -> str:
+        api_version, kind, namespace, name = split_key(key)
+        base = '/api/v1' if api_version == 'v1' else f'/apis/{api_version}'
+        resource = RESOURCE_NAMES.get(kind, f'{kind.lower()}s')
+        if namespace:
+            return f'{self.server}{base}/namespaces/{namespace}/{resource}/{name}'
+        return f'{self.server}{base}/{resource}/{name}'
+
+    def token(self, reread: bool = False) -> Optional[str]:
+        '''The bearer token, from token_file if there is one and it can be
+        read, else the fixed token.
+        '''
+        if self.token_file is None:
+            return self._token
+        try:
+            mtime = os.stat(self.token_file).st_mtime_ns
+        except OSError:
+            return self._token
+        with self._token_lock:
+            if reread or mtime != self._token_mtime:
+                self._token = _read(self.token_file)
+                self._token_mtime = mtime
+            return self._token
+
+    def _request(self, method: str, key: str, headers: Mapping = None, **kws) -> requests.Response:
+        for attempt in range(2):
+            token = self.token(reread=attempt > 0)
+            auth = {'Authorization': f'Bearer {token}'} if token is not None else {}
+            response = self.session.request(
+                method, self.url(key), headers={**(headers or {}), **auth}, timeout=self.timeout, **kws,
+            )
+            if response.status_code != 401 or self.token_file is None:
+                break
+        return response
+
+    def apply(self, spec: Mapping):
+        response = self._request(
+            'PATCH',
+            object_key(spec),
+            params={'fieldManager': self.field_manager, 'force': 'true'},
+            data=json.dumps(spec),  # JSON is YAML
+            headers={'Content-Type': APPLY_CONTENT_TYPE},
+        )
+        response.raise_for_status()
+
+    def delete(self, key: str):
+        response = self._request('DELETE', key, json={'propagationPolicy': 'Background'})
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    def apply_all(self, specs: List[Mapping]) -> Dict[str, Exception]:
+        '''Applies specs, Namespaces first. Returns the errors by object key.'''
+        namespaces = [spec for spec in specs if spec['kind'] == 'Namespace']
+        others = [spec for spec in specs if spec['kind'] != 'Namespace']
+        errors = self._run(self.apply, namespaces, object_key)
+        errors.update(self._run(self.apply, others, object_key))
+        return errors
+
+    def delete_all(self, keys: List[str]) -> Dict[str, Exception]:
+        '''Deletes the objects of keys, Namespaces last. Returns the errors by
+        object key.
+        '''
+        errors = self._run(self.delete, [key for key in keys if not _is_namespace(key)], str)
+        errors.update(self._run(self.delete, [key for key in keys if _is_namespace(key)], str))
+        return errors
+
+    def _run(self, method, items, key_of) -> Dict[str, Exception]:
+        futures = [(key_of(item), self._executor.submit(method, item)) for item in items]
+        errors = {}
+        for key, future in futures:
+            exn = future.exception()
+            if exn is not None:
+                errors[key] = exn
+        return errors
+
+
+class Kubectl:
+    '''The same as KubernetesApi, through one kubectl run per call.'''
+    def __init__(self, field_manager: str = K8S_FIELD_MANAGER):
+        self.field_manager = field_manager
+
+    def apply_all(self, specs: List[Mapping]) -> Dict[str, Exception]:
+        return self._run(
+            ['apply', '--server-side', '--force-conflicts', f'--field-manager={self.field_manager}'],
+            specs,
+        )
+
+    def delete_all(self, keys: List[str]) -> Dict[str, Exception]:
+        stubs = []
+        for key in keys:
+            api_version, kind, namespace, name = split_key(key)
+            metadata = {'name': name, 'namespace': namespace} if namespace else {'name': name}
+            stubs.append({'apiVersion': api_version, 'kind': kind, 'metadata': metadata})
+        return self._run(['delete', '--ignore-not-found'], stubs)
+
+    def _run(self, args, specs) -> Dict[str, Exception]:
+        if not specs:
+            return {}
+        kubectl_result = subprocess.run(
+            ['kubectl', *args, '-f', '-'],
+            input=yaml.safe_dump_all(specs), capture_output=True, text=True,
+        )
+        if kubectl_result.stdout:
+            logging.info(f'Got following output from Kubernetes:\n{kubectl_result.stdout}')
+        if kubectl_result.returncode == 0:
+            return {}
+        exn = RuntimeError(f'kubectl {args[0]} failed: {kubectl_result.stderr}')
+        return {object_key(spec): exn for spec in specs}
+
+
+class ApplyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.applies = 0
+        self.removes = 0
+        self.totals = {'applied': 0, 'unchanged': 0, 'deleted': 0, 'failed': 0}
+        self.last = None
+
+    def record(self, report: Mapping, remove: bool = False):
+        with self._lock:
+            if remove:
+                self.removes += 1
+            else:
+                self.applies += 1
+            for name in self.totals:
+                self.totals[name] += report[name]
+            self.last = dict(report)
+
+    def stats(self):
+        with self._lock:
+            return {'applies': self.applies, 'removes': self.removes, **self.totals, 'last': self.last}
+
+
+_stats = ApplyStats()
+
+
+def _report(applied, unchanged, deleted, failed, apply_time, remove_time):
+    return {
+        'applied': applied,
+        'unchanged': unchanged,
+        'deleted': deleted,
+        'failed': failed,
+        'apply_time': apply_time,
+        'remove_time': remove_time,
+    }
+
+
+def apply(
+    specs: List[Mapping], applied: Mapping[str, str] = None, api=None, full: bool = False,
+) -> Tuple[dict, Dict[str, str]]:
+    '''Applies specs, given the digests of the objects last applied for the
+    same deployment (None if there are none). With full, every spec is sent,
+    changed or not; objects no longer in specs are deleted either way.
+    Returns:
+        The report, with the object counts and the seconds spent applying and
+        removing objects, and the digests of the objects now applied (FAILED
+        for those that failed to).
+    '''
+    api = get_k8s_api() if api is None else api
+    diff = diff_specs(specs, applied)
+    if full:
+        diff = diff._replace(changed=list(specs), unchanged=0)
+    start = time.perf_counter()
+    apply_errors = api.apply_all(diff.changed)
+    apply_time = time.perf_counter() - start
+    start = time.perf_counter()
+    remove_errors = api.delete_all(diff.removed)
+    remove_time = time.perf_counter() - start
+
+    digests = dict(diff.digests)
+    for key in apply_errors:
+        digests[key] = FAILED
+    for key in remove_errors:
+        digests[key] = applied[key]
+    for key, exn in {**apply_errors, **remove_errors}.items():
+        logging.error(f'Failed to update {key}: {exn}')
+    report = _report(
+        len(diff.changed) - len(apply_errors), diff.unchanged, len(diff.removed) - len(remove_errors),
+        len(apply_errors) + len(remove_errors), apply_time, remove_time,
+    )
+    _stats.record(report)
+    logging.info(
+        f"Applied {report['applied']} k8s objects in {apply_time:.3f}s, removed {report['deleted']} "
+        f"in {remove_time:.3f}s; {report['unchanged']} unchanged, {report['failed']} failed."
+    )
+    return report, digests
+
+
+def remove(keys: Iterable[str], api=None) -> Tuple[dict, List[str]]:
+    '''Deletes the objects of keys (object_key()s).
+    Returns:
+        The report, and the keys of the objects that could not be deleted.
+    '''
+    api = get_k8s_api() if api is None else api
+    keys = list(keys)
+    start = time.perf_counter()
+    errors = api.delete_all(keys)
+    remove_time = time.perf_counter() - start
+    for key, exn in errors.items():
+        logging.error(f'Failed to delete {key}: {exn}')
+    report = _report(0, 0, len(keys) - len(errors), len(errors), 0.0, remove_time)
+    _stats.record(report, remove=True)
+    logging.info(f"Removed {report['deleted']} k8s objects in {remove_time:.3f}s; {report['failed']} failed.")
+    return report, list(errors)
+
+
+_api = None
+_api_lock = threading.Lock()
+
+
+def _read(path) -> Optional[str]:
+    if path and os.path.exists(path):
+        with open(path, 'r') as token_file:
+            return token_file.read().strip()
+    return None
+
+
+def get_k8s_api():
+    '''The KubernetesApi of K8S_API_SERVER, or a Kubectl if there is none.'''
+    global _api
+    with _api_lock:
+        if _api is None:
+            if K8S_API_SERVER is not None:
+                verify = K8S_CA_FILE if K8S_CA_FILE and os.path.exists(K8S_CA_FILE) else True
+                _api = KubernetesApi(K8S_API_SERVER, verify=verify, token_file=K8S_TOKEN_FILE)
+                logging.info(f'Applying k8s objects through {K8S_API_SERVER}.')
+            else:
+                _api = Kubectl()
+                logging.info('Applying k8s objects with kubectl: no API server configured.')
+        return _api
+
+
+def get_k8s_apply_stats():
+    '''Object counts of the applies and removes so far, and the last report.'''
+    return _stats.stats()
@@ -30,6 +30,7 @@ from .bpmn_util import (
     ServiceProperties,
     HealthProperties,
     BPMNComponent,
+    AnnotationIndex,
 )
 
 
@@ -39,12 +40,13 @@ logging.basicConfig(level=logging.INFO)
 class BPMNParallelGateway(BPMNComponent):
     '''Wrapper for BPMN service task metadata.
     '''
-    def __init__(self, gateway: OrderedDict, process: OrderedDict=None, global_props=None):
+    def __init__(self, gateway: OrderedDict, process: OrderedDict=None, global_props=None,
+                 annotations: AnnotationIndex = None):
 
         if process is None:
             process = OrderedDict()
 
-        super().__init__(gateway, process, global_props)
+        super().__init__(gateway, process, global_props, annotations=annotations)
         self.forward_componentids = []
         self.forward_componentid = None
         self.incoming_call_count = 0
@@ -70,6 +72,9 @@ class BPMNParallelGateway(BPMNComponent):
         # 2. Store the config in env vars for the deployment
         # Both of these things will be done in the to_kubernetes() function.
 
+    def kafka_transport_targets(self, sequence_flow_table: Mapping[str, Any]) -> List[str]:
+        return []
+
     def to_kubernetes(self, id_hash, component_map: Mapping[str, BPMNComponent], digraph: OrderedDict) -> list:
         '''Takes in a dict which maps a BPMN component id* to a BPMNComponent Object,
         and an OrderedDict which represents the whole BPMN Process as a directed graph.
@@ -8,6 +8,15 @@ from quart import Quart
 from hypercorn.config import Config
 from hypercorn.asyncio import serve
 
+from flowlib.circuit_breaker import get_circuit_breaker_stats
+from flowlib.constants import flow_result
+from flowlib.failure_reporter import get_failure_reporter_stats
+from flowlib.http_sessions import close_async_client, get_session_pool
+from flowlib.retry_policy import get_retry_budget
+from flowlib.shadowing import close_shadowers, get_shadower_stats
+from flowlib.spec_cache import get_spec_cache_stats
+from flowlib.workflow_cache import get_workflow_cache_stats
+
 
 class QuartApp:
     def __init__(self, name, config: Mapping[str, Any] = None, **kws):
@@ -16,6 +25,28 @@ class QuartApp:
             kws.update(config)
         self.config = Config.from_mapping(kws)
         self.shutdown_event = asyncio.Event()
+        self.app.route('/metrics', methods=['GET'])(self.metrics)
+        self.app.after_serving(self._after_serving)
+
+    def metrics(self):
+        return flow_result(0, 'Ok', **self._metrics())
+
+    def _metrics(self) -> dict:
+        '''Subclasses extend this with their own counters.'''
+        return {
+            'http_sessions': get_session_pool().stats(),
+            'retry_budget': get_retry_budget().stats(),
+            'circuit_breakers': get_circuit_breaker_stats(),
+            'shadowing': get_shadower_stats(),
+            'failure_reports': get_failure_reporter_stats(),
+            'workflow_cache': get_workflow_cache_stats(),
+            'spec_cache': get_spec_cache_stats(),
+        }
+
+    async def _after_serving(self):
+        # send whatever shadow traffic is still queued before we go.
+        await asyncio.get_event_loop().run_in_executor(None, close_shadowers)
+        await close_async_client()
 
     def _shutdown(self):
         pass
@@ -142,6 +142,16 @@ TransportCallDetails = namedtuple(
 )
 
 
+def kafka_transport_topic(from_component: BPMNComponent, to_component: BPMNComponent) -> str:
+    '''Name of the kafka topic that carries reliable transport between two
+    BPMNComponents.
+    '''
+    kafka_topic_name = to_valid_k8s_name(REXFLOW_ROOT_PREFIX)
+    kafka_topic_name += f'-transport_{from_component.workflow_properties.id}_'
+    kafka_topic_name += f'{from_component.name}_to_{to_component.name}'
+    return kafka_topic_name
+
+
 def create_kafka_transport(
         from_component: BPMNComponent, to_component: BPMNComponent) -> TransportCallDetails:
     '''Creates k8s specs for reliable transport via kafka between two BPMNComponents. There are
@@ -171,9 +181,7 @@ def create_kafka_transport(
         f'catch-{from_component.name}-to-{to_component.name}-{id_hash}'
     )
 
-    kafka_topic_name = to_valid_k8s_name(REXFLOW_ROOT_PREFIX)
-    kafka_topic_name += f'-transport_{from_component.workflow_properties.id}_'
-    kafka_topic_name += f'{from_component.name}_to_{to_component.name}'
+    kafka_topic_name = kafka_transport_topic(from_component, to_component)
 
     wf_id = from_component.workflow_properties.id
     assert wf_id == to_component.workflow_properties.id, \
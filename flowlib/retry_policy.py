@@ -0,0 +1,157 @@
+"""Retry policy for calls between BPMN components.
+
+A RetryPolicy says how many times a call is attempted, which failures are
+worth another attempt, and how long to wait before each retry (capped
+exponential backoff with full jitter). Every policy draws its retries from
+the per-process RetryBudget, so that during an upstream brownout retries
+stay a bounded fraction of the traffic instead of multiplying it.
+
+The number of attempts comes from the `retry` annotation of a task:
+
+    retry:
+      total_attempts: 3
+      backoff_base: 0.2       # optional, seconds
+      backoff_max: 2          # optional, seconds
+      retryable_statuses: [502, 503, 504]   # optional
+"""
+import logging
+import random
+import threading
+import time
+from typing import Any, Iterable, Mapping, Optional
+
+from flowlib.config import (
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+    RETRY_BUDGET_MIN_PER_SECOND,
+    RETRY_BUDGET_PERCENT,
+    RETRY_BUDGET_WINDOW,
+)
+
+
+# Statuses that mean the upstream (or the sidecar in front of it) is
+# unavailable right now, rather than that it rejected the request.
+DEFAULT_RETRYABLE_STATUSES = (502, 503)
+
+
+class RetryBudget:
+    """Allows retries up to `percent` percent of the calls recorded in the
+    last `window` seconds, plus `min_per_second` retries a second so that
+    a quiet process can still retry. Counts are kept in one-second buckets.
+    """
+    def __init__(
+        self,
+        percent: float = RETRY_BUDGET_PERCENT,
+        min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND,
+        window: int = RETRY_BUDGET_WINDOW,
+    ):
+        self._ratio = percent / 100
+        self._min_per_second = min_per_second
+        self._window = window
+        self._buckets = {}  # second -> [calls, retries]
+        self._lock = threading.Lock()
+        self._denied = 0
+
+    def record_call(self):
+        with self._lock:
+            self._bucket()[0] += 1
+
+    def try_withdraw(self) -> bool:
+        """Returns True, and counts a retry, if the budget allows one more.
+        """
+        with self._lock:
+            bucket = self._bucket()
+            calls = sum(c for c, _ in self._buckets.values())
+            retries = sum(r for _, r in self._buckets.values())
+            if retries + 1 > calls * self._ratio + self._min_per_second * self._window:
+                self._denied += 1
+                return False
+            bucket[1] += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._bucket()
+            return {
+                'calls': sum(c for c, _ in self._buckets.values()),
+                'retries': sum(r for _, r in self._buckets.values()),
+                'denied': self._denied,
+                'window': self._window,
+            }
+
+    def _bucket(self) -> list:
+        now = int(time.monotonic())
+        for second in [s for s in self._buckets if s <= now - self._window]:
+            del self._buckets[second]
+        return self._buckets.setdefault(now, [0, 0])
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_retry_budget() -> RetryBudget:
+    global _budget
+    if _budget is None:
+        with _budget_lock:
+            if _budget is None:
+                _budget = RetryBudget()
+    return _budget
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        total_attempts: int = 2,
+        backoff_base: float = RETRY_BACKOFF_BASE,
+        backoff_max: float = RETRY_BACKOFF_MAX,
+        retryable_statuses: Iterable[int] = DEFAULT_RETRYABLE_STATUSES,
+        budget: Optional[RetryBudget] = None,
+    ):
+        assert total_attempts >= 1, 'total_attempts must be at least 1'
+        self.total_attempts = int(total_attempts)
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.retryable_statuses = frozenset(int(status) for status in retryable_statuses)
+        self._budget = budget
+
+    @classmethod
+    def from_annotation(cls, retry: Mapping[str, Any]) -> 'RetryPolicy':
+        """Builds a policy from the `retry` annotation of a BPMN task.
+        """
+        kws = {
+            key: retry[key]
+            for key in ('total_attempts', 'backoff_base', 'backoff_max', 'retryable_statuses')
+            if retry.get(key) is not None
+        }
+        return cls(**kws)
+
+    @property
+    def budget(self) -> RetryBudget:
+        return self._budget if self._budget is not None else get_retry_budget()
+
+    def is_retryable_status(self, status_code: int) -> bool:
+        return status_code in self.retryable_statuses
+
+    def should_retry(self, attempt: int) -> bool:
+        """Called after attempt number `attempt` (counting from 1) failed in
+        a retryable way. Returns True if another attempt may be made, taking
+        it out of the retry budget.
+        """
+        if attempt >= self.total_attempts:
+            return False
+        if not self.budget.try_withdraw():
+            logging.warning('Retry budget exhausted, not retrying.')
+            return False
+        return True
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait before the retry that follows attempt `attempt`.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def __repr__(self):
+        return (
+            f'RetryPolicy(total_attempts={self.total_attempts}, backoff_base={self.backoff_base}, '
+            f'backoff_max={self.backoff_max}, retryable_statuses={sorted(self.retryable_statuses)})'
+        )
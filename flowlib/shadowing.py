@@ -0,0 +1,285 @@
+"""Traffic shadowing: a copy of every call between BPMN components is sent to
+the workflow's publisher (daemons/workflow_publisher.py), which puts it on the
+workflow's notification Kafka topic.
+
+Shadowing is best-effort and must never hold up the call being shadowed, so
+components hand records to a TrafficShadower, which queues them in memory
+(dropping, and counting, what does not fit) and sends them from a background
+thread in batches. Every component in a process shares one shadower per
+destination:
+
+    get_shadower(shadow_url).submit(data, headers)
+
+Records are POSTed as a JSON list to the publisher's /batch endpoint, or,
+with REXFLOW_SHADOW_KAFKA_TOPIC set, produced straight to Kafka in the same
+message format the publisher uses.
+"""
+import atexit
+import base64
+import collections
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+from urllib.parse import urljoin
+
+from flowlib.config import (
+    SHADOW_BATCH_SIZE,
+    SHADOW_FLUSH_TIMEOUT,
+    SHADOW_KAFKA_TOPIC,
+    SHADOW_LINGER,
+    SHADOW_QUEUE_SIZE,
+    get_kafka_config,
+)
+from flowlib.constants import Headers
+from flowlib.http_sessions import get_session_pool
+
+
+# Event type of shadowed requests on the notification topic.
+REQUEST_SENT = "REQUEST_SENT"
+
+# Path of the publisher's batch endpoint, relative to the shadow url.
+BATCH_PATH = 'batch'
+
+ShadowRecord = Tuple[Union[bytes, str], Dict[str, str]]
+
+
+def jsonify_or_encode_data(data: Union[bytes, str]) -> Union[dict, str]:
+    """Returns data in dict format (via json.loads()) if possible. If that is
+    not possible, base64-encodes it and returns it in string format.
+    """
+    try:
+        return json.loads(data.decode()) if isinstance(data, bytes) else json.loads(data)
+    except Exception as exn:
+        logging.exception(
+            f"Failed decoding json {data}",
+            exc_info=exn,
+        )
+        to_encode = data if isinstance(data, bytes) else data.encode()
+        encoded_bytes = base64.b64encode(to_encode) # type: bytes
+        return encoded_bytes.decode()
+
+
+def publisher_message(workflow_id: str, data: Union[bytes, str], headers: Mapping[str, str]):
+    """Builds the Kafka message for a shadowed request.
+    Returns:
+        (body, message_headers)
+    """
+    lowered = {k.lower(): v for k, v in headers.items()}
+    message_headers = {
+        'instance_id': lowered.get(Headers.X_HEADER_FLOW_ID.lower()),
+        'workflow_id': workflow_id,
+        'event_type': REQUEST_SENT,
+        'content-type': 'application/json',
+    }
+    payload = {
+        'request_data': jsonify_or_encode_data(data),
+        'request_headers': dict(headers),
+        **message_headers,
+    }
+    return json.dumps(payload), message_headers
+
+
+def encode_batch(records: List[ShadowRecord]) -> str:
+    """Body of a POST to the publisher's /batch endpoint.
+    """
+    return json.dumps([
+        {
+            'headers': dict(headers),
+            'data': base64.b64encode(data if isinstance(data, bytes) else data.encode()).decode(),
+        }
+        for data, headers in records
+    ])
+
+
+def decode_batch(body: Union[bytes, str]) -> List[ShadowRecord]:
+    return [
+        (base64.b64decode(record['data']), record['headers'])
+        for record in json.loads(body)
+    ]
+
+
+class HttpBatchSink:
+    """Sends batches to the publisher's /batch endpoint. Publishers that
+    predate it get the records one POST at a time, as before.
+    """
+    def __init__(self, url: str):
+        self.url = url
+        self.batch_url = urljoin(url, BATCH_PATH)
+        self._batch_supported = True
+
+    def send(self, records: List[ShadowRecord]):
+        pool = get_session_pool()
+        if self._batch_supported:
+            response = pool.post(
+                self.batch_url,
+                data=encode_batch(records),
+                headers={'content-type': 'application/json'},
+            )
+            if response.status_code not in (404, 405):
+                response.raise_for_status()
+                return
+            logging.warning(f'{self.batch_url} does not take batches; shadowing one record at a time.')
+            self._batch_supported = False
+        for data, headers in records:
+            pool.post(self.url, data=data, headers=headers).raise_for_status()
+
+
+class KafkaSink:
+    """Produces shadow records straight to a Kafka topic.
+    """
+    def __init__(self, topic: str, producer=None):
+        self.topic = topic
+        if producer is None:
+            from confluent_kafka import Producer
+            producer = Producer(get_kafka_config())
+        self._producer = producer
+
+    def send(self, records: List[ShadowRecord]):
+        for data, headers in records:
+            lowered = {k.lower(): v for k, v in headers.items()}
+            body, message_headers = publisher_message(
+                lowered.get(Headers.X_HEADER_WORKFLOW_ID.lower()), data, headers,
+            )
+            self._producer.produce(self.topic, body, headers=message_headers)
+        self._producer.flush()
+
+
+class TrafficShadower:
+    """Bounded queue of shadow records plus the thread that drains it.
+    """
+    def __init__(
+        self,
+        sink,
+        max_queue: int = SHADOW_QUEUE_SIZE,
+        batch_size: int = SHADOW_BATCH_SIZE,
+        linger: float = SHADOW_LINGER,
+    ):
+        self.sink = sink
+        self._max_queue = max_queue
+        self._batch_size = batch_size
+        self._linger = linger
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._closed = False
+        self._counts = collections.Counter()
+        self._thread = threading.Thread(target=self._run, name='shadower', daemon=True)
+        self._thread.start()
+
+    def submit(self, data: Union[bytes, str], headers: Mapping[str, str]) -> bool:
+        """Queues a record without blocking. Returns False if it was dropped.
+        """
+        with self._cond:
+            if self._closed or len(self._queue) >= self._max_queue:
+                self._counts['dropped'] += 1
+                return False
+            self._queue.append((data, dict(headers)))
+            self._counts['submitted'] += 1
+            if len(self._queue) == 1 or len(self._queue) >= self._batch_size:
+                self._cond.notify_all()
+            return True
+
+    def flush(self, timeout: float = SHADOW_FLUSH_TIMEOUT) -> bool:
+        """Waits until everything queued so far has been sent (or failed).
+        Returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._queue or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = SHADOW_FLUSH_TIMEOUT) -> bool:
+        """Flushes, then stops the sender. Records submitted afterwards are dropped.
+        """
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        return flushed
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(self._counts, queued=len(self._queue))
+
+    def _take_batch(self) -> Optional[List[ShadowRecord]]:
+        with self._cond:
+            while not self._queue:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            # give a small batch a moment to fill up
+            deadline = time.monotonic() + self._linger
+            while len(self._queue) < self._batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(self._batch_size, len(self._queue))
+            batch = [self._queue.popleft() for _ in range(count)]
+            self._in_flight = count
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                self.sink.send(batch)
+                outcome = 'sent'
+            except Exception as exn:
+                logging.warning(f'Failed shadowing {len(batch)} records: {exn}')
+                outcome = 'failed'
+            with self._cond:
+                self._counts[outcome] += len(batch)
+                self._counts['batches'] += 1
+                self._in_flight = 0
+                self._cond.notify_all()
+
+
+_shadowers = {}
+_shadowers_lock = threading.Lock()
+
+
+def get_shadower(url: str) -> TrafficShadower:
+    """Returns the process-wide shadower for a shadow url.
+    """
+    shadower = _shadowers.get(url)
+    if shadower is None:
+        with _shadowers_lock:
+            shadower = _shadowers.get(url)
+            if shadower is None:
+                if SHADOW_KAFKA_TOPIC and get_kafka_config() is not None:
+                    sink = KafkaSink(SHADOW_KAFKA_TOPIC)
+                else:
+                    sink = HttpBatchSink(url)
+                shadower = _shadowers[url] = TrafficShadower(sink)
+    return shadower
+
+
+def get_shadower_stats() -> dict:
+    with _shadowers_lock:
+        shadowers = dict(_shadowers)
+    return {url: shadower.stats() for url, shadower in shadowers.items()}
+
+
+def close_shadowers(timeout: float = SHADOW_FLUSH_TIMEOUT):
+    """Flushes and stops every shadower. Runs at interpreter exit.
+    """
+    with _shadowers_lock:
+        shadowers = list(_shadowers.values())
+        _shadowers.clear()
+    deadline = time.monotonic() + timeout
+    for shadower in shadowers:
+        if not shadower.close(max(deadline - time.monotonic(), 0)):
+            logging.warning(f'Gave up flushing shadow traffic: {shadower.stats()}')
+
+
+atexit.register(close_shadowers)
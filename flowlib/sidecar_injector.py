@@ -0,0 +1,466 @@
+'''Manual Istio sidecar injection.
+
+On docker-desktop, Istio cannot easily be configured to inject our own proxy
+image, so flowd injects the sidecars itself when DO_MANUAL_INJECTION is set.
+By default (SIDECAR_INJECTOR 'istioctl') it pipes the generated YAML through
+`istioctl kube-inject` and patches the output as text: istioctl_inject().
+With SIDECAR_INJECTOR 'native', inject_sidecars() applies the same injection
+template to the pod templates of the spec dicts instead, before they are
+dumped to YAML, so no istioctl binary or subprocess is needed. Without
+istioctl on the PATH, the native injector is used either way.
+
+The template is a dict of the pod fields injection adds: annotations and
+labels (added unless the pod already has them), init containers, containers
+and volumes (appended), the pod securityContext (if the pod has none) and
+the imagePullPolicy given to the injected containers and to any of the
+pod's containers that would always pull. With rewriteAppHTTPProbers set, the
+app containers' httpGet probes are rewritten as Istio does: they go to
+pilot-agent at /app-health/<container>/livez (readyz, startupz) on the
+template's statusPort, and the istio-proxy container is given the original
+probes in ISTIO_KUBE_APP_PROBERS, so that the kubelet's probes still work
+under mutual TLS. A pod opts out with the
+sidecar.istio.io/rewriteAppHTTPProbers: "false" annotation. The default is
+Istio 1.8's sidecar template with istioctl's defaults, using
+REX_ISTIO_PROXY_IMAGE for the proxy.
+REXFLOW_SIDECAR_TEMPLATE may name a YAML file of the same layout to use
+instead, for example to match a cluster's istio-sidecar-injector configmap.
+String values may refer to the pod being injected as ${name}, ${namespace},
+${app}, ${revision}, ${owner}, ${pod_ports} and ${app_containers}.
+'''
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+from string import Template
+from typing import Iterable, Mapping, Optional
+
+import yaml
+
+from .config import SIDECAR_INJECTOR, SIDECAR_TEMPLATE
+
+
+ISTIO_VERSION = os.getenv('ISTIO_VERSION', '1.8.2')
+REX_ISTIO_PROXY_IMAGE = os.getenv('REX_ISTIO_PROXY_IMAGE', 'rex-proxy:1.8.2')
+
+STATUS_ANNOTATION = 'sidecar.istio.io/status'
+INJECT_ANNOTATION = 'sidecar.istio.io/inject'
+REWRITE_PROBES_ANNOTATION = 'sidecar.istio.io/rewriteAppHTTPProbers'
+
+PROXY_CONTAINER = 'istio-proxy'
+APP_PROBERS_ENV = 'ISTIO_KUBE_APP_PROBERS'
+
+# Probe fields of a container, and the pilot-agent path each goes to.
+APP_PROBES = (
+    ('readinessProbe', '/app-health/{}/readyz'),
+    ('livenessProbe', '/app-health/{}/livez'),
+    ('startupProbe', '/app-health/{}/startupz'),
+)
+
+# Values Go's strconv.ParseBool takes, as Istio parses annotations.
+_TRUE = frozenset(['1', 't', 'T', 'TRUE', 'true', 'True'])
+_FALSE = frozenset(['0', 'f', 'F', 'FALSE', 'false', 'False'])
+
+# istioctl kube-inject flags for the files of an injector config, which let
+# it run without a cluster to read the config from.
+ISTIOCTL_CONFIG_FILES = {
+    '--meshConfigFile': 'mesh.yaml',
+    '--injectConfigFile': 'inject-config.yaml',
+    '--valuesFile': 'values.yaml',
+}
+
+# Namespaces istioctl never injects into.
+IGNORED_NAMESPACES = frozenset(['kube-system', 'kube-public'])
+
+# Where the pod template sits in each kind of workload istioctl injects.
+POD_TEMPLATE_PATHS = {
+    'Pod': (),
+    'Deployment': ('spec', 'template'),
+    'ReplicaSet': ('spec', 'template'),
+    'StatefulSet': ('spec', 'template'),
+    'DaemonSet': ('spec', 'template'),
+    'Job': ('spec', 'template'),
+    'ReplicationController': ('spec', 'template'),
+    'DeploymentConfig': ('spec', 'template'),
+    'CronJob': ('spec', 'jobTemplate', 'spec', 'template'),
+}
+
+
+def _resources(requests_cpu, requests_memory):
+    return {
+        'limits': {'cpu': '2000m', 'memory': '1024Mi'},
+        'requests': {'cpu': requests_cpu, 'memory': requests_memory},
+    }
+
+
+def _field_env(name, field_path):
+    return {'name': name, 'valueFrom': {'fieldRef': {'apiVersion': 'v1', 'fieldPath': field_path}}}
+
+
+def default_template(proxy_image: str = REX_ISTIO_PROXY_IMAGE) -> dict:
+    '''Istio 1.8's sidecar injection template, as istioctl kube-inject
+    renders it with the default mesh config.
+    '''
+    return {
+        'annotations': {
+            'prometheus.io/path': '/stats/prometheus',
+            'prometheus.io/port': '15020',
+            'prometheus.io/scrape': 'true',
+        },
+        'labels': {
+            'istio.io/rev': 'default',
+            'security.istio.io/tlsMode': 'istio',
+            'service.istio.io/canonical-name': '${app}',
+            'service.istio.io/canonical-revision': '${revision}',
+        },
+        'initContainers': [
+            {
+                'args': [
+                    'istio-iptables', '-p', '15001', '-z', '15006', '-u', '1337', '-m', 'REDIRECT',
+                    '-i', '*', '-x', '', '-b', '*', '-d', '15090,15021,15020',
+                ],
+                'image': proxy_image,
+                'name': 'istio-init',
+                'resources': _resources('10m', '40Mi'),
+                'securityContext': {
+                    'allowPrivilegeEscalation': False,
+                    'capabilities': {'add': ['NET_ADMIN', 'NET_RAW'], 'drop': ['ALL']},
+                    'privileged': False,
+                    'readOnlyRootFilesystem': False,
+                    'runAsGroup': 0,
+                    'runAsNonRoot': False,
+                    'runAsUser': 0,
+                },
+            },
+        ],
+        'containers': [
+            {
+                'args': [
+                    'proxy', 'sidecar', '--domain', '$(POD_NAMESPACE).svc.cluster.local',
+                    '--serviceCluster', '${app}.$(POD_NAMESPACE)', '--proxyLogLevel=warning',
+                    '--proxyComponentLogLevel=misc:error', '--concurrency', '2',
+                ],
+                'env': [
+                    {'name': 'JWT_POLICY', 'value': 'third-party-jwt'},
+                    {'name': 'PILOT_CERT_PROVIDER', 'value': 'istiod'},
+                    {'name': 'CA_ADDR', 'value': 'istiod.istio-system.svc:15012'},
+                    _field_env('POD_NAME', 'metadata.name'),
+                    _field_env('POD_NAMESPACE', 'metadata.namespace'),
+                    _field_env('INSTANCE_IP', 'status.podIP'),
+                    _field_env('SERVICE_ACCOUNT', 'spec.serviceAccountName'),
+                    _field_env('HOST_IP', 'status.hostIP'),
+                    _field_env('CANONICAL_SERVICE', "metadata.labels['service.istio.io/canonical-name']"),
+                    _field_env(
+                        'CANONICAL_REVISION', "metadata.labels['service.istio.io/canonical-revision']",
+                    ),
+                    {'name': 'PROXY_CONFIG', 'value': '{}\n'},
+                    {'name': 'ISTIO_META_POD_PORTS', 'value': '${pod_ports}'},
+                    {'name': 'ISTIO_META_APP_CONTAINERS', 'value': '${app_containers}'},
+                    {'name': 'ISTIO_META_CLUSTER_ID', 'value': 'Kubernetes'},
+                    {'name': 'ISTIO_META_INTERCEPTION_MODE', 'value': 'REDIRECT'},
+                    {'name': 'ISTIO_META_WORKLOAD_NAME', 'value': '${name}'},
+                    {'name': 'ISTIO_META_OWNER', 'value': '${owner}'},
+                    {'name': 'ISTIO_META_MESH_ID', 'value': 'cluster.local'},
+                    {'name': 'TRUST_DOMAIN', 'value': 'cluster.local'},
+                ],
+                'image': proxy_image,
+                'name': 'istio-proxy',
+                'ports': [{'containerPort': 15090, 'name': 'http-envoy-prom', 'protocol': 'TCP'}],
+                'readinessProbe': {
+                    'failureThreshold': 30,
+                    'httpGet': {'path': '/healthz/ready', 'port': 15021},
+                    'initialDelaySeconds': 1,
+                    'periodSeconds': 2,
+                    'timeoutSeconds': 3,
+                },
+                'resources': _resources('100m', '128Mi'),
+                'securityContext': {
+                    'allowPrivilegeEscalation': False,
+                    'capabilities': {'drop': ['ALL']},
+                    'privileged': False,
+                    'readOnlyRootFilesystem': True,
+                    'runAsGroup': 1337,
+                    'runAsNonRoot': True,
+                    'runAsUser': 1337,
+                },
+                'volumeMounts': [
+                    {'mountPath': '/var/run/secrets/istio', 'name': 'istiod-ca-cert'},
+                    {'mountPath': '/var/lib/istio/data', 'name': 'istio-data'},
+                    {'mountPath': '/etc/istio/proxy', 'name': 'istio-envoy'},
+                    {'mountPath': '/var/run/secrets/tokens', 'name': 'istio-token'},
+                    {'mountPath': '/etc/istio/pod', 'name': 'istio-podinfo'},
+                ],
+            },
+        ],
+        'volumes': [
+            {'emptyDir': {'medium': 'Memory'}, 'name': 'istio-envoy'},
+            {'emptyDir': {}, 'name': 'istio-data'},
+            {
+                'downwardAPI': {
+                    'items': [
+                        {'fieldRef': {'fieldPath': 'metadata.labels'}, 'path': 'labels'},
+                        {'fieldRef': {'fieldPath': 'metadata.annotations'}, 'path': 'annotations'},
+                    ],
+                },
+                'name': 'istio-podinfo',
+            },
+            {
+                'name': 'istio-token',
+                'projected': {
+                    'sources': [
+                        {
+                            'serviceAccountToken': {
+                                'audience': 'istio-ca',
+                                'expirationSeconds': 43200,
+                                'path': 'istio-token',
+                            },
+                        },
+                    ],
+                },
+            },
+            {'configMap': {'name': 'istio-ca-root-cert'}, 'name': 'istiod-ca-cert'},
+        ],
+        'securityContext': {'fsGroup': 1337},
+        'rewriteAppHTTPProbers': True,
+        'statusPort': 15020,
+        # so that images built into docker-desktop are used rather than pulled
+        'imagePullPolicy': 'IfNotPresent',
+    }
+
+
+def load_template(path: Optional[str] = SIDECAR_TEMPLATE) -> dict:
+    '''The template in the YAML file at path, or the default one if path is
+    None.
+    '''
+    if path is None:
+        return default_template()
+    with open(path, 'r') as template_file:
+        return yaml.safe_load(template_file)
+
+
+def template_version(template: Mapping) -> str:
+    '''Digest of a template, recorded in the status annotation of every pod
+    injected with it.
+    '''
+    return hashlib.sha256(json.dumps(template, sort_keys=True).encode()).hexdigest()
+
+
+def _substitute(value, params):
+    if isinstance(value, str):
+        return Template(value).safe_substitute(params) if '$' in value else value
+    if isinstance(value, list):
+        return [_substitute(item, params) for item in value]
+    if isinstance(value, dict):
+        return {key: _substitute(item, params) for key, item in value.items()}
+    return value
+
+
+def _pod_template(spec: Mapping) -> Optional[dict]:
+    path = POD_TEMPLATE_PATHS.get(spec.get('kind'))
+    if path is None:
+        return None
+    pod = spec
+    for key in path:
+        pod = pod.get(key)
+        if not isinstance(pod, dict):
+            return None
+    return pod
+
+
+def _params(spec, pod):
+    metadata = spec.get('metadata', {})
+    name = metadata.get('name', '')
+    namespace = metadata.get('namespace', 'default')
+    labels = pod.get('metadata', {}).get('labels', {})
+    containers = pod['spec'].get('containers', [])
+    api_version = spec.get('apiVersion', 'v1')
+    api_path = 'api/v1' if api_version == 'v1' else f'apis/{api_version}'
+    return {
+        'name': name,
+        'namespace': namespace,
+        'app': labels.get('app', labels.get('app.kubernetes.io/name', name)),
+        'revision': labels.get('version', labels.get('app.kubernetes.io/version', 'latest')),
+        'owner': f'kubernetes://{api_path}/namespaces/{namespace}/{spec["kind"].lower()}s/{name}',
+        'pod_ports': json.dumps(
+            [port for container in containers for port in container.get('ports', [])],
+            separators=(',', ':'),
+        ),
+        'app_containers': ','.join(container['name'] for container in containers),
+    }
+
+
+def _app_prober(probe: Optional[Mapping], ports: Mapping[str, int]) -> Optional[dict]:
+    '''probe as pilot-agent reads it from ISTIO_KUBE_APP_PROBERS, with its
+    fields in the order Go writes them, or None if it is not an httpGet
+    probe or names a port the container doesn't have.
+    '''
+    http_get = (probe or {}).get('httpGet')
+    if http_get is None:
+        return None
+    port = http_get.get('port', 0)
+    if isinstance(port, str):
+        if port not in ports:
+            return None
+        port = ports[port]
+    prober = {'httpGet': {
+        field: port if field == 'port' else http_get[field]
+        for field in ('path', 'port', 'host', 'scheme', 'httpHeaders')
+        if field == 'port' or http_get.get(field)
+    }}
+    if probe.get('timeoutSeconds'):
+        prober['timeoutSeconds'] = probe['timeoutSeconds']
+    return prober
+
+
+def rewrite_app_probes(pod_spec: dict, status_port: int) -> int:
+    '''Point the httpGet probes of the app containers of pod_spec at the
+    injected istio-proxy's pilot-agent, on status_port, which probes the app
+    in their stead. Returns how many probes were rewritten.
+    '''
+    proxy = next((c for c in pod_spec['containers'] if c.get('name') == PROXY_CONTAINER), None)
+    if proxy is None:
+        return 0
+    probers = {}
+    rewritten = 0
+    for container in pod_spec['containers']:
+        if container is proxy:
+            continue
+        ports = {port['name']: port['containerPort'] for port in container.get('ports', []) if port.get('name')}
+        for field, path in APP_PROBES:
+            probe = container.get(field)
+            if not probe or 'httpGet' not in probe:
+                continue
+            url = path.format(container['name'])
+            prober = _app_prober(probe, ports)
+            if prober is not None:
+                probers[url] = prober
+            http_get = {**probe['httpGet'], 'path': url, 'port': status_port}
+            if http_get.get('scheme') == 'HTTPS':
+                # pilot-agent still probes the app over HTTPS
+                http_get['scheme'] = 'HTTP'
+            container[field] = {**probe, 'httpGet': http_get}
+            rewritten += 1
+    if probers:
+        proxy.setdefault('env', []).append({
+            'name': APP_PROBERS_ENV,
+            'value': json.dumps(dict(sorted(probers.items())), separators=(',', ':')),
+        })
+    return rewritten
+
+
+def _rewrites_probes(annotations: Mapping, template: Mapping) -> bool:
+    value = str(annotations.get(REWRITE_PROBES_ANNOTATION, ''))
+    if value in _TRUE or value in _FALSE:
+        return value in _TRUE
+    return bool(template.get('rewriteAppHTTPProbers'))
+
+
+def inject_pod(spec: dict, pod: dict, template: Mapping, version: str) -> bool:
+    '''Inject the sidecar described by template into pod, the pod template
+    of spec. Returns False if the pod is not to be injected.
+    '''
+    pod_metadata = pod.setdefault('metadata', {})
+    annotations = pod_metadata.get('annotations') or {}
+    pod_spec = pod.get('spec')
+    if (
+        pod_spec is None
+        or pod_spec.get('hostNetwork')
+        or str(annotations.get(INJECT_ANNOTATION, 'true')).lower() in ('false', 'no', 'n', 'f', 'off')
+        or STATUS_ANNOTATION in annotations
+        or spec.get('metadata', {}).get('namespace') in IGNORED_NAMESPACES
+    ):
+        return False
+    # a fresh copy, so pods share none of their injected parts
+    patch = _substitute(template, _params(spec, pod))
+
+    labels = pod_metadata.setdefault('labels', {})
+    for key, value in patch.get('labels', {}).items():
+        labels.setdefault(key, value)
+    annotations = pod_metadata.setdefault('annotations', annotations)
+    for key, value in patch.get('annotations', {}).items():
+        annotations.setdefault(key, value)
+    for field in ('initContainers', 'containers', 'volumes'):
+        if patch.get(field):
+            pod_spec.setdefault(field, []).extend(patch[field])
+    if patch.get('securityContext') and not pod_spec.get('securityContext'):
+        pod_spec['securityContext'] = patch['securityContext']
+    if patch.get('statusPort') and _rewrites_probes(annotations, patch):
+        rewrite_app_probes(pod_spec, patch['statusPort'])
+    pull_policy = patch.get('imagePullPolicy')
+    if pull_policy is not None:
+        for container in patch.get('initContainers', []) + patch.get('containers', []):
+            container.setdefault('imagePullPolicy', pull_policy)
+        for container in pod_spec.get('initContainers', []) + pod_spec['containers']:
+            if container.get('imagePullPolicy') == 'Always':
+                container['imagePullPolicy'] = pull_policy
+    annotations[STATUS_ANNOTATION] = json.dumps({
+        'version': version,
+        'initContainers': [container['name'] for container in patch.get('initContainers', [])],
+        'containers': [container['name'] for container in patch.get('containers', [])],
+        'volumes': [volume['name'] for volume in patch.get('volumes', [])],
+        'imagePullSecrets': patch.get('imagePullSecrets'),
+    }, separators=(',', ':'))
+    return True
+
+
+def inject_sidecars(specs: Iterable[dict], template: Mapping = None) -> int:
+    '''Inject sidecars, in place, into every workload in specs that istioctl
+    kube-inject would inject. Returns how many were injected.
+    '''
+    if template is None:
+        template = get_template()
+    version = template_version(template)
+    injected = 0
+    for spec in specs:
+        pod = _pod_template(spec) if isinstance(spec, dict) else None
+        if pod is not None and inject_pod(spec, pod, template, version):
+            injected += 1
+    return injected
+
+
+_template = None
+
+
+def get_template() -> dict:
+    '''The configured template, loaded on first use.'''
+    global _template
+    if _template is None:
+        _template = load_template()
+    return _template
+
+
+def istioctl_inject(specs_yaml: str, config_dir: Optional[str] = None) -> Optional[str]:
+    '''specs_yaml injected by istioctl kube-inject, with the injector config
+    in config_dir if given (see ISTIOCTL_CONFIG_FILES), else the cluster's,
+    and with REX_ISTIO_PROXY_IMAGE pulled only if not present. None if
+    istioctl fails.
+    '''
+    args = ['istioctl', 'kube-inject', '-f', '-']
+    if config_dir is not None:
+        for flag, name in ISTIOCTL_CONFIG_FILES.items():
+            args += [flag, os.path.join(config_dir, name)]
+    istioctl_result = subprocess.run(args, input=specs_yaml, capture_output=True, text=True)
+    if istioctl_result.returncode != 0:
+        logging.error(f'Error from Istio:\n{istioctl_result.stderr}')
+        return None
+    return istioctl_result.stdout.replace(
+        ': Always',
+        ': IfNotPresent',
+    ).replace(f'docker.io/istio/proxyv2:{ISTIO_VERSION}', REX_ISTIO_PROXY_IMAGE)
+
+
+_injector = None
+
+
+def get_injector() -> str:
+    '''The injector in use: SIDECAR_INJECTOR, or 'native' if that is
+    'istioctl' but there is no istioctl on the PATH.
+    '''
+    global _injector
+    if _injector is None:
+        _injector = SIDECAR_INJECTOR
+        if _injector == 'istioctl' and shutil.which('istioctl') is None:
+            logging.warning('No istioctl on the PATH: injecting sidecars natively.')
+            _injector = 'native'
+    return _injector
@@ -0,0 +1,332 @@
+'''Process-wide cache of the k8s specs generated for deployments.
+
+Generating a deployment's specs (BPMNProcess.to_istio) runs every component's
+spec generation, sidecar injection and a YAML dump.
+ps with include_kubernetes, apply, start and stop all need the same specs.
+Entries are keyed by BPMNProcess.spec_key(), a digest of the process content
+and of the spec compiler version (which covers the flowd configuration the
+specs depend on), so an entry never has to be checked against anything.
+
+Specs are looked up in three tiers, and copied into the faster tiers on a
+hit:
+1. memory: an LRU bounded by the bytes of the specs it holds;
+2. local disk: one file per entry under SPEC_CACHE_DIR, also LRU and bounded,
+   which survives flowd restarts;
+3. S3 (if K8S_SPECS_S3_BUCKET is set): the specs of each deployment, stored
+   by deployment id at WorkflowKeys.specs_key. These pin the specs a
+   deployment was applied with across flowd upgrades, so they are served
+   even if the current compiler would generate something else.
+'''
+from collections import OrderedDict
+from io import BytesIO
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Callable, Optional
+
+import boto3
+from botocore.exceptions import ClientError
+
+from .config import (
+    K8S_SPECS_S3_BUCKET,
+    SPEC_CACHE_DIR,
+    SPEC_CACHE_DISK_MAX_BYTES,
+    SPEC_CACHE_MAX_BYTES,
+)
+from .constants import WorkflowKeys
+
+
+SPEC_FILE_SUFFIX = '.yaml'
+
+
+def _get_s3_bucket(bucket_name):
+    if bucket_name is None:
+        logging.info("Not setting up s3 bucket for k8s specs: no bucket configured.")
+        return None
+    return boto3.resource('s3').Bucket(bucket_name)
+
+
+class SpecCache:
+    '''Tiered cache of generated k8s specs (YAML text), keyed by spec key and
+    grouped by deployment id.
+    Example:
+        >>> specs = get_spec_cache().get_or_compile(did, key, compile)
+    '''
+    def __init__(self, max_bytes=None, directory=None, disk_max_bytes=None, s3_bucket=None):
+        '''Arguments:
+            max_bytes: bound on the memory tier, SPEC_CACHE_MAX_BYTES if None.
+            directory: root of the disk tier, or None for no disk tier.
+            disk_max_bytes: bound on the disk tier, SPEC_CACHE_DISK_MAX_BYTES
+                if None.
+            s3_bucket: a boto3 Bucket for the S3 tier, or None for no S3 tier.
+        '''
+        self.max_bytes = SPEC_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.directory = directory
+        self.disk_max_bytes = SPEC_CACHE_DISK_MAX_BYTES if disk_max_bytes is None else disk_max_bytes
+        self.s3_bucket = s3_bucket
+        self.hits = {'memory': 0, 'disk': 0, 's3': 0}
+        self.misses = 0
+        self.compiles = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.errors = 0
+        self._entries = OrderedDict()  # (did, key) -> specs
+        self._size = 0
+        self._files = OrderedDict()  # (did, key) -> size, least recently used first
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        if self.directory is not None:
+            self._scan_directory()
+
+    def get(self, did: str, key: str) -> Optional[str]:
+        '''The cached specs for deployment did under key, or None.'''
+        with self._lock:
+            specs = self._entries.get((did, key))
+            if specs is not None:
+                self._entries.move_to_end((did, key))
+                self.hits['memory'] += 1
+                return specs
+        specs = self._read_file(did, key)
+        if specs is not None:
+            with self._lock:
+                self.hits['disk'] += 1
+            self._remember(did, key, specs)
+            return specs
+        specs = self._download(did)
+        if specs is not None:
+            with self._lock:
+                self.hits['s3'] += 1
+            self._remember(did, key, specs)
+            self._write_file(did, key, specs)
+            return specs
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, did: str, key: str, specs: str):
+        '''Store freshly generated specs in every tier.'''
+        self._remember(did, key, specs)
+        self._write_file(did, key, specs)
+        self._upload(did, specs)
+
+    def get_or_compile(self, did: str, key: str, compile: Callable[[], Optional[str]]) -> Optional[str]:
+        '''The specs for deployment did under key, generating (and caching)
+        them with compile() if no tier has them. Nothing is cached if
+        compile() returns None.
+        '''
+        specs = self.get(did, key)
+        if specs is None:
+            with self._lock:
+                self.compiles += 1
+            specs = compile()
+            if specs is not None:
+                self.put(did, key, specs)
+        return specs
+
+    def invalidate(self, did: str, pinned: bool = False):
+        '''Drop every memory and disk entry of deployment did. With pinned,
+        also delete the specs the deployment was applied with from S3.
+        '''
+        with self._lock:
+            dropped = [entry for entry in self._entries if entry[0] == did]
+            for entry in dropped:
+                self._size -= len(self._entries.pop(entry))
+            files = [entry for entry in self._files if entry[0] == did]
+            for entry in files:
+                self._disk_size -= self._files.pop(entry)
+            if dropped or files:
+                self.invalidations += 1
+        if self.directory is not None:
+            shutil.rmtree(os.path.join(self.directory, did), ignore_errors=True)
+        if pinned and self.s3_bucket is not None:
+            try:
+                self.s3_bucket.delete_objects(
+                    Delete={'Objects': [{'Key': WorkflowKeys.specs_key(did)}]},
+                )
+            except Exception as exn:
+                self._error(f'Unable to delete s3 object for {did}', exn)
+
+    def clear(self):
+        '''Empty the memory and disk tiers. S3 is left alone.'''
+        with self._lock:
+            dids = {did for did, _ in self._files}
+            self._entries.clear()
+            self._size = 0
+            self._files.clear()
+            self._disk_size = 0
+        for did in dids:
+            shutil.rmtree(os.path.join(self.directory, did), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            hits = sum(self.hits.values())
+            lookups = hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'disk_entries': len(self._files),
+                'disk_bytes': self._disk_size,
+                'disk_max_bytes': self.disk_max_bytes if self.directory is not None else None,
+                's3': self.s3_bucket is not None,
+                'hits': dict(self.hits),
+                'misses': self.misses,
+                'hit_ratio': hits / lookups if lookups else None,
+                'compiles': self.compiles,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'errors': self.errors,
+            }
+
+    def _error(self, message, exn):
+        logging.warning(f'{message}: {exn}')
+        with self._lock:
+            self.errors += 1
+
+    def _remember(self, did, key, specs):
+        size = len(specs)
+        with self._lock:
+            old = self._entries.pop((did, key), None)
+            if old is not None:
+                self._size -= len(old)
+            if size > self.max_bytes:
+                return
+            self._entries[(did, key)] = specs
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def _path(self, did, key):
+        return os.path.join(self.directory, did, key + SPEC_FILE_SUFFIX)
+
+    def _scan_directory(self):
+        '''Index the files left by earlier flowd processes, oldest first.'''
+        files = []
+        try:
+            for did_entry in os.scandir(self.directory):
+                if not did_entry.is_dir():
+                    continue
+                for file_entry in os.scandir(did_entry.path):
+                    if file_entry.name.endswith(SPEC_FILE_SUFFIX):
+                        stat = file_entry.stat()
+                        key = file_entry.name[:-len(SPEC_FILE_SUFFIX)]
+                        files.append((stat.st_mtime, did_entry.name, key, stat.st_size))
+        except FileNotFoundError:
+            return
+        except OSError as exn:
+            self._error(f'Unable to scan {self.directory}', exn)
+            return
+        for _, did, key, size in sorted(files):
+            self._files[(did, key)] = size
+            self._disk_size += size
+
+    def _read_file(self, did, key):
+        if self.directory is None:
+            return None
+        with self._lock:
+            if (did, key) not in self._files:
+                return None
+            self._files.move_to_end((did, key))
+        path = self._path(did, key)
+        try:
+            with open(path, 'r') as spec_file:
+                specs = spec_file.read()
+            os.utime(path)
+            return specs
+        except OSError as exn:
+            with self._lock:
+                size = self._files.pop((did, key), None)
+                if size is not None:
+                    self._disk_size -= size
+            self._error(f'Unable to read cached specs at {path}', exn)
+            return None
+
+    def _write_file(self, did, key, specs):
+        if self.directory is None:
+            return
+        data = specs.encode()
+        if len(data) > self.disk_max_bytes:
+            return
+        path = self._path(did, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written whole or not at all, as other flowd processes may share the directory
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except OSError as exn:
+            self._error(f'Unable to write cached specs to {path}', exn)
+            return
+        evicted = []
+        with self._lock:
+            old = self._files.pop((did, key), None)
+            if old is not None:
+                self._disk_size -= old
+            self._files[(did, key)] = len(data)
+            self._disk_size += len(data)
+            while self._disk_size > self.disk_max_bytes:
+                entry, evicted_size = self._files.popitem(last=False)
+                self._disk_size -= evicted_size
+                self.evictions += 1
+                evicted.append(entry)
+        for entry in evicted:
+            try:
+                os.remove(self._path(*entry))
+                os.rmdir(os.path.dirname(self._path(*entry)))  # only if it is now empty
+            except OSError:
+                pass
+
+    def _download(self, did):
+        if self.s3_bucket is None:
+            return None
+        key = WorkflowKeys.specs_key(did)
+        fileobj = BytesIO()
+        try:
+            self.s3_bucket.download_fileobj(key, fileobj)
+        except ClientError:
+            logging.info(f"Unable to download s3 object for {key}.")
+            return None
+        logging.info(f"Getting k8s specs from S3 at {key}.")
+        return fileobj.getvalue().decode()
+
+    def _upload(self, did, specs):
+        if self.s3_bucket is None:
+            return
+        key = WorkflowKeys.specs_key(did)
+        try:
+            self.s3_bucket.upload_fileobj(BytesIO(specs.encode()), key)
+        except Exception as exn:
+            self._error(f'Unable to save k8s specs to S3 at {key}', exn)
+            return
+        logging.info(f"Successfully saved k8s specs to S3 at {key}.")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_spec_cache() -> SpecCache:
+    '''Get the module-level SpecCache, creating it on first use.'''
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SpecCache(
+                directory=SPEC_CACHE_DIR, s3_bucket=_get_s3_bucket(K8S_SPECS_S3_BUCKET),
+            )
+            logging.info(
+                f'Caching k8s specs in up to {_cache.max_bytes} bytes of memory'
+                + (f' and {_cache.disk_max_bytes} bytes under {_cache.directory}.'
+                   if _cache.directory is not None else '.')
+            )
+        return _cache
+
+
+def get_spec_cache_stats():
+    '''Stats of the module-level cache, or None if nothing has used it yet.'''
+    cache = _cache
+    return cache.stats() if cache is not None else None
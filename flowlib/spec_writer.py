@@ -0,0 +1,91 @@
+'''Finishing generated k8s specs: sidecar injection and the YAML dump.
+
+Generating the spec dicts of even a few thousand components takes well under
+a second; serializing them to YAML is what takes the time. dump_specs() uses
+libyaml's emitter (yaml.CSafeDumper) when PyYAML was built with it, which
+writes the same bytes as yaml.SafeDumper several times faster. Large spec
+lists are also split into contiguous chunks that a pool of SPEC_WORKERS
+processes injects and dumps; the chunks' YAML is joined in order, so the
+output is the same as that of one yaml.safe_dump_all() of the whole list.
+'''
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import multiprocessing
+import threading
+from typing import List, Mapping
+
+import yaml
+
+from .config import SPEC_PARALLEL_MIN_SPECS, SPEC_WORKERS
+from .sidecar_injector import inject_sidecars
+
+
+SpecDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# Chunks per worker: enough that an unlucky chunk of big specs doesn't hold
+# up the rest, few enough that each is worth shipping to a worker.
+CHUNKS_PER_WORKER = 4
+
+DOCUMENT_START = '---\n'
+
+
+def _finish(specs: List[dict], template: Mapping = None) -> str:
+    '''Injects sidecars into specs (if given a template) and dumps them.'''
+    if template is not None:
+        inject_sidecars(specs, template)
+    return yaml.dump_all(specs, Dumper=SpecDumper)
+
+
+def _chunks(specs, count):
+    size = -(-len(specs) // count)
+    return [specs[start:start + size] for start in range(0, len(specs), size)]
+
+
+def dump_specs(specs: List[dict], template: Mapping = None, workers: int = None, **kws) -> str:
+    '''The YAML of specs as yaml.safe_dump_all(specs, **kws) writes it, after
+    injecting sidecars with template, if given. Lists of at least
+    SPEC_PARALLEL_MIN_SPECS specs are finished on the spec pool, unless there
+    are dump options.
+    '''
+    workers = SPEC_WORKERS if workers is None else workers
+    if kws or workers <= 1 or len(specs) < SPEC_PARALLEL_MIN_SPECS:
+        if template is not None:
+            inject_sidecars(specs, template)
+        return yaml.dump_all(specs, Dumper=SpecDumper, **kws)
+    chunks = _chunks(specs, workers * CHUNKS_PER_WORKER)
+    try:
+        dumped = list(get_spec_pool(workers).map(_finish, chunks, [template] * len(chunks)))
+    except BrokenProcessPool as exn:
+        logging.warning(f'Finishing specs in-process, as the spec pool broke: {exn}')
+        _discard_pool()
+        return _finish(specs, template)
+    return DOCUMENT_START.join(dumped)
+
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def get_spec_pool(workers: int = SPEC_WORKERS) -> ProcessPoolExecutor:
+    '''The process pool that finishes large spec lists, started on first use.
+    Its workers are spawned rather than forked, since flowd runs threads.
+    '''
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+            logging.info(f'Finishing large k8s spec lists on {workers} processes.')
+        return _pool
+
+
+def _discard_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
@@ -5,7 +5,7 @@ Implements BPMNStartEvent object, which for now is just a pass-through to Flowd.
 from collections import OrderedDict
 from typing import Mapping
 
-from .bpmn_util import BPMNComponent, get_edge_transport
+from .bpmn_util import BPMNComponent, AnnotationIndex, get_edge_transport
 from .constants import to_valid_k8s_name
 
 from .k8s_utils import (
@@ -32,8 +32,9 @@ ATTEMPTS = 2
 class BPMNStartEvent(BPMNComponent):
     """Wrapper for BPMN service task metadata.
     """
-    def __init__(self, event: OrderedDict, process: OrderedDict, global_props):
-        super().__init__(event, process, global_props)
+    def __init__(self, event: OrderedDict, process: OrderedDict, global_props,
+                 annotations: AnnotationIndex = None):
+        super().__init__(event, process, global_props, annotations=annotations)
         self._namespace = global_props.namespace
 
         # Just for the Start Event, if the user specifies no name on BPMN, we will
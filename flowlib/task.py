@@ -5,7 +5,6 @@ Implements the BPMNTask object, which inherits BPMNComponent.
 from collections import OrderedDict, namedtuple
 import json
 from typing import List, Mapping, Any
-import yaml
 
 from .bpmn_util import (
     WorkflowProperties,
@@ -13,6 +12,8 @@ from .bpmn_util import (
     CallProperties,
     HealthProperties,
     BPMNComponent,
+    AnnotationIndex,
+    boundary_event_table,
     get_edge_transport,
     iter_xmldict_for_key,
 )
@@ -95,8 +96,13 @@ class BPMNTask(BPMNComponent):
         process: OrderedDict,
         global_props: WorkflowProperties,
         default_is_preexisting: bool = DEFAULT_USE_PREEXISTING_SERVICES,
+        annotations: AnnotationIndex = None,
+        boundary_events: List[OrderedDict] = None,
     ):
-        super().__init__(task, process, global_props, default_is_preexisting=default_is_preexisting)
+        super().__init__(
+            task, process, global_props, default_is_preexisting=default_is_preexisting,
+            annotations=annotations,
+        )
         self._task = task
 
         self._target_port = self.service_properties.port
@@ -119,7 +125,7 @@ class BPMNTask(BPMNComponent):
                 })
         elif 'bpmn:documentation' in task and task['bpmn:documentation'].startswith('rexflow:'):
             # Third priority: check for annotations in the documentation.
-            self.update_annotations(yaml.safe_load(task['bpmn:documentation']))
+            self.update_annotations(self._annotation_index.load(task['bpmn:documentation']))
 
         # The `.service_properties` and `.call_properties` properties of BPMNComponent
         # classes are used by _other_ BPMNComponents to know how to communicate with this
@@ -156,6 +162,10 @@ class BPMNTask(BPMNComponent):
                 # their health endpoint, so (for now) require it to be specified.
                 self._health_properties = None
         self._process = process
+        # BPMNProcess passes each task its entry of one boundary_event_table().
+        if boundary_events is None:
+            boundary_events = boundary_event_table(process).get(self.id, [])
+        self._boundary_events = boundary_events
         self.is_passthrough = (
             self._is_preexisting and (self._global_props.passthrough_target is not None)
         )
@@ -201,12 +211,10 @@ class BPMNTask(BPMNComponent):
             shadow_upstream = Upstream('', 0, '', '', 0, '')
 
         # Error Gateway stuff
-        error_gateways = []
-        for boundary_event in iter_xmldict_for_key(self._process, 'bpmn:boundaryEvent'):
-            if 'bpmn:errorEventDefinition' not in boundary_event:
-                continue
-            if boundary_event['@attachedToRef'] == self.id:
-                error_gateways.append(boundary_event)
+        error_gateways = [
+            boundary_event for boundary_event in self._boundary_events
+            if 'bpmn:errorEventDefinition' in boundary_event
+        ]
         error_upstream_configs = []
         if len(error_gateways):
             assert len(error_gateways) == 1, \
@@ -5,9 +5,9 @@ Implements the BPMNThrowEvent object, which inherits BPMNComponent.
 from collections import OrderedDict, namedtuple
 import json
 import os
-from typing import Mapping
+from typing import Any, List, Mapping
 
-from .bpmn_util import WorkflowProperties, BPMNComponent, get_edge_transport
+from .bpmn_util import WorkflowProperties, BPMNComponent, AnnotationIndex, get_edge_transport
 from .k8s_utils import (
     create_deployment,
     create_service,
@@ -31,8 +31,9 @@ THROW_GATEWAY_SVC_PREFIX = "throw"
 class BPMNThrowEvent(BPMNComponent):
     """Wrapper for BPMN service event metadata.
     """
-    def __init__(self, event: OrderedDict, process: OrderedDict, global_props: WorkflowProperties):
-        super().__init__(event, process, global_props)
+    def __init__(self, event: OrderedDict, process: OrderedDict, global_props: WorkflowProperties,
+                 annotations: AnnotationIndex = None):
+        super().__init__(event, process, global_props, annotations=annotations)
 
         assert 'service' not in self._annotation, "Service properties auto-inferred for Throw Event"
         assert 'topic' in self._annotation, \
@@ -46,6 +47,12 @@ class BPMNThrowEvent(BPMNComponent):
             "host": self.name,
         })
 
+    def kafka_transport_targets(self, sequence_flow_table: Mapping[str, Any]) -> List[str]:
+        # to_kubernetes() only ever looks at the first outgoing edge.
+        return super().kafka_transport_targets(
+            {self.id: sequence_flow_table.get(self.id, [])[:1]}
+        )
+
     def to_kubernetes(self,
                       id_hash,
                       component_map: Mapping[str, BPMNComponent],
@@ -25,11 +25,13 @@ The value is a JSON'd list of
 """
 from flowlib.etcd_utils import (
     locked_call, 
-    get_keys_from_prefix,
     get_etcd,
+    iter_prefix,
 )
-from multiprocessing import Lock
+from concurrent.futures import ThreadPoolExecutor
+import heapq
 import isodate
+import itertools
 import json
 import logging
 import threading
@@ -39,6 +41,7 @@ import uuid
 
 from enum import Enum
 from datetime import datetime, timezone
+from flowlib.config import ETCD_TXN_MAX_OPS, TIMER_WORKERS
 from flowlib.constants import WorkflowKeys, split_key
 from flowlib.executor import get_executor
 from flowlib.substitution import Substitutor, Tokens
@@ -254,6 +257,49 @@ class TimerContext(ValidationResults):
         key   = f'{WorkflowKeys.timed_events_key(did)}/{iid}'
         return cls.restore_from_key(key)
 
+    @classmethod
+    def save_many(cls, contexts:list):
+        """
+        Write several timer contexts, ETCD_TXN_MAX_OPS puts per transaction,
+        without taking the per-key locks.
+        """
+        etcd = get_etcd()
+        for i in range(0, len(contexts), ETCD_TXN_MAX_OPS):
+            chunk = contexts[i:i + ETCD_TXN_MAX_OPS]
+            etcd.transaction(
+                compare=[],
+                success=[etcd.transactions.put(ctx.key, ctx.to_json()) for ctx in chunk],
+                failure=[],
+            )
+
+    @classmethod
+    def erase_many(cls, keys:list):
+        """
+        Delete several timer contexts, ETCD_TXN_MAX_OPS deletes per transaction.
+        """
+        etcd = get_etcd()
+        for i in range(0, len(keys), ETCD_TXN_MAX_OPS):
+            etcd.transaction(
+                compare=[],
+                success=[etcd.transactions.delete(key) for key in keys[i:i + ETCD_TXN_MAX_OPS]],
+                failure=[],
+            )
+
+    @classmethod
+    def iter_from_prefix(cls, prefix:str):
+        """
+        Stream every timer context stored under prefix from a paged range
+        read. Yields (key, context) tuples; context is None for records that
+        cannot be parsed.
+        """
+        for value, meta in iter_prefix(get_etcd(), prefix):
+            key = meta.key.decode()
+            try:
+                yield key, cls.from_json(value)
+            except (ValueError, KeyError) as exn:
+                logging.error(f'Timer {key} could not be parsed: {exn}')
+                yield key, None
+
     @classmethod
     def restore_from_key(cls, key):
         def __logic(etcd):
@@ -272,11 +318,139 @@ class TimerContext(ValidationResults):
 
 from typing import Tuple
 
+class ScheduledCall:
+    """
+    Handle for a call queued on a TimerScheduler.
+    """
+    __slots__ = ('due', 'func', 'args', 'cancelled')
+
+    def __init__(self, due:float, func:Callable, args:tuple):
+        self.due = due
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+class TimerScheduler:
+    """
+    Runs any number of pending timers on one thread. Calls are kept in a
+    min-heap ordered by due time; the scheduler thread sleeps until the
+    earliest one matures and hands it to a small pool of worker threads.
+    A matured call is only taken off the heap once a worker is free, so a
+    slow callback delays (and shows up as lateness on) later timers rather
+    than piling up unbounded work.
+    """
+    def __init__(self, name:str = 'timers', workers:int = TIMER_WORKERS):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._slots = threading.BoundedSemaphore(workers)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._pending = 0
+        self._fired = 0
+        self._lateness_total = 0.0
+        self._lateness_max = 0.0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def schedule_many(self, calls:list) -> list:
+        """
+        Queue several (delay, func, args) calls at once. Cheaper than calling
+        schedule() for each when restoring thousands of timers.
+        """
+        now = time.monotonic()
+        handles = [ScheduledCall(now + max(delay, 0), func, tuple(args)) for delay, func, args in calls]
+        with self._cond:
+            self._heap.extend((call.due, next(self._seq), call) for call in handles)
+            heapq.heapify(self._heap)
+            self._pending += len(handles)
+            self._cond.notify()
+        return handles
+
+    def schedule(self, delay:float, func:Callable, *args) -> ScheduledCall:
+        call = ScheduledCall(time.monotonic() + max(delay, 0), func, args)
+        with self._cond:
+            heapq.heappush(self._heap, (call.due, next(self._seq), call))
+            self._pending += 1
+            # only wake the scheduler if this call is now the earliest
+            if self._heap[0][2] is call:
+                self._cond.notify()
+        return call
+
+    def cancel(self, call:ScheduledCall) -> bool:
+        """
+        Cancel a pending call. The heap entry is discarded lazily when it
+        reaches the top. Returns False if the call already ran or was cancelled.
+        """
+        with self._cond:
+            if call.cancelled or call.func is None:
+                return False
+            call.cancelled = True
+            self._pending -= 1
+            return True
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._pool.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'pending': self._pending,
+                'fired': self._fired,
+                'lateness_max': self._lateness_max,
+                'lateness_avg': self._lateness_total / self._fired if self._fired else 0.0,
+                'next_due_in': self._heap[0][0] - time.monotonic() if self._heap else None,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                    if self._heap and self._heap[0][0] <= time.monotonic():
+                        break
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if self._stopped:
+                    return
+            # wait for a free worker before taking the call off the heap
+            self._slots.acquire()
+            with self._cond:
+                if not self._heap or self._heap[0][2].cancelled or self._heap[0][0] > time.monotonic():
+                    # cancelled, or an earlier call arrived, while we waited
+                    self._slots.release()
+                    continue
+                _, _, call = heapq.heappop(self._heap)
+                func, args = call.func, call.args
+                call.func = None
+                self._pending -= 1
+                self._fired += 1
+                lateness = time.monotonic() - call.due
+                self._lateness_total += lateness
+                self._lateness_max = max(self._lateness_max, lateness)
+            try:
+                self._pool.submit(self._invoke, func, args)
+            except RuntimeError:
+                # the pool was shut down by stop()
+                self._slots.release()
+                return
+
+    def _invoke(self, func:Callable, args:tuple):
+        try:
+            func(*args)
+        except Exception as exn:
+            logging.exception('Timer callback failed', exc_info=exn)
+        finally:
+            self._slots.release()
+
 class WrappedTimer:
     """
     Python timers are created, start, and die without any notifications. This
-    class wraps a threading.Timer object so that we can receive a notification
-    once the timer matures.
+    class queues a call on the manager's TimerScheduler so that we can receive
+    a notification once the timer matures.
     """
     def __init__(self, mgr:TimedEventManager, interval:int, done_action:Callable[[object],None], action:Callable[[list],None], context:TimerContext):
         self.mgr = mgr
@@ -284,7 +458,7 @@ class WrappedTimer:
         self._done_action = done_action
         self._action = action
         self._context = context
-        self._timer = threading.Timer(interval, self.do_action, context.args)
+        self._call = None
         logging.info(f'{time.time()} Timer created with duration {interval}')
 
     def do_action(self, *args):
@@ -309,13 +483,26 @@ class WrappedTimer:
         self.done(abort)
 
     def start(self):
-        self._timer.start()
         self._context.save()
+        self._call = self.mgr.scheduler.schedule(self._interval, self.do_action, *self._context.args)
         logging.info(f'{self._context.guid} {TimeUtc.now()} Starting timer will execute {TimeUtc.format_8601(self._context.exec_time)}')
 
+    @classmethod
+    def start_many(cls, mgr:TimedEventManager, timers:list):
+        """
+        Start several timers whose contexts are already persisted, queueing
+        them on the manager's scheduler in one step.
+        """
+        calls = mgr.scheduler.schedule_many(
+            [(timer._interval, timer.do_action, timer._context.args) for timer in timers]
+        )
+        for timer, call in zip(timers, calls):
+            timer._call = call
+
     def cancel(self):
         logging.info(f'{self._context.guid} {TimeUtc.now()} Canceling timer')
-        self._timer.cancel()
+        if self._call is not None:
+            self.mgr.scheduler.cancel(self._call)
         self.done()
 
     def done(self, abort:bool = False):
@@ -352,6 +539,8 @@ class TimedEventManager:
             .add_handler(Literals.SUB_FUNC, Functions.func_sub) \
             .add_handler(Literals.NOW_FUNC, Functions.func_now)
 
+        self.scheduler = TimerScheduler(name=f'timers-{did}')
+        self.restore_stats = None
         self.executor = get_executor()
         self.future = self.executor.submit(self.__restore_latent_timers)
 
@@ -610,18 +799,88 @@ class TimedEventManager:
 
     def __restore_latent_timers(self):
         """
-        Pull any existing timer context records.
+        Pull any existing timer context records. The records are streamed
+        from one paged range read; timers still in the future are queued on
+        the scheduler together, and the expired ones are handed to the
+        recovery policy as one batch.
         """
-        key = WorkflowKeys.timed_events_key(self.did)
-        keys = get_keys_from_prefix(key)
-        if keys is not None and len(keys) > 0:
-            logging.info(f'Attempting to restore {len(keys)} timers from storage')
-            for k in keys:
-                ctx = TimerContext.restore_from_key(k)
-                if ctx is not None:
-                    self.restore_timer(ctx)
-        else:
-            logging.info('No timers found to restore')
+        started = time.time()
+        key = f'{WorkflowKeys.timed_events_key(self.did)}/'
+        time_now = TimeUtc.now()
+        pending = []
+        expired = []
+        unreadable = []
+        for k, ctx in TimerContext.iter_from_prefix(key):
+            if ctx is None:
+                unreadable.append(k)
+            elif ctx.exec_time < time_now:
+                expired.append(ctx)
+            else:
+                pending.append(ctx)
+        if unreadable:
+            TimerContext.erase_many(unreadable)
+
+        WrappedTimer.start_many(self, [
+            WrappedTimer(self, ctx.exec_time - time_now, self.__timer_done_action, self.__timer_action, ctx)
+            for ctx in pending
+        ])
+        if pending:
+            self.completed = False
+        # timer records don't carry a policy: the manager's applies to all.
+        if expired:
+            self.recover_timers(self.recovery_policy, expired)
+
+        self.restore_stats = {
+            'restored': len(pending) + len(expired),
+            'pending': len(pending),
+            'expired': {self.recovery_policy.name: len(expired)} if expired else {},
+            'unreadable': len(unreadable),
+            'duration': time.time() - started,
+        }
+        logging.info(f'Restored {self.restore_stats["restored"]} timers in {self.restore_stats["duration"]:.3f}s {self.restore_stats}')
+
+    def recover_timers(self, policy:TimerRecoveryPolicy, contexts:list):
+        """
+        Enforce a TimerRecoveryPolicy on a batch of restored timers whose
+        exec_time is in the past.
+        """
+        if policy == TimerRecoveryPolicy.RECOVER_FAIL:
+            for context in contexts:
+                self.signal_error(context, TimerErrorCode.TIMER_ERROR_FAIL_IID, f'Recovered timer expired - IID {context.iid} will be terminated')
+        elif policy == TimerRecoveryPolicy.RECOVER_FIRE:
+            # fire the events immediately
+            time_now = TimeUtc.now()
+            for context in contexts:
+                context.exec_time = time_now
+            TimerContext.save_many(contexts)
+            WrappedTimer.start_many(self, [
+                WrappedTimer(self, 0, self.__timer_done_action, self.__timer_action, context)
+                for context in contexts
+            ])
+            self.completed = False
+        elif policy == TimerRecoveryPolicy.RECOVER_FORGET:
+            # mark the timers as lost, and drop them so that a later restart
+            # does not count them as lost again.
+            logging.info(f'Dropped {len(contexts)} timers {[context.guid for context in contexts]}')
+            lost = {}
+            for context in contexts:
+                if context.token_pool_id is not None:
+                    lost[context.token_pool_id] = lost.get(context.token_pool_id, 0) + 1
+            names = list(lost.keys())
+            for i in range(0, len(names), ETCD_TXN_MAX_OPS):
+                chunk = names[i:i + ETCD_TXN_MAX_OPS]
+                def __release(pools, chunk=chunk):
+                    for name, pool in zip(chunk, pools):
+                        if pool is None:
+                            logging.warning(f'No token pool with name {name}')
+                            continue
+                        for _ in range(lost[name]):
+                            pool._release_as_lost()
+                TokenPool.batch_update(chunk, __release)
+            TimerContext.erase_many([context.key for context in contexts])
+        # else: # policy == TimerRecoveryPolicy.RECOVER_FUTURE:
+        #     # reschedule using NOW as base time
+        #     pass
 
     def restore_timer(self, context:TimerContext):
         """
@@ -632,22 +891,7 @@ class TimedEventManager:
         time_now = TimeUtc.now()
         if context.exec_time < time_now:
             # execution time is in the past ... enforce recoveryPolicy
-            if self.recovery_policy == TimerRecoveryPolicy.RECOVER_FAIL:
-                self.signal_error(context, TimerErrorCode.TIMER_ERROR_FAIL_IID, f'Recovered timer expired - IID {context.iid} will be terminated')
-            elif self.recovery_policy == TimerRecoveryPolicy.RECOVER_FIRE:
-                # fire the event immediately
-                context.exec_time = time_now
-                timer = WrappedTimer(self, 0, self.__timer_done_action, self.__timer_action, context)
-                timer.start()
-            elif self.recovery_policy == TimerRecoveryPolicy.RECOVER_FORGET:
-                # mark the timer as lost
-                logging.info(f'Dropped timer {context.guid}')
-                if context.token_pool_id is not None:
-                    tp = TokenPool.from_pool_name(context.token_pool_id)
-                    tp.release_as_lost()
-            # else: # self.recovery_policy == TimerRecoveryPolicy.RECOVER_FUTURE:
-            #     # reschedule using NOW as base time
-            #     pass
+            self.recover_timers(self.recovery_policy, [context])
         else:
             duration = context.exec_time - time_now
             timer = WrappedTimer(self, duration, self.__timer_done_action, self.__timer_action, context)
@@ -49,11 +49,14 @@ from etcd3.events import DeleteEvent, PutEvent
 from concurrent import futures
 import json
 import logging
+import random
+import time
 import uuid
 import threading
 import typing
+from .config import ETCD_TXN_MAX_OPS
 from .constants import REXFLOW_ROOT
-from .etcd_utils import get_etcd, locked_call
+from .etcd_utils import get_etcd
 
 """
 workflow id is akin to conditional-8c6be6a5
@@ -76,6 +79,13 @@ token_error - moves 1 from alloc to error
 """
 class TokenPool:
     SIZE_UNBOUNDED = -1
+    # Every change to a pool is a compare-and-swap on the pool key's
+    # mod_revision. A CAS that loses a race re-reads the pool in the same
+    # transaction and tries again after a jittered exponential backoff, up to
+    # this many times.
+    MAX_CAS_ATTEMPTS = 50
+    CAS_BACKOFF = 0.001
+    CAS_BACKOFF_MAX = 0.05
 
     def __init__(self, name:str, size:int):
         self.name     = name
@@ -84,6 +94,7 @@ class TokenPool:
         self.active   = 0
         self.lost     = 0
         self.complete = 0
+        self._mod_revision = None
 
     @property
     def bounded(self):
@@ -96,18 +107,10 @@ class TokenPool:
         return self.bounded and self.size == self.lost + self.complete
 
     def alloc(self):
-        if self.bounded:
-            assert self.avail > 0, f'{self.name} has no available tokens'
-            self.avail -= 1
-        self.active += 1
-        self.write()
+        self._update(self._alloc)
 
     def release_as_complete(self) -> bool:
-        assert self.active > 0, f'{self.name} has no active tokens'
-        self.active -= 1
-        self.complete += 1
-        self.write()
-        return self.is_done()
+        return self._update(self._release_as_complete)
 
     def release_as_lost(self) -> bool:
         """
@@ -116,15 +119,31 @@ class TokenPool:
         be accounted for. So we move a token from the avail bucket to the lost
         bucket directly.
         """
+        return self._update(self._release_as_lost)
+
+    def _alloc(self):
+        if self.bounded:
+            assert self.avail > 0, f'{self.name} has no available tokens'
+            self.avail -= 1
+        self.active += 1
+
+    def _release_as_complete(self) -> bool:
+        assert self.active > 0, f'{self.name} has no active tokens'
+        self.active -= 1
+        self.complete += 1
+        return self.is_done()
+
+    def _release_as_lost(self) -> bool:
         if self.bounded:
             assert self.avail > 0, f'{self.name} has no available tokens'
             self.avail -= 1
         self.lost += 1
-        self.write()
         return self.is_done()
 
     def to_json(self) -> str:
-        return json.dumps(self.__dict__)
+        return json.dumps({
+            k: v for k, v in self.__dict__.items() if not k.startswith('_')
+        })
 
     def __str__(self):
         return f'{self.name} size:{self.size} aval:{self.avail} ' \
@@ -147,6 +166,19 @@ class TokenPool:
         for k,v in hive.items():
             setattr(obj, k, v)
         return obj
+
+    @classmethod
+    def _from_range(cls, kvs):
+        """Builds a pool from a transaction range response (a list of
+        (value, metadata) tuples), remembering the mod_revision it was read at.
+        """
+        if not kvs:
+            return None
+        value, metadata = kvs[0]
+        pool = cls.from_json(value)
+        pool._mod_revision = metadata.mod_revision
+        return pool
+
     @classmethod
     def key(cls, name:str) -> str:
         """{REXFLOW_ROOT}/tokens/{self.wf_inst_id}"""
@@ -158,33 +190,140 @@ class TokenPool:
 
     @classmethod
     def from_pool_name(cls, name:str):
-        key = TokenPool.key(name)
-
-        def __logic(etcd):
-            return etcd.get(key)[0]
-
-        hive = locked_call(key, __logic)
-        if hive is not None:
-            return TokenPool.from_json(hive)
-        return None
+        value, metadata = get_etcd().get(TokenPool.key(name))
+        if value is None:
+            return None
+        pool = TokenPool.from_json(value)
+        pool._mod_revision = metadata.mod_revision
+        return pool
 
     @classmethod
     def erase(cls, name:str):
-        key = cls.key(name)
-
-        def __logic(etcd):
-            etcd.delete(key)
+        get_etcd().delete(cls.key(name))
 
-        locked_call(key, __logic)
+    @classmethod
+    def erase_many(cls, names:typing.List[str]):
+        """Deletes several pools, ETCD_TXN_MAX_OPS deletes per transaction."""
+        etcd = get_etcd()
+        keys = [cls.key(name) for name in names]
+        for i in range(0, len(keys), ETCD_TXN_MAX_OPS):
+            etcd.transaction(
+                compare=[],
+                success=[etcd.transactions.delete(key) for key in keys[i:i + ETCD_TXN_MAX_OPS]],
+                failure=[],
+            )
 
     def write(self):
+        """Unconditionally stores the pool, e.g. when it is first created."""
+        response = get_etcd().put(self.key(self.name), self.to_json())
+        self._mod_revision = response.header.revision
+        return response
+
+    def _update(self, change:typing.Callable[[], typing.Any]):
+        """Applies change() to this pool and stores the result, provided nobody
+        else has written the pool since it was read. On a conflict, the failure
+        branch of the same transaction returns the current pool, and change()
+        is re-applied to that.
+        """
+        etcd = get_etcd()
         key = self.key(self.name)
-        hive = self.to_json()
+        if self._mod_revision is None:
+            self._reload(etcd.get(key))
+        for attempt in range(self.MAX_CAS_ATTEMPTS):
+            if attempt:
+                self._backoff(attempt)
+            result = change()
+            success, responses = etcd.transaction(
+                compare=[etcd.transactions.mod(key) == self._mod_revision],
+                success=[
+                    etcd.transactions.put(key, self.to_json()),
+                    etcd.transactions.get(key),
+                ],
+                failure=[etcd.transactions.get(key)],
+            )
+            self._reload(responses[-1][0] if responses[-1] else (None, None))
+            if success:
+                return result
+        raise RuntimeError(
+            f'{self.name}: gave up after {self.MAX_CAS_ATTEMPTS} conflicting updates'
+        )
 
-        def __logic(etcd):
-            return etcd.put(key, hive)
+    @classmethod
+    def _backoff(cls, attempt:int):
+        time.sleep(random.uniform(0, min(cls.CAS_BACKOFF_MAX, cls.CAS_BACKOFF * 2 ** attempt)))
 
-        return locked_call(key, __logic)
+    def _reload(self, kv):
+        value, metadata = kv
+        if value is None:
+            raise RuntimeError(f'Token pool {self.name} no longer exists')
+        self.__dict__.update(json.loads(value))
+        self._mod_revision = metadata.mod_revision
+
+    @classmethod
+    def batch_update(cls, names:typing.List[str], change:typing.Callable[[list], typing.Any]):
+        """Reads several pools in one transaction, lets change() move tokens
+        between their buckets, and writes every changed pool back in a
+        second transaction that only succeeds if none of the pools moved in
+        the meantime. Retries on conflict.
+
+        change - called with the list of pools, in the order of names (None
+            for a pool that does not exist). Its return value is returned.
+        """
+        etcd = get_etcd()
+        keys = [cls.key(name) for name in names]
+        for attempt in range(cls.MAX_CAS_ATTEMPTS):
+            if attempt:
+                cls._backoff(attempt)
+            _, responses = etcd.transaction(
+                compare=[],
+                success=[etcd.transactions.get(key) for key in keys],
+                failure=[],
+            )
+            pools = [cls._from_range(kvs) for kvs in responses]
+            before = [pool.to_json() if pool else None for pool in pools]
+            result = change(pools)
+            changed = [
+                pool for pool, original in zip(pools, before)
+                if pool is not None and pool.to_json() != original
+            ]
+            if not changed:
+                return result
+            success, _ = etcd.transaction(
+                compare=[
+                    etcd.transactions.mod(cls.key(pool.name)) == pool._mod_revision
+                    for pool in pools if pool is not None
+                ],
+                success=[
+                    etcd.transactions.put(cls.key(pool.name), pool.to_json())
+                    for pool in changed
+                ],
+                failure=[],
+            )
+            if success:
+                return result
+        raise RuntimeError(
+            f'{names}: gave up after {cls.MAX_CAS_ATTEMPTS} conflicting updates'
+        )
+
+    @classmethod
+    def release_chain_as_complete(cls, names:typing.List[str]):
+        """Releases one token from each of a nested chain of pools, innermost
+        (first) pool first, moving on to the next pool only if the previous
+        one is done. This is what an end event does with the token stack it
+        receives, but in two round trips no matter how deep the stack.
+
+        Returns:
+            (alldone, pools) - alldone is True iff every pool in the chain is
+            done; pools are the pools as written.
+        """
+        def __release(pools):
+            for name, pool in zip(names, pools):
+                assert pool is not None, f'No token pool with name {name}'
+                if not pool._release_as_complete():
+                    return False, pools
+            return True, pools
+
+        return cls.batch_update(names, __release)
 
 if __name__ == "__main__":
     pool = TokenPool.create('test_workflow_id', 10)
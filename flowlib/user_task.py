@@ -7,6 +7,7 @@ from typing import Any, Mapping, List
 
 from flowlib.bpmn_util import (
     BPMNComponent,
+    AnnotationIndex,
     HealthProperties,
     ServiceProperties,
     CallProperties,
@@ -17,9 +18,10 @@ from flowlib.bpmn_util import (
 
 class BPMNUserTask(BPMNComponent):
     def __init__(self, user_task: OrderedDict, process: OrderedDict, global_props: WorkflowProperties,
-        service_props: ServiceProperties, call_props: CallProperties, health_props: HealthProperties = None
+        service_props: ServiceProperties, call_props: CallProperties, health_props: HealthProperties = None,
+        annotations: AnnotationIndex = None,
     ):
-        super().__init__(user_task, process, global_props)
+        super().__init__(user_task, process, global_props, annotations=annotations)
         self._user_task = user_task
 
         self._service_properties = service_props
@@ -29,11 +31,14 @@ class BPMNUserTask(BPMNComponent):
         self.field_desc = None
 
         # Convention is to use underscore for unused values.
-        for _, text in get_annotations(process, self.id):
+        for _, text in get_annotations(process, self.id, self._annotation_index):
             if 'rexflow' in text and 'fields' in text['rexflow'] and 'desc' in text['rexflow']['fields']:
                 self.field_desc = text['rexflow']['fields']['desc']
                 break
 
+    def kafka_transport_targets(self, sequence_flow_table: Mapping[str, Any]) -> List[str]:
+        return []
+
     def to_kubernetes(self, id_hash, component_map: Mapping[str, Any],
                       digraph: OrderedDict, sequence_flow_table: Mapping[str, Any]) -> list:
         return []
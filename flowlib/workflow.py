@@ -1,5 +1,4 @@
 from ast import literal_eval
-import functools
 from io import StringIO
 import json
 import logging
@@ -12,9 +11,12 @@ import requests
 import xmltodict
 import yaml
 
-from . import bpmn
+from . import bpmn, k8s_apply
 from .executor import get_executor
-from .etcd_utils import get_etcd, transition_state
+from .http_sessions import get_session_pool
+from .spec_cache import get_spec_cache
+from .workflow_cache import get_workflow_cache
+from .etcd_utils import get_etcd, transition_state, try_transition_state
 from .constants import (
     BStates,
     States,
@@ -51,12 +53,22 @@ class Workflow:
         self.id_hash = self.properties.id_hash
 
     @classmethod
-    @functools.lru_cache(maxsize=80)
     def from_id(cls, id):
-        etcd = get_etcd(is_not_none=True)
+        '''The deployment's compiled Workflow, from the process-wide
+        workflow_cache (compiled on first use and after every re-apply).
+        '''
+        return get_workflow_cache().get(id)
 
-        proc_key = WorkflowKeys.proc_key(id)
-        proc_bytes = etcd.get(proc_key)[0]
+    @classmethod
+    def from_proc(cls, proc_bytes, id, compiled_bytes=None):
+        '''Compile a deployment from its stored process: from the compiled
+        record if there is a usable one, else from the XML.
+        '''
+        if compiled_bytes is not None:
+            try:
+                return cls(bpmn.BPMNProcess.from_compiled(json.loads(compiled_bytes)), id)
+            except ValueError as exn:
+                logging.warning(f'Ignoring compiled process of {id}: {exn}')
         proc_odict = xmltodict.parse(proc_bytes)['bpmn:process']
         process = bpmn.BPMNProcess(proc_odict)
         return cls(process, id)
@@ -66,30 +78,57 @@ class Workflow:
         if not etcd.put_if_not_exists(self.keys.state, States.STARTING):
             if not etcd.replace(self.keys.state, States.STOPPED, States.STARTING):
                 raise RuntimeError(f'{self.id} is not in a startable state')
+        try:
+            specs_yaml = self._generate_specs()
+            if self.properties.orchestrator == 'istio':
+                self._create_kafka_topics()
+        except Exception as exn:
+            etcd.put(self.keys.state, States.ERROR)
+            raise exn
+        # the cluster may have drifted from the record while stopped
+        report = self._apply_specs(specs_yaml, full=True)
+        if report['failed']:
+            etcd.replace(self.keys.state, States.STARTING, States.ERROR)
+        return report
+
+    def redeploy(self):
+        '''Regenerates the deployment's k8s specs with this flowd, dropping
+        the specs pinned for it in S3, and applies whatever changed.
+        Returns:
+            The report of k8s_apply.apply().
+        '''
+        etcd = get_etcd(is_not_none=True)
+        state = etcd.get(self.keys.state)[0]
+        if state not in (BStates.RUNNING, BStates.ERROR):
+            raise RuntimeError(f'{self.id} is not in a redeployable state')
+        get_spec_cache().invalidate(self.process.id, pinned=True)
+        specs_yaml = self._generate_specs()
+        if self.properties.orchestrator == 'istio':
+            self._create_kafka_topics()
+        return self._apply_specs(specs_yaml)
+
+    def _generate_specs(self) -> str:
         orchestrator = self.properties.orchestrator
-        if orchestrator in {'kubernetes', 'istio'}:
-            kubernetes_input = StringIO()
-            try:
-                if orchestrator == 'kubernetes':
-                    self.process.to_kubernetes(kubernetes_input, self.id_hash)
-                else:
-                    self.process.to_istio(kubernetes_input, self.id_hash)
-                    self._create_kafka_topics()
-            except Exception as exn:
-                etcd.put(self.keys.state, States.ERROR)
-                raise exn
-            ctl_input = kubernetes_input.getvalue()
-            kubectl_result = subprocess.run(
-                ['kubectl', 'apply', '-f', '-'],
-                input=ctl_input, capture_output=True, text=True,
-            )
-            if kubectl_result.stdout:
-                logging.info(f'Got following output from Kubernetes:\n{kubectl_result.stdout}')
-            if kubectl_result.returncode != 0:
-                logging.error(f'Error from Kubernetes:\n{kubectl_result.stderr}')
-                etcd.replace(self.keys.state, States.STARTING, States.ERROR)
-        else:
+        if orchestrator not in {'kubernetes', 'istio'}:
             raise ValueError(f'Unrecognized orchestrator setting, "{orchestrator}"')
+        kubernetes_input = StringIO()
+        if orchestrator == 'kubernetes':
+            self.process.to_kubernetes(kubernetes_input, self.id_hash)
+        else:
+            self.process.to_istio(kubernetes_input, self.id_hash)
+        return kubernetes_input.getvalue()
+
+    def _applied(self):
+        '''Digests of the k8s objects last applied, or None if flowd has no
+        record of them.
+        '''
+        applied = get_etcd(is_not_none=True).get(self.keys.applied)[0]
+        return json.loads(applied) if applied is not None else None
+
+    def _apply_specs(self, specs_yaml: str, full: bool = False):
+        report, applied = k8s_apply.apply(k8s_apply.load_specs(specs_yaml), self._applied(), full=full)
+        get_etcd(is_not_none=True).put(self.keys.applied, json.dumps(applied))
+        return report
 
     def _create_kafka_topics(self):
         if KAFKA_CONFIG is None or len(self.process.kafka_topics) == 0:
@@ -155,21 +194,17 @@ class Workflow:
         elif orchestrator in {'kubernetes', 'istio'}:
             # TODO: Rethink when to delete kafka topics since more than
             # one deployment may use a given topic.
-            kubernetes_stream = StringIO()
-            if orchestrator == 'kubernetes':
-                self.process.to_kubernetes(kubernetes_stream, self.id_hash)
-            else:
-                self.process.to_istio(kubernetes_stream, self.id_hash)
-            ctl_input = kubernetes_stream.getvalue()
-            kubectl_result = subprocess.run(
-                ['kubectl', 'delete', '--ignore-not-found', '-f', '-'],
-                input=ctl_input, capture_output=True, text=True,
-            )
-            if kubectl_result.stdout:
-                logging.info(f'Got following output from Kubernetes:\n{kubectl_result.stdout}')
-            if kubectl_result.returncode != 0:
-                logging.error(f'Error from Kubernetes:\n{kubectl_result.stderr}')
+            applied = self._applied()
+            if applied is None:
+                # applied before flowd kept a record: remove what it would apply
+                applied = k8s_apply.diff_specs(k8s_apply.load_specs(self._generate_specs())).digests
+            report, failed = k8s_apply.remove(applied)
+            if failed:
+                etcd.put(self.keys.applied, json.dumps({key: applied[key] for key in failed}))
                 etcd.replace(self.keys.state, States.STOPPING, States.ERROR)
+            else:
+                etcd.delete(self.keys.applied)
+            return report
         else:
             raise ValueError(f'Unrecognized orchestrator setting, "{orchestrator}"')
 
@@ -203,84 +238,94 @@ class WorkflowInstance:
         uid = uuid.uuid1().hex
         return f'{parent_id}-{uid}'
 
-    def start(self, start_event_id=None, *args):
-        '''Starts the WF and returns the resulting ID. NOTE: Now, WF Id's are
-        created by the Start Event, so this method simply makes an HTTP rpc call
-        to the appropriate start event of the appropriate WF Deployment.
+    def start_target(self, start_event_id=None):
+        '''Picks the start event to call.
+        Returns:
+            (start event id, None), or (None, error result) if the process has
+            several start events and start_event_id names none of them.
         '''
-        process = self.parent.process
-        executor_obj = get_executor()
-
-        def start_wf(task_id: str):
-            '''
-            Arguments:
-                task_id - Task ID in the BPMN spec.
-            Returns:
-                A boolean value indicating an OK response.
-            '''
-            task = process.component_map[task_id]
-            call_props = task.call_properties
-            serialization = call_props.serialization.lower()
-            eval_args = [literal_eval(arg) for arg in args]
-            if serialization == 'json':
-                if eval_args == []:
-                    eval_args = {}
-                data = json.dumps(eval_args)
-                mime_type = 'application/json'
-            elif serialization == 'yaml':
-                data = yaml.dump(eval_args)
-                mime_type = 'application/x-yaml'
-            else:
-                raise ValueError(f'{serialization} is not a supported serialization type.')
-            method = call_props.method.lower()
-            if method not in {'post'}:
-                raise ValueError(f'{method} is not a supported method.')
-            request = getattr(requests, method)
-            req_headers = {
-                'X-Flow-ID': self.id,
-                'X-Rexflow-Wf-Id': self.parent.id,
-                'Content-Type': mime_type
-            }
-            response = request(
-                task.k8s_url,
-                headers=req_headers,
-                data=data
-            )
-            if response.ok:
-                logging.info(f"Response for {task_id} in {self.id} was OK.")
-            else:
-                logging.error(
-                    f"Response for {task_id} in {self.id} was not OK."
-                    f"(status code {response.status_code})"
-                )
-            return response
-
-        target = None
-        if len(process.entry_points) > 1:
-            start_event_ids = [ep['@id'] for ep in process.entry_points]
+        entry_points = self.parent.process.entry_points
+        if len(entry_points) > 1:
+            start_event_ids = [ep['@id'] for ep in entry_points]
             if start_event_id not in start_event_ids:
                 message = "Must choose between following start events: "
                 message += ', '.join(start_event_ids)
                 message += '. Use --start_event_id'
-                return {
+                return None, {
                     "status": -1,
                     "message": message
                 }
-            target = start_event_id
+            return start_event_id, None
+        return entry_points[0]['@id'], None
+
+    def call_start_event(self, task_id: str, args=()) -> requests.Response:
+        '''
+        Arguments:
+            task_id - Start event ID in the BPMN spec.
+            args - Python literals (as strings) to send as the request body.
+        Returns:
+            The start event's response; when it is OK, its JSON holds the new
+            instance's id.
+        '''
+        task = self.parent.process.component_map[task_id]
+        call_props = task.call_properties
+        serialization = call_props.serialization.lower()
+        eval_args = [literal_eval(arg) for arg in args]
+        if serialization == 'json':
+            if eval_args == []:
+                eval_args = {}
+            data = json.dumps(eval_args)
+            mime_type = 'application/json'
+        elif serialization == 'yaml':
+            data = yaml.dump(eval_args)
+            mime_type = 'application/x-yaml'
         else:
-            target = process.entry_points[0]['@id']
+            raise ValueError(f'{serialization} is not a supported serialization type.')
+        method = call_props.method.lower()
+        if method not in {'post'}:
+            raise ValueError(f'{method} is not a supported method.')
+        req_headers = {
+            'X-Flow-ID': self.id,
+            'X-Rexflow-Wf-Id': self.parent.id,
+            'Content-Type': mime_type
+        }
+        response = get_session_pool().request(
+            method,
+            task.k8s_url,
+            headers=req_headers,
+            data=data
+        )
+        if response.ok:
+            logging.info(f"Response for {task_id} in {self.id} was OK.")
+        else:
+            logging.error(
+                f"Response for {task_id} in {self.id} was not OK."
+                f"(status code {response.status_code})"
+            )
+        return response
+
+    def start(self, start_event_id=None, *args):
+        '''Starts the WF and returns the resulting ID. NOTE: Now, WF Id's are
+        created by the Start Event, so this method simply makes an HTTP rpc call
+        to the appropriate start event of the appropriate WF Deployment.
+        '''
+        executor_obj = get_executor()
+
+        target, error = self.start_target(start_event_id)
+        if error is not None:
+            return error
 
-        future = executor_obj.submit(start_wf, target)
+        future = executor_obj.submit(self.call_start_event, target, args)
 
         etcd = get_etcd(is_not_none=True)
         response = future.result()
 
         if not response.ok:
-            if not etcd.replace(self.keys.state, States.STARTING, States.ERROR):
+            if not try_transition_state(etcd, self.keys.state, [BStates.STARTING], BStates.ERROR)[0]:
                 logging.error('Failed to transition from STARTING -> ERROR.')
             return {"instance_id": "Error"}
         else:
-            if not etcd.replace(self.keys.state, States.STARTING, States.RUNNING):
+            if not try_transition_state(etcd, self.keys.state, [BStates.STARTING], BStates.RUNNING)[0]:
                 logging.error('Failed to transition from STARTING -> RUNNING.')
             return response.json()
 
@@ -302,7 +347,7 @@ class WorkflowInstance:
             )
             return flow_result(-1, "Failed to load previous instance state from before failure.")
 
-        if not etcd.replace(self.keys.state, States.STOPPED, States.STARTING):
+        if not try_transition_state(etcd, self.keys.state, [BStates.STOPPED], BStates.STARTING)[0]:
             logging.error('Failed to transition from STOPPED -> STARTING.')
 
         # now, start the thing again.
@@ -314,11 +359,11 @@ class WorkflowInstance:
 
         msg = "Retry Succeeded."
         if response.ok:
-            if not etcd.replace(self.keys.state, States.STARTING, States.RUNNING):
+            if not try_transition_state(etcd, self.keys.state, [BStates.STARTING], BStates.RUNNING)[0]:
                 logging.error('Failed to transition from STARTING -> RUNNING.')
             status = 0
         else:
-            if not etcd.replace(self.keys.state, States.STARTING, States.STOPPED):
+            if not try_transition_state(etcd, self.keys.state, [BStates.STARTING], BStates.STOPPED)[0]:
                 logging.error('Failed to transition from RUNNING -> ERROR.')
             msg = "Retry failed."
             status = -1
@@ -0,0 +1,266 @@
+'''Process-wide cache of compiled Workflow objects.
+
+Compiling a deployment (building the BPMNProcess from its stored process) is
+the expensive part of Workflow.from_id, and flowd's fail_route and wf_map, ps
+and healthd all do it on hot paths. Entries are keyed by deployment id plus
+the etcd mod_revision of the deployment's proc key, so a deployment deleted
+and re-applied under the same id is never served from an old entry.
+
+A watch on /rexflow/workflows (an EtcdMirror subclass that keeps only the
+proc keys' revisions) invalidates entries as their proc keys change, so hits
+cost no etcd round trip. While the watch is down, hits are validated with a
+keys-only read of the proc key instead. The cache is bounded by an estimate
+of the memory its entries hold rather than by their count, since one large
+deployment can cost as much as hundreds of small ones.
+'''
+from collections import OrderedDict
+import logging
+import threading
+
+from etcd3.events import DeleteEvent
+
+from .config import WORKFLOW_CACHE_MAX_BYTES
+from .constants import WorkflowKeys
+from .etcd_utils import EtcdMirror, get_etcd, get_prefix_pages
+
+
+# A compiled workflow holds roughly this many bytes per byte of BPMN, plus a
+# fixed overhead (measured with tracemalloc over the examples/ deployments).
+COMPILED_BYTES_PER_BPMN_BYTE = 4
+COMPILED_BASE_BYTES = 16 * 1024
+
+
+def estimate_size(proc_bytes: bytes) -> int:
+    return COMPILED_BASE_BYTES + COMPILED_BYTES_PER_BPMN_BYTE * len(proc_bytes)
+
+
+def _compile_workflow(did, proc_bytes, compiled_bytes):
+    from .workflow import Workflow
+    return Workflow.from_proc(proc_bytes, did, compiled_bytes)
+
+
+class _ProcRevisions(EtcdMirror):
+    '''Watch-fed map of deployment id to the mod_revision of its proc key.
+    Reuses EtcdMirror's watch, compaction and reconnect handling, but holds
+    neither keys nor values.
+    '''
+    def __init__(self, cache, etcd=None):
+        super().__init__(WorkflowKeys.ROOT + '/', etcd)
+        self.cache = cache
+        self._revisions = dict()
+        self._count = 0  # of all keys under the prefix, for sync()
+
+    def _id_of(self, key):
+        '''The deployment id if key is a deployment's proc key, else None.'''
+        did, _, rest = key[len(self.prefix):].decode('utf-8').partition('/')
+        return did if rest == 'proc' else None
+
+    def _load(self):
+        revisions = dict()
+        count = 0
+        revision = None
+        for response in get_prefix_pages(self.etcd, self.prefix, keys_only=True):
+            revision = response.header.revision
+            count += len(response.kvs)
+            for kv in response.kvs:
+                did = self._id_of(kv.key)
+                if did is not None:
+                    revisions[did] = kv.mod_revision
+        with self._cond:
+            self._revisions = revisions
+            self._count = count
+            self.revision = revision
+            self._cond.notify_all()
+        # after a compaction, whatever changed while the watch was behind
+        self.cache._retain(revisions)
+
+    def _apply(self, event):
+        did = self._id_of(event.key)
+        with self._cond:
+            if isinstance(event, DeleteEvent):
+                self._count -= 1
+            elif event.version == 1:
+                self._count += 1
+            if did is not None:
+                if isinstance(event, DeleteEvent):
+                    self._revisions.pop(did, None)
+                else:
+                    self._revisions[did] = event.mod_revision
+            self.revision = max(self.revision, event.mod_revision)
+            self.events_applied += 1
+            self._cond.notify_all()
+        if did is not None:
+            self.cache.invalidate(did, keep_revision=self.revision_of(did))
+
+    def _key_count(self):
+        return self._count
+
+    def revision_of(self, did):
+        '''The proc key's mod_revision as last seen by the watch, or None.'''
+        with self._cond:
+            return self._revisions.get(did)
+
+    def stats(self):
+        stats = super().stats()
+        del stats['prefix'], stats['keys'], stats['bytes'], stats['overflowed']
+        return stats
+
+
+class WorkflowCache:
+    '''LRU cache of compiled workflows, keyed by (deployment id, proc
+    mod_revision) and bounded by the estimated bytes of its entries.
+    Example:
+        >>> workflow = get_workflow_cache().get(did)
+    '''
+    def __init__(self, etcd=None, max_bytes=None, compile=_compile_workflow):
+        self.etcd = etcd if etcd is not None else get_etcd(is_not_none=True)
+        self.max_bytes = WORKFLOW_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.compile = compile
+        self.hits = 0
+        self.misses = 0
+        self.validations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # did -> (revision, workflow, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._watch = _ProcRevisions(self, self.etcd)
+
+    def start(self):
+        '''Start following the proc keys. Without it, every hit is validated
+        against etcd.
+        '''
+        self._watch.start()
+        return self
+
+    def stop(self):
+        self._watch.stop()
+
+    def get(self, did):
+        '''Returns the compiled Workflow for deployment did.
+        Raises:
+            KeyError if the deployment has no proc key.
+        '''
+        with self._lock:
+            entry = self._entries.get(did)
+        if entry is not None:
+            revision = entry[0]
+            if self._watch.live:
+                current = self._watch.revision_of(did)
+            else:
+                current = self._proc_revision(did)
+                with self._lock:
+                    self.validations += 1
+            if current == revision:
+                with self._lock:
+                    if did in self._entries:
+                        self._entries.move_to_end(did)
+                    self.hits += 1
+                return entry[1]
+        txns = self.etcd.transactions
+        _, (proc, compiled) = self.etcd.transaction(
+            compare=[],
+            success=[
+                txns.get(WorkflowKeys.proc_key(did)),
+                txns.get(WorkflowKeys.compiled_key(did)),
+            ],
+            failure=[],
+        )
+        if not proc:
+            raise KeyError(did)
+        proc_bytes, metadata = proc[0]
+        compiled_bytes = compiled[0][0] if compiled else None
+        workflow = self.compile(did, proc_bytes, compiled_bytes)
+        self._put(did, metadata.mod_revision, workflow, estimate_size(proc_bytes))
+        return workflow
+
+    def _proc_revision(self, did):
+        request = self.etcd._build_get_range_request(WorkflowKeys.proc_key(did), keys_only=True)
+        response = self.etcd.kvstub.Range(
+            request,
+            self.etcd.timeout,
+            credentials=self.etcd.call_credentials,
+            metadata=self.etcd.metadata,
+        )
+        return response.kvs[0].mod_revision if response.kvs else None
+
+    def _put(self, did, revision, workflow, size):
+        with self._lock:
+            self.misses += 1
+            watched = self._watch.revision_of(did)
+            if self._watch.live and watched is not None and watched > revision:
+                return  # re-applied while we compiled; don't cache the old one
+            old = self._entries.pop(did, None)
+            if old is not None:
+                self._size -= old[2]
+            if size > self.max_bytes:
+                return
+            self._entries[did] = (revision, workflow, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, did, keep_revision=None):
+        '''Drop the entry for did, unless it was compiled from keep_revision.'''
+        with self._lock:
+            entry = self._entries.get(did)
+            if entry is not None and entry[0] != keep_revision:
+                del self._entries[did]
+                self._size -= entry[2]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _retain(self, revisions):
+        '''Drop every entry whose proc key is not at the given revision.'''
+        with self._lock:
+            entries = list(self._entries.items())
+        for did, (revision, _, _) in entries:
+            if revisions.get(did) != revision:
+                self.invalidate(did, keep_revision=revisions.get(did))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'validations': self.validations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'watch': self._watch.stats(),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_workflow_cache() -> WorkflowCache:
+    '''Get the started, module-level WorkflowCache, creating it on first use.
+    Requires the module-level etcd client.
+    '''
+    global _cache
+    etcd = get_etcd(is_not_none=True)
+    with _cache_lock:
+        if _cache is None or _cache.etcd is not etcd:
+            if _cache is not None:
+                _cache.stop()
+            _cache = WorkflowCache(etcd).start()
+            logging.info(f'Caching compiled workflows in up to {_cache.max_bytes} bytes.')
+        return _cache
+
+
+def get_workflow_cache_stats():
+    '''Stats of the module-level cache, or None if nothing has used it yet.'''
+    cache = _cache
+    return cache.stats() if cache is not None else None
@@ -16,6 +16,7 @@ setuptools.setup(**rex_setup_args(
         'etcd3',
         'grpcio',
         'isodate',
+        'protobuf>=3.20',
         'pyyaml',
         'quart',
         'requests',
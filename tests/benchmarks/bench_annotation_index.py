@@ -0,0 +1,54 @@
+'''Build synthetic processes of growing size (one REXFlow annotation per
+service task) and time BPMNProcess construction, which looks each
+component's annotations up in the process's AnnotationIndex. For comparison,
+time the per-component scan of every association and annotation that the
+constructors used to do, sampled over a few components and scaled up. Most
+of a build from XML is YAML; the last column builds from a compiled process
+record, so it shows the cost of everything else.
+
+Usage:
+    python -m tests.benchmarks.bench_annotation_index [min_nodes] [max_nodes] [samples]
+'''
+import logging
+import sys
+import time
+
+import xmltodict
+
+from flowlib import bpmn
+from flowlib.bpmn_util import get_annotations
+from tests.benchmarks.bench_compiled_process import make_process_xml
+
+
+def main(min_nodes=100, max_nodes=5000, samples=50):
+    logging.getLogger().setLevel(logging.WARNING)
+    sizes = [min_nodes]
+    while sizes[-1] * 2 < max_nodes:
+        sizes.append(sizes[-1] * 2)
+    sizes.append(max_nodes)
+    print(f'{"nodes":>6} {"indexed build":>14} {"per node":>10} {"scan build (est.)":>18} '
+          f'{"per node":>10} {"from compiled":>14} {"per node":>10}')
+    for nodes in sizes:
+        process_dict = xmltodict.parse(make_process_xml(nodes))['bpmn:process']
+        start = time.perf_counter()
+        process = bpmn.BPMNProcess(process_dict)
+        indexed = time.perf_counter() - start
+
+        component_ids = [component.id for component in process.all_components]
+        sample = component_ids[::max(1, len(component_ids) // samples)]
+        start = time.perf_counter()
+        for component_id in sample:
+            list(get_annotations(process_dict, component_id))
+        scanned = (time.perf_counter() - start) / len(sample) * len(component_ids)
+
+        record = process.to_compiled()
+        start = time.perf_counter()
+        bpmn.BPMNProcess.from_compiled(record)
+        compiled = time.perf_counter() - start
+        print(f'{nodes:6} {indexed * 1000:11.1f} ms {indexed / nodes * 1e6:7.1f} us '
+              f'{scanned * 1000:15.1f} ms {scanned / nodes * 1e6:7.1f} us '
+              f'{compiled * 1000:11.1f} ms {compiled / nodes * 1e6:7.1f} us')
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,78 @@
+'''Load test of a Quart handler that forwards each request with FlowPost,
+the way the throw gateway does, when one of the upstreams is slow. With
+the blocking FlowPost the slow call stalls the whole event loop; with
+AsyncFlowPost only the request waiting on it is held up.
+
+Usage:
+    python -m tests.benchmarks.bench_async_flowpost [requests] [concurrency] [slow_delay_s]
+'''
+import asyncio
+import logging
+import statistics
+import sys
+import time
+
+from quart import Quart, request
+
+from flowlib.flowpost import AsyncFlowPost, FlowPost
+from flowlib.http_sessions import close_async_client
+from tests.http_stub import HttpStub
+
+
+def make_app(fast, slow):
+    app = Quart(__name__)
+
+    def poster(cls):
+        url = slow.url('/') if request.args.get('slow') else fast.url('/')
+        return cls('bench-did-iid', 'task-1', b'{}', url=url, retries=0, shadow_url='')
+
+    @app.route('/blocking', methods=['POST'])
+    async def blocking():
+        poster(FlowPost).send()
+        return 'ok'
+
+    @app.route('/async', methods=['POST'])
+    async def nonblocking():
+        await poster(AsyncFlowPost).send()
+        return 'ok'
+
+    return app
+
+
+async def load(app, path, total, concurrency):
+    client = app.test_client()
+    latencies = []
+    queue = list(range(total))
+    last_fast = [0.0]
+
+    async def worker():
+        while queue:
+            n = queue.pop()
+            # one request in every run goes to the slow upstream
+            url = f'{path}?slow=1' if n == 0 else path
+            start = time.perf_counter()
+            await client.post(url)
+            if n:
+                last_fast[0] = time.perf_counter()
+                latencies.append(last_fast[0] - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await close_async_client()
+    return last_fast[0] - start, sorted(latencies)
+
+
+def main(total=400, concurrency=20, slow_delay=2.0):
+    logging.disable(logging.WARNING)
+    print(f'{total} requests, {concurrency} concurrent, one to an upstream taking {slow_delay}s')
+    with HttpStub() as fast, HttpStub(delay=slow_delay) as slow:
+        app = make_app(fast, slow)
+        for label, path in (('FlowPost', '/blocking'), ('AsyncFlowPost', '/async')):
+            elapsed, latencies = asyncio.run(load(app, path, total, concurrency))
+            print(f'{label:>14}: fast requests {(total - 1) / elapsed:7.0f} req/s, '
+                  f'p50 {statistics.median(latencies) * 1000:7.1f} ms, '
+                  f'max {latencies[-1] * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,70 @@
+'''Cold-load a large deployment the way Workflow.from_id does on a cache miss:
+from the BPMN XML stored at the proc key (xmltodict plus a YAML parse of
+every annotation), versus from the compiled process record flowd stores next
+to it at apply time.
+
+Usage:
+    python -m tests.benchmarks.bench_compiled_process [nodes] [loads]
+'''
+import json
+import sys
+import time
+
+import xmltodict
+
+from flowlib import bpmn
+
+
+def make_process_xml(nodes, transport='rpc'):
+    '''A start event, nodes - 2 annotated service tasks in a chain, and an
+    end event, as the XML handle_apply stores.
+    '''
+    tasks = [f'Task_{n}' for n in range(nodes - 2)]
+    chain = ['Start_1'] + tasks + ['End_1']
+    elements = ['<bpmn:startEvent id="Start_1"/>', '<bpmn:endEvent id="End_1"/>']
+    if transport != 'rpc':
+        elements.append(
+            '<bpmn:textAnnotation id="Annotation_global"><bpmn:text>rexflow_global_properties:\n'
+            f'  transport: {transport}\n</bpmn:text></bpmn:textAnnotation>'
+        )
+    for task in tasks:
+        elements.append(f'<bpmn:serviceTask id="{task}" name="{task.lower()}"/>')
+        elements.append(
+            f'<bpmn:textAnnotation id="Annotation_{task}"><bpmn:text>rexflow:\n'
+            f'  service:\n    host: {task.lower()}\n    port: 5000\n'
+            f'  call:\n    path: /{task.lower()}\n    method: POST\n</bpmn:text></bpmn:textAnnotation>'
+        )
+        elements.append(
+            f'<bpmn:association id="Association_{task}" sourceRef="{task}" targetRef="Annotation_{task}"/>'
+        )
+    for n, (source, target) in enumerate(zip(chain, chain[1:])):
+        elements.append(f'<bpmn:sequenceFlow id="Flow_{n}" sourceRef="{source}" targetRef="{target}"/>')
+    return f'<bpmn:process id="Bench_{nodes}">{"".join(elements)}</bpmn:process>'
+
+
+def main(nodes=1000, loads=3):
+    proc_xml = bpmn.BPMNProcess(
+        xmltodict.parse(make_process_xml(nodes))['bpmn:process']
+    ).to_xml()
+    compiled_json = bpmn.BPMNProcess(xmltodict.parse(proc_xml)['bpmn:process']).to_compiled_json()
+    print(f'{nodes} nodes: {len(proc_xml) / 1024:.0f} KB of XML, '
+          f'{len(compiled_json) / 1024:.0f} KB compiled, {loads} cold loads each')
+
+    start = time.perf_counter()
+    for _ in range(loads):
+        from_xml = bpmn.BPMNProcess(xmltodict.parse(proc_xml)['bpmn:process'])
+    xml_elapsed = (time.perf_counter() - start) / loads
+    print(f'{"from XML":>14}: {xml_elapsed * 1000:10.1f} ms/load')
+
+    start = time.perf_counter()
+    for _ in range(loads):
+        from_compiled = bpmn.BPMNProcess.from_compiled(json.loads(compiled_json))
+    compiled_elapsed = (time.perf_counter() - start) / loads
+    print(f'{"from compiled":>14}: {compiled_elapsed * 1000:10.1f} ms/load '
+          f'({xml_elapsed / compiled_elapsed:.1f}x)')
+    assert from_compiled.hash == from_xml.hash
+    assert len(from_compiled.all_components) == len(from_xml.all_components) == nodes
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
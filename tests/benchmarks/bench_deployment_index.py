@@ -0,0 +1,66 @@
+'''Resolve workflow ids the way flowctl run does, against a fake etcd holding
+many deployments: the old scan of every key and value under
+/rexflow/workflows per request, versus flowd's watch-fed DeploymentIndex.
+
+Usage:
+    python -m tests.benchmarks.bench_deployment_index [deployments] [lookups] [latency_ms] [proc_kb]
+'''
+import sys
+import time
+
+from flowd.deployment_index import DeploymentIndex
+from flowlib import etcd_utils
+from flowlib.constants import WorkflowKeys
+from tests.fake_etcd import FakeEtcd
+
+
+def resolve_by_scan(workflow_id):
+    '''The previous implementation, from flowd/handlers/handle_run.py.'''
+    wf_keys = []
+    for wf_key, wf_data in etcd_utils.EtcdDict.from_root(f'/rexflow/workflows').items():
+        if workflow_id in wf_key:
+            wf_keys.append(wf_key)
+    if len(wf_keys) == 1:
+        workflow_id = wf_keys[0]
+    return workflow_id
+
+
+def main(deployments=500, lookups=100, latency_ms=0.5, proc_kb=20):
+    etcd = FakeEtcd()
+    etcd_utils._etcd = etcd
+    dids = [f'process-{n:04}-{n * 7919 % 100000:05}abc' for n in range(deployments)]
+    for did in dids:
+        etcd.put(WorkflowKeys.state_key(did), 'RUNNING')
+        etcd.put(WorkflowKeys.proc_key(did), 'x' * (proc_kb * 1024))
+        for task in ('start', 'task-1', 'task-2', 'end'):
+            etcd.put(WorkflowKeys.task_key(did, task), 'UP')
+    etcd.latency = latency_ms / 1000
+    queries = [dids[n % deployments][len('process-'):len('process-0000')] for n in range(lookups)]
+    print(f'{deployments} deployments ({proc_kb} KB BPMN each), {lookups} lookups, '
+          f'{latency_ms}ms per round trip')
+
+    etcd.reset_calls()
+    start = time.perf_counter()
+    scanned = [resolve_by_scan(query) for query in queries]
+    elapsed = time.perf_counter() - start
+    print(f'{"full scan":>16}: {etcd.round_trips:6} round trips, '
+          f'{elapsed / lookups * 1e6:10.1f} us/lookup')
+
+    etcd.reset_calls()
+    start = time.perf_counter()
+    index = DeploymentIndex(etcd).start()
+    load = time.perf_counter() - start
+    load_trips = etcd.round_trips
+    start = time.perf_counter()
+    indexed = [index.resolve(query) for query in queries]
+    elapsed = time.perf_counter() - start
+    print(f'{"index (load)":>16}: {load_trips:6} round trips, {load * 1000:10.1f} ms once')
+    print(f'{"index (lookup)":>16}: {etcd.round_trips - load_trips:6} round trips, '
+          f'{elapsed / lookups * 1e6:10.1f} us/lookup')
+    index.stop()
+    assert scanned == indexed
+    assert indexed[0] == dids[0]
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
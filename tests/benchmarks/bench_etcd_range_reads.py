@@ -0,0 +1,55 @@
+'''Compare prefix reads against the fake etcd: the old key-listing-plus-get
+loop versus the paged range reads in etcd_utils.get_dict_from_prefix().
+
+Usage:
+    python -m tests.benchmarks.bench_etcd_range_reads [instances] [latency_ms]
+'''
+import sys
+import time
+
+from flowlib import etcd_utils
+from tests.fake_etcd import FakeEtcd
+
+
+KEYS_PER_INSTANCE = ('state', 'parent', 'content_type', 'result', 'end_event')
+
+
+def get_dict_per_key(prefix, delim='/'):
+    '''The previous implementation: one range for the keys, then one get each.'''
+    etcd = etcd_utils._etcd
+    result = dict()
+    for _, metadata in etcd.get_prefix(prefix, keys_only=True):
+        key = metadata.key.decode('utf-8')
+        crnt = result
+        key_split = key[len(prefix):].split(delim)
+        for subkey in key_split[:-1]:
+            crnt = crnt.setdefault(subkey, dict())
+        crnt[key_split[-1]] = etcd.get(key)[0]
+    return result
+
+
+def main(instances=2000, latency_ms=0.5):
+    etcd = FakeEtcd()
+    etcd_utils._etcd = etcd
+    for index in range(instances):
+        for key in KEYS_PER_INSTANCE:
+            etcd.put(f'/rexflow/instances/iid-{index}/{key}', 'x' * 32)
+    etcd.latency = latency_ms / 1000
+    prefix = '/rexflow/instances/'
+    print(f'{instances} instances, {len(KEYS_PER_INSTANCE) * instances} keys, '
+          f'{latency_ms}ms per round trip')
+    results = []
+    for name, func in (
+        ('per-key get', get_dict_per_key),
+        ('paged range', etcd_utils.get_dict_from_prefix),
+    ):
+        etcd.reset_calls()
+        start = time.perf_counter()
+        results.append(func(prefix))
+        elapsed = time.perf_counter() - start
+        print(f'{name:>12}: {etcd.round_trips:6} round trips, {elapsed * 1000:9.1f} ms')
+    assert results[0] == results[1]
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,54 @@
+'''FlowPost latency against a local HTTP stand-in: a new TCP connection per
+call (the module-level requests.post) versus the keep-alive SessionPool.
+
+Usage:
+    python -m tests.benchmarks.bench_flowpost_sessions [calls] [threads]
+'''
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import statistics
+import sys
+import time
+
+import requests
+
+from flowlib.flowpost import FlowPost, FlowPostStatus
+from flowlib.http_sessions import SessionPool
+from tests.http_stub import HttpStub
+
+
+def run(stub, req_method, calls, threads):
+    def call(_):
+        start = time.perf_counter()
+        result = FlowPost(
+            'bench-did-iid', 'task-1', b'{"n": 1}', url=stub.url('/task'),
+            req_method=req_method, retries=0, shadow_url='',
+        ).send()
+        assert result.message == FlowPostStatus.SUCCESS
+        return time.perf_counter() - start
+
+    connections = stub.connections
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(executor.map(call, range(calls)))
+    elapsed = time.perf_counter() - start
+    return elapsed, latencies, stub.connections - connections
+
+
+def main(calls=2000, threads=4):
+    logging.disable(logging.WARNING)
+    print(f'{calls} FlowPost calls from {threads} threads to a local HTTP server')
+    pool = SessionPool()
+    with HttpStub() as stub:
+        for label, req_method in (('requests.post', requests.post), ('SessionPool', pool.post)):
+            elapsed, latencies, connections = run(stub, req_method, calls, threads)
+            print(f'{label:>14}: {calls / elapsed:8.0f} calls/s, '
+                  f'p50 {statistics.median(latencies) * 1000:6.2f} ms, '
+                  f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms, '
+                  f'{connections} connections')
+    print(f'pool stats: {pool.stats()}')
+    pool.close()
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,52 @@
+'''Time pushing the k8s objects of synthetic processes to a fake API server
+that takes latency seconds per request: every object one request at a time,
+as kubectl apply does; every object on the k8s_apply workers, as every
+start does; and, after one task's Deployment changed, only what changed.
+
+Usage:
+    python -m tests.benchmarks.bench_k8s_apply [min_tasks] [max_tasks] [latency] [workers]
+'''
+import logging
+import sys
+import time
+
+import xmltodict
+
+from flowlib import bpmn, k8s_apply
+from flowlib.config import K8S_APPLY_WORKERS
+from flowlib.k8s_apply import KubernetesApi
+from tests.benchmarks.bench_spec_generation import generate, make_process_xml
+from tests.fake_k8s import FakeKubernetes
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main(min_tasks=10, max_tasks=160, latency=0.01, workers=K8S_APPLY_WORKERS):
+    logging.getLogger().setLevel(logging.WARNING)
+    sizes = [min_tasks]
+    while sizes[-1] * 2 < max_tasks:
+        sizes.append(sizes[-1] * 2)
+    sizes.append(max_tasks)
+    print(f'{latency * 1000:.0f} ms per request, {workers} workers')
+    print(f'{"tasks":>6} {"objects":>8} {"one by one":>11} {"concurrent":>11} {"diff":>9} {"sent":>5}')
+    for tasks in sizes:
+        process = bpmn.BPMNProcess(xmltodict.parse(make_process_xml(tasks))['bpmn:process'])
+        specs = generate(process)
+        with FakeKubernetes(delay=latency) as server:
+            serial, _ = timed(k8s_apply.apply, specs, None, KubernetesApi(server.url(), workers=1))
+            server.objects.clear()
+            api = KubernetesApi(server.url(), workers=workers)
+            concurrent, (_, applied) = timed(k8s_apply.apply, specs, None, api)
+            deployment = next(spec for spec in specs if spec['kind'] == 'Deployment')
+            deployment['spec']['replicas'] = 2
+            diff, (report, _) = timed(k8s_apply.apply, specs, applied, api)
+        print(f'{tasks:6} {len(specs):8} {serial * 1000:8.0f} ms {concurrent * 1000:8.0f} ms '
+              f'{diff * 1000:6.0f} ms {report["applied"] + report["deleted"]:5}')
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
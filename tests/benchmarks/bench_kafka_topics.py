@@ -0,0 +1,80 @@
+'''Time the kafka topic discovery done when a deployment with many
+kafka-transport edges starts and stops. Workflow._create_kafka_topics and
+_delete_kafka_topics each read BPMNProcess.kafka_topics twice; it used to
+generate the k8s specs of every component on each read, and is now worked
+out once per process without generating any. The kafka admin client is
+replaced by one that knows no topics, so only topic discovery is timed.
+
+Usage:
+    python -m tests.benchmarks.bench_kafka_topics [nodes] [cycles]
+'''
+import logging
+import sys
+import time
+from unittest import mock
+
+import xmltodict
+
+from flowlib import bpmn, workflow
+from tests.benchmarks.bench_compiled_process import make_process_xml
+
+
+def topics_from_specs(process):
+    '''The previous BPMNProcess.kafka_topics, from flowlib/bpmn.py.'''
+    kafka_topics = []
+    for component in process.all_components:
+        component.to_kubernetes(
+            process.properties.id_hash,
+            process.component_map,
+            process._digraph,
+            process._sequence_flow_table
+        )
+        kafka_topics.extend(component.kafka_topics)
+    if process.properties.notification_kafka_topic:
+        kafka_topics.append(process.properties.notification_kafka_topic)
+    return set(kafka_topics)
+
+
+class AdminClient:
+    def __init__(self, config):
+        pass
+
+    def list_topics(self):
+        return mock.Mock(topics={})
+
+    def create_topics(self, topics):
+        return {}
+
+    def delete_topics(self, topics):
+        return {}
+
+
+def start_stop(process_dict, cycles):
+    elapsed = 0
+    for _ in range(cycles):
+        wf = workflow.Workflow(bpmn.BPMNProcess(process_dict), 'bench')
+        start = time.perf_counter()
+        wf._create_kafka_topics()
+        wf._delete_kafka_topics()
+        elapsed += time.perf_counter() - start
+    return elapsed / cycles
+
+
+def main(nodes=1000, cycles=3):
+    logging.getLogger().setLevel(logging.WARNING)
+    process_dict = xmltodict.parse(make_process_xml(nodes, transport='kafka'))['bpmn:process']
+    topics = bpmn.BPMNProcess(process_dict).kafka_topics
+    print(f'{nodes} nodes, {len(topics)} kafka topics, {cycles} start/stop cycles')
+    with mock.patch.object(workflow, 'KAFKA_CONFIG', {}), \
+            mock.patch.object(workflow, 'AdminClient', AdminClient):
+        with mock.patch.object(bpmn.BPMNProcess, 'kafka_topics', property(topics_from_specs)):
+            from_specs = start_stop(process_dict, cycles)
+        print(f'{"from k8s specs":>16}: {from_specs * 1000:10.1f} ms/start+stop')
+        compiled = start_stop(process_dict, cycles)
+        print(f'{"compiled once":>16}: {compiled * 1000:10.1f} ms/start+stop '
+              f'({from_specs / compiled:.0f}x)')
+    assert topics_from_specs(bpmn.BPMNProcess(process_dict)) == topics
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
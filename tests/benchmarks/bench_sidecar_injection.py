@@ -0,0 +1,56 @@
+'''Time the spec generation flowctl apply waits for with manual sidecar
+injection: generating a synthetic process's specs, then injecting sidecars
+in-process, versus piping the YAML through istioctl kube-inject as flowd
+does by default (only if istioctl is on the PATH).
+
+Usage:
+    python -m tests.benchmarks.bench_sidecar_injection [min_nodes] [max_nodes] [runs]
+'''
+import logging
+import shutil
+import sys
+import time
+from unittest import mock
+
+import xmltodict
+import yaml
+
+from flowlib import bpmn, sidecar_injector
+from flowlib.sidecar_injector import istioctl_inject
+from tests.benchmarks.bench_compiled_process import make_process_xml
+
+
+def main(min_nodes=50, max_nodes=400, runs=3):
+    logging.getLogger().setLevel(logging.WARNING)
+    has_istioctl = shutil.which('istioctl') is not None
+    sizes = [min_nodes]
+    while sizes[-1] * 2 < max_nodes:
+        sizes.append(sizes[-1] * 2)
+    sizes.append(max_nodes)
+    print(f'{"nodes":>6} {"generate":>12} {"inject":>12} {"apply total":>12} {"istioctl":>12}')
+    for nodes in sizes:
+        process = bpmn.BPMNProcess(xmltodict.parse(make_process_xml(nodes))['bpmn:process'])
+        generate = inject = istioctl = 0.0
+        for _ in range(runs):
+            with mock.patch.object(bpmn, 'DO_MANUAL_INJECTION', False):
+                start = time.perf_counter()
+                specs_yaml = process._generate_istio_specs(None)
+                generate += time.perf_counter() - start
+
+            specs = list(yaml.safe_load_all(specs_yaml))
+            start = time.perf_counter()
+            sidecar_injector.inject_sidecars(specs)
+            inject += time.perf_counter() - start
+
+            if has_istioctl:
+                start = time.perf_counter()
+                istioctl_inject(specs_yaml)
+                istioctl += time.perf_counter() - start
+        generate, inject, istioctl = generate / runs, inject / runs, istioctl / runs
+        print(f'{nodes:6} {generate * 1000:9.1f} ms {inject * 1000:9.1f} ms '
+              f'{(generate + inject) * 1000:9.1f} ms '
+              + (f'{istioctl * 1000:9.1f} ms' if has_istioctl else f'{"(no istioctl)":>12}'))
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,134 @@
+'''Generate the k8s specs of synthetic processes of growing size, as validate,
+apply and the spec cache do on a miss: a chain of annotated service tasks,
+an error boundary event on every fifth one and an exclusive gateway after
+every tenth. Times building the process, generating the spec dicts, the YAML
+dump with PyYAML's pure-Python SafeDumper (estimated from a sample of the
+specs) and dump_specs(), with libyaml and, for lists of at least
+SPEC_PARALLEL_MIN_SPECS specs, the spec pool. For comparison, estimates the
+per-task scan of every boundary event that tasks used to do.
+
+Usage:
+    python -m tests.benchmarks.bench_spec_generation [min_tasks] [max_tasks] [workers]
+'''
+import logging
+import sys
+import time
+from unittest import mock
+
+import xmltodict
+import yaml
+
+from flowlib import bpmn, spec_writer
+from flowlib.bpmn_util import iter_xmldict_for_key
+
+
+def iter_process_elements(tasks):
+    '''Yields the XML elements of a process of tasks service tasks.'''
+    yield '<bpmn:startEvent id="Start_1"/>'
+    yield '<bpmn:endEvent id="End_1" name="done"/>'
+    yield '<bpmn:endEvent id="End_error" name="failed"/>'
+    flows = iter(range(sys.maxsize))
+
+    def flow(source, target, condition=None):
+        if condition is None:
+            return f'<bpmn:sequenceFlow id="Flow_{next(flows)}" sourceRef="{source}" targetRef="{target}"/>'
+        return (
+            f'<bpmn:sequenceFlow id="Flow_{next(flows)}" sourceRef="{source}" targetRef="{target}">'
+            f'<bpmn:conditionExpression xsi:type="bpmn:tFormalExpression">{condition}'
+            '</bpmn:conditionExpression></bpmn:sequenceFlow>'
+        )
+
+    previous = 'Start_1'
+    for n in range(tasks):
+        task = f'Task_{n}'
+        yield f'<bpmn:serviceTask id="{task}" name="{task.lower()}"/>'
+        yield (
+            f'<bpmn:textAnnotation id="Annotation_{task}"><bpmn:text>rexflow:\n'
+            f'  service:\n    host: {task.lower()}\n    port: 5000\n'
+            f'  call:\n    path: /{task.lower()}\n    method: POST\n</bpmn:text></bpmn:textAnnotation>'
+        )
+        yield f'<bpmn:association id="Association_{task}" sourceRef="{task}" targetRef="Annotation_{task}"/>'
+        if previous is not None:  # else the gateway before it already flows here
+            yield flow(previous, task)
+        previous = task
+        if n % 5 == 4:
+            yield (
+                f'<bpmn:boundaryEvent id="Boundary_{n}" attachedToRef="{task}">'
+                f'<bpmn:errorEventDefinition id="Error_{n}"/></bpmn:boundaryEvent>'
+            )
+            yield flow(f'Boundary_{n}', 'End_error')
+        if n % 10 == 9 and n + 2 < tasks:
+            gateway = f'Gateway_{n}'
+            yield f'<bpmn:exclusiveGateway id="{gateway}" name="gateway-{n}"/>'
+            yield flow(task, gateway)
+            yield flow(gateway, f'Task_{n + 1}', condition=f'step = {n}')
+            yield flow(gateway, f'Task_{n + 2}')
+            previous = None
+    yield flow(previous, 'End_1')
+
+
+def make_process_xml(tasks):
+    return f'<bpmn:process id="Specs_{tasks}">{"".join(iter_process_elements(tasks))}</bpmn:process>'
+
+
+def generate(process):
+    '''The spec dicts to_istio dumps, without the namespace.'''
+    specs = []
+    for component in process.all_components:
+        specs.extend(component.to_kubernetes(
+            None, process.component_map, process._digraph, process._sequence_flow_table,
+        ))
+    return specs
+
+
+def scan_boundary_events(process, task):
+    '''What BPMNTask._generate_envoyfilter used to do for every task.'''
+    return [
+        boundary_event for boundary_event in iter_xmldict_for_key(process.xmldict, 'bpmn:boundaryEvent')
+        if 'bpmn:errorEventDefinition' in boundary_event and boundary_event['@attachedToRef'] == task.id
+    ]
+
+
+def main(min_tasks=100, max_tasks=5000, workers=spec_writer.SPEC_WORKERS, samples=200):
+    logging.getLogger().setLevel(logging.WARNING)
+    sizes = [min_tasks]
+    while sizes[-1] * 2 < max_tasks:
+        sizes.append(sizes[-1] * 2)
+    sizes.append(max_tasks)
+    print(f'{workers} workers, libyaml {"available" if yaml.__with_libyaml__ else "not available"}')
+    print(f'{"tasks":>6} {"specs":>6} {"build":>10} {"generate":>10} {"scans (est.)":>13} '
+          f'{"SafeDumper (est.)":>18} {"dump_specs":>11} {"speedup":>8}')
+    for tasks in sizes:
+        start = time.perf_counter()
+        process = bpmn.BPMNProcess(xmltodict.parse(make_process_xml(tasks))['bpmn:process'])
+        built = time.perf_counter() - start
+
+        start = time.perf_counter()
+        specs = generate(process)
+        generated = time.perf_counter() - start
+
+        sample = process.tasks[::max(1, len(process.tasks) // samples)]
+        start = time.perf_counter()
+        for task in sample:
+            scan_boundary_events(process, task)
+        scans = (time.perf_counter() - start) / len(sample) * len(process.tasks)
+
+        sample = specs[::max(1, len(specs) // samples)]
+        start = time.perf_counter()
+        yaml.safe_dump_all(sample)
+        pure = (time.perf_counter() - start) / len(sample) * len(specs)
+
+        with mock.patch.object(spec_writer, 'SPEC_WORKERS', workers):
+            spec_writer.dump_specs(generate(process))  # start the pool
+            start = time.perf_counter()
+            spec_writer.dump_specs(specs)
+            dumped = time.perf_counter() - start
+
+        before = generated + scans + pure
+        print(f'{tasks:6} {len(specs):6} {built * 1000:7.0f} ms {generated * 1000:7.0f} ms '
+              f'{scans * 1000:10.0f} ms {pure * 1000:15.0f} ms {dumped * 1000:8.0f} ms '
+              f'{before / (generated + dumped):7.1f}x')
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
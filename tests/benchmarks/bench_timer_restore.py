@@ -0,0 +1,81 @@
+'''Restoring persisted timers on catch-gateway startup against the fake etcd:
+the previous list-keys-then-locked-get-per-timer restore versus the single
+paged range read, with a share of the timers already expired.
+
+Usage:
+    python -m tests.benchmarks.bench_timer_restore [timers] [expired_pct] [latency_ms]
+'''
+import json
+import logging
+import sys
+import time
+
+from flowlib import etcd_utils
+from flowlib.constants import WorkflowKeys
+from flowlib.timer_util import TimedEventManager, TimerContext, TimeUtc
+from tests.fake_etcd import FakeEtcd
+
+DID = 'bench-did'
+
+
+def seed(etcd, timers, expired_pct):
+    now = TimeUtc.now()
+    for n in range(timers):
+        iid = f'{DID}-{n:06d}'
+        expired = n % 100 < expired_pct
+        exec_time = now - 60 if expired else now + 3600
+        context = TimerContext.from_json({
+            'guid': f'guid{n}', 'iid': iid, 'timer_type': 'TIME_DURATION',
+            'start_date': exec_time - 300, 'end_date': None, 'interval': 300,
+            'recurrence': 0, 'spec': 'PT5M', 'token_stack': '',
+            'exec_time': exec_time, 'token_pool_id': None,
+            'args': ['{}', iid, DID, 'application/json'], 'completed': False,
+            'did': DID, 'key': f'{WorkflowKeys.timed_events_key(DID)}/{iid}',
+        })
+        etcd.put(context.key, context.to_json())
+
+
+def restore_per_key(mgr):
+    '''The previous restore loop.'''
+    keys = etcd_utils.get_keys_from_prefix(WorkflowKeys.timed_events_key(mgr.did))
+    for k in keys:
+        ctx = TimerContext.restore_from_key(k)
+        if ctx is not None:
+            mgr.restore_timer(ctx)
+
+
+def run(timers, expired_pct, latency_ms, per_key):
+    etcd = FakeEtcd()
+    etcd_utils._etcd = etcd
+    seed(etcd, timers, expired_pct)
+    original = TimedEventManager._TimedEventManager__restore_latent_timers
+    if per_key:
+        TimedEventManager._TimedEventManager__restore_latent_timers = restore_per_key
+    try:
+        etcd.latency = latency_ms / 1000
+        etcd.reset_calls()
+        start = time.perf_counter()
+        mgr = TimedEventManager(
+            DID, json.dumps(['timeDuration', 'PT5M']),
+            lambda *args: None, lambda *args: None, 'recover_forget',
+        )
+        mgr.future.result()
+        elapsed = time.perf_counter() - start
+    finally:
+        TimedEventManager._TimedEventManager__restore_latent_timers = original
+        etcd.latency = 0
+    mgr.scheduler.stop()
+    return elapsed, etcd.round_trips
+
+
+def main(timers=5000, expired_pct=10, latency_ms=0.5):
+    logging.disable(logging.WARNING)
+    print(f'Restoring {timers} timers ({expired_pct}% expired, recover_forget), '
+          f'{latency_ms}ms per round trip')
+    for label, per_key in (('per-key locked', True), ('bulk range read', False)):
+        elapsed, round_trips = run(timers, expired_pct, latency_ms, per_key)
+        print(f'{label:>16}: {elapsed * 1000:9.1f} ms, {round_trips:6d} round trips')
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,67 @@
+'''Schedule a large number of timers, the way a busy timer catch event does,
+and compare the thread count and firing lateness of one threading.Timer per
+timer against the shared heap-based TimerScheduler.
+
+Usage:
+    python -m tests.benchmarks.bench_timer_scheduler [timers] [spread_s] [baseline_timers]
+'''
+import sys
+import threading
+import time
+
+from flowlib.timer_util import TimerScheduler
+
+
+def run(start_timer, timers, spread):
+    lock = threading.Lock()
+    done = threading.Event()
+    state = {'remaining': timers, 'late_total': 0.0, 'late_max': 0.0}
+
+    def fire(due):
+        lateness = time.monotonic() - due
+        with lock:
+            state['late_total'] += lateness
+            state['late_max'] = max(state['late_max'], lateness)
+            state['remaining'] -= 1
+            if state['remaining'] == 0:
+                done.set()
+
+    threads_before = threading.active_count()
+    peak_threads = threads_before
+    started = time.monotonic()
+    for i in range(timers):
+        delay = spread * (i / timers)
+        start_timer(delay, fire, time.monotonic() + delay)
+        if i % 1000 == 0:
+            peak_threads = max(peak_threads, threading.active_count())
+    schedule_time = time.monotonic() - started
+    peak_threads = max(peak_threads, threading.active_count())
+    done.wait()
+    return {
+        'schedule_s': schedule_time,
+        'extra_threads': peak_threads - threads_before,
+        'late_avg_ms': 1000 * state['late_total'] / timers,
+        'late_max_ms': 1000 * state['late_max'],
+    }
+
+
+def thread_per_timer(delay, func, *args):
+    timer = threading.Timer(delay, func, args)
+    timer.daemon = True
+    timer.start()
+
+
+def main(timers=100000, spread=5.0, baseline_timers=2000):
+    print(f'{"":>18} {"timers":>8} {"schedule s":>11} {"extra threads":>14} {"late avg ms":>12} {"late max ms":>12}')
+    result = run(thread_per_timer, baseline_timers, spread)
+    print(f'{"threading.Timer":>18} {baseline_timers:>8} {result["schedule_s"]:>11.3f} {result["extra_threads"]:>14} '
+          f'{result["late_avg_ms"]:>12.2f} {result["late_max_ms"]:>12.2f}')
+    scheduler = TimerScheduler(name='bench-timers')
+    result = run(scheduler.schedule, timers, spread)
+    scheduler.stop()
+    print(f'{"TimerScheduler":>18} {timers:>8} {result["schedule_s"]:>11.3f} {result["extra_threads"]:>14} '
+          f'{result["late_avg_ms"]:>12.2f} {result["late_max_ms"]:>12.2f}')
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
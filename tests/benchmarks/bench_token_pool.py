@@ -0,0 +1,74 @@
+'''Token moves against the fake etcd: the previous locked read + locked write
+TokenPool versus the mod_revision compare-and-swap one, with several timer
+threads hammering one pool the way a busy cycle timer does.
+
+Usage:
+    python -m tests.benchmarks.bench_token_pool [moves] [threads] [latency_ms]
+'''
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import sys
+import time
+
+from flowlib import etcd_utils
+from flowlib.token_api import TokenPool
+from tests.fake_etcd import FakeEtcd
+
+
+class LockedTokenPool(TokenPool):
+    '''The previous implementation: every read and every write takes the
+    pool key's lock, and writes overwrite whatever is there.'''
+    @classmethod
+    def from_pool_name(cls, name):
+        key = cls.key(name)
+        hive = etcd_utils.locked_call(key, lambda etcd: etcd.get(key)[0])
+        pool = cls.from_json(hive)
+        pool.__class__ = cls
+        return pool
+
+    def _update(self, change):
+        result = change()
+        key = self.key(self.name)
+        hive = self.to_json()
+        etcd_utils.locked_call(key, lambda etcd: etcd.put(key, hive))
+        return result
+
+
+def run(pool_class, moves, threads, latency_ms):
+    etcd = FakeEtcd()
+    etcd_utils._etcd = etcd
+    name = TokenPool.create('iid-bench', moves).get_name()
+    etcd.latency = latency_ms / 1000
+    etcd.reset_calls()
+
+    def move(_):
+        pool = pool_class.from_pool_name(name)
+        pool.alloc()
+        pool = pool_class.from_pool_name(name)
+        try:
+            pool.release_as_complete()
+        except AssertionError:
+            pass  # a lost update made the pool look as if it had no active tokens
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(move, range(moves)))
+    elapsed = time.perf_counter() - start
+    etcd.latency = 0
+    final = TokenPool.from_pool_name(name)
+    return elapsed, etcd.round_trips, final
+
+
+def main(moves=200, threads=8, latency_ms=0.5):
+    logging.disable(logging.WARNING)  # quiet the lock acquire retries
+    print(f'{moves} alloc/release pairs on one pool from {threads} threads, '
+          f'{latency_ms}ms per round trip')
+    for label, pool_class in (('locked', LockedTokenPool), ('mod_revision CAS', TokenPool)):
+        elapsed, round_trips, final = run(pool_class, moves, threads, latency_ms)
+        print(f'{label:>16}: {round_trips / moves:6.2f} round trips per token, '
+              f'{elapsed * 1000:8.1f} ms, completed {final.complete}/{moves} '
+              f'(lost updates: {moves - final.complete})')
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,88 @@
+'''Contention benchmark for instance state transitions against the fake etcd:
+the previous lock + get + replace implementation versus the single
+transaction in etcd_utils.try_transition_state().
+
+Several threads race to complete every instance at once, the way a result
+and an /instancefail report can race for the same instance.  Exactly one
+thread must win each instance.
+
+Usage:
+    python -m tests.benchmarks.bench_transition_state [instances] [threads] [latency_ms]
+'''
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import time
+
+from retry import retry
+
+from flowlib import etcd_utils
+from tests.fake_etcd import FakeEtcd
+
+
+GOOD_STATES = {b'STARTING', b'RUNNING'}
+
+
+def locked_transition(etcd, state_key, from_states, to_state):
+    '''The previous transition_state(), minus its logging.  python-etcd3's
+    Lock.acquire() raises a TypeError when the lock is contended, so the
+    acquire is retried the same way etcd_utils.locked_call() does it.
+    '''
+    result = False
+    lock = etcd.lock(state_key)
+    retry(tries=20, delay=0.01, jitter=(0, 0.01))(lock.acquire)()
+    try:
+        crnt_state = etcd.get(state_key)[0]
+        if crnt_state in from_states:
+            if etcd.replace(state_key, crnt_state, to_state):
+                result = True
+            else:
+                new_crnt_state = etcd.get(state_key)[0]
+                if new_crnt_state != crnt_state:
+                    if new_crnt_state in from_states and \
+                            etcd.replace(state_key, new_crnt_state, to_state):
+                        result = True
+    finally:
+        lock.release()
+    return result
+
+
+def cas_transition(etcd, state_key, from_states, to_state):
+    return etcd_utils.try_transition_state(etcd, state_key, from_states, to_state)[0]
+
+
+def run(transition, instances, threads, latency_ms):
+    etcd = FakeEtcd()
+    keys = [f'/rexflow/instances/iid-{index}/state' for index in range(instances)]
+    for key in keys:
+        etcd.put(key, 'RUNNING')
+    etcd.latency = latency_ms / 1000
+    etcd.reset_calls()
+    work = [
+        (key, b'COMPLETED' if contender % 2 else b'ERROR')
+        for key in keys for contender in range(threads)
+    ]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        wins = list(pool.map(
+            lambda item: transition(etcd, item[0], GOOD_STATES, item[1]), work,
+        ))
+    elapsed = time.perf_counter() - start
+    assert sum(wins) == instances, f'{sum(wins)} winners for {instances} instances'
+    return elapsed, etcd.round_trips
+
+
+def main(instances=200, threads=8, latency_ms=0.5):
+    print(f'{instances} instances, {threads} contenders each, '
+          f'{latency_ms}ms per round trip')
+    for name, transition in (
+        ('lock+get+replace', locked_transition),
+        ('single txn', cas_transition),
+    ):
+        elapsed, round_trips = run(transition, instances, threads, latency_ms)
+        attempts = instances * threads
+        print(f'{name:>16}: {round_trips / attempts:5.2f} round trips per attempt, '
+              f'{elapsed * 1000:8.1f} ms total')
+
+
+if __name__ == '__main__':
+    main(*(float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,437 @@
+'''In-memory stand-in for an etcd server, for unit tests and benchmarks.
+
+FakeEtcd subclasses the real python-etcd3 client and replaces the gRPC stubs
+underneath it, so get(), get_prefix(), transaction(), lock(), watch_prefix()
+and friends all run the library's own request/response code against a small
+MVCC key-value store kept in this process.  Every stub call is tallied in
+FakeEtcd.calls so a test can count round trips, and an optional per-call
+latency makes benchmarks behave like a remote server.
+
+Example:
+    >>> from tests.fake_etcd import FakeEtcd
+    >>> from flowlib import etcd_utils
+    >>> etcd_utils._etcd = FakeEtcd()
+'''
+import bisect
+import collections
+import itertools
+import threading
+import time
+import unittest
+
+import etcd3
+from etcd3 import etcdrpc, exceptions, utils
+from etcd3.client import Transactions
+from etcd3.etcdrpc import kv_pb2
+from etcd3.watch import WatchResponse
+from etcd3 import events as etcd_events
+import grpc
+
+from flowlib import etcd_utils
+
+
+_RANGE_ALL = b'\0'
+
+_SORT_TARGETS = {
+    etcdrpc.RangeRequest.VERSION: lambda kv: kv.version,
+    etcdrpc.RangeRequest.CREATE: lambda kv: kv.create_revision,
+    etcdrpc.RangeRequest.MOD: lambda kv: kv.mod_revision,
+    etcdrpc.RangeRequest.VALUE: lambda kv: kv.value,
+}
+
+
+def _in_range(key, start, end):
+    '''Evaluate etcd's key/range_end convention for a single key.'''
+    if not end:
+        return key == start
+    if end == _RANGE_ALL:
+        return key >= start
+    return start <= key < end
+
+
+class _Store:
+    '''A small multi-version key-value store with etcd's revision rules.'''
+    def __init__(self):
+        self.revision = 1
+        self.compacted = 0
+        self.keys = []  # sorted list of every key with live history
+        self.history = {}  # key -> [(revision, KeyValue or None)]
+        self.events = []  # [(revision, Event)]
+
+    def current(self, key, revision=None):
+        versions = self.history.get(key)
+        if not versions:
+            return None
+        if revision is None:
+            return versions[-1][1]
+        if revision <= self.compacted:
+            raise exceptions.RevisionCompactedError(self.compacted)
+        index = bisect.bisect_right([rev for rev, _ in versions], revision)
+        return versions[index - 1][1] if index else None
+
+    def range_keys(self, start, end):
+        if not end:
+            return [start] if start in self.history else []
+        low = bisect.bisect_left(self.keys, start)
+        if end == _RANGE_ALL:
+            return self.keys[low:]
+        high = bisect.bisect_left(self.keys, end)
+        return self.keys[low:high]
+
+    def put(self, key, value, lease, revision):
+        previous = self.current(key)
+        kv = kv_pb2.KeyValue(
+            key=key,
+            value=value,
+            lease=lease,
+            mod_revision=revision,
+            create_revision=previous.create_revision if previous else revision,
+            version=previous.version + 1 if previous else 1,
+        )
+        if key not in self.history:
+            bisect.insort(self.keys, key)
+            self.history[key] = []
+        self.history[key].append((revision, kv))
+        self.events.append((revision, kv_pb2.Event(type=kv_pb2.Event.PUT, kv=kv)))
+        return previous
+
+    def delete(self, key, revision):
+        previous = self.current(key)
+        if previous is None:
+            return None
+        self.history[key].append((revision, None))
+        self.events.append((revision, kv_pb2.Event(
+            type=kv_pb2.Event.DELETE,
+            kv=kv_pb2.KeyValue(key=key, mod_revision=revision),
+        )))
+        return previous
+
+    def compact(self, revision):
+        self.compacted = max(self.compacted, revision)
+        for key in list(self.keys):
+            versions = self.history[key]
+            index = bisect.bisect_right([rev for rev, _ in versions], revision)
+            if index > 1:
+                del versions[:index - 1]
+            if versions[0][1] is None and versions[0][0] <= revision:
+                versions.pop(0)
+            if not versions:
+                del self.history[key]
+                self.keys.remove(key)
+        self.events = [entry for entry in self.events if entry[0] > revision]
+
+
+class TooManyOpsError(grpc.RpcError):
+    '''What etcd answers a transaction over its --max-txn-ops.'''
+    def code(self):
+        return grpc.StatusCode.INVALID_ARGUMENT
+
+    def details(self):
+        return 'etcdserver: too many operations in txn request'
+
+
+def _check_txn(request, max_ops):
+    '''etcd's checkTxnRequest(): a nested txn gets whatever budget the
+    transaction around it leaves.'''
+    ops = max(len(request.compare), len(request.success), len(request.failure))
+    if ops > max_ops:
+        raise TooManyOpsError()
+    for op in list(request.success) + list(request.failure):
+        if op.WhichOneof('request') == 'request_txn':
+            _check_txn(op.request_txn, max_ops - ops)
+
+
+class _FakeKVStub:
+    def __init__(self, server):
+        self.server = server
+
+    def Range(self, request, *args, **kws):
+        self.server._round_trip('Range')
+        with self.server._lock:
+            return self.server._range(request)
+
+    def Put(self, request, *args, **kws):
+        self.server._round_trip('Put')
+        with self.server._lock:
+            revision = self.server._next_revision()
+            previous = self.server._store.put(
+                request.key, request.value, request.lease, revision)
+            self.server._commit(revision)
+            response = etcdrpc.PutResponse(header=self.server._header())
+            if request.prev_kv and previous is not None:
+                response.prev_kv.CopyFrom(previous)
+            return response
+
+    def DeleteRange(self, request, *args, **kws):
+        self.server._round_trip('DeleteRange')
+        with self.server._lock:
+            revision = self.server._next_revision()
+            response = self.server._delete(request, revision)
+            if response.deleted:
+                self.server._commit(revision)
+            response.header.CopyFrom(self.server._header())
+            return response
+
+    def Txn(self, request, *args, **kws):
+        self.server._round_trip('Txn')
+        _check_txn(request, self.server.max_txn_ops)
+        with self.server._lock:
+            revision = self.server._next_revision()
+            response, wrote = self.server._txn(request, revision)
+            if wrote:
+                self.server._commit(revision)
+            response.header.CopyFrom(self.server._header())
+            return response
+
+    def Compact(self, request, *args, **kws):
+        self.server._round_trip('Compact')
+        self.server.compact_to(request.revision)
+        return etcdrpc.CompactionResponse()
+
+
+class _FakeLeaseStub:
+    def __init__(self, server):
+        self.server = server
+        self.ids = itertools.count(1000)
+
+    def LeaseGrant(self, request, *args, **kws):
+        self.server._round_trip('LeaseGrant')
+        return etcdrpc.LeaseGrantResponse(
+            ID=request.ID or next(self.ids), TTL=request.TTL)
+
+    def LeaseRevoke(self, request, *args, **kws):
+        self.server._round_trip('LeaseRevoke')
+        with self.server._lock:
+            store = self.server._store
+            doomed = [
+                key for key in store.keys
+                if store.current(key) is not None
+                and store.current(key).lease == request.ID
+            ]
+            if doomed:
+                revision = self.server._next_revision()
+                for key in doomed:
+                    store.delete(key, revision)
+                self.server._commit(revision)
+        return etcdrpc.LeaseRevokeResponse()
+
+
+class _FakeWatcher:
+    '''Replaces etcd3.watch.Watcher; callbacks run on the writer's thread.'''
+    def __init__(self, server):
+        self.server = server
+        self.ids = itertools.count(1)
+        self.callbacks = {}
+
+    def add_callback(self, key, callback, range_end=None, start_revision=None,
+                     progress_notify=False, filters=None, prev_kv=False):
+        self.server._round_trip('Watch')
+        key = utils.to_bytes(key)
+        range_end = utils.to_bytes(range_end) if range_end is not None else b''
+        with self.server._lock:
+            store = self.server._store
+            if start_revision is not None and start_revision <= store.compacted:
+                raise exceptions.RevisionCompactedError(store.compacted)
+            watch_id = next(self.ids)
+            self.callbacks[watch_id] = (key, range_end, callback)
+            if start_revision is not None:
+                backlog = [
+                    event for revision, event in store.events
+                    if revision >= start_revision
+                    and _in_range(event.kv.key, key, range_end)
+                ]
+                if backlog:
+                    callback(WatchResponse(
+                        self.server._header(),
+                        [etcd_events.new_event(event) for event in backlog]))
+            return watch_id
+
+    def cancel(self, watch_id):
+        with self.server._lock:
+            self.callbacks.pop(watch_id, None)
+
+    def dispatch(self, raw_events):
+        for key, range_end, callback in list(self.callbacks.values()):
+            matched = [
+                etcd_events.new_event(event) for event in raw_events
+                if _in_range(event.kv.key, key, range_end)
+            ]
+            if matched:
+                callback(WatchResponse(self.server._header(), matched))
+
+    def fail_all(self, error):
+        callbacks, self.callbacks = self.callbacks, {}
+        for _, _, callback in callbacks.values():
+            callback(error)
+
+
+class FakeEtcd(etcd3.Etcd3Client):
+    '''A python-etcd3 client bound to an in-memory server.
+
+    Arguments:
+        latency - Seconds to sleep on every simulated RPC.  Default is 0.
+        max_txn_ops - etcd's --max-txn-ops; bigger transactions, nested ones
+            included, fail as they would against etcd.  Default is 128.
+    Attributes:
+        calls - collections.Counter of RPC name to number of calls.
+    '''
+    def __init__(self, latency=0.0, max_txn_ops=128):
+        # Deliberately skip Etcd3Client.__init__(): there is no channel.
+        self.timeout = None
+        self.call_credentials = None
+        self.metadata = None
+        self.transactions = Transactions()
+        self.latency = latency
+        self.max_txn_ops = max_txn_ops
+        self.calls = collections.Counter()
+        self._lock = threading.RLock()
+        self._store = _Store()
+        self._pending_revision = None
+        self.kvstub = _FakeKVStub(self)
+        self.leasestub = _FakeLeaseStub(self)
+        self.watcher = _FakeWatcher(self)
+
+    @property
+    def round_trips(self):
+        return sum(self.calls.values())
+
+    @property
+    def revision(self):
+        return self._store.revision
+
+    def reset_calls(self):
+        self.calls.clear()
+
+    def compact_to(self, revision):
+        with self._lock:
+            self._store.compact(revision)
+
+    def break_watches(self):
+        '''Cancel every open watch the way etcd does when a watcher falls
+        behind the compaction point.'''
+        with self._lock:
+            self.watcher.fail_all(
+                exceptions.RevisionCompactedError(self._store.compacted))
+
+    def close(self):
+        pass
+
+    def _round_trip(self, name):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _header(self, revision=None):
+        return etcdrpc.ResponseHeader(
+            revision=revision if revision else self._store.revision)
+
+    def _next_revision(self):
+        return self._store.revision + 1
+
+    def _commit(self, revision):
+        self._store.revision = revision
+        raw_events = []
+        for rev, event in reversed(self._store.events):
+            if rev != revision:
+                break
+            raw_events.append(event)
+        raw_events.reverse()
+        self.watcher.dispatch(raw_events)
+
+    def _range(self, request):
+        store = self._store
+        revision = request.revision or None
+        kvs = []
+        for key in store.range_keys(request.key, request.range_end):
+            kv = store.current(key, revision)
+            if kv is not None:
+                kvs.append(kv)
+        if request.sort_target != etcdrpc.RangeRequest.KEY:
+            kvs.sort(key=_SORT_TARGETS[request.sort_target])
+        if request.sort_order == etcdrpc.RangeRequest.DESCEND:
+            kvs.reverse()
+        count = len(kvs)
+        more = bool(request.limit) and count > request.limit
+        if request.limit:
+            kvs = kvs[:request.limit]
+        response = etcdrpc.RangeResponse(
+            header=self._header(revision), count=count, more=more)
+        if not request.count_only:
+            for kv in kvs:
+                out = response.kvs.add()
+                out.CopyFrom(kv)
+                if request.keys_only:
+                    out.value = b''
+        return response
+
+    def _delete(self, request, revision):
+        response = etcdrpc.DeleteRangeResponse()
+        for key in list(self._store.range_keys(request.key, request.range_end)):
+            previous = self._store.delete(key, revision)
+            if previous is not None:
+                response.deleted += 1
+                if request.prev_kv:
+                    response.prev_kvs.add().CopyFrom(previous)
+        return response
+
+    def _compare(self, compare):
+        kv = self._store.current(compare.key)
+        target = compare.target
+        if target == etcdrpc.Compare.VALUE:
+            if kv is None:
+                return False
+            actual, expected = kv.value, compare.value
+        elif target == etcdrpc.Compare.VERSION:
+            actual, expected = (kv.version if kv else 0), compare.version
+        elif target == etcdrpc.Compare.CREATE:
+            actual = kv.create_revision if kv else 0
+            expected = compare.create_revision
+        elif target == etcdrpc.Compare.MOD:
+            actual = kv.mod_revision if kv else 0
+            expected = compare.mod_revision
+        else:
+            raise NotImplementedError(f'compare target {target}')
+        result = compare.result
+        if result == etcdrpc.Compare.EQUAL:
+            return actual == expected
+        if result == etcdrpc.Compare.NOT_EQUAL:
+            return actual != expected
+        if result == etcdrpc.Compare.LESS:
+            return actual < expected
+        return actual > expected
+
+    def _txn(self, request, revision):
+        succeeded = all(self._compare(compare) for compare in request.compare)
+        ops = request.success if succeeded else request.failure
+        response = etcdrpc.TxnResponse(succeeded=succeeded)
+        wrote = False
+        for op in ops:
+            kind = op.WhichOneof('request')
+            out = response.responses.add()
+            if kind == 'request_range':
+                out.response_range.CopyFrom(self._range(op.request_range))
+            elif kind == 'request_put':
+                put = op.request_put
+                self._store.put(put.key, put.value, put.lease, revision)
+                out.response_put.CopyFrom(etcdrpc.PutResponse())
+                wrote = True
+            elif kind == 'request_delete_range':
+                deleted = self._delete(op.request_delete_range, revision)
+                out.response_delete_range.CopyFrom(deleted)
+                wrote = wrote or bool(deleted.deleted)
+            elif kind == 'request_txn':
+                nested, nested_wrote = self._txn(op.request_txn, revision)
+                out.response_txn.CopyFrom(nested)
+                wrote = wrote or nested_wrote
+        return response, wrote
+
+
+class EtcdTestCase(unittest.TestCase):
+    '''Points the etcd_utils module-level client at a fresh FakeEtcd.'''
+    def setUp(self):
+        self.saved_etcd = etcd_utils._etcd
+        self.etcd = FakeEtcd()
+        etcd_utils._etcd = self.etcd
+
+    def tearDown(self):
+        etcd_utils._etcd = self.saved_etcd
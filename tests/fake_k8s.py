@@ -0,0 +1,120 @@
+'''A local HTTP server standing in for the Kubernetes API server, for unit
+tests and benchmarks of flowlib.k8s_apply.
+
+It keeps the objects it was sent by path. A server-side apply (PATCH with
+the apply-patch content type) stores the object and answers 201 if it is
+new, else 200; DELETE answers 404 for objects it doesn't have. Requests are
+recorded in order, the most requests in flight at once is tracked, and
+paths in `failing` answer 500. With a `token` set, requests without it as
+their bearer token answer 401.
+
+Example:
+    >>> with FakeKubernetes() as server:
+    ...     api = KubernetesApi(server.url())
+'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _handle(self):
+        server = self.server.fake
+        length = int(self.headers.get('content-length', 0))
+        body = self.rfile.read(length) if length else b''
+        url = urlparse(self.path)
+        with server.lock:
+            server.requests.append((self.command, url.path, parse_qs(url.query), self.headers.get('content-type')))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if server.delay:
+                time.sleep(server.delay)
+            with server.lock:
+                status = self._respond(server, url, body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+        payload = json.dumps({'code': status}).encode()
+        self.send_response(status)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _respond(self, server, url, body):
+        if server.token is not None and self.headers.get('authorization') != f'Bearer {server.token}':
+            return 401
+        if url.path in server.failing:
+            return 500
+        if self.command == 'PATCH':
+            query = parse_qs(url.query)
+            if self.headers.get('content-type') != 'application/apply-patch+yaml' or 'fieldManager' not in query:
+                return 400
+            created = url.path not in server.objects
+            server.objects[url.path] = json.loads(body)
+            return 201 if created else 200
+        if self.command == 'DELETE':
+            return 200 if server.objects.pop(url.path, None) is not None else 404
+        if self.command == 'GET':
+            return 200 if url.path in server.objects else 404
+        return 405
+
+    do_GET = do_PATCH = do_DELETE = do_POST = do_PUT = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class FakeKubernetes:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.objects = {}  # path -> object
+        self.requests = []  # (method, path, query, content type)
+        self.failing = set()
+        self.token = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True,
+        )
+
+    def url(self, path=''):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}{path}'
+
+    def methods(self):
+        '''Counts of the requests so far by method, and forgets them.'''
+        with self.lock:
+            counts = {}
+            for method, *_ in self.requests:
+                counts[method] = counts.get(method, 0) + 1
+            self.requests = []
+            return counts
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
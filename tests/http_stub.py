@@ -0,0 +1,86 @@
+'''A local HTTP/1.1 server standing in for an upstream BPMN component, for
+unit tests and benchmarks of outbound calls.
+
+Example:
+    >>> with HttpStub() as stub:
+    ...     requests.post(stub.url('/'), json={})
+'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out as separate writes; don't let Nagle hold the body
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('content-length', 0))
+        body = self.rfile.read(length) if length else b''
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests.append((
+                self.command, self.path, {k.lower(): v for k, v in self.headers.items()}, body,
+            ))
+            status = stub.statuses.pop(0) if stub.statuses else stub.status
+        if stub.delay:
+            time.sleep(stub.delay)
+        payload = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_PUT = do_PATCH = do_DELETE = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def get_request(self):
+        conn, addr = super().get_request()
+        with self.stub.lock:
+            self.stub.connections += 1
+        return conn, addr
+
+
+class HttpStub:
+    '''Answers every request with `status` (or the next entry of `statuses`)
+    after `delay` seconds, recording the requests (with lowercased header
+    names) and counting the TCP connections it accepted.'''
+    def __init__(self, status=200, delay=0.0):
+        self.status = status
+        self.statuses = []
+        self.delay = delay
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.stub = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True,
+        )
+
+    def url(self, path='/'):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}{path}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
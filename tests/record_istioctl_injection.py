@@ -0,0 +1,56 @@
+'''Record what istioctl kube-inject makes of super_happy_specs.yaml as
+super_happy_istioctl.yaml, which test_sidecar_injector checks the default
+template against. Needs istioctl 1.8.2 on the PATH, but no cluster: the
+injector config is taken from the ConfigMaps of an Istio manifest.
+
+Usage:
+    istioctl manifest generate > istio-1.8.2.yaml
+    python -m tests.record_istioctl_injection istio-1.8.2.yaml
+'''
+import os
+import sys
+import tempfile
+
+import yaml
+
+from flowlib.sidecar_injector import ISTIOCTL_CONFIG_FILES, istioctl_inject
+
+
+TESTS = os.path.dirname(__file__)
+
+# (ConfigMap, key) holding each file of the injector config.
+CONFIG_MAP_KEYS = {
+    'mesh.yaml': ('istio', 'mesh'),
+    'inject-config.yaml': ('istio-sidecar-injector', 'config'),
+    'values.yaml': ('istio-sidecar-injector', 'values'),
+}
+
+
+def write_config(manifest_yaml, config_dir):
+    config_maps = {
+        doc['metadata']['name']: doc.get('data', {})
+        for doc in yaml.safe_load_all(manifest_yaml)
+        if doc and doc.get('kind') == 'ConfigMap'
+    }
+    for name in ISTIOCTL_CONFIG_FILES.values():
+        config_map, key = CONFIG_MAP_KEYS[name]
+        with open(os.path.join(config_dir, name), 'w') as config_file:
+            config_file.write(config_maps[config_map][key])
+
+
+def main(manifest_path):
+    with open(manifest_path, 'r') as manifest_file:
+        manifest_yaml = manifest_file.read()
+    with open(os.path.join(TESTS, 'super_happy_specs.yaml'), 'r') as spec_file:
+        specs_yaml = spec_file.read()
+    with tempfile.TemporaryDirectory() as config_dir:
+        write_config(manifest_yaml, config_dir)
+        injected_yaml = istioctl_inject(specs_yaml, config_dir)
+    if injected_yaml is None:
+        sys.exit('istioctl kube-inject failed')
+    with open(os.path.join(TESTS, 'super_happy_istioctl.yaml'), 'w') as injected_file:
+        injected_file.write(injected_yaml)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,68 @@
+'''Tests for the per-process index of REXFlow annotations.
+'''
+import unittest
+from unittest import mock
+
+import xmltodict
+
+from flowlib import bpmn, bpmn_util
+from flowlib.bpmn_util import AnnotationIndex, get_annotations
+from tests.benchmarks.bench_compiled_process import make_process_xml
+from tests.test_compiled_process import BPMN_FILES
+
+
+PROCESS = xmltodict.parse('''<bpmn:process id="p">
+  <bpmn:serviceTask id="a"/>
+  <bpmn:serviceTask id="b"/>
+  <bpmn:textAnnotation id="t1"><bpmn:text>rexflow:
+  service:
+    host: one</bpmn:text></bpmn:textAnnotation>
+  <bpmn:textAnnotation id="t2"><bpmn:text>just a comment</bpmn:text></bpmn:textAnnotation>
+  <bpmn:textAnnotation id="t3"><bpmn:text>rexflow:
+  preexisting: true</bpmn:text></bpmn:textAnnotation>
+  <bpmn:association id="x1" sourceRef="a" targetRef="t3"/>
+  <bpmn:association id="x2" sourceRef="a" targetRef="t1"/>
+  <bpmn:association id="x3" sourceRef="a" targetRef="t1"/>
+  <bpmn:association id="x4" sourceRef="b" targetRef="t2"/>
+  <bpmn:association id="x5" sourceRef="b" targetRef="t1"/>
+</bpmn:process>''')['bpmn:process']
+
+
+class TestAnnotationIndex(unittest.TestCase):
+    def test_matches_the_scan(self):
+        index = AnnotationIndex(PROCESS)
+        for source_ref in ('a', 'b', 'c'):
+            self.assertEqual(
+                list(get_annotations(PROCESS, source_ref, index)),
+                list(get_annotations(PROCESS, source_ref)),
+            )
+        self.assertEqual([annotation['@id'] for annotation, _ in index.get('a')], ['t1', 't3'])
+
+    def test_each_text_is_parsed_once(self):
+        index = AnnotationIndex(PROCESS)
+        with mock.patch('yaml.safe_load', side_effect=lambda text: {'text': text}) as safe_load:
+            self.assertIs(next(index.get('a'))[1], next(index.get('b'))[1])
+        self.assertEqual(safe_load.call_count, 1)
+
+    def test_process_construction_scans_associations_once(self):
+        for path in BPMN_FILES:
+            with self.subTest(path=path), open(path, 'rb') as bpmn_file:
+                process_dict = xmltodict.parse(bpmn_file.read())['bpmn:definitions']['bpmn:process']
+                with mock.patch(
+                    'flowlib.bpmn_util.iter_xmldict_for_key', wraps=bpmn_util.iter_xmldict_for_key,
+                ) as iter_xmldict_for_key:
+                    process = bpmn.BPMNProcess(process_dict)
+                scanned = [call.args[1] for call in iter_xmldict_for_key.call_args_list]
+                self.assertEqual(scanned.count('bpmn:association'), 1)
+                self.assertTrue(process.all_components)
+
+    def test_lookups_do_not_rescan(self):
+        process_dict = xmltodict.parse(make_process_xml(800))['bpmn:process']
+        index = AnnotationIndex(process_dict)
+        with mock.patch('flowlib.bpmn_util.iter_xmldict_for_key', side_effect=AssertionError):
+            found = sum(1 for n in range(798) for _ in index.get(f'Task_{n}'))
+        self.assertEqual(found, 798)
+
+
+if __name__ == '__main__':
+    unittest.main()
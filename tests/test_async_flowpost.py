@@ -0,0 +1,115 @@
+'''Tests for flowlib.flowpost.AsyncFlowPost against local HTTP stand-ins.
+'''
+import asyncio
+import socket
+import time
+import unittest
+from unittest import mock
+
+from flowlib import flowpost
+from flowlib.constants import ErrorCodes, Headers
+from flowlib.failure_reporter import decode_failures
+from flowlib.flowpost import AsyncFlowPost, FlowPostStatus
+from flowlib.http_sessions import close_async_client
+from flowlib.shadowing import decode_batch, get_shadower
+from tests.http_stub import HttpStub
+
+
+def unused_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{sock.getsockname()[1]}/'
+
+
+class TestAsyncFlowPost(unittest.TestCase):
+    def setUp(self):
+        self.task = HttpStub().start()
+        self.flowd = HttpStub().start()
+        self.shadow = HttpStub().start()
+        for stub in (self.task, self.flowd, self.shadow):
+            self.addCleanup(stub.stop)
+        patcher = mock.patch.object(flowpost, 'INSTANCE_FAIL_ENDPOINT', self.flowd.url('/instancefail'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, url=None, **kws):
+        kws.setdefault('retries', 0)
+        kws.setdefault('shadow_url', self.shadow.url('/shadow'))
+
+        async def go():
+            result = await AsyncFlowPost(
+                'wf-did-iid', 'task-1', b'{"a": 1}', url=url or self.task.url('/task'), **kws
+            ).send()
+            await close_async_client()
+            return result
+        result = asyncio.run(go())
+        if kws['shadow_url']:
+            get_shadower(kws['shadow_url']).flush()
+        return result
+
+    def reported_error(self):
+        self.assertEqual(len(self.flowd.requests), 1)
+        self.assertEqual(self.flowd.requests[0][1], '/instancefail/batch')
+        [(headers, payload)] = decode_failures(self.flowd.requests[0][3])
+        self.assertEqual(headers[Headers.X_HEADER_TASK_ID], 'task-1')
+        return payload['error_code']
+
+    def test_success_is_shadowed_once(self):
+        result = self.send()
+        self.assertEqual(result.message, FlowPostStatus.SUCCESS)
+        self.assertEqual(result.response.status_code, 200)
+        self.assertEqual(self.task.requests[0][3], b'{"a": 1}')
+        self.assertEqual(len(self.shadow.requests), 1)
+        self.assertEqual(self.shadow.requests[0][1], '/batch')
+        [(data, headers)] = decode_batch(self.shadow.requests[0][3])
+        self.assertEqual(data, b'{"a": 1}')
+        self.assertEqual(headers[Headers.X_HEADER_TASK_ID], 'task-1')
+        self.assertEqual(self.flowd.requests, [])
+
+    def test_task_error_is_reported(self):
+        self.task.status = 500
+        result = self.send()
+        self.assertEqual(result.message, FlowPostStatus.REPORTED_ERROR)
+        self.assertEqual(self.reported_error(), ErrorCodes.FAILED_TASK)
+
+    def test_unavailable_is_a_connection_error(self):
+        self.task.status = 503
+        self.assertEqual(self.send().message, FlowPostStatus.REPORTED_ERROR)
+        self.assertEqual(self.reported_error(), ErrorCodes.FAILED_CONNECTION)
+
+    def test_connection_failure_is_retried_then_reported(self):
+        result = self.send(url=unused_url(), retries=2, shadow_url='')
+        self.assertEqual(result.message, FlowPostStatus.REPORTED_ERROR)
+        self.assertEqual(self.reported_error(), ErrorCodes.FAILED_CONNECTION)
+
+    def test_failure_to_report(self):
+        self.task.status = 500
+        self.flowd.status = 500
+        self.assertEqual(self.send().message, FlowPostStatus.FAILED_TO_REPORT_ERROR)
+
+    def test_slow_upstream_does_not_hold_up_others(self):
+        slow = HttpStub(delay=1.0).start()
+        self.addCleanup(slow.stop)
+        finished = {}
+
+        async def post(name, url):
+            await AsyncFlowPost(
+                'wf-did-iid', 'task-1', b'{}', url=url, retries=0, shadow_url='',
+            ).send()
+            finished[name] = time.monotonic()
+
+        async def go():
+            await asyncio.gather(
+                post('slow', slow.url('/')),
+                *(post(n, self.task.url('/')) for n in range(20)),
+            )
+            await close_async_client()
+        started = time.monotonic()
+        asyncio.run(go())
+        fast = max(t for name, t in finished.items() if name != 'slow')
+        self.assertLess(fast - started, 0.5)
+        self.assertGreaterEqual(finished['slow'] - started, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+'''Tests for flowlib.circuit_breaker, and FlowPost behind a breaker when its
+upstream is dead.
+'''
+from concurrent.futures import ThreadPoolExecutor
+import time
+import unittest
+from unittest import mock
+
+from flowlib import flowpost
+from flowlib.circuit_breaker import BreakerState, CircuitBreaker
+from flowlib.constants import ErrorCodes
+from flowlib.failure_reporter import decode_failures
+from flowlib.flowpost import FlowPost, FlowPostStatus
+from flowlib.http_sessions import SessionPool
+from flowlib.retry_policy import RetryBudget, RetryPolicy
+from tests.http_stub import HttpStub
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def breaker(self, **kws):
+        kws.setdefault('failure_percent', 50)
+        kws.setdefault('min_calls', 4)
+        kws.setdefault('open_seconds', 0.05)
+        return CircuitBreaker('http://task/', **kws)
+
+    def test_opens_on_failure_rate(self):
+        breaker = self.breaker()
+        for outcome in (True, True, False):
+            self.assertTrue(breaker.allow())
+            breaker.record_success() if outcome else breaker.record_failure()
+        self.assertEqual(breaker.state, BreakerState.CLOSED)  # too few calls yet
+        breaker.record_failure()
+        self.assertEqual(breaker.state, BreakerState.OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.stats()['rejected'], 1)
+
+    def test_stays_closed_below_failure_rate(self):
+        breaker = self.breaker()
+        for _ in range(10):
+            breaker.record_success()
+        for _ in range(9):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, BreakerState.CLOSED)
+
+    def test_half_open_trial(self):
+        breaker = self.breaker(min_calls=1)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, BreakerState.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # only one trial at a time
+        breaker.record_failure()
+        self.assertEqual(breaker.state, BreakerState.OPEN)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, BreakerState.CLOSED)
+        self.assertEqual(breaker.stats()['times_opened'], 2)
+
+
+class TestDeadUpstream(unittest.TestCase):
+    '''An upstream that never answers within the request timeout.'''
+    CALLS = 40
+    THREADS = 4
+    TIMEOUT = 0.3
+
+    def setUp(self):
+        self.dead = HttpStub(delay=5).start()
+        self.flowd = HttpStub().start()
+        self.addCleanup(self.dead.stop)
+        self.addCleanup(self.flowd.stop)
+        self.pool = SessionPool()
+        self.addCleanup(self.pool.close)
+        for name, value in (
+            ('get_session_pool', mock.Mock(return_value=self.pool)),
+            ('INSTANCE_FAIL_ENDPOINT', self.flowd.url('/instancefail')),
+            ('TIMEOUT', (self.TIMEOUT, self.TIMEOUT)),
+        ):
+            patcher = mock.patch.object(flowpost, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_executor_is_not_saturated(self):
+        breaker = CircuitBreaker(self.dead.url('/'), min_calls=self.THREADS, open_seconds=60)
+        policy = RetryPolicy(total_attempts=2, backoff_base=0.01, budget=RetryBudget())
+
+        def send(n):
+            return FlowPost(
+                f'wf-did-iid{n}', 'task-1', b'{}', url=self.dead.url('/'), shadow_url='',
+                retry_policy=policy, circuit_breaker=breaker,
+            ).send()
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            results = list(executor.map(send, range(self.CALLS)))
+        elapsed = time.monotonic() - start
+
+        # Without the breaker this takes CALLS / THREADS * 2 attempts * TIMEOUT = 6s.
+        self.assertLess(elapsed, 4 * self.TIMEOUT)
+        self.assertEqual(breaker.state, BreakerState.OPEN)
+        self.assertLessEqual(len(self.dead.requests), self.THREADS * 2)
+        # every instance is still reported as failed
+        self.assertEqual([r.message for r in results], [FlowPostStatus.REPORTED_ERROR] * self.CALLS)
+        reports = [
+            payload for _, _, _, body in self.flowd.requests for _, payload in decode_failures(body)
+        ]
+        self.assertEqual(len(reports), self.CALLS)
+        self.assertEqual({p['error_code'] for p in reports}, {ErrorCodes.FAILED_CONNECTION})
+
+
+if __name__ == '__main__':
+    unittest.main()
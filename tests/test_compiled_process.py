@@ -0,0 +1,111 @@
+'''Tests for the compiled process records that flowd stores next to the XML.
+'''
+import contextlib
+import json
+import os
+import unittest
+from unittest import mock
+
+import xmltodict
+import yaml
+
+from flowlib import bpmn, workflow
+from flowlib.constants import WorkflowKeys
+from tests.fake_etcd import EtcdTestCase
+
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'examples', 'full-functionality')
+# examples that compile without kafka
+BPMN_FILES = [
+    os.path.join(EXAMPLES, 'closure', 'closure_example.bpmn'),
+    os.path.join(EXAMPLES, 'async-service-task', 'async.bpmn'),
+    os.path.join(EXAMPLES, 'error_gateway', 'error_gateway.bpmn'),
+    os.path.join(EXAMPLES, 'exclusive-gateway', 'conditional_feel.bpmn'),
+    os.path.join(EXAMPLES, 'timed_events', 'timed_start_cycle.bpmn'),
+    os.path.join(os.path.dirname(__file__), 'super_happy.bpmn'),
+]
+
+
+def parse(path):
+    with open(path, 'rb') as bpmn_file:
+        return bpmn.BPMNProcess(xmltodict.parse(bpmn_file.read())['bpmn:definitions']['bpmn:process'])
+
+
+def specs(process):
+    return [
+        component.to_kubernetes(
+            None, process.component_map, process._digraph, process._sequence_flow_table,
+        )
+        for component in process.all_components
+    ]
+
+
+@contextlib.contextmanager
+def no_parsing():
+    '''Fails the test on any XML or YAML parsing.'''
+    with mock.patch.object(xmltodict, 'parse', side_effect=AssertionError('parsed XML')), \
+            mock.patch.object(yaml, 'safe_load', side_effect=AssertionError('parsed YAML')):
+        yield
+
+
+class TestCompiledProcess(unittest.TestCase):
+    def test_round_trip_matches_the_xml(self):
+        for path in BPMN_FILES:
+            with self.subTest(path=os.path.basename(path)):
+                original = parse(path)
+                record = json.loads(original.to_compiled_json())
+                with no_parsing():
+                    loaded = bpmn.BPMNProcess.from_compiled(record)
+                self.assertEqual((loaded.id, loaded.hash), (original.id, original.hash))
+                self.assertEqual(loaded.digraph, original.digraph)
+                self.assertEqual(
+                    [(component.id, component.name, component.annotation) for component in loaded.all_components],
+                    [(component.id, component.name, component.annotation) for component in original.all_components],
+                )
+                self.assertEqual(specs(loaded), specs(original))
+                self.assertEqual(loaded.to_xml(), original.to_xml())
+
+    def test_other_versions_are_refused(self):
+        record = parse(BPMN_FILES[0]).to_compiled()
+        record['version'] += 1
+        with self.assertRaises(ValueError):
+            bpmn.BPMNProcess.from_compiled(record)
+
+    def test_annotations_that_do_not_survive_json_are_left_out(self):
+        annotations = bpmn.AnnotationIndex()
+        annotations.load('rexflow:\n  when: 2021-06-01')
+        annotations.load('rexflow:\n  retry:\n    1: x')
+        annotations.load('rexflow:\n  service:\n    host: a')
+        self.assertEqual(annotations.to_record(), {
+            'rexflow:\n  service:\n    host: a': {'rexflow': {'service': {'host': 'a'}}},
+        })
+
+
+class TestWorkflowFromCompiled(EtcdTestCase):
+    def setUp(self):
+        super().setUp()
+        self.process = parse(BPMN_FILES[1])
+        self.proc_bytes = self.process.to_xml().encode('utf-8')
+
+    def test_prefers_the_compiled_record(self):
+        compiled = self.process.to_compiled_json().encode('utf-8')
+        with no_parsing():
+            wf = workflow.Workflow.from_proc(self.proc_bytes, 'wf-1', compiled)
+        self.assertEqual(wf.process.id, self.process.id)
+
+    def test_falls_back_to_the_xml(self):
+        record = self.process.to_compiled()
+        record['version'] = 0
+        wf = workflow.Workflow.from_proc(self.proc_bytes, 'wf-1', json.dumps(record).encode('utf-8'))
+        self.assertEqual(wf.process.id, self.process.id)
+
+    def test_from_workflow_id_reads_the_compiled_key(self):
+        self.etcd.put(WorkflowKeys.proc_key('wf-1'), self.proc_bytes)
+        self.etcd.put(WorkflowKeys.compiled_key('wf-1'), self.process.to_compiled_json())
+        with no_parsing():
+            process = bpmn.BPMNProcess.from_workflow_id('wf-1')
+        self.assertEqual(process.hash, self.process.hash)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+'''Tests for flowd's in-memory deployment id index.
+'''
+import threading
+import time
+import unittest
+from unittest import mock
+
+from flowd.deployment_index import DeploymentIndex
+from flowd.handlers.handle_run import resolve_workflow_id
+from flowlib.constants import WorkflowKeys
+from tests.fake_etcd import EtcdTestCase
+
+
+class TestDeploymentIndex(EtcdTestCase):
+    def setUp(self):
+        super().setUp()
+        for did in ('process-a-1111', 'process-a-2222', 'process-b-3333'):
+            self.etcd.put(WorkflowKeys.state_key(did), 'RUNNING')
+            self.etcd.put(WorkflowKeys.proc_key(did), '<bpmn/>' * 100)
+        self.etcd.put(WorkflowKeys.field_key('process-b-3333', 'task') + '/state', 'x')
+        self.index = DeploymentIndex(self.etcd).start()
+        self.addCleanup(self.index.stop)
+
+    def test_lookups_come_from_memory(self):
+        self.etcd.reset_calls()
+        self.assertEqual(self.index.ids(), ['process-a-1111', 'process-a-2222', 'process-b-3333'])
+        self.assertIn('process-a-2222', self.index)
+        self.assertNotIn('process-a', self.index)
+        self.assertEqual(self.index.with_prefix('process-a'), ['process-a-1111', 'process-a-2222'])
+        self.assertEqual(self.index.matching('3333'), ['process-b-3333'])
+        self.assertEqual(self.index.resolve('b-33'), 'process-b-3333')
+        self.assertEqual(self.etcd.round_trips, 0)
+        # a miss syncs once before giving up
+        self.assertEqual(self.index.resolve('process-a'), 'process-a')  # ambiguous
+        self.assertEqual(self.index.resolve('nothing'), 'nothing')
+        self.assertEqual(self.etcd.calls['Range'], 2)
+
+    def test_exact_id_wins_over_longer_matches(self):
+        self.etcd.put(WorkflowKeys.state_key('process-a-1111-2'), 'RUNNING')
+        self.assertTrue(self.index.sync())
+        self.assertEqual(self.index.resolve('process-a-1111'), 'process-a-1111')
+        self.assertEqual(self.index.resolve('1111'), '1111')
+
+    def test_follows_state_keys(self):
+        self.etcd.delete(WorkflowKeys.state_key('process-a-1111'))
+        self.etcd.put(WorkflowKeys.state_key('process-c-4444'), 'STOPPED')
+        self.etcd.put(WorkflowKeys.proc_key('process-d-5555'), '<bpmn/>')
+        self.assertTrue(self.index.sync())
+        self.assertEqual(self.index.ids(), ['process-a-2222', 'process-b-3333', 'process-c-4444'])
+        self.assertEqual(self.index.stats()['deployments'], 3)
+
+    def lagging_watch(self, delay=0.1):
+        '''Have the index apply watch events only after delay seconds.'''
+        apply = self.index._apply
+        patcher = mock.patch.object(
+            self.index, '_apply', side_effect=lambda event: threading.Timer(delay, apply, [event]).start(),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_resolve_reads_its_own_writes(self):
+        self.lagging_watch()
+        self.etcd.put(WorkflowKeys.state_key('process-c-4444'), 'RUNNING')
+        self.assertNotIn('process-c-4444', self.index)
+        self.assertEqual(resolve_workflow_id('c-4444'), 'process-c-4444')
+
+    def test_sync_waits_for_deletes(self):
+        self.lagging_watch()
+        self.etcd.delete(WorkflowKeys.state_key('process-a-1111'))
+        self.assertIn('process-a-1111', self.index)
+        self.assertTrue(self.index.sync())
+        self.assertNotIn('process-a-1111', self.index)
+
+    def test_sync_on_a_quiet_prefix(self):
+        self.etcd.put('/rexflow/instances/wf-1/state', 'RUNNING')
+        started = time.monotonic()
+        self.assertTrue(self.index.sync())
+        self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_reloads_after_compaction(self):
+        self.etcd.put(WorkflowKeys.state_key('process-c-4444'), 'RUNNING')
+        self.etcd.compact_to(self.etcd.revision)
+        self.etcd.break_watches()
+        self.etcd.put(WorkflowKeys.state_key('process-d-5555'), 'RUNNING')
+        self.assertTrue(self.index.sync())
+        self.assertEqual(self.index.resyncs, 1)
+        self.assertEqual(len(self.index.ids()), 5)
+
+    def test_handle_run_resolves_through_the_index(self):
+        self.assertEqual(resolve_workflow_id('a-2222'), 'process-a-2222')
+        self.etcd.reset_calls()
+        self.assertEqual(resolve_workflow_id('b-3333'), 'process-b-3333')
+        self.assertEqual(self.etcd.calls['Range'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,236 @@
+'''Tests for flowlib.etcd_utils, run against the in-memory fake etcd.
+'''
+import time
+import unittest
+from unittest import mock
+
+from flowlib import etcd_utils
+from tests.fake_etcd import EtcdTestCase
+
+
+class TestPrefixReads(EtcdTestCase):
+    def populate(self, count):
+        for index in range(count):
+            self.etcd.put(f'/rexflow/instances/iid-{index:04}/state', 'RUNNING')
+            self.etcd.put(f'/rexflow/instances/iid-{index:04}/parent', 'wf-1')
+        self.etcd.put('/rexflow/instancesx/other', 'not in the prefix')
+        self.etcd.reset_calls()
+
+    def test_get_dict_from_prefix_values(self):
+        self.populate(3)
+        result = etcd_utils.get_dict_from_prefix(
+            '/rexflow/instances', value_transformer=bytes.decode,
+        )
+        self.assertEqual(set(result.keys()), {'iid-0000', 'iid-0001', 'iid-0002'})
+        self.assertEqual(result['iid-0001'], {'state': 'RUNNING', 'parent': 'wf-1'})
+        self.assertEqual(self.etcd.calls['Range'], 1)
+
+    def test_get_dict_from_prefix_keys_filter(self):
+        self.populate(2)
+        result = etcd_utils.get_dict_from_prefix(
+            '/rexflow/instances', keys=['state'], keys_only=True,
+        )
+        self.assertEqual(result, {
+            'iid-0000': {'state': None},
+            'iid-0001': {'state': None},
+        })
+
+    def test_paged_reads_use_one_snapshot(self):
+        self.populate(25)
+        pages = etcd_utils.get_prefix_pages(
+            self.etcd, '/rexflow/instances/', page_size=10,
+        )
+        first = next(pages)
+        # A write between pages must not show up in later pages.
+        self.etcd.put('/rexflow/instances/iid-9999/state', 'RUNNING')
+        rest = list(pages)
+        keys = [kv.key for page in [first] + rest for kv in page.kvs]
+        self.assertEqual(len(keys), 50)
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(rest), 4)
+        self.assertTrue(all(
+            page.header.revision == first.header.revision for page in rest
+        ))
+
+    def test_round_trips_are_per_page(self):
+        self.populate(200)
+        etcd_utils.get_dict_from_prefix('/rexflow/instances')
+        expected = -(-400 // etcd_utils.ETCD_RANGE_PAGE_SIZE)
+        self.assertEqual(self.etcd.round_trips, expected)
+
+
+class TestTransitionState(EtcdTestCase):
+    STATE_KEY = '/rexflow/instances/iid-1/state'
+    GOOD_STATES = (b'STARTING', b'RUNNING', b'STOPPING')
+
+    def test_transition_from_each_state(self):
+        for from_state in self.GOOD_STATES:
+            self.etcd.put(self.STATE_KEY, from_state)
+            self.etcd.reset_calls()
+            result = etcd_utils.try_transition_state(
+                self.etcd, self.STATE_KEY, self.GOOD_STATES, b'COMPLETED',
+            )
+            self.assertEqual(result, (True, from_state))
+            self.assertEqual(self.etcd.get(self.STATE_KEY)[0], b'COMPLETED')
+            self.assertEqual(self.etcd.calls['Txn'], 1)
+
+    def test_refused_transition_reports_prior_state(self):
+        self.etcd.put(self.STATE_KEY, 'ERROR')
+        self.etcd.reset_calls()
+        result = etcd_utils.try_transition_state(
+            self.etcd, self.STATE_KEY, self.GOOD_STATES, b'COMPLETED',
+            puts={'/rexflow/instances/iid-1/result': 'nope'},
+        )
+        self.assertEqual(result, (False, b'ERROR'))
+        self.assertEqual(self.etcd.round_trips, 1)
+        self.assertIsNone(self.etcd.get('/rexflow/instances/iid-1/result')[0])
+        self.assertEqual(
+            etcd_utils.try_transition_state(
+                self.etcd, '/rexflow/instances/iid-2/state', [b'RUNNING'], b'ERROR',
+            ),
+            (False, None),
+        )
+
+    def test_puts_share_the_transaction(self):
+        self.etcd.put(self.STATE_KEY, 'RUNNING')
+        revision = self.etcd.revision
+        self.assertTrue(etcd_utils.transition_state(
+            self.etcd, self.STATE_KEY, {b'RUNNING'}, b'COMPLETED',
+            puts={
+                '/rexflow/instances/iid-1/result': '{}',
+                '/rexflow/instances/iid-1/content_type': 'application/json',
+            },
+        ))
+        result, metadata = self.etcd.get('/rexflow/instances/iid-1/result')
+        self.assertEqual(result, b'{}')
+        self.assertEqual(metadata.mod_revision, revision + 1)
+        self.assertEqual(self.etcd.get(self.STATE_KEY)[1].mod_revision, revision + 1)
+
+    def test_batched_transitions(self):
+        self.etcd.put('/rexflow/instances/iid-1/state', 'RUNNING')
+        self.etcd.put('/rexflow/instances/iid-2/state', 'ERROR')
+        self.etcd.put('/rexflow/instances/iid-3/state', 'STARTING')
+        self.etcd.reset_calls()
+        transitions = [
+            (f'/rexflow/instances/iid-{n}/state', self.GOOD_STATES, b'COMPLETED',
+             {f'/rexflow/instances/iid-{n}/result': 'done'})
+            for n in range(1, 5)
+        ]
+        # each transition is a 12-op nested txn, so two fit in 14 ops
+        self.etcd.max_txn_ops = 14
+        results = etcd_utils.try_transition_states(self.etcd, transitions, max_ops=14)
+        self.assertEqual(results, [(True, b'RUNNING'), (False, b'ERROR'), (True, b'STARTING'), (False, None)])
+        self.assertEqual(self.etcd.calls['Txn'], 2)
+        self.assertEqual(self.etcd.get('/rexflow/instances/iid-3/result')[0], b'done')
+        self.assertIsNone(self.etcd.get('/rexflow/instances/iid-2/result')[0])
+
+    def test_batch_fits_etcd_limits(self):
+        for n in range(500):
+            self.etcd.put(f'/rexflow/instances/iid-{n}/state', 'RUNNING')
+        self.etcd.reset_calls()
+        transitions = [
+            (f'/rexflow/instances/iid-{n}/state', self.GOOD_STATES, b'ERROR',
+             {f'/rexflow/instances/iid-{n}/result': 'failed', f'/rexflow/instances/iid-{n}/content_type': 'text'})
+            for n in range(500)
+        ]
+        results = etcd_utils.try_transition_states(self.etcd, transitions)
+        self.assertEqual(results, [(True, b'RUNNING')] * 500)
+        self.assertEqual(self.etcd.calls['Txn'], 5)
+        self.assertEqual(self.etcd.get('/rexflow/instances/iid-499/state')[0], b'ERROR')
+
+    def test_txn_chunks(self):
+        txns = self.etcd.transactions
+        nested = txns.txn(compare=[], success=[txns.txn(compare=[], success=[txns.get('a')] * 3)], failure=[])
+        self.assertEqual(etcd_utils.txn_ops(nested), 4)
+        chunks = list(etcd_utils.txn_chunks([txns.get('a')] * 6 + [nested] * 3, max_ops=8))
+        self.assertEqual([len(chunk) for chunk in chunks], [6, 3])
+
+
+class TestEtcdMirror(EtcdTestCase):
+    PREFIX = '/rexflow/workflows'
+
+    def setUp(self):
+        super().setUp()
+        self.etcd.put(f'{self.PREFIX}/wf-1/state', 'RUNNING')
+        self.etcd.put(f'{self.PREFIX}/wf-1/proc', '<bpmn/>')
+        self.etcd.put(f'{self.PREFIX}/wf-2/state', 'STOPPED')
+        self.etcd.put('/rexflow/instances/iid-1/state', 'RUNNING')
+        self.mirror = etcd_utils.EtcdMirror(self.PREFIX, self.etcd).start()
+
+    def tearDown(self):
+        self.mirror.stop()
+        super().tearDown()
+
+    def test_reads_come_from_memory(self):
+        self.etcd.reset_calls()
+        self.assertEqual(self.mirror.get_next_level(self.PREFIX), {'wf-1', 'wf-2'})
+        self.assertEqual(
+            self.mirror.get_dict(self.PREFIX, keys={'state'}),
+            {'wf-1': {'state': b'RUNNING'}, 'wf-2': {'state': b'STOPPED'}},
+        )
+        self.assertEqual(self.mirror.get(f'{self.PREFIX}/wf-1/proc'), b'<bpmn/>')
+        self.assertEqual(self.etcd.round_trips, 0)
+
+    def test_follows_writes(self):
+        self.etcd.put(f'{self.PREFIX}/wf-3/state', 'STARTING')
+        self.etcd.delete(f'{self.PREFIX}/wf-2/state')
+        self.etcd.replace(f'{self.PREFIX}/wf-1/state', 'RUNNING', 'STOPPING')
+        self.assertTrue(self.mirror.sync())
+        self.assertEqual(
+            self.mirror.get_dict(self.PREFIX, keys={'state'}),
+            {'wf-1': {'state': b'STOPPING'}, 'wf-3': {'state': b'STARTING'}},
+        )
+        self.assertEqual(self.mirror.revision, self.etcd.revision)
+
+    def test_sync_while_keys_are_created(self):
+        range_request = self.etcd.kvstub.Range
+        created = iter(range(100, 1000))
+
+        def range_then_put(*args, **kws):
+            # an instance created between the range request and the wait
+            response = range_request(*args, **kws)
+            self.etcd.put(f'{self.PREFIX}/wf-{next(created)}/state', 'STARTING')
+            return response
+
+        self.etcd.put(f'{self.PREFIX}/wf-3/state', 'STARTING')
+        with mock.patch.object(self.etcd.kvstub, 'Range', side_effect=range_then_put):
+            started = time.monotonic()
+            for _ in range(3):
+                self.assertTrue(self.mirror.sync())
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(self.mirror.stats()['sync_timeouts'], 0)
+        self.assertIn('wf-3', self.mirror.get_next_level(self.PREFIX))
+
+    def test_sync_timeout_is_counted(self):
+        self.mirror.stop()
+        self.etcd.put(f'{self.PREFIX}/wf-3/state', 'STARTING')
+        with self.assertLogs(level='WARNING'):
+            self.assertFalse(self.mirror.sync(timeout=0.1))
+        self.assertEqual(self.mirror.stats()['sync_timeouts'], 1)
+
+    def test_resync_after_compaction(self):
+        self.assertTrue(self.mirror.sync())
+        self.mirror.stop()
+        self.mirror = etcd_utils.EtcdMirror(self.PREFIX, self.etcd).start()
+        self.etcd.put(f'{self.PREFIX}/wf-4/state', 'RUNNING')
+        self.etcd.compact_to(self.etcd.revision)
+        self.etcd.break_watches()
+        self.etcd.put(f'{self.PREFIX}/wf-5/state', 'RUNNING')
+        self.assertTrue(self.mirror.sync())
+        self.assertEqual(self.mirror.resyncs, 1)
+        self.assertEqual(
+            self.mirror.get_next_level(self.PREFIX), {'wf-1', 'wf-2', 'wf-4', 'wf-5'},
+        )
+
+    def test_overflow_reads_through(self):
+        self.mirror.stop()
+        self.mirror = etcd_utils.EtcdMirror(self.PREFIX, self.etcd, max_bytes=64).start()
+        self.assertTrue(self.mirror.overflowed)
+        self.assertEqual(self.mirror.stats()['keys'], 0)
+        self.assertEqual(self.mirror.get(f'{self.PREFIX}/wf-2/state'), b'STOPPED')
+        self.assertEqual(self.mirror.get_next_level(self.PREFIX), {'wf-1', 'wf-2'})
+        self.assertEqual(self.mirror.fallback_reads, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
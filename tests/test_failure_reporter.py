@@ -0,0 +1,65 @@
+'''Tests for flowlib.failure_reporter against a local HTTP stand-in for flowd.
+'''
+from concurrent.futures import ThreadPoolExecutor
+import json
+import unittest
+
+from flowlib.failure_reporter import FailureReporter, decode_failures, encode_failures
+from tests.http_stub import HttpStub
+
+
+def report(n):
+    return {'X-Flow-Id': f'iid-{n}'}, {'error_code': 'FAILED_CONNECTION', 'n': n}
+
+
+class TestFailureReporter(unittest.TestCase):
+    def setUp(self):
+        self.flowd = HttpStub().start()
+        self.addCleanup(self.flowd.stop)
+
+    def reported(self):
+        return [
+            payload['n']
+            for _, _, _, body in self.flowd.requests
+            for _, payload in decode_failures(body)
+        ]
+
+    def test_encoding_round_trip(self):
+        records = [report(1), report(2)]
+        self.assertEqual(decode_failures(encode_failures(records)), records)
+        with self.assertRaises(ValueError):
+            decode_failures('{}')
+
+    def test_storm_is_coalesced(self):
+        reporter = FailureReporter(self.flowd.url('/instancefail'), linger=0.05, batch_size=100)
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            futures = list(executor.map(lambda n: reporter.report(*report(n)), range(250)))
+        self.assertTrue(all(future.result(timeout=5) for future in futures))
+        self.assertEqual(sorted(self.reported()), list(range(250)))
+        self.assertLessEqual(len(self.flowd.requests), 10)
+        self.assertEqual({path for _, path, _, _ in self.flowd.requests}, {'/instancefail/batch'})
+        stats = reporter.stats()
+        self.assertEqual((stats['reports'], stats['undelivered']), (250, 0))
+        self.assertLessEqual(stats['largest_batch'], 100)
+
+    def test_falls_back_to_single_reports(self):
+        self.flowd.statuses = [404]
+        reporter = FailureReporter(self.flowd.url('/instancefail'), linger=0.05)
+        futures = [reporter.report(*report(n)) for n in range(3)]
+        self.assertTrue(all(future.result(timeout=5) for future in futures))
+        self.assertEqual(
+            [path for _, path, _, _ in self.flowd.requests],
+            ['/instancefail/batch'] + ['/instancefail'] * 3,
+        )
+        self.assertEqual(json.loads(self.flowd.requests[1][3])['n'], 0)
+        self.assertEqual(self.flowd.requests[1][2]['x-flow-id'], 'iid-0')
+
+    def test_undelivered_reports(self):
+        self.flowd.status = 500
+        reporter = FailureReporter(self.flowd.url('/instancefail'), linger=0)
+        self.assertFalse(reporter.report(*report(1)).result(timeout=5))
+        self.assertEqual(reporter.stats()['undelivered'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
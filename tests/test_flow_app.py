@@ -0,0 +1,153 @@
+'''Tests for flowd's /instancefail endpoints, against a FakeEtcd.
+'''
+import asyncio
+import json
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from flowd import flow_app, handlers
+from flowd.dispatch import RpcDispatcher
+from flowd.flow_app import FlowApp
+from flowd.flow_daemon import Flow
+from flowlib import flow_pb2
+from flowlib.constants import BStates, ErrorCodes, Headers, WorkflowInstanceKeys
+from flowlib.failure_reporter import encode_failures
+from flowlib.token_api import TokenPool
+from tests.fake_etcd import EtcdTestCase
+
+
+def fake_workflow(recoverable=False):
+    return SimpleNamespace(process=SimpleNamespace(
+        properties=SimpleNamespace(is_recoverable=recoverable),
+    ))
+
+
+def failure(iid, wf_id='wf-did', **headers):
+    headers.update({Headers.X_HEADER_FLOW_ID: iid, Headers.X_HEADER_WORKFLOW_ID: wf_id})
+    return headers, {
+        'from_envoy': False,
+        'error_code': ErrorCodes.FAILED_CONNECTION,
+        'error_msg': f'{iid} could not connect.',
+    }
+
+
+class FlowAppTestCase(EtcdTestCase):
+    def setUp(self):
+        super().setUp()
+        self.workflows = {'wf-did': fake_workflow(), 'wf-recoverable': fake_workflow(True)}
+        patcher = mock.patch.object(flow_app.Workflow, 'from_id', side_effect=self.workflows.__getitem__)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.app = FlowApp()
+
+    def state(self, iid):
+        return self.etcd.get(WorkflowInstanceKeys.state_key(iid))[0]
+
+
+class TestFailBatchRoute(FlowAppTestCase):
+
+    def post(self, body):
+        async def go():
+            response = await self.app.app.test_client().post('/instancefail/batch', data=body)
+            return response.status_code, json.loads(await response.get_data())
+        return asyncio.run(go())
+
+    def test_batch_is_applied_in_grouped_transactions(self):
+        count = 300
+        for n in range(count):
+            self.etcd.put(WorkflowInstanceKeys.state_key(f'iid-{n}'), BStates.RUNNING)
+        self.etcd.put(WorkflowInstanceKeys.state_key('iid-0'), BStates.COMPLETED)
+        self.etcd.reset_calls()
+
+        status, body = self.post(encode_failures([failure(f'iid-{n}') for n in range(count)]))
+        self.assertEqual(status, 200)
+        results = body['results']
+        self.assertEqual(len(results), count)
+        self.assertEqual(results[0], {'id': 'iid-0', 'failed': False, 'message': 'Instance is COMPLETED'})
+        self.assertTrue(all(result['failed'] for result in results[1:]))
+        self.assertEqual(self.state('iid-0'), BStates.COMPLETED)
+        self.assertEqual(self.state('iid-7'), BStates.ERROR)
+        saved = json.loads(self.etcd.get(WorkflowInstanceKeys.result_key('iid-7'))[0])
+        self.assertEqual(saved['error_code'], ErrorCodes.FAILED_CONNECTION)
+        # 300 transitions at 128 per transaction
+        self.assertEqual(self.etcd.calls['Txn'], 3)
+
+    def test_recoverable_pools_duplicates_and_bad_records(self):
+        for iid in ('iid-1', 'iid-2'):
+            self.etcd.put(WorkflowInstanceKeys.state_key(iid), BStates.RUNNING)
+        pools = [TokenPool.create('iid-1', 2).name, TokenPool.create('iid-1', 2).name]
+        records = [
+            failure('iid-1', **{Headers.X_HEADER_TOKEN_POOL_ID: ','.join(pools)}),
+            failure('iid-1'),
+            failure('iid-2', 'wf-recoverable'),
+            failure('iid-3', 'wf-unknown'),
+            ({}, {}),
+        ]
+        status, body = self.post(encode_failures(records))
+        self.assertEqual(status, 200)
+        self.assertEqual([r['failed'] for r in body['results']], [True, False, True, False, False])
+        self.assertEqual(body['results'][1]['message'], 'Duplicate')
+        self.assertEqual(self.state('iid-2'), BStates.STOPPED)
+        self.assertIsNone(self.state('iid-3'))
+        for name in pools:
+            self.assertIsNone(self.etcd.get(TokenPool.key(name))[0])
+
+    def test_malformed_body(self):
+        status, body = self.post('{"not": "a list"}')
+        self.assertEqual(status, 400)
+        self.assertEqual(body['status'], -1)
+
+
+class TestFailRouteDuringApply(FlowAppTestCase):
+    '''The gRPC server and the Quart app share one event loop in flowd.'''
+    APPLY_SECONDS = 1.0
+    SAMPLES = 10
+
+    def setUp(self):
+        super().setUp()
+        for n in range(2 * self.SAMPLES):
+            self.etcd.put(WorkflowInstanceKeys.state_key(f'iid-{n}'), BStates.RUNNING)
+
+        def apply(request):
+            # stands in for kubectl apply and friends
+            time.sleep(self.APPLY_SECONDS)
+            return {}
+        patcher = mock.patch.object(handlers.handle_apply, 'handler', apply)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dispatcher = RpcDispatcher(workers=2)
+        self.addCleanup(self.dispatcher.shutdown)
+
+    async def fail_latencies(self, client, first):
+        latencies = []
+        for n in range(first, first + self.SAMPLES):
+            headers, payload = failure(f'iid-{n}')
+            started = time.monotonic()
+            response = await client.post('/instancefail', headers=headers, data=json.dumps(payload))
+            latencies.append(time.monotonic() - started)
+            self.assertEqual(response.status_code, 200)
+            await asyncio.sleep(0.02)
+        return latencies
+
+    def test_latency_stays_flat(self):
+        async def go():
+            client = self.app.app.test_client()
+            idle = await self.fail_latencies(client, 0)
+            apply = asyncio.ensure_future(
+                Flow(self.dispatcher).ApplyWorkflow(flow_pb2.ApplyRequest(), None)
+            )
+            await asyncio.sleep(0.05)
+            during = await self.fail_latencies(client, self.SAMPLES)
+            self.assertFalse(apply.done())
+            self.assertEqual((await apply).status, 0)
+            return idle, during
+
+        idle, during = asyncio.run(go())
+        self.assertLess(max(during), max(idle) + 0.1)
+        self.assertEqual(self.state(f'iid-{2 * self.SAMPLES - 1}'), BStates.ERROR)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+'''Tests for flowd.dispatch.RpcDispatcher.
+'''
+import asyncio
+import json
+import time
+import unittest
+from unittest import mock
+
+from flowd import handlers
+from flowd.dispatch import RpcDispatcher
+from flowd.flow_daemon import Flow
+from flowlib import flow_pb2
+
+
+def slow_handler(seconds, response=None):
+    def handler(request):
+        time.sleep(seconds)
+        return response if response is not None else {}
+    return handler
+
+
+class TestRpcDispatcher(unittest.TestCase):
+    def patch_handler(self, command, handler):
+        patcher = mock.patch.object(getattr(handlers, f'handle_{command}'), 'handler', handler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_per_rpc_limit_and_metrics(self):
+        self.patch_handler('apply', slow_handler(0.2, {'applied': True}))
+        self.patch_handler('ps', slow_handler(0.01))
+        dispatcher = RpcDispatcher(workers=4, concurrency=4, limits={'apply': 1})
+        self.addCleanup(dispatcher.shutdown)
+        flow = Flow(dispatcher)
+
+        async def go():
+            started = time.monotonic()
+            applies = [flow.ApplyWorkflow(flow_pb2.ApplyRequest(), None) for _ in range(3)]
+            results = await asyncio.gather(*applies, flow.PSQuery(flow_pb2.PSRequest(), None))
+            return results, time.monotonic() - started
+
+        results, elapsed = asyncio.run(go())
+        self.assertEqual(json.loads(results[0].data), {'applied': True})
+        # applies ran one at a time; ps did not wait behind them
+        self.assertGreaterEqual(elapsed, 0.6)
+        stats = dispatcher.stats()
+        self.assertEqual(stats['apply']['calls'], 3)
+        self.assertEqual(stats['apply']['limit'], 1)
+        self.assertGreaterEqual(stats['apply']['queue_time_max'], 0.35)
+        self.assertGreaterEqual(stats['apply']['handle_time_max'], 0.2)
+        self.assertEqual((stats['apply']['waiting'], stats['apply']['active']), (0, 0))
+        self.assertLess(stats['ps']['queue_time_max'], 0.1)
+
+    def test_errors_are_counted(self):
+        def broken(request):
+            raise ValueError('nope')
+        self.patch_handler('delete', broken)
+        dispatcher = RpcDispatcher(workers=1)
+        self.addCleanup(dispatcher.shutdown)
+        result = asyncio.run(Flow(dispatcher).DeleteWorkflow(flow_pb2.DeleteRequest(), None))
+        self.assertEqual(result.status, -1)
+        self.assertEqual(dispatcher.stats()['delete']['errors'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
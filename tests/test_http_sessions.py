@@ -0,0 +1,84 @@
+'''Tests for flowlib.http_sessions, and FlowPost's use of it, against a local
+HTTP stand-in.
+'''
+import unittest
+from unittest import mock
+
+from flowlib import flowpost
+from flowlib.flowpost import FlowPost, FlowPostStatus
+from flowlib.http_sessions import SessionPool
+from tests.http_stub import HttpStub
+
+
+class TestSessionPool(unittest.TestCase):
+    def setUp(self):
+        self.stub = HttpStub().start()
+        self.pool = SessionPool(max_hosts=2, connections_per_host=4)
+
+    def tearDown(self):
+        self.pool.close()
+        self.stub.stop()
+
+    def test_connections_are_kept_alive(self):
+        for _ in range(10):
+            self.pool.post(self.stub.url('/'), json={'a': 1}).raise_for_status()
+        self.assertEqual(self.stub.connections, 1)
+        stats = self.pool.stats()
+        self.assertEqual((stats['session_hits'], stats['session_misses']), (9, 1))
+        self.assertEqual(
+            (stats['requests'], stats['connections_opened'], stats['connections_reused']),
+            (10, 1, 9),
+        )
+
+    def test_keep_alive_off(self):
+        pool = SessionPool(keep_alive=False)
+        for _ in range(3):
+            pool.get(self.stub.url('/'))
+        pool.close()
+        self.assertEqual(self.stub.connections, 3)
+
+    def test_least_recently_used_host_is_evicted(self):
+        with HttpStub() as second, HttpStub() as third:
+            self.pool.get(self.stub.url('/'))
+            self.pool.get(second.url('/'))
+            self.pool.get(self.stub.url('/'))
+            self.pool.get(third.url('/'))
+            self.pool.get(self.stub.url('/'))
+            stats = self.pool.stats()
+        self.assertEqual(stats['hosts'], 2)
+        self.assertEqual(stats['session_evictions'], 1)
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(self.stub.connections, 1)
+
+
+class TestFlowPostSessions(unittest.TestCase):
+    def setUp(self):
+        self.stub = HttpStub().start()
+        self.pool = SessionPool()
+        patcher = mock.patch.object(flowpost, 'get_session_pool', return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.pool.close()
+        self.stub.stop()
+
+    def send(self, **kws):
+        return FlowPost(
+            'wf-did-iid', 'task-1', b'{}', url=self.stub.url('/task'),
+            retries=0, shadow_url='', **kws
+        ).send()
+
+    def test_calls_share_one_connection(self):
+        for _ in range(5):
+            self.assertEqual(self.send().message, FlowPostStatus.SUCCESS)
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual(self.pool.stats()['connections_reused'], 4)
+
+    def test_method_is_honoured(self):
+        self.send(method='put')
+        self.assertEqual(self.stub.requests[0][0], 'PUT')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+'''Tests for the instance state/metadata index, against a FakeEtcd.
+'''
+import json
+import os
+import unittest
+from unittest import mock
+
+from flowd.handlers import handle_delete
+from flowlib import flow_pb2
+from flowlib.constants import BStates, InstanceIndexKeys, WorkflowInstanceKeys, WorkflowKeys
+from flowlib.etcd_utils import (
+    get_prefix_pages,
+    try_create_state,
+    try_transition_state,
+    try_transition_states,
+)
+from flowlib.instance_index import check_index, find_instances, is_ready, metadata_ops
+from flowlib.workflow import Workflow, WorkflowInstance
+from tests.fake_etcd import EtcdTestCase
+from tests.test_compiled_process import parse
+
+
+class TestInstanceIndex(EtcdTestCase):
+    def index(self):
+        return sorted(
+            kv.key.decode('utf-8')[len(InstanceIndexKeys.ROOT) + 1:]
+            for response in get_prefix_pages(self.etcd, InstanceIndexKeys.ROOT + '/', keys_only=True)
+            for kv in response.kvs
+        )
+
+    def create(self, iid, state=BStates.STARTING, **metadata):
+        self.assertTrue(try_create_state(self.etcd, WorkflowInstanceKeys.state_key(iid), state))
+        if metadata:
+            self.etcd.transaction(
+                compare=[], success=metadata_ops(self.etcd.transactions, iid, metadata), failure=[],
+            )
+
+    def test_transitions_move_the_state_entry(self):
+        self.create('wf-1')
+        self.assertFalse(try_create_state(self.etcd, WorkflowInstanceKeys.state_key('wf-1'), BStates.RUNNING))
+        self.assertEqual(self.index(), ['state/STARTING/wf-1'])
+        state_key = WorkflowInstanceKeys.state_key('wf-1')
+        self.assertTrue(try_transition_state(
+            self.etcd, state_key, [BStates.STARTING, BStates.RUNNING], BStates.RUNNING,
+        )[0])
+        self.assertEqual(self.index(), ['state/RUNNING/wf-1'])
+        # the second from-state takes its own success branch
+        self.assertTrue(try_transition_state(
+            self.etcd, state_key, [BStates.STARTING, BStates.RUNNING], BStates.ERROR,
+        )[0])
+        self.assertEqual(self.index(), ['state/ERROR/wf-1'])
+        self.assertFalse(try_transition_state(self.etcd, state_key, [BStates.RUNNING], BStates.STOPPED)[0])
+        self.assertEqual(self.index(), ['state/ERROR/wf-1'])
+
+    def test_batched_transitions_and_deployments(self):
+        self.create('wf-1')
+        self.create('wf-2')
+        try_transition_states(self.etcd, [
+            (WorkflowInstanceKeys.state_key('wf-1'), [BStates.STARTING], BStates.STOPPING, None),
+            (WorkflowInstanceKeys.state_key('wf-2'), [BStates.RUNNING], BStates.STOPPING, None),
+        ])
+        self.assertEqual(self.index(), ['state/STARTING/wf-2', 'state/STOPPING/wf-1'])
+        # deployment state keys are not indexed
+        self.etcd.put(WorkflowKeys.state_key('wf'), BStates.RUNNING)
+        try_transition_state(self.etcd, WorkflowKeys.state_key('wf'), [BStates.RUNNING], BStates.STOPPING)
+        self.assertEqual(len(self.index()), 2)
+
+    def test_find_instances(self):
+        self.create('wf-1', user='Ann', team='a')
+        self.create('wf-2', user='ann', team='b')
+        self.create('wf-3', user='bob/builder', team='a')
+        self.create('other-1', user='ann')
+        self.assertEqual(list(find_instances(self.etcd, metadata={'user': 'ANN'})), ['other-1', 'wf-1', 'wf-2'])
+        self.assertEqual(list(find_instances(self.etcd, metadata={'user': 'ann', 'team': 'a'})), ['wf-1'])
+        self.assertEqual(list(find_instances(self.etcd, metadata={'user': 'bob/builder'})), ['wf-3'])
+        self.assertEqual(list(find_instances(self.etcd, metadata={'user': 'ann'}, id_prefix='wf')), ['wf-1', 'wf-2'])
+        self.assertEqual(list(find_instances(self.etcd, metadata={'user': 'ann'}, after='wf-1')), ['wf-2'])
+        try_transition_state(self.etcd, WorkflowInstanceKeys.state_key('wf-2'), [BStates.STARTING], BStates.RUNNING)
+        self.assertEqual(list(find_instances(self.etcd, states=['RUNNING', 'STARTING'])), ['other-1', 'wf-1', 'wf-2', 'wf-3'])
+        self.assertEqual(list(find_instances(self.etcd, states=['RUNNING'], after='wf-1')), ['wf-2'])
+
+    def test_delete_removes_entries(self):
+        self.create('wf-1', BStates.COMPLETED, user='ann')
+        self.create('wf-2', BStates.COMPLETED, user='ann')
+        result = handle_delete.handler(flow_pb2.DeleteRequest(kind=flow_pb2.INSTANCE, ids=['wf-1']))
+        self.assertEqual(result['wf-1']['result'], 0)
+        self.assertEqual(self.index(), ['meta/user/ann/wf-2', 'state/COMPLETED/wf-2'])
+
+    def test_check_and_repair(self):
+        self.create('wf-1', user='ann')
+        # written around the index, as by a writer that predates it
+        self.etcd.put(WorkflowInstanceKeys.state_key('wf-2'), BStates.RUNNING)
+        self.etcd.put(WorkflowInstanceKeys.metadata_key('wf-2'), json.dumps({'user': 'bob'}))
+        self.etcd.put(WorkflowInstanceKeys.state_key('wf-1'), BStates.ERROR)
+        self.etcd.put(InstanceIndexKeys.state_key('RUNNING', 'gone-1'), b'')
+        self.assertFalse(is_ready(self.etcd))
+
+        report = check_index(self.etcd)
+        self.assertEqual(
+            (report['instances'], report['missing'], report['stale'], report['repaired']), (2, 3, 2, 0),
+        )
+        self.assertFalse(is_ready(self.etcd))
+        report = check_index(self.etcd, repair=True)
+        self.assertEqual((report['repaired'], report['skipped']), (3, 0))
+        self.assertTrue(is_ready(self.etcd))
+        self.assertEqual(self.index(), [
+            'meta/user/ann/wf-1', 'meta/user/bob/wf-2', 'ready',
+            'state/ERROR/wf-1', 'state/RUNNING/wf-2',
+        ])
+        report = check_index(self.etcd)
+        self.assertEqual((report['missing'], report['stale']), (0, 0))
+
+    def test_first_repair_of_many_instances(self):
+        # the first check after an upgrade has a fix for every instance
+        for n in range(500):
+            self.etcd.put(WorkflowInstanceKeys.state_key(f'wf-{n}'), BStates.RUNNING)
+            self.etcd.put(WorkflowInstanceKeys.metadata_key(f'wf-{n}'), json.dumps({'user': f'u{n % 7}'}))
+        self.etcd.reset_calls()
+        report = check_index(self.etcd, repair=True)
+        self.assertEqual((report['repaired'], report['skipped']), (500, 0))
+        self.assertTrue(is_ready(self.etcd))
+        self.assertEqual(len(list(find_instances(self.etcd, states=['RUNNING']))), 500)
+
+    def test_retry_moves_the_state_entry(self):
+        workflow = Workflow(parse(os.path.join(os.path.dirname(__file__), 'super_happy.bpmn')))
+        iid = f'{workflow.id}-abc'
+        self.create(iid, BStates.STOPPED)
+        self.etcd.put(WorkflowInstanceKeys.result_key(iid), json.dumps({
+            'input_headers': {}, 'input_data': {}, 'failed_task_id': workflow.process.tasks[0].id,
+        }))
+        with mock.patch('flowlib.workflow.requests.post', return_value=mock.Mock(ok=True)):
+            self.assertEqual(WorkflowInstance(workflow, id=iid).retry()['status'], 0)
+        self.assertEqual(self.etcd.get(WorkflowInstanceKeys.state_key(iid))[0], BStates.RUNNING)
+        self.assertEqual(list(find_instances(self.etcd, states=['RUNNING'])), [iid])
+        self.assertEqual(list(find_instances(self.etcd, states=['STOPPED'])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+'''Tests for diff-based applies of k8s objects, against a fake API server.
+'''
+import copy
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import yaml
+
+from flowlib import bpmn, k8s_apply, spec_cache
+from flowlib.constants import BStates, States
+from flowlib.k8s_apply import KubernetesApi, object_key
+from flowlib.workflow import Workflow
+from tests.fake_etcd import EtcdTestCase
+from tests.fake_k8s import FakeKubernetes
+from tests.test_compiled_process import parse
+
+
+TESTS = os.path.dirname(__file__)
+NAMESPACE = 'process-0wcmy6c-2a1b7a31'
+
+
+def fixture_specs():
+    with open(os.path.join(TESTS, 'super_happy_specs.yaml'), 'r') as spec_file:
+        return list(yaml.safe_load_all(spec_file))
+
+
+class K8sTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeKubernetes().start()
+        self.addCleanup(self.server.stop)
+        self.api = KubernetesApi(self.server.url(), token='t0ken', workers=4)
+
+
+class TestApply(K8sTestCase):
+    def test_first_apply(self):
+        report, applied = k8s_apply.apply(fixture_specs(), None, self.api)
+        self.assertEqual((report['applied'], report['unchanged'], report['failed']), (13, 0, 0))
+        self.assertEqual(set(applied), {object_key(spec) for spec in fixture_specs()})
+        self.assertEqual(self.server.requests[0][1], f'/api/v1/namespaces/{NAMESPACE}')
+        self.assertIn(f'/apis/apps/v1/namespaces/{NAMESPACE}/deployments/happiness', self.server.objects)
+        self.assertIn(
+            '/apis/networking.istio.io/v1alpha3/namespaces/default/virtualservices/happiness-2a1b7a31',
+            self.server.objects,
+        )
+        self.assertEqual(self.server.requests[0][2], {'fieldManager': ['rexflow'], 'force': ['true']})
+        self.assertEqual(self.server.methods(), {'PATCH': 13})
+
+    def test_only_changes_are_sent(self):
+        _, applied = k8s_apply.apply(fixture_specs(), None, self.api)
+        self.server.methods()
+        report, again = k8s_apply.apply(fixture_specs(), applied, self.api)
+        self.assertEqual((report['applied'], report['unchanged'], report['deleted']), (0, 13, 0))
+        self.assertEqual(again, applied)
+        self.assertEqual(self.server.methods(), {})
+
+        specs = fixture_specs()
+        deployment = next(spec for spec in specs if spec['kind'] == 'Deployment')
+        deployment['spec']['replicas'] = 3
+        gone = specs.pop()
+        report, applied = k8s_apply.apply(specs, applied, self.api)
+        self.assertEqual((report['applied'], report['unchanged'], report['deleted']), (1, 11, 1))
+        self.assertEqual(self.server.methods(), {'PATCH': 1, 'DELETE': 1})
+        self.assertNotIn(object_key(gone), applied)
+        self.assertEqual(applied[object_key(deployment)], k8s_apply.spec_digest(deployment))
+
+    def test_full_apply(self):
+        _, applied = k8s_apply.apply(fixture_specs(), None, self.api)
+        self.server.methods()
+        specs = fixture_specs()
+        gone = specs.pop()
+        report, again = k8s_apply.apply(specs, applied, self.api, full=True)
+        self.assertEqual((report['applied'], report['unchanged'], report['deleted']), (12, 0, 1))
+        self.assertEqual(self.server.methods(), {'PATCH': 12, 'DELETE': 1})
+        self.assertNotIn(object_key(gone), again)
+
+    def test_failures_are_retried(self):
+        specs = fixture_specs()
+        deployment = next(spec for spec in specs if spec['kind'] == 'Deployment')
+        path = f'/apis/apps/v1/namespaces/{NAMESPACE}/deployments/{deployment["metadata"]["name"]}'
+        self.server.failing.add(path)
+        report, applied = k8s_apply.apply(specs, None, self.api)
+        self.assertEqual((report['applied'], report['failed']), (12, 1))
+        self.assertEqual(applied[object_key(deployment)], k8s_apply.FAILED)
+
+        self.server.failing.clear()
+        self.server.methods()
+        report, applied = k8s_apply.apply(specs, applied, self.api)
+        self.assertEqual((report['applied'], report['unchanged'], report['failed']), (1, 12, 0))
+        self.assertIn(path, self.server.objects)
+
+    def test_failed_objects_are_removed(self):
+        # the apply may have gone through even though the request failed
+        specs = fixture_specs()
+        deployment = next(spec for spec in specs if spec['kind'] == 'Deployment')
+        path = f'/apis/apps/v1/namespaces/{NAMESPACE}/deployments/{deployment["metadata"]["name"]}'
+        self.server.failing.add(path)
+        _, applied = k8s_apply.apply(specs, None, self.api)
+        self.server.failing.clear()
+        self.server.objects[path] = deployment
+        report, failed = k8s_apply.remove(applied, self.api)
+        self.assertEqual((report['deleted'], failed), (13, []))
+        self.assertEqual(self.server.objects, {})
+
+    def test_remove(self):
+        _, applied = k8s_apply.apply(fixture_specs(), None, self.api)
+        self.server.requests = []
+        self.server.failing.add(f'/api/v1/namespaces/{NAMESPACE}/services/happiness')
+        report, failed = k8s_apply.remove(applied, self.api)
+        self.assertEqual((report['deleted'], report['failed']), (12, 1))
+        self.assertEqual(failed, [f'v1/Service/{NAMESPACE}/happiness'])
+        self.assertEqual(self.server.requests[-1][1], f'/api/v1/namespaces/{NAMESPACE}')
+        self.assertEqual(list(self.server.objects), [f'/api/v1/namespaces/{NAMESPACE}/services/happiness'])
+        # already gone is fine
+        report, failed = k8s_apply.remove([object_key(fixture_specs()[1])], self.api)
+        self.assertEqual((report['deleted'], failed), (1, []))
+
+    def test_rotated_token(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        token_file = os.path.join(temp_dir.name, 'token')
+
+        def rotate(token, mtime):
+            with open(token_file, 'w') as f:
+                f.write(f'{token}\n')
+            os.utime(token_file, (mtime, mtime))
+            self.server.token = token
+
+        rotate('t0ken', 1000)
+        api = KubernetesApi(self.server.url(), workers=4, token_file=token_file)
+        report, _ = k8s_apply.apply(fixture_specs(), None, api)
+        self.assertEqual(report['failed'], 0)
+        # the kubelet swaps in a new token: seen by its new mtime
+        rotate('t0ken-2', 2000)
+        report, _ = k8s_apply.apply(fixture_specs(), None, api)
+        self.assertEqual(report['failed'], 0)
+        # or, should the mtime not change, after a 401
+        rotate('t0ken-3', 2000)
+        self.server.methods()
+        report, _ = k8s_apply.apply(fixture_specs()[:1], None, api)
+        self.assertEqual(report['failed'], 0)
+        self.assertEqual(self.server.methods(), {'PATCH': 2})
+
+    def test_concurrent_requests(self):
+        self.server.delay = 0.05
+        api = KubernetesApi(self.server.url(), workers=8)
+        start = time.perf_counter()
+        k8s_apply.apply(fixture_specs(), None, api)
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLess(time.perf_counter() - start, 13 * self.server.delay)
+
+
+class TestWorkflow(K8sTestCase, EtcdTestCase):
+    def setUp(self):
+        super().setUp()
+        for patcher in (
+            mock.patch.object(k8s_apply, '_api', self.api),
+            mock.patch.object(spec_cache, '_cache', spec_cache.SpecCache()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.workflow = Workflow(parse(os.path.join(TESTS, 'super_happy.bpmn')))
+
+    def test_start_stop_start_remove(self):
+        report = self.workflow.start()
+        self.assertEqual(report['applied'], len(self.server.objects))
+        self.assertEqual(self.etcd.get(self.workflow.keys.state)[0], BStates.STARTING)
+        self.assertIsNotNone(self.etcd.get(self.workflow.keys.applied)[0])
+
+        # restarting re-sends everything, whatever the record says
+        self.etcd.put(self.workflow.keys.state, States.STOPPED)
+        self.server.methods()
+        gone = next(path for path in self.server.objects if '/deployments/' in path)
+        del self.server.objects[gone]
+        report = self.workflow.start()
+        self.assertEqual((report['applied'], report['unchanged']), (len(self.server.objects), 0))
+        self.assertEqual(self.server.methods(), {'PATCH': len(self.server.objects)})
+        self.assertIn(gone, self.server.objects)
+
+        self.etcd.put(self.workflow.keys.state, States.STOPPING)
+        report = self.workflow.remove()
+        self.assertEqual(report['failed'], 0)
+        self.assertEqual(self.server.objects, {})
+        self.assertIsNone(self.etcd.get(self.workflow.keys.applied)[0])
+        self.assertEqual(self.etcd.get(self.workflow.keys.state)[0], BStates.STOPPING)
+
+    def test_failed_start(self):
+        self.server.failing.add(f'/api/v1/namespaces/{self.workflow.process.namespace}')
+        self.assertEqual(self.workflow.start()['failed'], 1)
+        self.assertEqual(self.etcd.get(self.workflow.keys.state)[0], BStates.ERROR)
+
+    def test_redeploy(self):
+        self.workflow.start()
+        before = copy.deepcopy(self.server.objects)
+        self.etcd.put(self.workflow.keys.state, States.RUNNING)
+        self.server.methods()
+        with mock.patch.object(bpmn, 'DO_MANUAL_INJECTION', not bpmn.DO_MANUAL_INJECTION):
+            report = self.workflow.redeploy()
+        deployments = [path for path in before if '/deployments/' in path]
+        self.assertEqual((report['applied'], report['deleted']), (len(deployments), 0))
+        self.assertEqual(self.server.methods(), {'PATCH': len(deployments)})
+        self.assertTrue(all(self.server.objects[path] != before[path] for path in deployments))
+
+    def test_remove_without_a_record(self):
+        k8s_apply.apply(k8s_apply.load_specs(self.workflow._generate_specs()), None, self.api)
+        self.etcd.put(self.workflow.keys.state, States.STOPPING)
+        self.assertEqual(self.workflow.remove()['failed'], 0)
+        self.assertEqual(self.server.objects, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+'''Tests for BPMNProcess.kafka_topics, which is worked out without generating
+any k8s specs.
+'''
+import os
+import unittest
+from unittest import mock
+
+import xmltodict
+
+from flowlib import bpmn, catch_event, end_event, start_event, throw_event
+from flowlib.bpmn_util import BPMNComponent
+from tests.benchmarks.bench_compiled_process import make_process_xml
+from tests.benchmarks.bench_kafka_topics import topics_from_specs
+
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'examples', 'full-functionality')
+BPMN_FILES = [
+    os.path.join(EXAMPLES, 'reliable', 'reliable.bpmn'),
+    os.path.join(EXAMPLES, 'reliable', 'conditional.bpmn'),
+    os.path.join(EXAMPLES, 'throw-catch-events', 'throw.bpmn'),
+    os.path.join(EXAMPLES, 'throw-catch-events', 'catch.bpmn'),
+    os.path.join(EXAMPLES, 'start-stop-events', 'b.bpmn'),
+    os.path.join(EXAMPLES, 'shadow', 'traffic_shadow.bpmn'),
+    os.path.join(EXAMPLES, 'async-service-task', 'async.bpmn'),
+]
+
+
+def parse(path):
+    with open(path, 'rb') as bpmn_file:
+        return bpmn.BPMNProcess(xmltodict.parse(bpmn_file.read())['bpmn:definitions']['bpmn:process'])
+
+
+class TestKafkaTopics(unittest.TestCase):
+    def setUp(self):
+        # spec generation for event components insists on a kafka installation
+        for module in (catch_event, end_event, start_event, throw_event):
+            patcher = mock.patch.object(module, 'KAFKA_HOST', 'kafka:9092')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_same_topics_as_spec_generation(self):
+        for path in BPMN_FILES:
+            with self.subTest(path=os.path.basename(path)):
+                self.assertEqual(parse(path).kafka_topics, topics_from_specs(parse(path)))
+        reliable = parse(BPMN_FILES[0]).kafka_topics
+        self.assertEqual(len(reliable), 3)
+        self.assertTrue(all('-transport_' in topic for topic in reliable))
+
+    def test_compiled_once_without_specs(self):
+        process = bpmn.BPMNProcess(xmltodict.parse(make_process_xml(50, transport='kafka'))['bpmn:process'])
+        with mock.patch.object(BPMNComponent, 'kafka_transport_targets',
+                               autospec=True, side_effect=BPMNComponent.kafka_transport_targets) as targets, \
+                mock.patch('flowlib.task.BPMNTask.to_kubernetes', side_effect=AssertionError):
+            topics = process.kafka_topics
+            self.assertIs(process.kafka_topics, topics)
+        self.assertEqual(len(topics), 49)
+        self.assertEqual(targets.call_count, 50)  # once per component
+        self.assertEqual(topics, topics_from_specs(process))
+
+
+if __name__ == '__main__':
+    unittest.main()
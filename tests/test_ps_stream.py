@@ -0,0 +1,143 @@
+'''Tests for the streaming, paginated PSQuery, against a FakeEtcd.
+'''
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import threading
+import unittest
+
+from grpc.experimental import aio
+
+from flowctl.actions import ps_action
+from flowd.dispatch import RpcDispatcher
+from flowd.flow_daemon import Flow
+from flowd.handlers.handle_ps import decode_page_token, stream_instances
+from flowlib import flow_pb2, flow_pb2_grpc
+from flowlib.constants import WorkflowInstanceKeys
+from flowlib.flowd_utils import get_flowd_connection
+from flowlib.instance_index import check_index
+from tests.fake_etcd import EtcdTestCase
+
+
+def put_instance(etcd, iid, state, **metadata):
+    keys = WorkflowInstanceKeys(iid)
+    etcd.put(keys.state, state)
+    etcd.put(keys.proc, '<bpmn>' * 100)
+    etcd.put(keys.metadata, json.dumps(metadata))
+    if state == 'ERROR':
+        etcd.put(keys.content_type, 'application/json')
+        etcd.put(keys.result, json.dumps({'error_code': 'FAILED_TASK'}))
+
+
+class PSStreamTestCase(EtcdTestCase):
+    def setUp(self):
+        super().setUp()
+        for n in range(120):
+            put_instance(self.etcd, f'alpha-1-{n:04}', 'ERROR' if n % 10 == 0 else 'COMPLETED', n=str(n % 3))
+        for n in range(30):
+            put_instance(self.etcd, f'beta-2-{n:04}', 'RUNNING')
+
+
+class TestStreamInstances(PSStreamTestCase):
+    def stream(self, **kws):
+        return list(stream_instances(self.etcd, flow_pb2.PSStreamRequest(**kws)))
+
+    def test_pages(self):
+        pages = self.stream(page_size=50)
+        self.assertEqual([len(json.loads(page.data)) for page in pages], [50, 50, 50, 0])
+        self.assertEqual(decode_page_token(pages[0].next_page_token), 'alpha-1-0049')
+        self.assertEqual(pages[-1].next_page_token, '')
+        ids = [iid for page in pages for iid in json.loads(page.data)]
+        self.assertEqual(len(set(ids)), 150)
+        error = json.loads(pages[0].data)['alpha-1-0010']
+        self.assertEqual(error['error_code'], 'FAILED_TASK')
+        self.assertEqual(error['metadata'], {'n': '1'})
+
+    def test_filters_and_projection(self):
+        pages = self.stream(states=['ERROR', 'RUNNING'], fields=['state'], page_size=1000)
+        instances = json.loads(pages[0].data)
+        self.assertEqual(len(instances), 12 + 30)
+        self.assertEqual(instances['alpha-1-0020'], {'state': 'ERROR'})
+        pages = self.stream(workflow_id_prefix='beta', fields=['state', 'metadata'])
+        self.assertEqual(set(json.loads(pages[0].data)), {f'beta-2-{n:04}' for n in range(30)})
+        pages = self.stream(metadata=[flow_pb2.StringPair(key='n', value='2')], page_size=1000)
+        self.assertEqual(len(json.loads(pages[0].data)), 40)
+
+    def test_limit_and_resume(self):
+        first = self.stream(limit=70, page_size=50, workflow_id_prefix='alpha')
+        self.assertEqual([len(json.loads(page.data)) for page in first], [50, 20])
+        rest = self.stream(page_token=first[-1].next_page_token, workflow_id_prefix='alpha')
+        ids = [iid for page in first + rest for iid in json.loads(page.data)]
+        self.assertEqual(ids, [f'alpha-1-{n:04}' for n in range(120)])
+        # a token from outside the prefix does not widen the scan
+        rest = self.stream(page_token=first[-1].next_page_token, workflow_id_prefix='beta')
+        self.assertEqual(len(json.loads(rest[0].data)), 30)
+
+
+class TestStreamInstancesFromIndex(TestStreamInstances):
+    '''The same queries, with filtered ones answered from the instance index.'''
+    def setUp(self):
+        super().setUp()
+        check_index(self.etcd, repair=True)
+
+    def test_filters_read_only_candidates(self):
+        self.etcd.reset_calls()
+        pages = self.stream(states=['ERROR'], page_size=1000)
+        self.assertEqual(len(json.loads(pages[0].data)), 12)
+        # one range over the ERROR index, one transaction reading the 12
+        self.assertEqual((self.etcd.calls['Range'], self.etcd.calls['Txn']), (2, 1))
+
+
+class TestPSQueryStreamRpc(PSStreamTestCase):
+    '''flowctl ps against a real gRPC server.'''
+    def setUp(self):
+        super().setUp()
+        self.dispatcher = RpcDispatcher(workers=2)
+        self.addCleanup(self.dispatcher.shutdown)
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def serve():
+            self.stopping = asyncio.Event()
+            self.server = aio.server()
+            flow_pb2_grpc.add_FlowDaemonServicer_to_server(Flow(self.dispatcher), self.server)
+            self.port = self.server.add_insecure_port('127.0.0.1:0')
+            await self.server.start()
+            started.set()
+            await self.stopping.wait()
+            await self.server.stop(None)
+
+        self.thread = threading.Thread(target=self.loop.run_until_complete, args=(serve(),), daemon=True)
+        self.thread.start()
+        started.wait(5)
+        self.addCleanup(self.stop_server)
+
+    def stop_server(self):
+        self.loop.call_soon_threadsafe(self.stopping.set)
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.loop.close()
+
+    def ps(self, *args):
+        parser = ps_action.__refine_args__(argparse.ArgumentParser())
+        namespace = parser.parse_args(['-o', *args])
+        stdout = io.StringIO()
+        with get_flowd_connection('127.0.0.1', self.port) as flowd, contextlib.redirect_stdout(stdout):
+            status = ps_action.ps_stream(flowd, namespace)
+        return status, json.loads(stdout.getvalue())
+
+    def test_flowctl_ps_streams(self):
+        status, instances = self.ps('--page-size', '7', '--fields', 'state')
+        self.assertEqual(status, 0)
+        self.assertEqual(len(instances), 150)
+        self.assertEqual(instances['beta-2-0003'], {'state': 'RUNNING'})
+        status, instances = self.ps('--state', 'ERROR', '--limit', '5')
+        self.assertEqual(list(instances), [f'alpha-1-{n:04}' for n in range(0, 50, 10)])
+        stats = self.dispatcher.stats()['ps_stream']
+        self.assertEqual((stats['calls'], stats['errors']), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
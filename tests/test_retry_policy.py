@@ -0,0 +1,111 @@
+'''Tests for flowlib.retry_policy, and FlowPost's retries against a local
+HTTP stand-in.
+'''
+import unittest
+from unittest import mock
+
+from flowlib import flowpost
+from flowlib.bpmn_util import CallProperties
+from flowlib.constants import ErrorCodes
+from flowlib.failure_reporter import decode_failures
+from flowlib.flowpost import FlowPost, FlowPostStatus
+from flowlib.http_sessions import SessionPool
+from flowlib.retry_policy import RetryBudget, RetryPolicy
+from flowlib.shadowing import get_shadower
+from tests.http_stub import HttpStub
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_backoff_is_capped_and_jittered(self):
+        policy = RetryPolicy(total_attempts=10, backoff_base=0.1, backoff_max=0.5)
+        delays = [policy.backoff(1) for _ in range(200)]
+        self.assertTrue(all(0 <= d <= 0.1 for d in delays))
+        self.assertGreater(len(set(delays)), 1)
+        self.assertTrue(all(0 <= policy.backoff(8) <= 0.5 for _ in range(200)))
+
+    def test_attempts(self):
+        policy = RetryPolicy(total_attempts=3, budget=RetryBudget())
+        self.assertEqual([policy.should_retry(n) for n in (1, 2, 3)], [True, True, False])
+
+    def test_budget(self):
+        budget = RetryBudget(percent=10, min_per_second=0, window=10)
+        for _ in range(50):
+            budget.record_call()
+        allowed = sum(budget.try_withdraw() for _ in range(20))
+        self.assertEqual(allowed, 5)
+        self.assertEqual(budget.stats()['denied'], 15)
+
+    def test_from_call_properties(self):
+        props = CallProperties()
+        props.update({'retry': {'total_attempts': 4, 'backoff_max': 1, 'retryable_statuses': [503]}})
+        policy = props.retry_policy
+        self.assertEqual(policy.total_attempts, 4)
+        self.assertEqual(policy.backoff_max, 1.0)
+        self.assertFalse(policy.is_retryable_status(502))
+        self.assertEqual(CallProperties().retry_policy.total_attempts, 2)
+
+
+class TestFlowPostRetries(unittest.TestCase):
+    def setUp(self):
+        self.task = HttpStub().start()
+        self.flowd = HttpStub().start()
+        self.shadow = HttpStub().start()
+        for stub in (self.task, self.flowd, self.shadow):
+            self.addCleanup(stub.stop)
+        self.pool = SessionPool()
+        self.addCleanup(self.pool.close)
+        for name, value in (
+            ('get_session_pool', mock.Mock(return_value=self.pool)),
+            ('INSTANCE_FAIL_ENDPOINT', self.flowd.url('/instancefail')),
+        ):
+            patcher = mock.patch.object(flowpost, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.budget = RetryBudget()
+
+    def send(self, total_attempts=3):
+        poster = FlowPost(
+            'wf-did-iid', 'task-1', b'{}', url=self.task.url('/'),
+            shadow_url=self.shadow.url('/'),
+            retry_policy=RetryPolicy(total_attempts, backoff_base=0.01, budget=self.budget),
+        )
+        result = poster.send()
+        get_shadower(self.shadow.url('/')).flush()
+        return result
+
+    def reported_error(self):
+        [(_, payload)] = decode_failures(self.flowd.requests[0][3])
+        return payload['error_code']
+
+    def test_unavailable_is_retried_and_shadowed_once(self):
+        self.task.statuses = [503, 502]
+        self.assertEqual(self.send().message, FlowPostStatus.SUCCESS)
+        self.assertEqual(len(self.task.requests), 3)
+        self.assertEqual(len(self.shadow.requests), 1)
+        self.assertEqual(self.budget.stats()['retries'], 2)
+
+    def test_client_error_is_not_retried(self):
+        self.task.status = 404
+        self.assertEqual(self.send().message, FlowPostStatus.REPORTED_ERROR)
+        self.assertEqual(len(self.task.requests), 1)
+        self.assertEqual(self.reported_error(), ErrorCodes.FAILED_TASK)
+
+    def test_exhausted_retries_report_connection_error(self):
+        self.task.status = 503
+        self.assertEqual(self.send().message, FlowPostStatus.REPORTED_ERROR)
+        self.assertEqual(len(self.task.requests), 3)
+        self.assertEqual(len(self.shadow.requests), 1)
+        self.assertEqual(
+            self.reported_error(), ErrorCodes.FAILED_CONNECTION,
+        )
+
+    def test_budget_stops_retries(self):
+        self.budget = RetryBudget(percent=0, min_per_second=0)
+        self.task.status = 503
+        self.send()
+        self.assertEqual(len(self.task.requests), 1)
+        self.assertEqual(self.budget.stats()['denied'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+'''Tests for the RunWorkflowBatch handler and flowctl's bulk run mode.
+'''
+import argparse
+import contextlib
+import io
+import json
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import grpc
+
+from flowctl.actions import run_action
+from flowd.handlers import handle_run_batch
+from flowlib import flow_pb2, workflow
+from flowlib.constants import WorkflowInstanceKeys, WorkflowKeys
+from flowlib.instance_index import find_instances
+from tests.fake_etcd import EtcdTestCase
+
+
+class FakeDeployment:
+    def __init__(self, did):
+        self.id = did
+        self.keys = WorkflowKeys(did)
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class FakeInstance:
+    '''Stands in for WorkflowInstance; tracks how many start events run at once.'''
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    def __init__(self, parent, id=None):
+        self.parent = parent
+
+    def start_target(self, start_event_id=None):
+        if start_event_id == 'ambiguous':
+            return None, {'status': -1, 'message': 'Must choose between following start events'}
+        return 'start', None
+
+    def call_start_event(self, task_id, args=()):
+        with FakeInstance.lock:
+            FakeInstance.active += 1
+            FakeInstance.peak = max(FakeInstance.peak, FakeInstance.active)
+        time.sleep(0.01)
+        with FakeInstance.lock:
+            FakeInstance.active -= 1
+        if args[0] == 'fail':
+            return FakeResponse(503)
+        return FakeResponse(200, {'id': f'{self.parent.id}-{args[0]}', 'status': 0, 'message': 'Ok'})
+
+
+def batch_request(count, **kws):
+    return flow_pb2.RunBatchRequest(workflow_id='wf', items=[
+        flow_pb2.RunBatchItem(args=[str(n)], metadata=[flow_pb2.StringPair(key='n', value=str(n))])
+        for n in range(count)
+    ], **kws)
+
+
+class TestRunBatchHandler(EtcdTestCase):
+    def setUp(self):
+        super().setUp()
+        FakeInstance.peak = 0
+        for target, name, value in [
+            (workflow, 'WorkflowInstance', FakeInstance),
+            (workflow.Workflow, 'from_id', lambda did: FakeDeployment(did)),
+        ]:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.etcd.put(WorkflowKeys.state_key('wf'), 'RUNNING')
+
+    def test_starts_every_item_concurrently(self):
+        request = batch_request(40, parallelism=8)
+        request.items[3].args[0] = 'fail'
+        request.items[5].start_event_id = 'ambiguous'
+        self.etcd.reset_calls()
+        results = handle_run_batch.handler(request)
+        self.assertEqual(len(results), 40)
+        self.assertEqual(results[0], {'status': 0, 'message': 'Ok', 'id': 'wf-0'})
+        self.assertEqual(results[3]['status'], -1)
+        self.assertIn('503', results[3]['message'])
+        self.assertIn('Must choose', results[5]['message'])
+        self.assertEqual(sum(result['status'] == 0 for result in results), 38)
+        self.assertTrue(1 < FakeInstance.peak <= 8)
+        # 38 instances x (metadata + one index entry) fit in one transaction
+        self.assertEqual(self.etcd.calls['Txn'], 1)
+        self.assertEqual(self.etcd.get(WorkflowInstanceKeys.metadata_key('wf-7'))[0], b'{"n": "7"}')
+        self.assertIsNone(self.etcd.get(WorkflowInstanceKeys.metadata_key('wf-3'))[0])
+        self.assertEqual(list(find_instances(self.etcd, metadata={'n': '7'})), ['wf-7'])
+
+    def test_metadata_is_written_in_bounded_transactions(self):
+        self.etcd.reset_calls()
+        results = handle_run_batch.handler(batch_request(200))
+        self.assertTrue(all(result['status'] == 0 for result in results))
+        self.assertEqual(self.etcd.calls['Txn'], 4)  # 400 ops, at most 128 a txn
+
+    def test_deployment_not_running(self):
+        self.etcd.put(WorkflowKeys.state_key('wf'), 'STOPPED')
+        results = handle_run_batch.handler(batch_request(3))
+        self.assertEqual([result['status'] for result in results], [-1, -1, -1])
+        self.assertEqual(FakeInstance.peak, 0)
+
+
+class FakeRpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+class FakeFlowd:
+    def __init__(self, batch=True):
+        self.batch = batch
+        self.requests = []
+
+    def RunWorkflowBatch(self, request):
+        if not self.batch:
+            raise FakeRpcError(grpc.StatusCode.UNIMPLEMENTED)
+        self.requests.append(request)
+        return flow_pb2.FlowdResult(status=0, message='Ok', data=json.dumps([
+            {'status': 0, 'message': 'Ok', 'id': f'wf-{item.args[0]}'} for item in request.items
+        ]))
+
+    def RunWorkflow(self, request):
+        self.requests.append(request)
+        return flow_pb2.FlowdResult(status=0, message='Ok', data=json.dumps(
+            {'status': 0, 'message': 'Ok', 'id': f'wf-{request.args[0]}'}
+        ))
+
+
+class TestFlowctlRunBatch(unittest.TestCase):
+    def run_batch(self, flowd, lines, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as batch_file:
+            batch_file.write('\n'.join(lines))
+            batch_file.flush()
+            parser = run_action.__refine_args__(argparse.ArgumentParser())
+            namespace = parser.parse_args(['-o', 'wf', '--batch-file', batch_file.name, *args])
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                status = run_action.run_batch(flowd, namespace)
+        return status, [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_file_is_sent_in_chunks(self):
+        lines = [json.dumps({'args': [n], 'metadata': {'n': n}}) for n in range(25)] + ['']
+        flowd = FakeFlowd()
+        status, results = self.run_batch(flowd, lines, '--batch-size', '10', '--parallelism', '4')
+        self.assertEqual(status, 0)
+        self.assertEqual([len(request.items) for request in flowd.requests], [10, 10, 5])
+        self.assertEqual(flowd.requests[0].parallelism, 4)
+        self.assertEqual(flowd.requests[2].items[4].metadata[0].value, '24')
+        self.assertEqual([result['id'] for result in results], [f'wf-{n}' for n in range(25)])
+
+    def test_falls_back_to_single_runs(self):
+        flowd = FakeFlowd(batch=False)
+        status, results = self.run_batch(flowd, [json.dumps({'args': [n]}) for n in range(3)])
+        self.assertEqual(status, 0)
+        self.assertEqual([type(request) for request in flowd.requests], [flow_pb2.RunRequest] * 3)
+        self.assertEqual([result['id'] for result in results], ['wf-0', 'wf-1', 'wf-2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+'''Tests for flowlib.shadowing.
+'''
+import json
+import threading
+import unittest
+
+from flowlib.constants import Headers
+from flowlib.shadowing import (
+    HttpBatchSink,
+    KafkaSink,
+    TrafficShadower,
+    decode_batch,
+    encode_batch,
+    publisher_message,
+)
+from tests.http_stub import HttpStub
+
+
+class ListSink:
+    def __init__(self, block: threading.Event = None, fail: bool = False):
+        self.batches = []
+        self.block = block
+        self.fail = fail
+
+    def send(self, records):
+        if self.block is not None:
+            self.block.wait()
+        if self.fail:
+            raise ConnectionError('down')
+        self.batches.append(records)
+
+
+class FakeProducer:
+    def __init__(self):
+        self.produced = []
+        self.flushes = 0
+
+    def produce(self, topic, body, headers=None):
+        self.produced.append((topic, json.loads(body), headers))
+
+    def flush(self):
+        self.flushes += 1
+
+
+def record(n):
+    return f'{{"n": {n}}}'.encode(), {Headers.X_HEADER_FLOW_ID: f'iid-{n}'}
+
+
+class TestTrafficShadower(unittest.TestCase):
+    def test_records_are_batched(self):
+        sink = ListSink()
+        shadower = TrafficShadower(sink, max_queue=100, batch_size=10, linger=1)
+        for n in range(25):
+            self.assertTrue(shadower.submit(*record(n)))
+        self.assertTrue(shadower.close(timeout=5))
+        self.assertEqual([len(batch) for batch in sink.batches], [10, 10, 5])
+        self.assertEqual([data for batch in sink.batches for data, _ in batch], [record(n)[0] for n in range(25)])
+        stats = shadower.stats()
+        self.assertEqual((stats['sent'], stats['batches'], stats['queued']), (25, 3, 0))
+
+    def test_full_queue_drops_without_blocking(self):
+        block = threading.Event()
+        sink = ListSink(block)
+        shadower = TrafficShadower(sink, max_queue=5, batch_size=1, linger=0)
+        accepted = sum(shadower.submit(*record(n)) for n in range(20))
+        block.set()
+        shadower.close(timeout=5)
+        stats = shadower.stats()
+        self.assertLess(accepted, 20)
+        self.assertEqual(stats['dropped'], 20 - accepted)
+        self.assertEqual(stats['sent'], accepted)
+
+    def test_sink_failures_are_counted(self):
+        shadower = TrafficShadower(ListSink(fail=True), batch_size=10, linger=0)
+        for n in range(3):
+            shadower.submit(*record(n))
+        shadower.close(timeout=5)
+        self.assertEqual(shadower.stats()['failed'], 3)
+        self.assertFalse(shadower.submit(*record(4)))
+
+
+class TestSinks(unittest.TestCase):
+    def test_batch_round_trip(self):
+        records = [record(1), ('not json', {'a': 'b'})]
+        self.assertEqual(decode_batch(encode_batch(records)), [record(1), (b'not json', {'a': 'b'})])
+
+    def test_http_batch_sink(self):
+        with HttpStub() as stub:
+            HttpBatchSink(stub.url('/')).send([record(1), record(2)])
+            self.assertEqual(len(stub.requests), 1)
+            method, path, _, body = stub.requests[0]
+            self.assertEqual((method, path), ('POST', '/batch'))
+            self.assertEqual(decode_batch(body), [record(1), record(2)])
+
+    def test_http_sink_falls_back_to_single_posts(self):
+        with HttpStub() as stub:
+            stub.statuses = [404]
+            sink = HttpBatchSink(stub.url('/'))
+            sink.send([record(1), record(2)])
+            sink.send([record(3)])
+            self.assertEqual([r[1] for r in stub.requests], ['/batch', '/', '/', '/'])
+            self.assertEqual(stub.requests[-1][3], record(3)[0])
+
+    def test_kafka_sink_matches_publisher_format(self):
+        producer = FakeProducer()
+        data, headers = record(1)
+        headers[Headers.X_HEADER_WORKFLOW_ID] = 'wf-did'
+        KafkaSink('shadow-topic', producer).send([(data, headers)])
+        body, message_headers = publisher_message('wf-did', data, headers)
+        self.assertEqual(producer.produced, [('shadow-topic', json.loads(body), message_headers)])
+        self.assertEqual(message_headers['instance_id'], 'iid-1')
+        self.assertEqual(producer.flushes, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
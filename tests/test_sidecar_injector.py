@@ -0,0 +1,181 @@
+'''Tests for the in-process sidecar injection meant to replace istioctl
+kube-inject, which stays the default until it is checked against recorded
+istioctl output.
+
+super_happy_specs.yaml holds the specs generated for super_happy.bpmn, and
+super_happy_injected.yaml the same specs after injection with the default
+template, which test_fixtures_are_current keeps in step with spec
+generation. What istioctl 1.8.2 kube-inject makes of the same specs is
+recorded, offline, as super_happy_istioctl.yaml by
+tests/record_istioctl_injection.py; once it is, the default template is
+checked against it. With istioctl on the PATH (and a cluster, or
+ISTIO_CONFIG_DIR, to read the injector config from), test_matches_istioctl
+also checks it against a live run.
+'''
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+from flowlib import bpmn, sidecar_injector
+from tests.test_compiled_process import parse
+
+
+TESTS = os.path.dirname(__file__)
+TEMPLATE = sidecar_injector.default_template('rex-proxy:1.8.2')
+
+
+def read(name):
+    with open(os.path.join(TESTS, name), 'r') as spec_file:
+        return spec_file.read()
+
+
+def injected(specs_yaml, template=TEMPLATE):
+    specs = list(yaml.safe_load_all(specs_yaml))
+    sidecar_injector.inject_sidecars(specs, template)
+    return yaml.safe_dump_all(specs)
+
+
+def normalized(value):
+    '''value without the fields istioctl writes out at their zero values,
+    and without the template version, which istioctl takes from its own
+    rendering of the template.
+    '''
+    if isinstance(value, dict):
+        result = {key: normalized(item) for key, item in value.items() if item not in (None, {})}
+        status = result.get(sidecar_injector.STATUS_ANNOTATION)
+        if status is not None:
+            status = yaml.safe_load(status)
+            del status['version']
+            result[sidecar_injector.STATUS_ANNOTATION] = status
+        return result
+    if isinstance(value, list):
+        return [normalized(item) for item in value]
+    return value
+
+
+class TestSidecarInjector(unittest.TestCase):
+    def test_matches_the_fixture(self):
+        self.assertEqual(injected(read('super_happy_specs.yaml')), read('super_happy_injected.yaml'))
+
+    def test_fixtures_are_current(self):
+        process = parse(os.path.join(TESTS, 'super_happy.bpmn'))
+        with mock.patch.object(bpmn, 'DO_MANUAL_INJECTION', False):
+            self.assertEqual(process._generate_istio_specs(None), read('super_happy_specs.yaml'))
+        with mock.patch.object(bpmn, 'DO_MANUAL_INJECTION', True), \
+                mock.patch.object(bpmn, 'get_injector', return_value='native'), \
+                mock.patch.object(sidecar_injector, 'get_template', return_value=TEMPLATE):
+            self.assertEqual(process._generate_istio_specs(None), read('super_happy_injected.yaml'))
+
+    @unittest.skipUnless(
+        os.path.exists(os.path.join(TESTS, 'super_happy_istioctl.yaml')),
+        'istioctl output not recorded: see tests/record_istioctl_injection.py',
+    )
+    def test_matches_recorded_istioctl(self):
+        self.assertEqual(
+            normalized(list(yaml.safe_load_all(read('super_happy_injected.yaml')))),
+            normalized(list(yaml.safe_load_all(read('super_happy_istioctl.yaml')))),
+        )
+
+    @unittest.skipIf(shutil.which('istioctl') is None, 'needs istioctl')
+    def test_matches_istioctl(self):
+        specs_yaml = read('super_happy_specs.yaml')
+        self.assertEqual(
+            normalized(list(yaml.safe_load_all(injected(specs_yaml)))),
+            normalized(list(yaml.safe_load_all(sidecar_injector.istioctl_inject(specs_yaml, os.getenv('ISTIO_CONFIG_DIR'))))),
+        )
+
+    def test_istioctl_is_the_default(self):
+        with mock.patch.object(sidecar_injector, '_injector', None), \
+                mock.patch.object(sidecar_injector.shutil, 'which', return_value='/usr/local/bin/istioctl'):
+            self.assertEqual(sidecar_injector.get_injector(), 'istioctl')
+        with mock.patch.object(sidecar_injector, '_injector', None), \
+                mock.patch.object(sidecar_injector.shutil, 'which', return_value=None), \
+                self.assertLogs(level='WARNING'):
+            self.assertEqual(sidecar_injector.get_injector(), 'native')
+        process = parse(os.path.join(TESTS, 'super_happy.bpmn'))
+        with mock.patch.object(bpmn, 'DO_MANUAL_INJECTION', True), \
+                mock.patch.object(bpmn, 'get_injector', return_value='istioctl'), \
+                mock.patch.object(bpmn, 'istioctl_inject', return_value='injected') as istioctl_inject:
+            self.assertEqual(process._generate_istio_specs(None), 'injected')
+        istioctl_inject.assert_called_once_with(read('super_happy_specs.yaml'))
+
+    def test_rewrites_app_probes(self):
+        specs = list(yaml.safe_load_all(read('super_happy_specs.yaml')))
+        pod = next(spec for spec in specs if spec['kind'] == 'Deployment')['spec']['template']
+        app = pod['spec']['containers'][0]
+        app['ports'] = [{'containerPort': 80, 'name': 'http'}]
+        app['readinessProbe']['httpGet'].update(port='http', scheme='HTTPS')
+        sidecar_injector.inject_sidecars(specs, TEMPLATE)
+        app, proxy = pod['spec']['containers']
+        self.assertEqual(app['livenessProbe']['httpGet'], {'path': '/app-health/happiness/livez', 'port': 15020})
+        self.assertEqual(
+            app['readinessProbe']['httpGet'],
+            {'path': '/app-health/happiness/readyz', 'port': 15020, 'scheme': 'HTTP'},
+        )
+        self.assertEqual(app['livenessProbe']['initialDelaySeconds'], 30)
+        self.assertEqual(proxy['env'][-1], {
+            'name': 'ISTIO_KUBE_APP_PROBERS',
+            'value': '{"/app-health/happiness/livez":{"httpGet":{"path":"/","port":80},"timeoutSeconds":5},'
+                     '"/app-health/happiness/readyz":{"httpGet":{"path":"/","port":80,"scheme":"HTTPS"},'
+                     '"timeoutSeconds":5}}',
+        })
+        self.assertEqual(proxy['readinessProbe']['httpGet'], {'path': '/healthz/ready', 'port': 15021})
+
+    def test_probe_rewrite_opt_out(self):
+        specs = list(yaml.safe_load_all(read('super_happy_specs.yaml')))
+        pod = next(spec for spec in specs if spec['kind'] == 'Deployment')['spec']['template']
+        pod['metadata']['annotations'] = {sidecar_injector.REWRITE_PROBES_ANNOTATION: 'false'}
+        original = pod['spec']['containers'][0]['livenessProbe']
+        sidecar_injector.inject_sidecars(specs, TEMPLATE)
+        app, proxy = pod['spec']['containers']
+        self.assertEqual(app['livenessProbe'], original)
+        self.assertNotIn('ISTIO_KUBE_APP_PROBERS', [env['name'] for env in proxy['env']])
+
+    def test_skips(self):
+        specs = list(yaml.safe_load_all(read('super_happy_specs.yaml')))
+        deployments = [spec for spec in specs if spec['kind'] == 'Deployment']
+        deployments[0]['spec']['template']['metadata']['annotations'] = {
+            sidecar_injector.INJECT_ANNOTATION: 'false',
+        }
+        deployments[1]['spec']['template']['spec']['hostNetwork'] = True
+        self.assertEqual(sidecar_injector.inject_sidecars(specs, TEMPLATE), 1)
+        self.assertEqual(sidecar_injector.inject_sidecars(specs, TEMPLATE), 0)  # already injected
+        self.assertEqual(
+            [len(deployment['spec']['template']['spec']['containers']) for deployment in deployments],
+            [1, 1, 2],
+        )
+
+    def test_template_file(self):
+        template = {
+            'containers': [{'name': 'sidecar', 'image': 'sidecar:1', 'args': ['--owner', '${owner}']}],
+            'labels': {'sidecar': '${app}'},
+            'imagePullPolicy': 'Never',
+        }
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        path = os.path.join(temp_dir.name, 'template.yaml')
+        with open(path, 'w') as template_file:
+            yaml.safe_dump(template, template_file)
+        specs = list(yaml.safe_load_all(read('super_happy_specs.yaml')))
+        sidecar_injector.inject_sidecars(specs, sidecar_injector.load_template(path))
+        pod = next(spec for spec in specs if spec['kind'] == 'Deployment')['spec']['template']
+        self.assertEqual(pod['metadata']['labels']['sidecar'], 'happiness')
+        self.assertEqual(pod['spec']['containers'][-1], {
+            'name': 'sidecar',
+            'image': 'sidecar:1',
+            'args': [
+                '--owner',
+                'kubernetes://apis/apps/v1/namespaces/process-0wcmy6c-2a1b7a31/deployments/happiness',
+            ],
+            'imagePullPolicy': 'Never',
+        })
+        self.assertEqual(pod['spec']['containers'][0]['imagePullPolicy'], 'Never')
+        self.assertNotIn('securityContext', pod['spec'])
+
+
+if __name__ == '__main__':
+    unittest.main()
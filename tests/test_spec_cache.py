@@ -0,0 +1,155 @@
+'''Tests for the tiered cache of generated k8s specs.
+'''
+from io import BytesIO
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from flowlib import bpmn
+from flowlib.constants import WorkflowKeys
+from flowlib.spec_cache import SpecCache
+from tests.test_compiled_process import BPMN_FILES, parse
+
+
+class FakeBucket:
+    '''Just enough of a boto3 Bucket for the S3 tier.'''
+    def __init__(self):
+        self.objects = {}
+        self.downloads = 0
+
+    def download_fileobj(self, key, fileobj):
+        self.downloads += 1
+        if key not in self.objects:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        fileobj.write(self.objects[key])
+
+    def upload_fileobj(self, fileobj: BytesIO, key):
+        self.objects[key] = fileobj.read()
+
+    def delete_objects(self, Delete):
+        for obj in Delete['Objects']:
+            self.objects.pop(obj['Key'], None)
+
+
+class TestSpecCache(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory = temp_dir.name
+        self.bucket = FakeBucket()
+        self.compiles = []
+
+    def new_cache(self, **kws):
+        kws.setdefault('directory', self.directory)
+        return SpecCache(**kws)
+
+    def compile(self, specs):
+        def compile():
+            self.compiles.append(specs)
+            return specs
+        return compile
+
+    def test_tiers(self):
+        cache = self.new_cache(s3_bucket=self.bucket)
+        self.assertEqual(cache.get_or_compile('wf-1', 'k1', self.compile('a: 1\n')), 'a: 1\n')
+        self.assertEqual(cache.get_or_compile('wf-1', 'k1', self.compile('a: 2\n')), 'a: 1\n')
+        self.assertEqual(self.compiles, ['a: 1\n'])
+        self.assertEqual(self.bucket.objects, {WorkflowKeys.specs_key('wf-1'): b'a: 1\n'})
+        self.assertEqual(self.bucket.downloads, 1)
+
+        # a restarted flowd finds the specs on disk, without going to S3
+        restarted = self.new_cache(s3_bucket=self.bucket)
+        self.assertEqual(restarted.get('wf-1', 'k1'), 'a: 1\n')
+        self.assertEqual(restarted.get('wf-1', 'k1'), 'a: 1\n')
+        self.assertEqual(self.bucket.downloads, 1)
+        # one on another host (or after an upgrade) gets the pinned specs from S3
+        elsewhere = self.new_cache(directory=None, s3_bucket=self.bucket)
+        self.assertEqual(elsewhere.get_or_compile('wf-1', 'k2', self.compile('a: 3\n')), 'a: 1\n')
+        self.assertEqual(self.compiles, ['a: 1\n'])
+
+        self.assertEqual(cache.stats()['hits'], {'memory': 1, 'disk': 0, 's3': 0})
+        self.assertEqual(restarted.stats()['hits'], {'memory': 1, 'disk': 1, 's3': 0})
+        stats = elsewhere.stats()
+        self.assertEqual((stats['hits']['s3'], stats['misses'], stats['compiles']), (1, 0, 0))
+        self.assertEqual(cache.stats()['hit_ratio'], 0.5)
+
+    def test_invalidate(self):
+        cache = self.new_cache(s3_bucket=self.bucket)
+        cache.put('wf-1', 'k1', 'a: 1\n')
+        cache.put('wf-1', 'k2', 'a: 2\n')
+        cache.put('wf-2', 'k1', 'b: 1\n')
+        cache.invalidate('wf-1')
+        self.assertEqual(os.listdir(self.directory), ['wf-2'])
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['disk_entries'], stats['invalidations']), (1, 1, 1))
+        # S3 still has the pinned specs, unless those go too
+        self.assertEqual(cache.get('wf-1', 'k1'), 'a: 2\n')
+        cache.invalidate('wf-1', pinned=True)
+        self.assertIsNone(self.new_cache(directory=None, s3_bucket=self.bucket).get('wf-1', 'k1'))
+
+        cache.clear()
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertIsNone(self.new_cache().get('wf-2', 'k1'))
+
+    def test_bounded_lru(self):
+        cache = self.new_cache(max_bytes=10, disk_max_bytes=15)
+        cache.put('wf-1', 'k', 'x' * 5)
+        cache.put('wf-2', 'k', 'y' * 5)
+        self.assertEqual(cache.get('wf-1', 'k'), 'x' * 5)
+        cache.put('wf-3', 'k', 'z' * 5)
+        cache.put('wf-4', 'k', 'w' * 20)  # too big for either tier
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['bytes']), (2, 10))
+        self.assertEqual((stats['disk_entries'], stats['disk_bytes']), (3, 15))
+        self.assertEqual(cache.get('wf-2', 'k'), 'y' * 5)  # from disk
+        cache.put('wf-5', 'k', 'v' * 5)
+        # wf-1 was used last on disk before wf-3, wf-2 and wf-5
+        self.assertEqual(sorted(os.listdir(self.directory)), ['wf-2', 'wf-3', 'wf-5'])
+        self.assertEqual(self.new_cache().stats()['disk_bytes'], 15)
+
+
+class TestProcessSpecs(unittest.TestCase):
+    def setUp(self):
+        self.cache = SpecCache()
+        for patcher in (
+            mock.patch.object(bpmn, 'get_spec_cache', return_value=self.cache),
+            mock.patch.object(bpmn, 'DO_MANUAL_INJECTION', False),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_generated_once_across_processes(self):
+        original = parse(BPMN_FILES[-1])
+        with mock.patch.object(
+            bpmn.BPMNProcess, '_generate_istio_specs', autospec=True,
+            side_effect=bpmn.BPMNProcess._generate_istio_specs,
+        ) as generate:
+            specs = original.to_istio_helper(None)
+            self.assertEqual(parse(BPMN_FILES[-1]).to_istio_helper(None), specs)
+            loaded = bpmn.BPMNProcess.from_compiled(original.to_compiled())
+            self.assertEqual(loaded.to_istio_helper(None), specs)
+            self.assertEqual(generate.call_count, 1)
+            original.to_istio_helper(original.properties.id_hash)
+            self.assertEqual(generate.call_count, 2)
+        self.assertIn('kind: Deployment', specs)
+        self.assertEqual(self.cache.stats()['hits']['memory'], 2)
+
+    def test_keys(self):
+        process = parse(BPMN_FILES[-1])
+        self.assertEqual(process.spec_key(None), parse(BPMN_FILES[-1]).spec_key(None))
+        keys = {
+            process.spec_key(None),
+            process.spec_key('abc'),
+            process.spec_key(None, width=100),
+            parse(BPMN_FILES[0]).spec_key(None),
+        }
+        with mock.patch.object(bpmn, 'SPEC_COMPILER', bpmn.SPEC_COMPILER + '.next'):
+            keys.add(process.spec_key(None))
+        self.assertEqual(len(keys), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+'''Tests for the spec writer, which dumps (and injects) large spec lists on a
+process pool, and for the indexes spec generation builds once per process.
+'''
+import os
+import unittest
+from unittest import mock
+
+import xmltodict
+import yaml
+
+from flowlib import bpmn, bpmn_util, sidecar_injector, spec_writer
+from flowlib.task import BPMNTask
+from tests.benchmarks.bench_spec_generation import make_process_xml
+from tests.test_compiled_process import BPMN_FILES, EXAMPLES, parse, specs
+
+
+TEMPLATE = sidecar_injector.default_template('rex-proxy:1.8.2')
+
+
+def flattened(process):
+    return [spec for component_specs in specs(process) for spec in component_specs]
+
+
+class TestDumpSpecs(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.process = bpmn.BPMNProcess(xmltodict.parse(make_process_xml(30))['bpmn:process'])
+
+    def test_pool_matches_one_dump(self):
+        with mock.patch.object(spec_writer, 'SPEC_PARALLEL_MIN_SPECS', 1):
+            self.assertEqual(
+                spec_writer.dump_specs(flattened(self.process), workers=2),
+                yaml.safe_dump_all(flattened(self.process)),
+            )
+            expected = flattened(self.process)
+            sidecar_injector.inject_sidecars(expected, TEMPLATE)
+            self.assertEqual(
+                spec_writer.dump_specs(flattened(self.process), TEMPLATE, workers=2),
+                yaml.safe_dump_all(expected),
+            )
+
+    def test_dump_options(self):
+        with mock.patch.object(spec_writer, 'SPEC_PARALLEL_MIN_SPECS', 1), \
+                mock.patch.object(spec_writer, 'get_spec_pool', side_effect=AssertionError('used the pool')):
+            self.assertEqual(
+                spec_writer.dump_specs(flattened(self.process), workers=2, default_flow_style=True),
+                yaml.safe_dump_all(flattened(self.process), default_flow_style=True),
+            )
+            self.assertEqual(
+                spec_writer.dump_specs(flattened(self.process), workers=1),
+                yaml.safe_dump_all(flattened(self.process)),
+            )
+
+
+class TestBoundaryEvents(unittest.TestCase):
+    def test_process_construction_scans_boundary_events_once(self):
+        for path in BPMN_FILES:
+            with self.subTest(path=os.path.basename(path)), mock.patch(
+                'flowlib.bpmn_util.iter_xmldict_for_key', wraps=bpmn_util.iter_xmldict_for_key,
+            ) as iter_xmldict_for_key:
+                specs(parse(path))
+                scanned = [call.args[1] for call in iter_xmldict_for_key.call_args_list]
+                self.assertEqual(scanned.count('bpmn:boundaryEvent'), 1)
+
+    def test_indexed_tasks_match_standalone_tasks(self):
+        process = parse(os.path.join(EXAMPLES, 'error_gateway', 'error_gateway.bpmn'))
+        self.assertTrue(any(task._boundary_events for task in process.tasks))
+        for task in process.tasks:
+            standalone = BPMNTask(
+                task._task, process.xmldict, process.properties, annotations=process._annotations,
+            )
+            self.assertEqual(standalone._boundary_events, task._boundary_events)
+            self.assertEqual(
+                standalone.to_kubernetes(
+                    None, process.component_map, process._digraph, process._sequence_flow_table,
+                ),
+                task.to_kubernetes(
+                    None, process.component_map, process._digraph, process._sequence_flow_table,
+                ),
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
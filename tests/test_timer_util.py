@@ -0,0 +1,158 @@
+'''Tests for flowlib.timer_util: the TimerScheduler, and restoring persisted
+timers against the in-memory fake etcd.
+'''
+import json
+import threading
+import time
+import unittest
+
+from flowlib.constants import WorkflowKeys
+from flowlib.timer_util import (
+    TimedEventManager,
+    TimerContext,
+    TimerScheduler,
+    TimeUtc,
+)
+from flowlib.token_api import TokenPool
+from tests.fake_etcd import EtcdTestCase
+
+
+class TestTimerScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = TimerScheduler(name='test-timers', workers=2)
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def test_fires_in_due_order(self):
+        fired = []
+        done = threading.Event()
+        def record(tag):
+            fired.append(tag)
+            if len(fired) == 3:
+                done.set()
+        self.scheduler.schedule(0.06, record, 'c')
+        self.scheduler.schedule(0.02, record, 'a')
+        self.scheduler.schedule(0.04, record, 'b')
+        self.assertTrue(done.wait(2))
+        self.assertEqual(fired, ['a', 'b', 'c'])
+        stats = self.scheduler.stats()
+        self.assertEqual((stats['pending'], stats['fired']), (0, 3))
+
+    def test_cancel(self):
+        fired = threading.Event()
+        call = self.scheduler.schedule(0.02, fired.set)
+        self.assertEqual(self.scheduler.stats()['pending'], 1)
+        self.assertTrue(self.scheduler.cancel(call))
+        self.assertFalse(self.scheduler.cancel(call))
+        self.assertFalse(fired.wait(0.1))
+        self.assertEqual(self.scheduler.stats()['pending'], 0)
+
+    def test_many_timers_use_no_extra_threads(self):
+        before = threading.active_count()
+        count = 1000
+        remaining = [count]
+        lock = threading.Lock()
+        done = threading.Event()
+        def tick():
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    done.set()
+        for i in range(count):
+            self.scheduler.schedule(0.01 + i / 100000, tick)
+        self.assertLessEqual(threading.active_count(), before + 2)
+        self.assertTrue(done.wait(5))
+
+    def test_failing_callback_frees_its_worker(self):
+        done = threading.Event()
+        def boom():
+            raise ValueError('boom')
+        for _ in range(4):
+            self.scheduler.schedule(0, boom)
+        self.scheduler.schedule(0.01, done.set)
+        self.assertTrue(done.wait(2))
+
+
+class TestRestoreTimers(EtcdTestCase):
+    DID = 'wf-did'
+
+    def setUp(self):
+        super().setUp()
+        self.fired = []
+        self.errors = []
+        self.managers = []
+
+    def tearDown(self):
+        for mgr in self.managers:
+            mgr.scheduler.stop()
+        super().tearDown()
+
+    def store_timer(self, n, exec_time, token_pool_id=None):
+        iid = f'{self.DID}-{n:05d}'
+        context = TimerContext.from_json({
+            'guid': f'guid{n}', 'iid': iid, 'timer_type': 'TIME_DURATION',
+            'start_date': exec_time - 300, 'end_date': None, 'interval': 300,
+            'recurrence': 0, 'spec': 'PT5M', 'token_stack': '',
+            'exec_time': exec_time, 'token_pool_id': token_pool_id,
+            'args': ['{}', iid, self.DID, 'application/json'], 'completed': False,
+            'did': self.DID, 'key': f'{WorkflowKeys.timed_events_key(self.DID)}/{iid}',
+        })
+        self.etcd.put(context.key, context.to_json())
+        return context
+
+    def restore(self, policy):
+        mgr = TimedEventManager(
+            self.DID, json.dumps(['timeDuration', 'PT5M']),
+            lambda *args: self.fired.append(args),
+            lambda iid, code, message: self.errors.append(iid),
+            policy,
+        )
+        self.managers.append(mgr)
+        mgr.future.result(timeout=5)
+        return mgr
+
+    def test_restore_is_one_paged_read(self):
+        now = TimeUtc.now()
+        for n in range(250):
+            self.store_timer(n, now + 3600)
+        self.etcd.reset_calls()
+        mgr = self.restore('recover_fail')
+        self.assertEqual(self.etcd.calls['Range'], 1)
+        self.assertEqual(self.etcd.calls['LeaseGrant'], 0)
+        self.assertEqual(mgr.scheduler.stats()['pending'], 250)
+        self.assertEqual(mgr.restore_stats['restored'], 250)
+        self.assertEqual(mgr.restore_stats['expired'], {})
+
+    def test_recover_forget_releases_pools_in_bulk(self):
+        now = TimeUtc.now()
+        pool = TokenPool.create('iid-pool', 10)
+        expired = [self.store_timer(n, now - 60, pool.get_name()) for n in range(6)]
+        self.store_timer(99, now + 3600)
+        self.etcd.reset_calls()
+        mgr = self.restore('recover_forget')
+        # one range read, one read and one write of the pool, one delete txn
+        self.assertEqual(self.etcd.round_trips, 4)
+        self.assertEqual(mgr.restore_stats['expired'], {'RECOVER_FORGET': 6})
+        self.assertEqual(TokenPool.from_pool_name(pool.get_name()).lost, 6)
+        for context in expired:
+            self.assertIsNone(self.etcd.get(context.key)[0])
+        self.assertEqual(mgr.scheduler.stats()['pending'], 1)
+
+    def test_recover_fail_and_fire(self):
+        now = TimeUtc.now()
+        for n in range(3):
+            self.store_timer(n, now - 60)
+        self.restore('recover_fail')
+        self.assertEqual(sorted(self.errors), [f'{self.DID}-{n:05d}' for n in range(3)])
+
+        mgr = self.restore('recover_fire')
+        self.assertEqual(mgr.restore_stats['expired'], {'RECOVER_FIRE': 3})
+        deadline = time.time() + 5
+        while len(self.fired) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.fired), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
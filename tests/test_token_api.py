@@ -0,0 +1,65 @@
+'''Tests for flowlib.token_api, run against the in-memory fake etcd.
+'''
+import unittest
+
+from flowlib.token_api import TokenPool
+from tests.fake_etcd import EtcdTestCase
+
+
+class TestTokenPool(EtcdTestCase):
+    def test_token_life_cycle(self):
+        pool = TokenPool.create('iid-1', 2)
+        pool.alloc()
+        self.assertFalse(pool.release_as_complete())
+        self.assertTrue(pool.release_as_lost())
+        stored = TokenPool.from_pool_name(pool.get_name())
+        self.assertEqual(
+            (stored.avail, stored.active, stored.complete, stored.lost), (0, 0, 1, 1),
+        )
+        self.assertTrue(stored.is_done())
+        self.assertNotIn('_mod_revision', stored.to_json())
+
+    def test_one_round_trip_per_move(self):
+        pool = TokenPool.create('iid-1', 10)
+        self.etcd.reset_calls()
+        pool.alloc()
+        pool.release_as_complete()
+        self.assertEqual(self.etcd.round_trips, 2)
+        self.assertEqual(self.etcd.calls['LeaseGrant'], 0)
+
+    def test_stale_copy_does_not_lose_updates(self):
+        name = TokenPool.create('iid-1', 3).get_name()
+        first = TokenPool.from_pool_name(name)
+        second = TokenPool.from_pool_name(name)
+        first.alloc()
+        second.alloc()  # conflicts, re-reads, and allocates on top of first
+        self.assertEqual(second.active, 2)
+        self.assertEqual(TokenPool.from_pool_name(name).avail, 1)
+
+    def test_erased_pool(self):
+        pool = TokenPool.create('iid-1', 1)
+        TokenPool.erase(pool.get_name())
+        self.assertIsNone(TokenPool.from_pool_name(pool.get_name()))
+        with self.assertRaises(RuntimeError):
+            pool.alloc()
+
+    def test_release_chain(self):
+        outer = TokenPool.create('iid-1', 1)
+        inner = TokenPool.create('iid-1', 2)
+        for pool in (outer, inner, inner):
+            pool.alloc()
+        names = [inner.get_name(), outer.get_name()]
+        self.etcd.reset_calls()
+        alldone, pools = TokenPool.release_chain_as_complete(names)
+        self.assertFalse(alldone)
+        self.assertEqual(self.etcd.round_trips, 2)
+        self.assertEqual([pool.complete for pool in pools], [1, 0])
+        alldone, pools = TokenPool.release_chain_as_complete(names)
+        self.assertTrue(alldone)
+        self.assertTrue(all(
+            TokenPool.from_pool_name(name).is_done() for name in names
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
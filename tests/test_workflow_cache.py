@@ -0,0 +1,108 @@
+'''Tests for the shared, revision-keyed cache of compiled workflows.
+'''
+import os
+import threading
+import unittest
+from unittest import mock
+
+import xmltodict
+
+from flowlib import bpmn, workflow_cache
+from flowlib.constants import WorkflowKeys
+from flowlib.workflow import Workflow
+from tests.fake_etcd import EtcdTestCase
+
+
+with open(os.path.join(os.path.dirname(__file__), 'super_happy.bpmn'), 'rb') as bpmn_file:
+    # the proc key holds the process as handle_apply writes it
+    PROC = bpmn.BPMNProcess(
+        xmltodict.parse(bpmn_file.read())['bpmn:definitions']['bpmn:process']
+    ).to_xml().encode('utf-8')
+
+
+class TestWorkflowCache(EtcdTestCase):
+    def setUp(self):
+        super().setUp()
+        self.compiled = []
+        for did in ('wf-1', 'wf-2', 'wf-3'):
+            self.etcd.put(WorkflowKeys.proc_key(did), PROC)
+            self.etcd.put(WorkflowKeys.state_key(did), 'RUNNING')
+        self.cache = self.new_cache().start()
+        self.addCleanup(self.cache.stop)
+
+    def new_cache(self, **kws):
+        def compile(did, proc_bytes, compiled_bytes):
+            self.compiled.append(did)
+            return Workflow.from_proc(proc_bytes, did, compiled_bytes)
+        return workflow_cache.WorkflowCache(self.etcd, compile=compile, **kws)
+
+    def test_hits_cost_no_round_trips(self):
+        first = self.cache.get('wf-1')
+        self.assertEqual(first.id, 'wf-1')
+        self.assertTrue(first.process.id.startswith('process-0wcmy6c'))
+        self.etcd.reset_calls()
+        self.assertIs(self.cache.get('wf-1'), first)
+        self.assertEqual(self.etcd.round_trips, 0)
+        self.assertEqual(self.compiled, ['wf-1'])
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 1, 0.5))
+        with self.assertRaises(KeyError):
+            self.cache.get('wf-missing')
+
+    def test_reapply_and_delete_invalidate(self):
+        first = self.cache.get('wf-1')
+        self.cache.get('wf-2')
+        # the state key changing does not touch the compiled process
+        self.etcd.put(WorkflowKeys.state_key('wf-1'), 'STOPPED')
+        self.assertTrue(self.cache._watch.sync())
+        self.assertIs(self.cache.get('wf-1'), first)
+        self.etcd.put(WorkflowKeys.proc_key('wf-1'), PROC)
+        self.etcd.delete(WorkflowKeys.proc_key('wf-2'))
+        self.assertTrue(self.cache._watch.sync())
+        self.assertEqual(self.cache.stats()['entries'], 0)
+        self.assertEqual(self.cache.stats()['invalidations'], 2)
+        self.assertIsNot(self.cache.get('wf-1'), first)
+        with self.assertRaises(KeyError):
+            self.cache.get('wf-2')
+
+    def test_sync_waits_for_deletes(self):
+        self.cache.get('wf-1')
+        watch = self.cache._watch
+        apply = watch._apply
+        with mock.patch.object(
+            watch, '_apply', side_effect=lambda event: threading.Timer(0.1, apply, [event]).start(),
+        ):
+            self.etcd.delete(WorkflowKeys.proc_key('wf-1'))
+            self.assertIsNotNone(watch.revision_of('wf-1'))
+            self.assertTrue(watch.sync())
+        self.assertIsNone(watch.revision_of('wf-1'))
+        with self.assertRaises(KeyError):
+            self.cache.get('wf-1')
+
+    def test_evicts_by_size(self):
+        size = workflow_cache.estimate_size(PROC)
+        cache = self.new_cache(max_bytes=2 * size + 1)
+        for did in ('wf-1', 'wf-2', 'wf-1', 'wf-3'):
+            cache.get(did)
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['bytes'], stats['evictions']), (2, 2 * size, 1))
+        # wf-2 was least recently used
+        self.assertEqual(list(cache._entries), ['wf-1', 'wf-3'])
+
+    def test_validates_hits_without_a_watch(self):
+        cache = self.new_cache()  # not started
+        first = cache.get('wf-1')
+        self.assertIs(cache.get('wf-1'), first)
+        self.etcd.put(WorkflowKeys.proc_key('wf-1'), PROC)
+        self.assertIsNot(cache.get('wf-1'), first)
+        self.assertEqual(cache.stats()['validations'], 2)
+        self.assertEqual(self.compiled, ['wf-1', 'wf-1'])
+
+    def test_from_id_shares_the_module_cache(self):
+        self.assertIs(Workflow.from_id('wf-3'), Workflow.from_id('wf-3'))
+        stats = workflow_cache.get_workflow_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
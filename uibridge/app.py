@@ -16,6 +16,7 @@ from .prism_api.client import PrismApiClient
 
 from flowlib import executor, user_task
 from flowlib.constants import Headers, flow_result, TEST_MODE_URI
+from flowlib.etcd_utils import try_transition_state
 from . import graphql_handlers, flowd_api
 from .async_service import AsyncService
 
@@ -78,7 +79,7 @@ class REXFlowUIBridge(AsyncService):
         tid = request.headers[Headers.X_HEADER_TASK_ID]
         logging.info(f'Starting init_route()... {iid} {tid}')
 
-        self.etcd.replace(f'{self.get_instance_etcd_key(request)}state', 'pending', 'initialized')
+        try_transition_state(self.etcd, f'{self.get_instance_etcd_key(request)}state', ['pending'], 'initialized')
         if Headers.X_HEADER_TOKEN_POOL_ID in request.headers.keys():
             self.workflow.register_instance_header(iid, f'{Headers.X_HEADER_TOKEN_POOL_ID}:{request.headers[Headers.X_HEADER_TOKEN_POOL_ID]}')
         req_json = await request.get_json()
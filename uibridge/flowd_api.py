@@ -5,15 +5,15 @@ import json
 import logging
 import os
 import re
-import requests
 import threading
 from typing import Any, Dict, List, NoReturn, Tuple
 
 from etcd3.events import DeleteEvent, PutEvent
 
-from flowlib import flow_pb2, etcd_utils, executor
+from flowlib import flow_pb2, etcd_utils, executor, instance_index
 from flowlib.flowpost import FlowPost, FlowPostResult, FlowPostStatus
 from flowlib.flowd_utils import get_flowd_connection
+from flowlib.http_sessions import get_session_pool
 from flowlib.constants import WorkflowKeys, WorkflowInstanceKeys, States, TEST_MODE_URI, Headers
 from .graphql_wrappers import (
     ENCRYPTED,
@@ -140,6 +140,12 @@ class Workflow:
         raise ValueError(f'{iid} is not a known instance')
 
     def get_instances(self, meta:dict = None) -> list:
+        if meta:
+            etcd = etcd_utils.get_etcd()
+            if instance_index.is_ready(etcd):
+                # Candidates only (the index case-folds values); the caller
+                # still compares each instance's metadata.
+                return list(instance_index.find_instances(etcd, metadata=meta, id_prefix=self.did))
         with get_flowd_connection(self.flowd_host, self.flowd_port) as flowd:
             request = flow_pb2.PSRequest(
                 kind=flow_pb2.INSTANCE, ids = [], include_kubernetes=False,
@@ -214,7 +220,8 @@ class Workflow:
             logging.info(f'-- headers {next_headers} data {data}')
             
             try:
-                call = requests.post if next_task['method'] == 'POST' else requests.get
+                pool = get_session_pool()
+                call = pool.post if next_task['method'] == 'POST' else pool.get
                 svc_response = call(next_task['k8s_url'], headers=next_headers, json=data)
                 svc_response.raise_for_status()
                 # try:
@@ -49,7 +49,7 @@ def mutation_get_instance(_,info, input=None):
         if IID in input:
             iid_list = [input[IID]]
     if iid_list is None:
-        iid_list = workflow.get_instances()
+        iid_list = workflow.get_instances(in_meta)
 
     iid_info = []
     for iid in iid_list: